@@ -0,0 +1,26 @@
+"""api_keys: класс приоритета ключа (для сброса нагрузки).
+
+Revision ID: 0003_api_keys_priority
+Revises: 0002_api_keys_key_id
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003_api_keys_priority"
+down_revision = "0002_api_keys_key_id"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "api_keys",
+        sa.Column("priority", sa.String(length=20), nullable=False, server_default="normal"),
+    )
+
+
+def downgrade():
+    op.drop_column("api_keys", "priority")
@@ -0,0 +1,23 @@
+"""api_keys: лимит одновременных запросов (max in-flight).
+
+Revision ID: 0004_api_keys_max_concurrent
+Revises: 0003_api_keys_priority
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004_api_keys_max_concurrent"
+down_revision = "0003_api_keys_priority"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("api_keys", sa.Column("max_concurrent", sa.Integer(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("api_keys", "max_concurrent")
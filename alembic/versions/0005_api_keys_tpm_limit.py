@@ -0,0 +1,23 @@
+"""api_keys: лимит токенов в минуту (TPM).
+
+Revision ID: 0005_api_keys_tpm_limit
+Revises: 0004_api_keys_max_concurrent
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0005_api_keys_tpm_limit"
+down_revision = "0004_api_keys_max_concurrent"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("api_keys", sa.Column("tpm_limit", sa.Integer(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("api_keys", "tpm_limit")
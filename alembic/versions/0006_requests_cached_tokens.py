@@ -0,0 +1,23 @@
+"""requests: cached_tokens (prompt cache провайдера).
+
+Revision ID: 0006_requests_cached_tokens
+Revises: 0005_api_keys_tpm_limit
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0006_requests_cached_tokens"
+down_revision = "0005_api_keys_tpm_limit"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("requests", sa.Column("cached_tokens", sa.Integer(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("requests", "cached_tokens")
@@ -0,0 +1,32 @@
+"""prompt_templates: серверные шаблоны промптов (версионированные).
+
+Revision ID: 0007_prompt_templates
+Revises: 0006_requests_cached_tokens
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0007_prompt_templates"
+down_revision = "0006_requests_cached_tokens"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "prompt_templates",
+        sa.Column("id", sa.Uuid(), primary_key=True, nullable=False),
+        sa.Column("name", sa.String(length=200), nullable=False),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.Column("kind", sa.String(length=50), nullable=True),
+        sa.Column("body", sa.JSON(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.UniqueConstraint("name", "version", name="uq_prompt_templates_name_version"),
+    )
+
+
+def downgrade():
+    op.drop_table("prompt_templates")
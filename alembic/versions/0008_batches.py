@@ -0,0 +1,57 @@
+"""files/batches: Batch API на JSONL-файлах; jobs.batch_id и custom_id.
+
+Revision ID: 0008_batches
+Revises: 0007_prompt_templates
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0008_batches"
+down_revision = "0007_prompt_templates"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "files",
+        sa.Column("id", sa.Uuid(), primary_key=True, nullable=False),
+        sa.Column("api_key_id", sa.Uuid(), sa.ForeignKey("api_keys.id"), nullable=False),
+        sa.Column("purpose", sa.String(length=50), nullable=False),
+        sa.Column("filename", sa.String(length=300), nullable=False),
+        sa.Column("bytes", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_table(
+        "batches",
+        sa.Column("id", sa.Uuid(), primary_key=True, nullable=False),
+        sa.Column("api_key_id", sa.Uuid(), sa.ForeignKey("api_keys.id"), nullable=False),
+        sa.Column("kind", sa.String(length=50), nullable=False),
+        sa.Column("status", sa.String(length=20), nullable=False),
+        sa.Column("input_file_id", sa.Uuid(), sa.ForeignKey("files.id"), nullable=False),
+        sa.Column("output_file_id", sa.Uuid(), sa.ForeignKey("files.id"), nullable=True),
+        sa.Column("error_file_id", sa.Uuid(), sa.ForeignKey("files.id"), nullable=True),
+        sa.Column("total", sa.Integer(), nullable=False),
+        sa.Column("completed", sa.Integer(), nullable=False),
+        sa.Column("failed", sa.Integer(), nullable=False),
+        sa.Column("metadata", sa.JSON(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.add_column(
+        "jobs",
+        sa.Column("batch_id", sa.Uuid(), sa.ForeignKey("batches.id"), nullable=True),
+    )
+    op.add_column("jobs", sa.Column("custom_id", sa.String(length=200), nullable=True))
+    op.create_index("ix_jobs_batch_id", "jobs", ["batch_id"])
+
+
+def downgrade():
+    op.drop_index("ix_jobs_batch_id", table_name="jobs")
+    op.drop_column("jobs", "custom_id")
+    op.drop_column("jobs", "batch_id")
+    op.drop_table("batches")
+    op.drop_table("files")
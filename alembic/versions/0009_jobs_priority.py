@@ -0,0 +1,26 @@
+"""jobs: приоритет внутри очереди ключа (справедливая очередь jobs).
+
+Revision ID: 0009_jobs_priority
+Revises: 0008_batches
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0009_jobs_priority"
+down_revision = "0008_batches"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "jobs",
+        sa.Column("priority", sa.Integer(), nullable=False, server_default="5"),
+    )
+
+
+def downgrade():
+    op.drop_column("jobs", "priority")
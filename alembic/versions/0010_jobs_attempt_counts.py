@@ -0,0 +1,46 @@
+"""jobs: счётчики попыток (claim одним UPDATE вместо MAX(attempt) по истории).
+
+Revision ID: 0010_jobs_attempt_counts
+Revises: 0009_jobs_priority
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0010_jobs_attempt_counts"
+down_revision = "0009_jobs_priority"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "jobs",
+        sa.Column("attempt_count", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.add_column(
+        "jobs",
+        sa.Column("webhook_attempt_count", sa.Integer(), nullable=False, server_default="0"),
+    )
+    # Уже выполненные попытки: нумерация продолжается с последней записанной.
+    op.execute(
+        """
+        UPDATE jobs SET attempt_count = a.n
+        FROM (SELECT job_id, MAX(attempt) AS n FROM job_attempts GROUP BY job_id) a
+        WHERE a.job_id = jobs.id
+        """
+    )
+    op.execute(
+        """
+        UPDATE jobs SET webhook_attempt_count = d.n
+        FROM (SELECT job_id, MAX(attempt) AS n FROM webhook_deliveries GROUP BY job_id) d
+        WHERE d.job_id = jobs.id
+        """
+    )
+
+
+def downgrade():
+    op.drop_column("jobs", "webhook_attempt_count")
+    op.drop_column("jobs", "attempt_count")
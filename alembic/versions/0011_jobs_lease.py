@@ -0,0 +1,31 @@
+"""jobs: lease воркера на job в `running` (heartbeat и reaper).
+
+Revision ID: 0011_jobs_lease
+Revises: 0010_jobs_attempt_counts
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0011_jobs_lease"
+down_revision = "0010_jobs_attempt_counts"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("jobs", sa.Column("lease_expires_at", sa.DateTime(timezone=True), nullable=True))
+    # Reaper ищет только среди `running`: частичный индекс не растёт с историей jobs.
+    op.create_index(
+        "ix_jobs_running_lease_expires_at",
+        "jobs",
+        ["lease_expires_at"],
+        postgresql_where=sa.text("status = 'running'"),
+    )
+
+
+def downgrade():
+    op.drop_index("ix_jobs_running_lease_expires_at", table_name="jobs")
+    op.drop_column("jobs", "lease_expires_at")
@@ -0,0 +1,138 @@
+"""Бенчмарк: TCP+TLS на каждый запрос (`httpx.post`) против пула `build_client`.
+
+Поднимает локальный HTTPS stand-in (самоподписанный сертификат через `openssl`) и считает
+handshake'и на стороне сервера. Запуск:
+
+    python benchmarks/http_handshake_bench.py --requests 300
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import httpx
+
+from ai_gateway.infrastructure.http import build_client
+from ai_gateway.metrics import http_client_requests_total, http_pool_wait_seconds
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True  # иначе Nagle + delayed ACK добавляют ~40 мс на ответ
+
+    def do_POST(self) -> None:  # noqa: N802
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        body = b'{"ok":true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+
+class _TLSServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, ctx: ssl.SSLContext) -> None:
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self._ctx = ctx
+        self.handshakes = 0
+        self._lock = threading.Lock()
+
+    def get_request(self):  # type: ignore[no-untyped-def]
+        sock, addr = super().get_request()
+        with self._lock:
+            self.handshakes += 1
+        return self._ctx.wrap_socket(sock, server_side=True), addr
+
+
+def _make_cert(tmp: Path) -> tuple[Path, Path]:
+    cert, key = tmp / "cert.pem", tmp / "key.pem"
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+            "-subj", "/CN=localhost", "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1",
+            "-keyout", str(key), "-out", str(cert),
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return cert, key
+
+
+def _run(name: str, server: _TLSServer, n: int, send) -> dict:  # type: ignore[no-untyped-def]
+    before = server.handshakes
+    t0 = time.perf_counter()
+    for _ in range(n):
+        r = send()
+        r.raise_for_status()
+    elapsed = time.perf_counter() - t0
+    return {
+        "mode": name,
+        "requests": n,
+        "handshakes": server.handshakes - before,
+        "total_s": round(elapsed, 3),
+        "ms_per_request": round(elapsed * 1000 / n, 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        cert, key = _make_cert(Path(d))
+        server_ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        server_ctx.load_cert_chain(cert, key)
+        client_ctx = ssl.create_default_context(cafile=str(cert))
+
+        server = _TLSServer(server_ctx)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"https://localhost:{server.server_address[1]}/hook"
+        body = json.dumps({"job_id": "bench", "status": "succeeded"}).encode()
+
+        rows = [
+            _run(
+                "httpx.post (per request)",
+                server,
+                args.requests,
+                lambda: httpx.post(url, content=body, verify=client_ctx),
+            )
+        ]
+        client = build_client("bench", 10.0, verify=client_ctx)
+        rows.append(
+            _run(
+                "build_client (pooled)",
+                server,
+                args.requests,
+                lambda: client.post(url, content=body),
+            )
+        )
+        client.close()
+        server.shutdown()
+
+    for row in rows:
+        print(json.dumps(row, ensure_ascii=False))
+    reused = http_client_requests_total.labels(client="bench", connection="reused")._value.get()
+    wait_sum = http_pool_wait_seconds.labels(client="bench")._sum.get()
+    print(json.dumps({"pooled_reused": reused, "pooled_pool_wait_s": round(wait_sum, 6)}))
+    saved_hs = rows[0]["handshakes"] - rows[1]["handshakes"]
+    saved_s = rows[0]["total_s"] - rows[1]["total_s"]
+    print(f"handshakes saved: {saved_hs}, time saved: {saved_s:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
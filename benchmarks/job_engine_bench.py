@@ -0,0 +1,174 @@
+"""Бенчмарк: prefork (процесс на job, как Celery по умолчанию) против async-движка воркера.
+
+Поднимает локальный upstream, который отвечает через `--latency` секунд (как LLM), и гоняет
+через него `--jobs` вызовов chat completions по пути провайдера jobs (fallback, bulkhead
+выключен, pacing выключен — без Redis/Postgres). Prefork: `--processes` процессов, каждый
+выполняет свои jobs по одной. Async: один процесс, до `--concurrency` jobs на event loop.
+Память — пиковый RSS (VmHWM) процессов-исполнителей. Запуск (Linux):
+
+    python benchmarks/job_engine_bench.py --jobs 2000 --latency 0.5 --processes 32 \\
+        --concurrency 500
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import os
+import socket
+import threading
+import time
+
+_RESPONSE = json.dumps(
+    {
+        "id": "chatcmpl-bench",
+        "object": "chat.completion",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12},
+    }
+).encode()
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, latency: float):
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in head.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":", 1)[1])
+            await reader.readexactly(length)
+            await asyncio.sleep(latency)
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                + f"Content-Length: {len(_RESPONSE)}\r\n\r\n".encode()
+                + _RESPONSE
+            )
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+def _serve(sock: socket.socket, latency: float) -> None:
+    async def main() -> None:
+        server = await asyncio.start_server(
+            lambda r, w: _handle(r, w, latency), sock=sock, backlog=4096
+        )
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(main())
+
+
+def _peak_rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _env(port: int, concurrency: int) -> None:
+    os.environ.update(
+        {
+            "DEFAULT_PROVIDER": "openai",
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{port}",
+            "OPENAI_API_KEY": "bench",
+            "PACING_ENABLED": "false",
+            "BULKHEAD_ENABLED": "false",
+            "AFFINITY_ENABLED": "false",
+            "HTTP_MAX_CONNECTIONS": str(max(100, concurrency)),
+            "HTTP_MAX_KEEPALIVE_CONNECTIONS": str(max(20, concurrency)),
+            "OPENAI_TIMEOUT_SECONDS": "60",
+        }
+    )
+
+
+_PAYLOAD = {"model": "bench", "messages": [{"role": "user", "content": "ping"}]}
+
+
+def _prefork_child(jobs: int, out: mp.Queue) -> None:
+    from ai_gateway.providers.fallback import call_with_fallback
+
+    for _ in range(jobs):
+        call_with_fallback("chat.completions", "openai", _PAYLOAD)
+    out.put(_peak_rss_mb())
+
+
+def _async_child(jobs: int, concurrency: int, out: mp.Queue) -> None:
+    from ai_gateway.providers.fallback import acall_with_fallback
+
+    async def main() -> None:
+        slots = asyncio.Semaphore(concurrency)
+
+        async def one() -> None:
+            async with slots:
+                await acall_with_fallback("chat.completions", "openai", _PAYLOAD)
+
+        await asyncio.gather(*(one() for _ in range(jobs)))
+
+    asyncio.run(main())
+    out.put(_peak_rss_mb())
+
+
+def _run(name: str, workers: list[mp.Process], out: mp.Queue, jobs: int, concurrent: int) -> dict:
+    t0 = time.perf_counter()
+    for w in workers:
+        w.start()
+    rss = [out.get() for _ in workers]
+    elapsed = time.perf_counter() - t0
+    for w in workers:
+        w.join()
+    total_mb = sum(rss)
+    return {
+        "mode": name,
+        "jobs": jobs,
+        "concurrent_jobs": concurrent,
+        "processes": len(workers),
+        "total_s": round(elapsed, 2),
+        "jobs_per_s": round(jobs / elapsed, 1),
+        "rss_mb": round(total_mb, 1),
+        "concurrent_jobs_per_gb": round(concurrent / (total_mb / 1024), 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--jobs", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--processes", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=500)
+    args = parser.parse_args()
+
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(4096)
+    port = sock.getsockname()[1]
+    threading.Thread(target=_serve, args=(sock, args.latency), daemon=True).start()
+    _env(port, args.concurrency)
+
+    # fork — как prefork-пул Celery (дочерние процессы наследуют импортированное).
+    ctx = mp.get_context("fork")
+    out: mp.Queue = ctx.Queue()
+    per = args.jobs // args.processes
+    prefork = [ctx.Process(target=_prefork_child, args=(per, out)) for _ in range(args.processes)]
+    rows = [_run("prefork", prefork, out, per * args.processes, args.processes)]
+
+    engine = [ctx.Process(target=_async_child, args=(args.jobs, args.concurrency, out))]
+    rows.append(_run("async", engine, out, args.jobs, args.concurrency))
+
+    for row in rows:
+        print(json.dumps(row, ensure_ascii=False))
+    ratio = rows[1]["concurrent_jobs_per_gb"] / rows[0]["concurrent_jobs_per_gb"]
+    print(
+        f"async: x{rows[1]['jobs_per_s'] / rows[0]['jobs_per_s']:.1f} jobs/s, "
+        f"x{ratio:.1f} concurrent jobs per GB"
+    )
+
+
+if __name__ == "__main__":
+    main()
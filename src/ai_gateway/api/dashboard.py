@@ -85,6 +85,7 @@ def _load_dashboard_data(limit: int = 30) -> dict:
                 "prompt_tokens": r.prompt_tokens,
                 "completion_tokens": r.completion_tokens,
                 "total_tokens": r.total_tokens,
+                "cached_tokens": r.cached_tokens,
                 "cost_rub": float(r.cost_rub) if r.cost_rub is not None else None,
                 "request_payload": r.request_payload_redacted,
                 "response_payload": r.response_payload_redacted,
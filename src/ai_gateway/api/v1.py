@@ -2,7 +2,9 @@
 
 from fastapi import APIRouter
 
+from ai_gateway.api.v1_batches import router as batches_router
 from ai_gateway.api.v1_chat import router as chat_router
+from ai_gateway.api.v1_estimate import router as estimate_router
 from ai_gateway.api.v1_jobs import router as jobs_router
 from ai_gateway.api.v1_models import router as models_router
 from ai_gateway.api.v1_responses import router as responses_router
@@ -12,3 +14,5 @@ router.include_router(responses_router)
 router.include_router(chat_router)
 router.include_router(models_router)
 router.include_router(jobs_router)
+router.include_router(estimate_router)
+router.include_router(batches_router)
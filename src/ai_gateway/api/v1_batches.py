@@ -0,0 +1,206 @@
+"""Batch API в стиле OpenAI: файлы JSONL (`/v1/files`) и пачки запросов (`/v1/batches`)."""
+
+from __future__ import annotations
+
+import os
+import uuid
+from typing import Literal
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from ai_gateway.auth.apikey import AuthedKey, require_api_key
+from ai_gateway.db.models import Batch, StoredFile
+from ai_gateway.infrastructure.db import SessionLocal
+from ai_gateway.infrastructure.redis import get_redis
+from ai_gateway.services.batches import (
+    batch_progress,
+    cancel_batch,
+    create_batch,
+    file_path,
+    save_upload,
+)
+from ai_gateway.services.budgets import BudgetLimits, enforce_budgets
+from ai_gateway.services.limits import enforce_rpm_limit
+from ai_gateway.settings import get_settings
+
+router = APIRouter()
+
+
+class BatchCreate(BaseModel):
+    input_file_id: str
+    endpoint: Literal["/v1/responses", "/v1/chat/completions"]
+    completion_window: Literal["24h"] = "24h"
+    provider: str | None = None
+    metadata: dict[str, str] | None = None
+
+
+def _file_obj(f: StoredFile) -> dict:
+    return {
+        "id": str(f.id),
+        "object": "file",
+        "purpose": f.purpose,
+        "filename": f.filename,
+        "bytes": f.bytes,
+        "created_at": int(f.created_at.timestamp()),
+    }
+
+
+def _batch_obj(b: Batch, counts: dict[str, int]) -> dict:
+    return {
+        "id": str(b.id),
+        "object": "batch",
+        "endpoint": "/v1/chat/completions" if b.kind == "chat.completions" else "/v1/responses",
+        "status": b.status,
+        "input_file_id": str(b.input_file_id),
+        "output_file_id": str(b.output_file_id) if b.output_file_id else None,
+        "error_file_id": str(b.error_file_id) if b.error_file_id else None,
+        "completion_window": "24h",
+        "request_counts": counts,
+        "metadata": b.metadata_,
+        "created_at": int(b.created_at.timestamp()),
+        "finished_at": int(b.finished_at.timestamp()) if b.finished_at else None,
+    }
+
+
+def _get_owned(session: Session, model: type, obj_id: str, authed: AuthedKey, what: str):
+    try:
+        obj_uuid = uuid.UUID(obj_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail=f"{what} не найден") from None
+    obj = session.get(model, obj_uuid)
+    if obj is None or str(obj.api_key_id) != authed.api_key_id:
+        raise HTTPException(status_code=404, detail=f"{what} не найден")
+    return obj
+
+
+def _save_file_row(file_id: uuid.UUID, authed: AuthedKey, filename: str, size: int) -> dict:
+    session: Session = SessionLocal()
+    try:
+        f = StoredFile(
+            id=file_id,
+            api_key_id=uuid.UUID(authed.api_key_id),
+            purpose="batch",
+            filename=filename,
+            bytes=size,
+        )
+        session.add(f)
+        session.commit()
+        return _file_obj(f)
+    finally:
+        session.close()
+
+
+@router.post("/files")
+async def upload_file(
+    request: Request,
+    purpose: Literal["batch"] = Query(default="batch"),
+    filename: str = Query(default="batch.jsonl", max_length=300),
+    authed: AuthedKey = Depends(require_api_key),
+) -> dict:
+    """Загрузка JSONL: тело запроса — сам файл, пишется на диск потоком."""
+    if request.headers.get("content-type", "").startswith("multipart/"):
+        raise HTTPException(
+            status_code=415,
+            detail="Передайте JSONL телом запроса (Content-Type: application/jsonl)",
+        )
+    await run_in_threadpool(
+        enforce_rpm_limit, get_redis(), authed.api_key_id, "files.create", authed.rpm_limit
+    )
+    file_id = uuid.uuid4()
+    size = await save_upload(file_id, request.stream())
+    try:
+        return await run_in_threadpool(_save_file_row, file_id, authed, filename, size)
+    except BaseException:
+        os.unlink(file_path(file_id))
+        raise
+
+
+@router.get("/files/{file_id}")
+def get_file(file_id: str, authed: AuthedKey = Depends(require_api_key)) -> dict:
+    session: Session = SessionLocal()
+    try:
+        return _file_obj(_get_owned(session, StoredFile, file_id, authed, "Файл"))
+    finally:
+        session.close()
+
+
+@router.get("/files/{file_id}/content")
+def get_file_content(
+    file_id: str,
+    authed: AuthedKey = Depends(require_api_key),
+) -> FileResponse:
+    """Содержимое файла отдаётся с диска по частям, без чтения в память."""
+    session: Session = SessionLocal()
+    try:
+        f = _get_owned(session, StoredFile, file_id, authed, "Файл")
+    finally:
+        session.close()
+    path = file_path(f.id)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Содержимое файла не найдено")
+    return FileResponse(path, media_type="application/jsonl", filename=f.filename)
+
+
+@router.post("/batches")
+def create_batch_endpoint(
+    body: BatchCreate,
+    x_provider: str | None = Header(default=None, alias="X-Provider"),
+    authed: AuthedKey = Depends(require_api_key),
+) -> dict:
+    settings = get_settings()
+    r = get_redis()
+    enforce_rpm_limit(r, authed.api_key_id, "batches.create", authed.rpm_limit)
+
+    session: Session = SessionLocal()
+    try:
+        input_file = _get_owned(session, StoredFile, body.input_file_id, authed, "Файл")
+        if input_file.purpose != "batch":
+            raise HTTPException(status_code=422, detail="Нужен файл с purpose=batch")
+        enforce_budgets(
+            session,
+            authed.api_key_id,
+            BudgetLimits(
+                daily_budget_rub=authed.daily_budget_rub,
+                monthly_budget_rub=authed.monthly_budget_rub,
+            ),
+        )
+        batch = create_batch(
+            session,
+            r,
+            authed.api_key_id,
+            input_file,
+            body.endpoint,
+            body.provider or x_provider or settings.default_provider,
+            body.metadata,
+            key_priority=authed.priority,
+        )
+        return _batch_obj(batch, batch_progress(r, batch))
+    finally:
+        session.close()
+
+
+@router.get("/batches/{batch_id}")
+def get_batch(batch_id: str, authed: AuthedKey = Depends(require_api_key)) -> dict:
+    session: Session = SessionLocal()
+    try:
+        batch = _get_owned(session, Batch, batch_id, authed, "Пачка")
+        return _batch_obj(batch, batch_progress(get_redis(), batch))
+    finally:
+        session.close()
+
+
+@router.post("/batches/{batch_id}/cancel")
+def cancel_batch_endpoint(batch_id: str, authed: AuthedKey = Depends(require_api_key)) -> dict:
+    r = get_redis()
+    session: Session = SessionLocal()
+    try:
+        batch = _get_owned(session, Batch, batch_id, authed, "Пачка")
+        cancel_batch(session, r, batch)
+        session.refresh(batch)
+        return _batch_obj(batch, batch_progress(r, batch))
+    finally:
+        session.close()
@@ -0,0 +1,63 @@
+"""Эндпоинт `/v1/estimate`: оценка токенов и стоимости запроса без вызова upstream."""
+
+from fastapi import APIRouter, Header
+
+from ai_gateway.auth.apikey import Authed, AuthedKey
+from ai_gateway.infrastructure.redis import get_redis
+from ai_gateway.services.limits import enforce_rpm_limit
+from ai_gateway.services.pricing import calc_cost_rub, load_pricing
+from ai_gateway.services.templates import expand_request
+from ai_gateway.services.tokens import (
+    estimate_prompt_tokens,
+    max_output_tokens,
+    tokenizer_kind,
+)
+from ai_gateway.settings import get_settings
+
+router = APIRouter()
+
+
+@router.post("/estimate")
+def estimate(
+    payload: dict,
+    x_provider: str | None = Header(default=None, alias="X-Provider"),
+    authed: AuthedKey = Authed,
+) -> dict:
+    """Принимает тело `/v1/responses` или `/v1/chat/completions` (по наличию `messages`).
+
+    `template_id` разворачивается так же, как в самих эндпоинтах.
+    """
+    settings = get_settings()
+    provider_name = x_provider or settings.default_provider
+
+    endpoint = "estimate"
+    enforce_rpm_limit(get_redis(), authed.api_key_id, endpoint, authed.rpm_limit)
+
+    request = expand_request(None, payload)
+    payload = request.payload
+    if request.template is not None and request.template.kind is not None:
+        kind = request.template.kind
+    else:
+        kind = "chat.completions" if "messages" in payload else "responses"
+    model = str(payload.get("model") or "")
+    input_tokens = estimate_prompt_tokens(kind, payload)
+    output_limit = max_output_tokens(payload)
+    output_tokens = output_limit if output_limit is not None else settings.tpm_default_output_tokens
+
+    pricing = load_pricing()
+    input_cost = calc_cost_rub(model, input_tokens, 0, pricing, provider_name)
+    total_cost = calc_cost_rub(model, input_tokens, output_tokens, pricing, provider_name)
+    return {
+        "object": "estimate",
+        "kind": kind,
+        "provider": provider_name,
+        "model": model,
+        "tokenizer": tokenizer_kind(),
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "total_tokens": input_tokens + output_tokens,
+        "cost_rub": {
+            "input": float(input_cost) if input_cost is not None else None,
+            "total": float(total_cost) if total_cost is not None else None,
+        },
+    }
@@ -1,26 +1,44 @@
-"""Async jobs API: создать задачу и получить статус/результат."""
+"""Async jobs API: создать задачу и получить статус/результат (в том числе long-poll и SSE)."""
 
 from __future__ import annotations
 
+import asyncio
+import json
 import uuid
+from collections.abc import AsyncIterator
 from typing import Any, Literal
 
-from fastapi import APIRouter, Depends, Header, HTTPException
-from pydantic import BaseModel, Field
-from sqlalchemy import and_
+import structlog
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
+from sqlalchemy import select, tuple_
 from sqlalchemy.orm import Session
 
 from ai_gateway.auth.apikey import AuthedKey, require_api_key
 from ai_gateway.db.models import Job
 from ai_gateway.infrastructure.db import SessionLocal
 from ai_gateway.infrastructure.redis import get_redis
-from ai_gateway.queue.tasks import process_job
+from ai_gateway.metrics import job_status_cache_total
+from ai_gateway.queue.execution import TERMINAL_STATUSES
+from ai_gateway.queue.fair import DEFAULT_PRIORITY, MAX_PRIORITY, MIN_PRIORITY
 from ai_gateway.services.budgets import BudgetLimits, enforce_budgets
+from ai_gateway.services.concurrency import concurrency_usage
+from ai_gateway.services.job_events import (
+    cache_status,
+    doc_key,
+    get_job_events,
+    job_document,
+    status_entry,
+)
+from ai_gateway.services.jobs import NewJob, submit_job, submit_jobs
 from ai_gateway.services.limits import enforce_rpm_limit
-from ai_gateway.services.redaction import redact_chat_payload, redact_responses_payload
+from ai_gateway.services.templates import expand_request
 from ai_gateway.settings import get_settings
 
 router = APIRouter()
+log = structlog.get_logger()
 
 
 class WebhookCfg(BaseModel):
@@ -36,27 +54,32 @@ class JobCreate(BaseModel):
     payload: dict[str, Any] = Field(default_factory=dict)
     webhook: WebhookCfg | None = None
     idempotency_key: str | None = None
-
-
-def _payload_redacted(kind: str, payload: dict) -> dict:
-    if kind == "chat.completions":
-        return redact_chat_payload(payload)
-    return redact_responses_payload(payload)
+    # 0..9: порядок среди jobs своего ключа (при JOB_FAIR_QUEUING).
+    priority: int = Field(default=DEFAULT_PRIORITY, ge=MIN_PRIORITY, le=MAX_PRIORITY)
 
 
 @router.post("/jobs")
 def create_job(
     body: JobCreate,
+    response: Response,
     x_provider: str | None = Header(default=None, alias="X-Provider"),
+    idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
     authed: AuthedKey = Depends(require_api_key),
 ) -> dict:
     settings = get_settings()
     provider_name = body.provider or x_provider or settings.default_provider
-    model = body.model or str(body.payload.get("model") or "")
+    # Шаблон проверяем и фиксируем версию сразу; в очередь уходит компактная форма.
+    request = expand_request(body.kind, body.payload)
+    model = body.model or request.model
 
     endpoint = "jobs.create"
     r = get_redis()
     enforce_rpm_limit(r, authed.api_key_id, endpoint, authed.rpm_limit)
+    if authed.max_concurrent:
+        # Job займёт слот только в воркере; здесь показываем текущую загрузку.
+        in_use = concurrency_usage(r, authed.api_key_id)
+        response.headers["X-Concurrency-Limit"] = str(authed.max_concurrent)
+        response.headers["X-Concurrency-Remaining"] = str(max(0, authed.max_concurrent - in_use))
 
     session: Session = SessionLocal()
     try:
@@ -69,74 +92,349 @@ def create_job(
             ),
         )
 
-        if body.idempotency_key:
-            existing = (
-                session.query(Job)
-                .filter(
-                    and_(
-                        Job.api_key_id == uuid.UUID(authed.api_key_id),
-                        Job.idempotency_key == body.idempotency_key,
-                    )
-                )
-                .one_or_none()
-            )
-            if existing:
-                return {"job_id": str(existing.id), "status": existing.status}
-
-        job = Job(
-            api_key_id=uuid.UUID(authed.api_key_id),
-            kind=body.kind,
-            provider=provider_name,
-            model=model,
-            status="queued",
-            idempotency_key=body.idempotency_key,
-            payload_redacted=_payload_redacted(body.kind, body.payload),
+        job = submit_job(
+            session,
+            authed.api_key_id,
+            body.kind,
+            provider_name,
+            model,
+            request.compact,
+            idempotency_key=body.idempotency_key or idempotency_key,
             webhook_url=body.webhook.url if body.webhook else None,
             webhook_secret=body.webhook.secret if body.webhook else None,
             webhook_headers=body.webhook.headers if body.webhook else None,
+            priority=body.priority,
+            key_priority=authed.priority,
+        )
+        return {"job_id": job.job_id, "status": job.status}
+    finally:
+        session.close()
+
+
+_JOB_LIST = TypeAdapter(list[JobCreate])
+
+
+def _parse_batch(raw: bytes, content_type: str) -> list[JobCreate]:
+    """JSON-массив (или `{"jobs": [...]}`) либо NDJSON — по строке `JobCreate` на job."""
+    try:
+        if "ndjson" in content_type or "jsonl" in content_type:
+            lines = [line for line in raw.splitlines() if line.strip()]
+            data: Any = [json.loads(line) for line in lines]
+        else:
+            data = json.loads(raw or b"null")
+            if isinstance(data, dict):
+                data = data.get("jobs")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Невалидный JSON: {e}") from None
+    if not isinstance(data, list):
+        raise HTTPException(status_code=422, detail="Ожидается массив jobs")
+
+    limit = get_settings().jobs_batch_max_items
+    if len(data) > limit:
+        raise HTTPException(status_code=413, detail=f"Не больше {limit} jobs в пачке")
+    try:
+        return _JOB_LIST.validate_python(data)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False)) from None
+
+
+def _submit_batch(
+    items: list[JobCreate],
+    x_provider: str | None,
+    authed: AuthedKey,
+) -> dict:
+    settings = get_settings()
+    # Пачка — один запрос к API: один RPM-тик, одна проверка бюджета.
+    enforce_rpm_limit(get_redis(), authed.api_key_id, "jobs.batch", authed.rpm_limit)
+
+    data: list[dict[str, Any]] = [{} for _ in items]
+    accepted: list[tuple[int, NewJob]] = []
+    for i, item in enumerate(items):
+        try:
+            request = expand_request(item.kind, item.payload)
+        except HTTPException as e:
+            # Ошибка одной job (шаблон) не роняет пачку.
+            data[i] = {"index": i, "error": {"status": e.status_code, "message": e.detail}}
+            continue
+        accepted.append(
+            (
+                i,
+                NewJob(
+                    kind=item.kind,
+                    provider=item.provider or x_provider or settings.default_provider,
+                    model=item.model or request.model,
+                    payload=request.compact,
+                    idempotency_key=item.idempotency_key,
+                    webhook_url=item.webhook.url if item.webhook else None,
+                    webhook_secret=item.webhook.secret if item.webhook else None,
+                    webhook_headers=item.webhook.headers if item.webhook else None,
+                    priority=item.priority,
+                ),
+            )
         )
-        session.add(job)
-        session.commit()
 
-        # Сырой payload уходит через брокер (Redis), а в БД мы храним только redacted.
-        process_job.delay(str(job.id), body.payload)
-        return {"job_id": str(job.id), "status": job.status}
+    session: Session = SessionLocal()
+    try:
+        enforce_budgets(
+            session,
+            authed.api_key_id,
+            BudgetLimits(
+                daily_budget_rub=authed.daily_budget_rub,
+                monthly_budget_rub=authed.monthly_budget_rub,
+            ),
+        )
+        submitted = submit_jobs(
+            session,
+            authed.api_key_id,
+            [job for _, job in accepted],
+            key_priority=authed.priority,
+        )
     finally:
         session.close()
 
+    for (i, _), job in zip(accepted, submitted, strict=True):
+        data[i] = {"index": i, "job_id": job.job_id, "status": job.status, "created": job.created}
+    return {
+        "object": "list",
+        "data": data,
+        "created": sum(1 for job in submitted if job.created),
+        "failed": len(items) - len(accepted),
+    }
 
-@router.get("/jobs/{job_id}")
-def get_job(
-    job_id: str,
+
+@router.post("/jobs/batch")
+async def create_jobs_batch(
+    request: Request,
+    x_provider: str | None = Header(default=None, alias="X-Provider"),
     authed: AuthedKey = Depends(require_api_key),
 ) -> dict:
+    """Много jobs за один запрос: JSON-массив или NDJSON (`Content-Type: application/x-ndjson`)."""
+    raw = await request.body()
+    items = _parse_batch(raw, request.headers.get("content-type", ""))
+    return await run_in_threadpool(_submit_batch, items, x_provider, authed)
+
+
+def _cached(r, job_ids: list[str], api_key_id: str) -> list[dict | None]:
+    """Документы из кэша; чужая или отсутствующая запись — `None` (решит БД)."""
+    if get_settings().jobs_status_cache_ttl_seconds <= 0:
+        return [None] * len(job_ids)
     try:
-        job_uuid = uuid.UUID(job_id)
+        raw = r.mget([doc_key(job_id) for job_id in job_ids])
+    except Exception as e:
+        log.warning("job_status_cache_failed", err=str(e))
+        return [None] * len(job_ids)
+    docs: list[dict | None] = []
+    for value in raw:
+        entry = json.loads(value) if value else None
+        docs.append(entry["doc"] if entry and entry["api_key_id"] == api_key_id else None)
+    hits = sum(1 for doc in docs if doc is not None)
+    job_status_cache_total.labels(result="hit").inc(hits)
+    job_status_cache_total.labels(result="miss").inc(len(docs) - hits)
+    return docs
+
+
+def _cache_terminal(r, jobs: list[Job]) -> None:
+    """Итоговый статус больше не меняется — его можно положить в кэш и при чтении из БД."""
+    done = [job for job in jobs if job.status in TERMINAL_STATUSES]
+    if not done or get_settings().jobs_status_cache_ttl_seconds <= 0:
+        return
+    try:
+        pipe = r.pipeline(transaction=False)
+        for job in done:
+            cache_status(pipe, status_entry(job))
+        pipe.execute()
+    except Exception as e:
+        log.warning("job_status_cache_failed", err=str(e))
+
+
+def _load_jobs(job_uuids: list[uuid.UUID], authed: AuthedKey) -> dict[str, dict]:
+    """Документы jobs ключа: сначала кэш Redis, недостающие — одним запросом в БД."""
+    r = get_redis()
+    ids = [str(job_uuid) for job_uuid in job_uuids]
+    found = {
+        job_id: doc
+        for job_id, doc in zip(ids, _cached(r, ids, authed.api_key_id), strict=True)
+        if doc is not None
+    }
+    missing = [job_uuid for job_uuid in job_uuids if str(job_uuid) not in found]
+    if not missing:
+        return found
+    session: Session = SessionLocal()
+    try:
+        jobs = list(
+            session.scalars(
+                select(Job).where(
+                    Job.id.in_(missing),
+                    Job.api_key_id == uuid.UUID(authed.api_key_id),
+                )
+            )
+        )
+        _cache_terminal(r, jobs)
+        found.update((str(job.id), job_document(job)) for job in jobs)
+        return found
+    finally:
+        session.close()
+
+
+def _load_job(job_uuid: uuid.UUID, authed: AuthedKey) -> dict:
+    doc = _load_jobs([job_uuid], authed).get(str(job_uuid))
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return doc
+
+
+def _job_uuid(job_id: str) -> uuid.UUID:
+    try:
+        return uuid.UUID(job_id)
     except Exception:
         raise HTTPException(status_code=404, detail="Задача не найдена") from None
 
+
+async def _next_status(events: asyncio.Queue[str], current: str, timeout: float) -> str | None:
+    """Ждёт статус, отличный от `current`; `None` — не дождались."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while (left := deadline - loop.time()) > 0:
+        try:
+            status = await asyncio.wait_for(events.get(), timeout=left)
+        except TimeoutError:
+            return None
+        if status != current:
+            return status
+    return None
+
+
+def _list_jobs(
+    status: str,
+    limit: int,
+    after: str | None,
+    order: str,
+    authed: AuthedKey,
+) -> dict:
+    """Keyset по (`created_at`, `id`) внутри статуса: индекс `ix_jobs_status_created_at`."""
+    api_key_uuid = uuid.UUID(authed.api_key_id)
     session: Session = SessionLocal()
     try:
-        job = (
-            session.query(Job)
-            .filter(and_(Job.id == job_uuid, Job.api_key_id == uuid.UUID(authed.api_key_id)))
-            .one_or_none()
-        )
-        if job is None:
-            raise HTTPException(status_code=404, detail="Задача не найдена")
-
-        return {
-            "job_id": str(job.id),
-            "status": job.status,
-            "kind": job.kind,
-            "provider": job.provider,
-            "model": job.model,
-            "error_code": job.error_code,
-            "error_text": job.error_text,
-            "result": job.result_redacted,
-            "created_at": job.created_at.isoformat(),
-            "updated_at": job.updated_at.isoformat(),
-            "webhook_url": job.webhook_url,
-        }
+        q = select(Job).where(Job.status == status, Job.api_key_id == api_key_uuid)
+        if after is not None:
+            cursor = session.execute(
+                select(Job.created_at, Job.id).where(
+                    Job.id == _job_uuid(after), Job.api_key_id == api_key_uuid
+                )
+            ).one_or_none()
+            if cursor is None:
+                raise HTTPException(status_code=422, detail="Неизвестный курсор `after`")
+            key = tuple_(Job.created_at, Job.id)
+            q = q.where(key < tuple_(*cursor) if order == "desc" else key > tuple_(*cursor))
+        if order == "desc":
+            q = q.order_by(Job.created_at.desc(), Job.id.desc())
+        else:
+            q = q.order_by(Job.created_at.asc(), Job.id.asc())
+        jobs = list(session.scalars(q.limit(limit + 1)))
+        data = [job_document(job) for job in jobs[:limit]]
     finally:
         session.close()
+    return {
+        "object": "list",
+        "data": data,
+        "first_id": data[0]["job_id"] if data else None,
+        "last_id": data[-1]["job_id"] if data else None,
+        "has_more": len(jobs) > limit,
+    }
+
+
+@router.get("/jobs")
+def list_jobs(
+    ids: str | None = Query(default=None, description="id jobs через запятую"),
+    status: Literal["queued", "running", "succeeded", "failed"] | None = Query(default=None),
+    limit: int = Query(default=20, ge=1, le=100),
+    after: str | None = Query(default=None),
+    order: Literal["asc", "desc"] = Query(default="desc"),
+    authed: AuthedKey = Depends(require_api_key),
+) -> dict:
+    """Статусы многих jobs: `?ids=a,b,c` (порядок сохраняется) или список по `?status=`."""
+    if ids is None:
+        if status is None:
+            raise HTTPException(status_code=422, detail="Нужен `ids` или `status`")
+        return _list_jobs(status, limit, after, order, authed)
+
+    requested = [job_id.strip() for job_id in ids.split(",") if job_id.strip()]
+    max_ids = get_settings().jobs_status_max_ids
+    if len(requested) > max_ids:
+        raise HTTPException(status_code=413, detail=f"Не больше {max_ids} id за запрос")
+    parsed: dict[str, uuid.UUID | None] = {}
+    for job_id in requested:
+        try:
+            parsed[job_id] = uuid.UUID(job_id)
+        except ValueError:
+            parsed[job_id] = None
+    valid = list({job_uuid for job_uuid in parsed.values() if job_uuid is not None})
+    found = _load_jobs(valid, authed) if valid else {}
+    data: list[dict[str, Any]] = []
+    for job_id in requested:
+        job_uuid = parsed[job_id]
+        doc = found.get(str(job_uuid)) if job_uuid is not None else None
+        if doc is None:
+            doc = {"job_id": job_id, "error": {"status": 404, "message": "Задача не найдена"}}
+        data.append(doc)
+    return {"object": "list", "data": data}
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    wait: float = Query(default=0, ge=0),
+    authed: AuthedKey = Depends(require_api_key),
+) -> dict:
+    """Статус job; с `?wait=N` (long-poll) — как только статус сменится, но не позже N секунд."""
+    job_uuid = _job_uuid(job_id)
+    wait = min(wait, get_settings().jobs_wait_max_seconds)
+    if wait <= 0:
+        return await run_in_threadpool(_load_job, job_uuid, authed)
+
+    async with get_job_events().subscribe(str(job_uuid)) as events:
+        doc = await run_in_threadpool(_load_job, job_uuid, authed)
+        if doc["status"] in TERMINAL_STATUSES:
+            return doc
+        if await _next_status(events, doc["status"], wait) is None:
+            return doc
+    return await run_in_threadpool(_load_job, job_uuid, authed)
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(
+    job_id: str,
+    authed: AuthedKey = Depends(require_api_key),
+) -> StreamingResponse:
+    """SSE: текущий статус, затем каждая смена; поток закрывается на итоговом статусе."""
+    job_uuid = _job_uuid(job_id)
+    keepalive = get_settings().jobs_events_keepalive_seconds
+    # Сначала проверяем доступ: 404 должен прийти обычным ответом, а не внутри потока.
+    await run_in_threadpool(_load_job, job_uuid, authed)
+
+    async def stream() -> AsyncIterator[str]:
+        async with get_job_events().subscribe(str(job_uuid)) as events:
+            doc = await run_in_threadpool(_load_job, job_uuid, authed)
+            yield _sse("status", doc)
+            status = doc["status"]
+            while status not in TERMINAL_STATUSES:
+                new = await _next_status(events, status, keepalive)
+                if new is None:
+                    yield ": keepalive\n\n"
+                    continue
+                status = new
+                if status in TERMINAL_STATUSES:
+                    # Итог — полным документом (результат, ошибка), как в `GET /v1/jobs/{id}`.
+                    yield _sse("status", await run_in_threadpool(_load_job, job_uuid, authed))
+                else:
+                    yield _sse("status", {"job_id": str(job_uuid), "status": status})
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,85 +1,47 @@
-"""Models discovery (`/v1/models`) + кэш в Redis."""
+"""Models discovery (`/v1/models`): каталог из кэша (память → Redis), ETag / `If-None-Match`."""
 
-import json
 import time
 import uuid
 
 import structlog
-from fastapi import APIRouter, Depends, Header
+from fastapi import APIRouter, Header, Query, Response
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 
-from ai_gateway.auth.apikey import AuthedKey, require_api_key
+from ai_gateway.auth.apikey import Authed, AuthedKey
 from ai_gateway.db.models import RequestLog
 from ai_gateway.infrastructure.db import SessionLocal
 from ai_gateway.infrastructure.redis import get_redis
 from ai_gateway.metrics import request_latency_seconds, requests_total
-from ai_gateway.providers.factory import get_provider
 from ai_gateway.services.errors import error_payload, map_provider_exception
 from ai_gateway.services.limits import enforce_rpm_limit
-from ai_gateway.services.redaction import redact_result_summary, sha256_hex
+from ai_gateway.services.models_catalog import (
+    ModelsLookup,
+    ModelsUnavailableError,
+    configured_providers,
+    etag_matches,
+    get_models,
+    merge_catalogs,
+)
+from ai_gateway.services.redaction import redact_result_summary
 from ai_gateway.settings import get_settings
 
 router = APIRouter()
 log = structlog.get_logger()
 
 
-def _cache_key(provider: str, base_url: str | None) -> str:
-    suffix = sha256_hex(base_url) if base_url else "-"
-    return f"models:{provider}:{suffix}"
-
-
-@router.get("/models")
-def list_models(
-    x_provider: str | None = Header(default=None, alias="X-Provider"),
-    authed: AuthedKey = Depends(require_api_key),
-) -> dict:
-    settings = get_settings()
-    provider_name = x_provider or settings.default_provider
-
-    endpoint = "models"
-    r = get_redis()
-    enforce_rpm_limit(r, authed.api_key_id, endpoint, authed.rpm_limit)
-
-    cache_key = _cache_key(
-        provider_name,
-        settings.openai_base_url if provider_name == "openai" else None,
-    )
-    cached = r.get(cache_key)
-    if cached:
-        data = json.loads(cached)
-        data = dict(data)
-        data["meta"] = {"cached": True, "provider": provider_name}
-        return data
-
+def _log_upstream_call(
+    authed: AuthedKey,
+    provider_name: str,
+    status: str,
+    latency_ms: int,
+    data: dict,
+    err_code: str | None = None,
+    err_text: str | None = None,
+) -> str:
+    """RequestLog пишем только когда запрос сам сходил в upstream (холодный кэш)."""
     session: Session = SessionLocal()
     try:
-        t0 = time.time()
-        status = "failed"
-        http_status = 502
-        err_code = None
-        err_text = None
-        try:
-            provider = get_provider(provider_name)
-            data = provider.list_models()
-            status = "succeeded"
-            http_status = 200
-        except Exception as e:
-            pub = map_provider_exception(e)
-            log.warning(
-                "provider_error",
-                endpoint=endpoint,
-                provider=provider_name,
-                code=pub.code,
-                err=str(e),
-            )
-            data = error_payload(pub)
-            err_code = pub.code
-            err_text = str(e)
-            http_status = pub.status_code
-
-        latency_ms = int((time.time() - t0) * 1000)
-
         req = RequestLog(
             api_key_id=uuid.UUID(authed.api_key_id),
             kind="models",
@@ -94,25 +56,97 @@ def list_models(
             cost_rub=None,
             latency_ms=latency_ms,
             request_payload_redacted=None,
-            response_payload_redacted=(
-                redact_result_summary(data) if isinstance(data, dict) else None
-            ),
+            response_payload_redacted=redact_result_summary(data),
         )
         session.add(req)
         session.commit()
+        return str(req.id)
+    finally:
+        session.close()
 
-        requests_total.labels(endpoint=endpoint, provider=provider_name, status=status).inc()
-        request_latency_seconds.labels(endpoint=endpoint, provider=provider_name).observe(
-            time.time() - t0
-        )
 
-        data = dict(data) if isinstance(data, dict) else {"data": data}
-        data["meta"] = {"request_id": str(req.id), "provider": provider_name, "cached": False}
+@router.get("/models", response_model=None)
+def list_models(
+    response: Response,
+    all_providers: bool = Query(default=False, alias="all"),
+    x_provider: str | None = Header(default=None, alias="X-Provider"),
+    if_none_match: str | None = Header(default=None, alias="If-None-Match"),
+    authed: AuthedKey = Authed,
+) -> dict | Response:
+    settings = get_settings()
+    provider_name = x_provider or settings.default_provider
 
-        if status == "succeeded":
-            r.setex(cache_key, settings.models_cache_ttl_seconds, json.dumps(data))
-            return data
+    endpoint = "models"
+    enforce_rpm_limit(get_redis(), authed.api_key_id, endpoint, authed.rpm_limit)
 
-        return JSONResponse(status_code=http_status, content=data)
-    finally:
-        session.close()
+    names = configured_providers() if all_providers else [provider_name]
+    lookups: list[tuple[str, ModelsLookup]] = []
+    request_id = None
+    failed: JSONResponse | None = None
+    for name in names:
+        t0 = time.time()
+        try:
+            lookup = get_models(name)
+        except Exception as e:
+            pub = map_provider_exception(e)
+            log.warning(
+                "provider_error",
+                endpoint=endpoint,
+                provider=name,
+                code=pub.code,
+                err=str(e),
+            )
+            data = error_payload(pub)
+            req_id = None
+            # Ошибка из кэша (negative cache, каталог грузит другой процесс) или неизвестный
+            # провайдер — в upstream этот запрос не ходил, RequestLog не пишем.
+            if not isinstance(e, ModelsUnavailableError) and pub.code != "unknown_provider":
+                req_id = _log_upstream_call(
+                    authed,
+                    name,
+                    "failed",
+                    int((time.time() - t0) * 1000),
+                    data,
+                    pub.code,
+                    str(e),
+                )
+            requests_total.labels(endpoint=endpoint, provider=name, status="failed").inc()
+            data["meta"] = {"request_id": req_id, "provider": name, "cached": False}
+            failed = JSONResponse(status_code=pub.status_code, content=data)
+            # В общем каталоге недоступный провайдер просто пропускаем.
+            continue
+
+        if lookup.source == "upstream":
+            request_id = _log_upstream_call(
+                authed,
+                name,
+                "succeeded",
+                int((time.time() - t0) * 1000),
+                lookup.entry.data,
+            )
+        requests_total.labels(endpoint=endpoint, provider=name, status="succeeded").inc()
+        request_latency_seconds.labels(endpoint=endpoint, provider=name).observe(time.time() - t0)
+        lookups.append((name, lookup))
+
+    if not lookups and failed is not None:
+        return failed
+
+    if all_providers:
+        data, etag = merge_catalogs([(name, lookup.entry) for name, lookup in lookups])
+    else:
+        data, etag = dict(lookups[0][1].entry.data), lookups[0][1].entry.etag
+
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+
+    cached = all(lookup.source != "upstream" for _, lookup in lookups)
+    data["meta"] = {
+        "request_id": request_id,
+        "provider": "all" if all_providers else provider_name,
+        "providers": [name for name, _ in lookups],
+        "cached": cached,
+        "stale": any(lookup.stale for _, lookup in lookups),
+    }
+    return data
@@ -3,22 +3,35 @@
 import time
 import uuid
 
+import redis
 import structlog
-from fastapi import APIRouter, Depends, Header
+from fastapi import APIRouter, Depends, Header, Response
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 
-from ai_gateway.auth.apikey import AuthedKey, require_api_key
+from ai_gateway.auth.apikey import AuthedKey
 from ai_gateway.db.models import RequestLog
 from ai_gateway.infrastructure.db import SessionLocal
 from ai_gateway.infrastructure.redis import get_redis
-from ai_gateway.metrics import cost_rub_total, request_latency_seconds, requests_total, tokens_total
-from ai_gateway.providers.factory import get_provider
+from ai_gateway.metrics import (
+    cost_rub_total,
+    prompt_cache_savings_rub_total,
+    request_latency_seconds,
+    requests_total,
+    tokens_total,
+)
+from ai_gateway.providers.fallback import call_with_fallback
+from ai_gateway.services.admission import admit_request
 from ai_gateway.services.budgets import BudgetLimits, enforce_budgets
+from ai_gateway.services.concurrency import acquire_concurrency_slot
 from ai_gateway.services.errors import error_payload, map_provider_exception
-from ai_gateway.services.limits import enforce_rpm_limit
-from ai_gateway.services.pricing import calc_cost_rub, load_pricing
-from ai_gateway.services.redaction import redact_responses_payload, redact_result_summary
+from ai_gateway.services.idempotency import with_idempotency
+from ai_gateway.services.limits import TokenReservation, enforce_rpm_limit, enforce_tpm_limit
+from ai_gateway.services.pricing import cache_savings_rub, calc_cost_rub, load_pricing
+from ai_gateway.services.redaction import redact_result_summary
+from ai_gateway.services.spillover import spill_to_job, spillover_reason
+from ai_gateway.services.templates import ExpandedRequest, expand_request, redact_request
+from ai_gateway.services.tokens import estimate_request_tokens
 from ai_gateway.settings import get_settings
 
 router = APIRouter()
@@ -28,8 +41,11 @@ log = structlog.get_logger()
 @router.post("/responses")
 def responses(
     payload: dict,
+    response: Response,
     x_provider: str | None = Header(default=None, alias="X-Provider"),
-    authed: AuthedKey = Depends(require_api_key),
+    idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
+    prefer: str | None = Header(default=None, alias="Prefer"),
+    authed: AuthedKey = Depends(admit_request),
 ) -> dict:
     settings = get_settings()
     provider_name = x_provider or settings.default_provider
@@ -38,8 +54,46 @@ def responses(
     r = get_redis()
     enforce_rpm_limit(r, authed.api_key_id, endpoint, authed.rpm_limit)
 
+    request = expand_request(endpoint, payload)
+    reason = spillover_reason(endpoint, request.payload, prefer)
+    if reason is not None:
+        # Idempotency-Key становится ключом job: повтор вернёт ту же job.
+        return spill_to_job(authed, endpoint, provider_name, request, reason, idempotency_key)
+
+    return with_idempotency(
+        r,
+        authed.api_key_id,
+        endpoint,
+        idempotency_key,
+        {"provider": provider_name, "payload": payload},
+        lambda: _serve(r, request, response, provider_name, authed),
+        response,
+    )
+
+
+def _serve(
+    r: redis.Redis,
+    request: ExpandedRequest,
+    response: Response,
+    provider_name: str,
+    authed: AuthedKey,
+) -> dict | JSONResponse:
+    endpoint = "responses"
+    payload = request.payload
+    lease = acquire_concurrency_slot(r, authed.api_key_id, authed.max_concurrent)
+    response.headers.update(lease.headers())
+
+    tpm = TokenReservation(r=None)
+    used_tokens = 0
     session: Session = SessionLocal()
     try:
+        tpm = enforce_tpm_limit(
+            r,
+            authed.api_key_id,
+            str(payload.get("model") or ""),
+            estimate_request_tokens(endpoint, payload),
+            authed.tpm_limit,
+        )
         enforce_budgets(
             session,
             authed.api_key_id,
@@ -55,16 +109,29 @@ def responses(
         err_code = None
         err_text = None
         model = str(payload.get("model") or "")
+        served_provider = provider_name
+        served_model = model
+        fallback_hop = 0
 
         try:
-            provider = get_provider(provider_name)
-            res = provider.responses(payload)
+            served = call_with_fallback(
+                "responses",
+                provider_name,
+                payload,
+                affinity=request.affinity,
+            )
+            res = served.result
+            served_provider = served.provider
+            served_model = served.model
+            fallback_hop = served.hop
             status = "succeeded"
             http_status = 200
             resp_json = res.json
             prompt_tokens = res.prompt_tokens
             completion_tokens = res.completion_tokens
             total_tokens = res.total_tokens
+            cached_tokens = res.cached_tokens
+            used_tokens = total_tokens if total_tokens is not None else tpm.reserved
         except Exception as e:
             pub = map_provider_exception(e)
             log.warning(
@@ -81,54 +148,92 @@ def responses(
             prompt_tokens = None
             completion_tokens = None
             total_tokens = None
+            cached_tokens = None
 
         latency_ms = int((time.time() - t0) * 1000)
         pricing = load_pricing()
-        cost = calc_cost_rub(model, prompt_tokens, completion_tokens, pricing)
+        cost = calc_cost_rub(
+            served_model,
+            prompt_tokens,
+            completion_tokens,
+            pricing,
+            served_provider,
+            cached_tokens,
+        )
 
         req = RequestLog(
             api_key_id=uuid.UUID(authed.api_key_id),
             kind="responses",
-            provider=provider_name,
-            model=model,
+            provider=served_provider,
+            model=served_model,
             status=status,
             error_code=err_code,
             error_text=err_text,
             prompt_tokens=prompt_tokens,
             completion_tokens=completion_tokens,
             total_tokens=total_tokens,
+            cached_tokens=cached_tokens,
             cost_rub=cost,
             latency_ms=latency_ms,
-            request_payload_redacted=redact_responses_payload(payload),
+            request_payload_redacted=redact_request(endpoint, request.compact, request.template),
             response_payload_redacted=redact_result_summary(resp_json),
         )
         session.add(req)
         session.commit()
 
-        requests_total.labels(endpoint=endpoint, provider=provider_name, status=status).inc()
-        request_latency_seconds.labels(endpoint=endpoint, provider=provider_name).observe(
+        requests_total.labels(endpoint=endpoint, provider=served_provider, status=status).inc()
+        request_latency_seconds.labels(endpoint=endpoint, provider=served_provider).observe(
             time.time() - t0
         )
         if total_tokens is not None:
             tokens_total.labels(
-                provider=provider_name,
-                model=model or "-",
+                provider=served_provider,
+                model=served_model or "-",
                 kind="total",
             ).inc(total_tokens)
+        if prompt_tokens is not None:
+            # Доля prompt cache: cached / prompt.
+            tokens_total.labels(
+                provider=served_provider,
+                model=served_model or "-",
+                kind="prompt",
+            ).inc(prompt_tokens)
+        if cached_tokens:
+            tokens_total.labels(
+                provider=served_provider,
+                model=served_model or "-",
+                kind="cached",
+            ).inc(cached_tokens)
+            savings = cache_savings_rub(served_model, cached_tokens, pricing, served_provider)
+            if savings:
+                prompt_cache_savings_rub_total.labels(
+                    provider=served_provider,
+                    model=served_model or "-",
+                ).inc(float(savings))
         if cost is not None:
-            cost_rub_total.labels(provider=provider_name, model=model or "-").inc(float(cost))
+            cost_rub_total.labels(provider=served_provider, model=served_model or "-").inc(
+                float(cost)
+            )
 
         resp_json = dict(resp_json)
         resp_json["meta"] = {
             "request_id": str(req.id),
-            "provider": provider_name,
+            "provider": served_provider,
+            "model": served_model,
+            "fallback_hop": fallback_hop,
             "latency_ms": latency_ms,
             "cost_rub": float(cost) if cost is not None else None,
         }
 
         if status != "succeeded":
-            return JSONResponse(status_code=http_status, content=resp_json)
+            return JSONResponse(
+                status_code=http_status,
+                content=resp_json,
+                headers=lease.headers(),
+            )
 
         return resp_json
     finally:
+        tpm.settle(used_tokens)
         session.close()
+        lease.release()
@@ -1,17 +1,24 @@
 """Служебные эндпоинты: health/ready/metrics."""
 
+import structlog
 from fastapi import APIRouter, Response
+from fastapi.concurrency import run_in_threadpool
 from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
 from ai_gateway.infrastructure.health import check_readiness
+from ai_gateway.infrastructure.redis import get_redis
 from ai_gateway.metrics import registry
+from ai_gateway.queue.fair import refresh_depth_metrics
+from ai_gateway.settings import get_settings
+
+log = structlog.get_logger()
 
 router = APIRouter()
 
 
 @router.get("/healthz")
-def healthz() -> dict:
-    """Простой healthcheck: процесс жив."""
+async def healthz() -> dict:
+    """Простой healthcheck: процесс жив (async — не ждёт свободный тред из общего пула)."""
     return {"status": "ok"}
 
 
@@ -23,7 +30,13 @@ def readyz() -> dict:
 
 
 @router.get("/metrics")
-def metrics() -> Response:
+async def metrics() -> Response:
     """Prometheus метрики."""
+    if get_settings().job_fair_queuing:
+        try:
+            # Глубина очередей ключей — общая для всех процессов, читаем из Redis на scrape.
+            await run_in_threadpool(refresh_depth_metrics, get_redis())
+        except Exception as e:
+            log.warning("fair_queue_metrics_failed", err=str(e))
     data = generate_latest(registry)
     return Response(content=data, media_type=CONTENT_TYPE_LATEST)
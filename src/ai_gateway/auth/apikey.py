@@ -17,6 +17,9 @@ class AuthedKey:
     rpm_limit: int | None
     daily_budget_rub: Decimal | None
     monthly_budget_rub: Decimal | None
+    priority: str = "normal"
+    max_concurrent: int | None = None
+    tpm_limit: int | None = None
 
 
 def _parse_api_key(value: str) -> tuple[str | None, str]:
@@ -60,6 +63,9 @@ def require_api_key(x_api_key: str | None = Header(default=None, alias="X-API-Ke
                     rpm_limit=k.rpm_limit,
                     daily_budget_rub=k.daily_budget_rub,
                     monthly_budget_rub=k.monthly_budget_rub,
+                    priority=k.priority,
+                    max_concurrent=k.max_concurrent,
+                    tpm_limit=k.tpm_limit,
                 )
 
         # Legacy: старые ключи без `key_id` (там bcrypt от всего токена).
@@ -78,6 +84,9 @@ def require_api_key(x_api_key: str | None = Header(default=None, alias="X-API-Ke
                     rpm_limit=k.rpm_limit,
                     daily_budget_rub=k.daily_budget_rub,
                     monthly_budget_rub=k.monthly_budget_rub,
+                    priority=k.priority,
+                    max_concurrent=k.max_concurrent,
+                    tpm_limit=k.tpm_limit,
                 )
     finally:
         session.close()
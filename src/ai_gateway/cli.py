@@ -1,15 +1,18 @@
-"""CLI утилита (создание клиентских API ключей)."""
+"""CLI утилита (клиентские API ключи, шаблоны промптов, воркер очереди на Redis Streams)."""
 
 import argparse
+import json
 import secrets
 import sys
 import uuid
 
 import bcrypt
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
-from ai_gateway.db.models import ApiKey
+from ai_gateway.db.models import ApiKey, PromptTemplate
 from ai_gateway.infrastructure.db import SessionLocal
+from ai_gateway.services.templates import TemplateVersion, forget_latest
 
 
 def cmd_create_key(args: argparse.Namespace) -> int:
@@ -26,8 +29,11 @@ def cmd_create_key(args: argparse.Namespace) -> int:
             key_id=key_id,
             key_hash=key_hash,
             rpm_limit=args.rpm_limit,
+            max_concurrent=args.max_concurrent,
+            tpm_limit=args.tpm_limit,
             daily_budget_rub=args.daily_budget_rub,
             monthly_budget_rub=args.monthly_budget_rub,
+            priority=args.priority,
             is_active=True,
         )
         session.add(api_key)
@@ -42,6 +48,41 @@ def cmd_create_key(args: argparse.Namespace) -> int:
         session.close()
 
 
+def cmd_create_template(args: argparse.Namespace) -> int:
+    """Публикует новую версию шаблона промпта (старые версии не меняются)."""
+    with open(args.file, encoding="utf-8") as f:
+        body = json.load(f)
+
+    session: Session = SessionLocal()
+    try:
+        last = (
+            session.query(func.max(PromptTemplate.version))
+            .filter(PromptTemplate.name == args.name)
+            .scalar()
+        )
+        version = int(last or 0) + 1
+        # Проверяем, что тело компилируется, до записи в БД.
+        tpl = TemplateVersion(args.name, version, args.kind, body)
+        session.add(PromptTemplate(name=args.name, version=version, kind=args.kind, body=body))
+        session.commit()
+    finally:
+        session.close()
+
+    forget_latest(args.name)
+    print(f"Шаблон {args.name}@{version} создан.")
+    if tpl.variables:
+        print(f"Переменные: {', '.join(sorted(tpl.variables))}")
+    return 0
+
+
+def cmd_worker(args: argparse.Namespace) -> int:
+    """Воркер jobs и вебхуков на Redis Streams (`JOB_QUEUE=streams`), работает до SIGTERM."""
+    from ai_gateway.queue.stream_worker import run_worker
+
+    run_worker(args.concurrency)
+    return 0
+
+
 def main(argv: list[str] | None = None) -> int:
     """Точка входа CLI."""
     parser = argparse.ArgumentParser(prog="ai-gateway", description="AI Gateway: CLI")
@@ -55,6 +96,18 @@ def main(argv: list[str] | None = None) -> int:
         default=None,
         help="Лимит запросов в минуту (RPM)",
     )
+    p_create.add_argument(
+        "--max-concurrent",
+        type=int,
+        default=None,
+        help="Максимум одновременных запросов/jobs в работе",
+    )
+    p_create.add_argument(
+        "--tpm-limit",
+        type=int,
+        default=None,
+        help="Лимит токенов в минуту (TPM)",
+    )
     p_create.add_argument(
         "--daily-budget-rub",
         type=float,
@@ -67,8 +120,38 @@ def main(argv: list[str] | None = None) -> int:
         default=None,
         help="Месячный бюджет (RUB)",
     )
+    p_create.add_argument(
+        "--priority",
+        choices=["high", "normal", "low"],
+        default="normal",
+        help="Класс приоритета при перегрузке (low сбрасывается первым)",
+    )
     p_create.set_defaults(func=cmd_create_key)
 
+    p_tpl = sub.add_parser("create-template", help="Опубликовать новую версию шаблона промпта")
+    p_tpl.add_argument("--name", required=True, help="Имя шаблона (template_id)")
+    p_tpl.add_argument(
+        "--file",
+        required=True,
+        help="JSON с полями запроса (messages/input/instructions/tools/model, `{{var}}`)",
+    )
+    p_tpl.add_argument(
+        "--kind",
+        choices=["responses", "chat.completions"],
+        default=None,
+        help="Для какого эндпоинта шаблон (по умолчанию — для любого)",
+    )
+    p_tpl.set_defaults(func=cmd_create_template)
+
+    p_worker = sub.add_parser("worker", help="Запустить воркер очереди на Redis Streams")
+    p_worker.add_argument(
+        "--concurrency",
+        type=int,
+        default=None,
+        help="Сколько задач одновременно (по умолчанию JOB_ASYNC_CONCURRENCY)",
+    )
+    p_worker.set_defaults(func=cmd_worker)
+
     args = parser.parse_args(argv)
     return int(args.func(args))
 
@@ -37,8 +37,12 @@ class ApiKey(Base):
     is_active: Mapped[bool] = mapped_column(Boolean, nullable=False, default=True)
 
     rpm_limit: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    max_concurrent: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    tpm_limit: Mapped[int | None] = mapped_column(Integer, nullable=True)
     daily_budget_rub: Mapped[Decimal | None] = mapped_column(Numeric(12, 2), nullable=True)
     monthly_budget_rub: Mapped[Decimal | None] = mapped_column(Numeric(12, 2), nullable=True)
+    # high | normal | low: кого первым сбрасывать при перегрузке.
+    priority: Mapped[str] = mapped_column(String(20), nullable=False, default="normal")
 
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
@@ -70,6 +74,7 @@ class RequestLog(Base):
     prompt_tokens: Mapped[int | None] = mapped_column(Integer, nullable=True)
     completion_tokens: Mapped[int | None] = mapped_column(Integer, nullable=True)
     total_tokens: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    cached_tokens: Mapped[int | None] = mapped_column(Integer, nullable=True)
     cost_rub: Mapped[Decimal | None] = mapped_column(Numeric(12, 4), nullable=True)
 
     latency_ms: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
@@ -103,6 +108,23 @@ class Job(Base):
     provider: Mapped[str] = mapped_column(String(50), nullable=False)
     model: Mapped[str] = mapped_column(String(200), nullable=False, default="")
     status: Mapped[str] = mapped_column(String(20), nullable=False, default="queued")
+    # 0..9, выше — раньше среди jobs того же ключа (справедливая очередь, JOB_FAIR_QUEUING).
+    priority: Mapped[int] = mapped_column(Integer, nullable=False, default=5)
+    # Номер текущей попытки вызова и доставки вебхука: растут в том же UPDATE, что берёт job.
+    attempt_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    webhook_attempt_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # До какого момента job в `running` принадлежит воркеру (продлевается heartbeat'ом).
+    lease_expires_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True),
+        nullable=True,
+    )
+    # ORM-UPDATE строки job идёт с `WHERE attempt_count = <прочитанный>`: итог попытки, чей lease
+    # reaper уже отдал другой, не перезапишет job (StaleDataError). Счётчик меняют только UPDATE'ы
+    # claim/unclaim (`queue.execution`), поэтому генератор версий выключен.
+    __mapper_args__ = {
+        "version_id_col": attempt_count,
+        "version_id_generator": False,
+    }
 
     idempotency_key: Mapped[str | None] = mapped_column(String(200), nullable=True)
 
@@ -116,6 +138,14 @@ class Job(Base):
     error_code: Mapped[str | None] = mapped_column(String(100), nullable=True)
     error_text: Mapped[str | None] = mapped_column(Text, nullable=True)
 
+    # Job из `/v1/batches`: строка входного JSONL и её `custom_id`.
+    batch_id: Mapped[uuid.UUID | None] = mapped_column(
+        ForeignKey("batches.id"),
+        nullable=True,
+        index=True,
+    )
+    custom_id: Mapped[str | None] = mapped_column(String(200), nullable=True)
+
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
         nullable=False,
@@ -152,6 +182,73 @@ class JobAttempt(Base):
     job: Mapped[Job] = relationship(back_populates="attempts")
 
 
+class StoredFile(Base):
+    """Файл `/v1/files` (JSONL пачки или результаты); содержимое лежит на диске."""
+
+    __tablename__ = "files"
+
+    id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default=uuid.uuid4)
+    api_key_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("api_keys.id"), nullable=False)
+    purpose: Mapped[str] = mapped_column(String(50), nullable=False)  # batch | batch_output
+    filename: Mapped[str] = mapped_column(String(300), nullable=False)
+    bytes: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        nullable=False,
+        default=utcnow,
+    )
+
+
+class Batch(Base):
+    """Пачка `/v1/batches`: строки входного файла стали jobs с `batch_id`."""
+
+    __tablename__ = "batches"
+
+    id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default=uuid.uuid4)
+    api_key_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("api_keys.id"), nullable=False)
+    kind: Mapped[str] = mapped_column(String(50), nullable=False)  # responses | chat.completions
+    # in_progress | cancelling | cancelled | completed
+    status: Mapped[str] = mapped_column(String(20), nullable=False, default="in_progress")
+    input_file_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("files.id"), nullable=False)
+    output_file_id: Mapped[uuid.UUID | None] = mapped_column(
+        ForeignKey("files.id"),
+        nullable=True,
+    )
+    error_file_id: Mapped[uuid.UUID | None] = mapped_column(ForeignKey("files.id"), nullable=True)
+    # Итоговые счётчики; пока пачка идёт, актуальные — в Redis.
+    total: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    completed: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    failed: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    metadata_: Mapped[dict | None] = mapped_column("metadata", JSON, nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        nullable=False,
+        default=utcnow,
+    )
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+
+class PromptTemplate(Base):
+    __tablename__ = "prompt_templates"
+    __table_args__ = (
+        UniqueConstraint("name", "version", name="uq_prompt_templates_name_version"),
+    )
+
+    id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default=uuid.uuid4)
+    name: Mapped[str] = mapped_column(String(200), nullable=False)
+    version: Mapped[int] = mapped_column(Integer, nullable=False)
+    # responses | chat.completions | None (для любого эндпоинта)
+    kind: Mapped[str | None] = mapped_column(String(50), nullable=True)
+    body: Mapped[dict] = mapped_column(JSON, nullable=False)
+
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        nullable=False,
+        default=utcnow,
+    )
+
+
 class WebhookDelivery(Base):
     __tablename__ = "webhook_deliveries"
 
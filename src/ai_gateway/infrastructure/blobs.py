@@ -0,0 +1,130 @@
+"""Хранилища blob'ов с TTL (payload'ы jobs, тела вебхуков): Redis или локальный диск."""
+
+from __future__ import annotations
+
+import contextlib
+import os
+import tempfile
+import threading
+import time
+from typing import Protocol
+
+import redis
+
+from ai_gateway.settings import get_settings
+
+
+class BlobStore(Protocol):
+    def put(self, key: str, data: bytes, ttl_seconds: int) -> None: ...
+
+    def put_many(self, items: list[tuple[str, bytes]], ttl_seconds: int) -> None: ...
+
+    def get(self, key: str) -> bytes | None: ...
+
+    def delete(self, key: str) -> None: ...
+
+
+class RedisBlobStore:
+    """Blob — обычный ключ Redis с EXPIRE (бинарный клиент, без decode_responses)."""
+
+    def __init__(self, r: redis.Redis, prefix: str = "blob:") -> None:
+        self._r = r
+        self._prefix = prefix
+
+    def put(self, key: str, data: bytes, ttl_seconds: int) -> None:
+        self._r.set(self._prefix + key, data, ex=ttl_seconds)
+
+    def put_many(self, items: list[tuple[str, bytes]], ttl_seconds: int) -> None:
+        # Один round-trip на пачку (bulk-создание jobs).
+        pipe = self._r.pipeline(transaction=False)
+        for key, data in items:
+            pipe.set(self._prefix + key, data, ex=ttl_seconds)
+        pipe.execute()
+
+    def get(self, key: str) -> bytes | None:
+        data = self._r.get(self._prefix + key)
+        return bytes(data) if data is not None else None
+
+    def delete(self, key: str) -> None:
+        self._r.delete(self._prefix + key)
+
+
+class DiskBlobStore:
+    """Файл на blob; срок годности — в mtime. Каталог должен быть общим у API и воркеров."""
+
+    # Просроченные файлы удаляем не чаще раза в минуту, попутно с записью.
+    _SWEEP_EVERY_SECONDS = 60.0
+
+    def __init__(self, root: str) -> None:
+        self._root = root
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+
+    def _path(self, key: str) -> str:
+        if not key or "/" in key or key.startswith("."):
+            raise ValueError(f"bad blob key: {key!r}")
+        return os.path.join(self._root, key)
+
+    def put(self, key: str, data: bytes, ttl_seconds: int) -> None:
+        path = self._path(key)
+        fd, tmp = tempfile.mkstemp(dir=self._root, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            expires = time.time() + ttl_seconds
+            os.utime(tmp, (expires, expires))
+            os.replace(tmp, path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(tmp)
+            raise
+        self._maybe_sweep()
+
+    def put_many(self, items: list[tuple[str, bytes]], ttl_seconds: int) -> None:
+        for key, data in items:
+            self.put(key, data, ttl_seconds)
+
+    def get(self, key: str) -> bytes | None:
+        path = self._path(key)
+        try:
+            if os.stat(path).st_mtime < time.time():
+                self.delete(key)
+                return None
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def delete(self, key: str) -> None:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self._path(key))
+
+    def _maybe_sweep(self) -> None:
+        now = time.time()
+        with self._lock:
+            if now < self._next_sweep:
+                return
+            self._next_sweep = now + self._SWEEP_EVERY_SECONDS
+        with os.scandir(self._root) as it:
+            for entry in it:
+                with contextlib.suppress(FileNotFoundError):
+                    if not entry.name.startswith(".") and entry.stat().st_mtime < now:
+                        os.unlink(entry.path)
+
+
+_store: BlobStore | None = None
+_lock = threading.Lock()
+
+
+def get_blob_store() -> BlobStore:
+    """Хранилище по `JOB_BLOB_STORE` (один экземпляр на процесс)."""
+    global _store
+    with _lock:
+        if _store is None:
+            settings = get_settings()
+            if settings.job_blob_store == "disk":
+                _store = DiskBlobStore(settings.job_blob_dir)
+            else:
+                _store = RedisBlobStore(redis.Redis.from_url(settings.redis_url))
+        return _store
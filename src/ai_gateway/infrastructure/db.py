@@ -1,6 +1,9 @@
 """Подключение к БД и фабрика сессий SQLAlchemy."""
 
+import threading
+
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from ai_gateway.settings import get_settings
@@ -14,3 +17,28 @@ def create_session_factory() -> sessionmaker:
 
 
 SessionLocal = create_session_factory()
+
+_async_factory: async_sessionmaker[AsyncSession] | None = None
+_async_lock = threading.Lock()
+
+
+def get_async_session_factory() -> async_sessionmaker[AsyncSession]:
+    """Async-сессии (psycopg 3) для воркера на event loop; engine создаётся при первом вызове.
+
+    `expire_on_commit=False`: объекты после commit читаются без похода в БД.
+    """
+    global _async_factory
+    with _async_lock:
+        if _async_factory is None:
+            settings = get_settings()
+            engine = create_async_engine(
+                settings.database_url,
+                pool_pre_ping=True,
+                pool_size=settings.job_async_db_pool_size,
+            )
+            _async_factory = async_sessionmaker(
+                bind=engine,
+                autoflush=False,
+                expire_on_commit=False,
+            )
+        return _async_factory
@@ -0,0 +1,299 @@
+"""Общие HTTP-клиенты: пул соединений, keepalive, HTTP/2 и кэш DNS."""
+
+from __future__ import annotations
+
+import socket
+import ssl
+import threading
+import time
+from collections.abc import Iterable
+from typing import Any
+
+import httpcore
+import httpx
+import structlog
+
+from ai_gateway.metrics import http_client_requests_total, http_pool_wait_seconds
+from ai_gateway.settings import get_settings
+
+log = structlog.get_logger()
+
+
+class DnsCache:
+    """TTL-кэш `getaddrinfo` (общий для upstream'ов и вебхуков одного процесса)."""
+
+    def __init__(self, ttl_seconds: float) -> None:
+        self.ttl_seconds = ttl_seconds
+        self._entries: dict[tuple[str, int], tuple[float, list[str]]] = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, host: str, port: int) -> list[str]:
+        try:
+            socket.inet_pton(socket.AF_INET6 if ":" in host else socket.AF_INET, host)
+            return [host]  # уже IP
+        except OSError:
+            pass
+
+        now = time.monotonic()
+        with self._lock:
+            hit = self._entries.get((host, port))
+        if hit is not None and hit[0] > now:
+            return hit[1]
+
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        addrs = list(dict.fromkeys(str(info[4][0]) for info in infos))
+        with self._lock:
+            self._entries[(host, port)] = (now + self.ttl_seconds, addrs)
+        return addrs
+
+    def forget(self, host: str, port: int) -> None:
+        with self._lock:
+            self._entries.pop((host, port), None)
+
+
+class _CachingBackend(httpcore.NetworkBackend):
+    """Sync backend httpcore, который резолвит хост через `DnsCache` (SNI остаётся по имени)."""
+
+    def __init__(self, dns: DnsCache) -> None:
+        self._inner = httpcore.SyncBackend()
+        self._dns = dns
+
+    def connect_tcp(
+        self,
+        host: str,
+        port: int,
+        timeout: float | None = None,
+        local_address: str | None = None,
+        socket_options: Iterable[Any] | None = None,
+    ) -> httpcore.NetworkStream:
+        try:
+            addrs = self._dns.resolve(host, port)
+        except OSError as e:
+            raise httpcore.ConnectError(str(e)) from e
+
+        last_exc: Exception | None = None
+        for addr in addrs:
+            try:
+                return self._inner.connect_tcp(addr, port, timeout, local_address, socket_options)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                last_exc = e
+        # Ни один адрес не ответил — возможно, запись устарела.
+        self._dns.forget(host, port)
+        assert last_exc is not None
+        raise last_exc
+
+    def connect_unix_socket(
+        self,
+        path: str,
+        timeout: float | None = None,
+        socket_options: Iterable[Any] | None = None,
+    ) -> httpcore.NetworkStream:
+        return self._inner.connect_unix_socket(path, timeout, socket_options)
+
+    def sleep(self, seconds: float) -> None:
+        self._inner.sleep(seconds)
+
+
+class InstrumentedTransport(httpx.HTTPTransport):
+    """HTTPTransport с кэшем DNS и метриками переиспользования соединений/ожидания пула."""
+
+    def __init__(
+        self,
+        client_name: str,
+        *,
+        limits: httpx.Limits,
+        http2: bool = False,
+        verify: ssl.SSLContext | bool = True,
+        dns: DnsCache | None = None,
+    ) -> None:
+        super().__init__(verify=verify, http2=http2, limits=limits)
+        self.client_name = client_name
+        if dns is not None:
+            # Публичного способа передать network_backend через httpx нет — собираем пул сами.
+            self._pool = httpcore.ConnectionPool(
+                ssl_context=httpx.create_ssl_context(verify=verify),
+                max_connections=limits.max_connections,
+                max_keepalive_connections=limits.max_keepalive_connections,
+                keepalive_expiry=limits.keepalive_expiry,
+                http1=True,
+                http2=http2,
+                network_backend=_CachingBackend(dns),
+            )
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        marks: dict[str, float] = {}
+        outer = request.extensions.get("trace")
+
+        def trace(event: str, info: dict[str, Any]) -> None:
+            marks.setdefault(event, time.perf_counter())
+            if outer is not None:
+                outer(event, info)
+
+        request.extensions["trace"] = trace
+        t0 = time.perf_counter()
+        try:
+            return super().handle_request(request)
+        finally:
+            _observe(self.client_name, t0, marks)
+
+
+class InstrumentedAsyncTransport(httpx.AsyncHTTPTransport):
+    """Async-вариант для воркера на event loop: те же метрики (DNS резолвит сам asyncio)."""
+
+    def __init__(
+        self,
+        client_name: str,
+        *,
+        limits: httpx.Limits,
+        http2: bool = False,
+        verify: ssl.SSLContext | bool = True,
+    ) -> None:
+        super().__init__(verify=verify, http2=http2, limits=limits)
+        self.client_name = client_name
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        marks: dict[str, float] = {}
+        outer = request.extensions.get("trace")
+
+        async def trace(event: str, info: dict[str, Any]) -> None:
+            marks.setdefault(event, time.perf_counter())
+            if outer is not None:
+                await outer(event, info)
+
+        request.extensions["trace"] = trace
+        t0 = time.perf_counter()
+        try:
+            return await super().handle_async_request(request)
+        finally:
+            _observe(self.client_name, t0, marks)
+
+
+def _observe(client_name: str, t0: float, marks: dict[str, float]) -> None:
+    sent = marks.get("http11.send_request_headers.started") or marks.get(
+        "http2.send_request_headers.started"
+    )
+    if sent is None:
+        return  # запрос не ушёл (ошибка соединения)
+
+    reused = "connection.connect_tcp.started" not in marks
+    connect = 0.0
+    for step in ("connect_tcp", "start_tls"):
+        started = marks.get(f"connection.{step}.started")
+        complete = marks.get(f"connection.{step}.complete")
+        if started is not None and complete is not None:
+            connect += complete - started
+
+    http_client_requests_total.labels(
+        client=client_name,
+        connection="reused" if reused else "new",
+    ).inc()
+    http_pool_wait_seconds.labels(client=client_name).observe(max(0.0, sent - t0 - connect))
+
+
+_dns_cache: DnsCache | None = None
+_webhook_client: httpx.Client | None = None
+_lock = threading.Lock()
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _shared_dns() -> DnsCache | None:
+    global _dns_cache
+    ttl = get_settings().dns_cache_ttl_seconds
+    if ttl <= 0:
+        return None
+    with _lock:
+        if _dns_cache is None:
+            _dns_cache = DnsCache(ttl)
+        return _dns_cache
+
+
+def _pool_settings(client_name: str, shards: int = 1) -> tuple[httpx.Limits, bool]:
+    settings = get_settings()
+    http2 = settings.http2_enabled
+    if http2 and not _http2_available():
+        log.warning("http2_unavailable", client=client_name, hint="pip install 'httpx[http2]'")
+        http2 = False
+
+    limits = httpx.Limits(
+        max_connections=max(1, -(-settings.http_max_connections // shards)),
+        max_keepalive_connections=-(-settings.http_max_keepalive_connections // shards),
+        keepalive_expiry=settings.http_keepalive_expiry_seconds,
+    )
+    return limits, http2
+
+
+def build_client(
+    client_name: str,
+    timeout: float,
+    *,
+    verify: ssl.SSLContext | bool = True,
+) -> httpx.Client:
+    """`httpx.Client` с настройками пула/keepalive/HTTP2 из settings и общим кэшем DNS."""
+    settings = get_settings()
+    limits, http2 = _pool_settings(client_name)
+    transport = InstrumentedTransport(
+        client_name,
+        limits=limits,
+        http2=http2,
+        verify=verify,
+        dns=_shared_dns(),
+    )
+    return httpx.Client(
+        timeout=httpx.Timeout(timeout, pool=settings.http_pool_timeout_seconds),
+        transport=transport,
+    )
+
+
+# Пул httpcore на каждое событие перебирает все соединения × ожидающие запросы: на сотнях
+# одновременных вызовов это съедает CPU event loop. Поэтому async-пул режем на шарды.
+_ASYNC_POOL_SHARD = 16
+
+
+def build_async_clients(
+    client_name: str,
+    timeout: float,
+    *,
+    verify: ssl.SSLContext | bool = True,
+) -> list[httpx.AsyncClient]:
+    """`httpx.AsyncClient`'ы с настройками пула из settings, поделёнными на шарды.
+
+    Вместе шарды держат не больше `HTTP_MAX_CONNECTIONS`; клиенты привязаны к своему loop.
+    """
+    settings = get_settings()
+    shards = max(1, -(-settings.http_max_connections // _ASYNC_POOL_SHARD))
+    limits, http2 = _pool_settings(client_name, shards)
+    return [
+        httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout, pool=settings.http_pool_timeout_seconds),
+            transport=InstrumentedAsyncTransport(
+                client_name,
+                limits=limits,
+                http2=http2,
+                verify=verify,
+            ),
+        )
+        for _ in range(shards)
+    ]
+
+
+def get_webhook_client() -> httpx.Client:
+    """Общий клиент для доставки вебхуков (одно соединение на хост вместо TCP+TLS на запрос)."""
+    global _webhook_client
+    with _lock:
+        client = _webhook_client
+    if client is None:
+        client = build_client("webhooks", get_settings().webhook_timeout_seconds)
+        with _lock:
+            if _webhook_client is None:
+                _webhook_client = client
+            else:
+                client.close()
+                client = _webhook_client
+    return client
@@ -1,6 +1,7 @@
 """Подключение к Redis."""
 
 import redis
+import redis.asyncio
 
 from ai_gateway.settings import get_settings
 
@@ -9,3 +10,9 @@ def get_redis() -> redis.Redis:
     """Возвращает клиент Redis (decode_responses=True)."""
     settings = get_settings()
     return redis.Redis.from_url(settings.redis_url, decode_responses=True)
+
+
+def get_async_redis() -> redis.asyncio.Redis:
+    """Async-клиент Redis для event loop воркера (decode_responses=True)."""
+    settings = get_settings()
+    return redis.asyncio.Redis.from_url(settings.redis_url, decode_responses=True)
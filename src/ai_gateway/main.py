@@ -1,5 +1,9 @@
 """FastAPI приложение (роутеры + логирование)."""
 
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+import anyio.to_thread
 from fastapi import FastAPI
 
 from ai_gateway import __version__
@@ -7,13 +11,26 @@ from ai_gateway.api.dashboard import router as dashboard_router
 from ai_gateway.api.v1 import router as v1_router
 from ai_gateway.api.well_known import router as well_known_router
 from ai_gateway.infrastructure.logging import configure_logging
+from ai_gateway.services.payloads import check_codecs
+from ai_gateway.services.pricing import install_sighup_reload
+from ai_gateway.settings import get_settings
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Старт/стоп приложения: размер threadpool для sync-эндпоинтов, SIGHUP → перечитать цены."""
+    check_codecs()
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = get_settings().sync_threadpool_size
+    install_sighup_reload()
+    yield
 
 
 def create_app() -> FastAPI:
     """Собирает FastAPI приложение."""
     configure_logging()
 
-    app = FastAPI(title="AI Gateway", version=__version__)
+    app = FastAPI(title="AI Gateway", version=__version__, lifespan=lifespan)
 
     app.include_router(well_known_router)
     app.include_router(v1_router, prefix="/v1")
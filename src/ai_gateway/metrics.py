@@ -1,6 +1,6 @@
 """Метрики Prometheus (локальный registry)."""
 
-from prometheus_client import CollectorRegistry, Counter, Histogram
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
 
 registry = CollectorRegistry()
 
@@ -45,3 +45,235 @@ cost_rub_total = Counter(
     ["provider", "model"],
     registry=registry,
 )
+
+fallbacks_total = Counter(
+    "fallbacks_total",
+    "Fallback hops taken after a provider error",
+    ["from_provider", "to_provider", "trigger"],
+    registry=registry,
+)
+
+upstream_key_headroom = Gauge(
+    "upstream_key_headroom",
+    "Remaining share of upstream key quota (min of requests/tokens)",
+    ["upstream", "key"],
+    registry=registry,
+)
+
+upstream_key_cooldowns_total = Counter(
+    "upstream_key_cooldowns_total",
+    "Upstream keys put on cooldown after exhausting quota",
+    ["upstream", "key"],
+    registry=registry,
+)
+
+upstream_queue_depth = Gauge(
+    "upstream_queue_depth",
+    "Requests waiting for an upstream pacing slot",
+    ["upstream", "priority"],
+    registry=registry,
+)
+
+upstream_queue_wait_seconds = Histogram(
+    "upstream_queue_wait_seconds",
+    "Time spent waiting for an upstream pacing slot",
+    ["upstream", "priority"],
+    registry=registry,
+)
+
+upstream_pacing_rejected_total = Counter(
+    "upstream_pacing_rejected_total",
+    "Requests rejected because the pacing slot would miss their deadline",
+    ["upstream", "priority"],
+    registry=registry,
+)
+
+upstream_pacing_rate = Gauge(
+    "upstream_pacing_rate",
+    "Current paced request rate per upstream (req/s)",
+    ["upstream"],
+    registry=registry,
+)
+
+http_client_requests_total = Counter(
+    "http_client_requests_total",
+    "Outgoing HTTP requests by connection reuse",
+    ["client", "connection"],
+    registry=registry,
+)
+
+http_pool_wait_seconds = Histogram(
+    "http_pool_wait_seconds",
+    "Time spent waiting for a free connection in the HTTP pool",
+    ["client"],
+    registry=registry,
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+
+bulkhead_in_flight = Gauge(
+    "bulkhead_in_flight",
+    "Calls currently holding a bulkhead slot",
+    ["bulkhead"],
+    registry=registry,
+)
+
+bulkhead_queued = Gauge(
+    "bulkhead_queued",
+    "Calls waiting for a bulkhead slot",
+    ["bulkhead"],
+    registry=registry,
+)
+
+bulkhead_limit = Gauge(
+    "bulkhead_limit",
+    "Configured bulkhead concurrency limit",
+    ["bulkhead"],
+    registry=registry,
+)
+
+bulkhead_rejected_total = Counter(
+    "bulkhead_rejected_total",
+    "Calls rejected by a saturated bulkhead",
+    ["bulkhead", "reason"],
+    registry=registry,
+)
+
+edge_concurrency_limit = Gauge(
+    "edge_concurrency_limit",
+    "Current adaptive concurrency limit at the gateway edge",
+    registry=registry,
+)
+
+edge_in_flight = Gauge(
+    "edge_in_flight",
+    "Requests currently admitted by the edge limiter",
+    registry=registry,
+)
+
+edge_shed_total = Counter(
+    "edge_shed_total",
+    "Requests shed by the edge limiter",
+    ["priority"],
+    registry=registry,
+)
+
+models_catalog_lookups_total = Counter(
+    "models_catalog_lookups_total",
+    "Models catalog lookups by the tier that served them",
+    ["source"],
+    registry=registry,
+)
+
+models_catalog_refresh_total = Counter(
+    "models_catalog_refresh_total",
+    "Upstream /v1/models refreshes",
+    ["provider", "status"],
+    registry=registry,
+)
+
+spillover_total = Counter(
+    "spillover_total",
+    "Sync requests moved to the job queue",
+    ["endpoint", "reason"],
+    registry=registry,
+)
+
+prompt_cache_savings_rub_total = Counter(
+    "prompt_cache_savings_rub_total",
+    "Estimated savings from provider-side prompt caching (RUB)",
+    ["provider", "model"],
+    registry=registry,
+)
+
+template_lookups_total = Counter(
+    "template_lookups_total",
+    "Prompt template lookups by the tier that served them",
+    ["source"],
+    registry=registry,
+)
+
+job_engine_in_flight = Gauge(
+    "job_engine_in_flight",
+    "Jobs running concurrently on the async worker event loop",
+    registry=registry,
+)
+
+job_engine_admission_wait_seconds = Histogram(
+    "job_engine_admission_wait_seconds",
+    "Time a job waited for a free async worker slot",
+    registry=registry,
+)
+
+payload_blob_bytes_total = Counter(
+    "payload_blob_bytes_total",
+    "Bytes of job payloads/webhook bodies moved to the blob store (raw JSON vs stored)",
+    ["stage"],
+    registry=registry,
+)
+
+job_stream_reclaimed_total = Counter(
+    "job_stream_reclaimed_total",
+    "Stream entries taken over from consumers that stopped acking them",
+    registry=registry,
+)
+
+job_stream_dead_letters_total = Counter(
+    "job_stream_dead_letters_total",
+    "Stream entries dropped after too many deliveries without ack",
+    ["type"],
+    registry=registry,
+)
+
+batch_items_total = Counter(
+    "batch_items_total",
+    "Batch API requests by outcome (cancelled are also counted as failed in batch progress)",
+    ["status"],
+    registry=registry,
+)
+
+job_fair_queue_depth = Gauge(
+    "job_fair_queue_depth",
+    "Jobs waiting in the per-key fair queue (refreshed on scrape)",
+    ["api_key_id"],
+    registry=registry,
+)
+
+job_fair_wait_seconds = Histogram(
+    "job_fair_wait_seconds",
+    "Time a job waited in the per-key fair queue before going to the broker",
+    ["api_key_id"],
+    buckets=(0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600, 14400),
+    registry=registry,
+)
+
+job_status_waiters = Gauge(
+    "job_status_waiters",
+    "Clients waiting for a job status change (long-poll and SSE)",
+    registry=registry,
+)
+
+job_status_cache_total = Counter(
+    "job_status_cache_total",
+    "Job status reads served from the Redis cache (hit) or Postgres (miss)",
+    ["result"],
+    registry=registry,
+)
+
+job_stuck_running = Gauge(
+    "job_stuck_running",
+    "Running jobs with an expired lease found by the last reaper pass",
+    registry=registry,
+)
+
+job_lease_reclaimed_total = Counter(
+    "job_lease_reclaimed_total",
+    "Jobs with an expired lease taken back by the reaper",
+    ["action"],  # requeued | failed
+    registry=registry,
+)
+
+job_lease_lost_total = Counter(
+    "job_lease_lost_total",
+    "Job results dropped because the worker's lease had been reclaimed meanwhile",
+    registry=registry,
+)
@@ -0,0 +1,98 @@
+"""Prefix affinity: запросы с одинаковым началом промпта идут на тот же upstream и ключ.
+
+Провайдеры кэшируют префикс промпта (скидка и меньше задержка), но только в пределах
+своего backend'а/ключа. Ключ affinity — хэш стабильного префикса (system + tools + первые
+сообщения), выбор цели — rendezvous hashing (HRW): при добавлении/удалении цели переезжает
+только её доля префиксов, а порядок остальных целей служит готовым порядком fallback.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import random
+import time
+from typing import Any
+
+import redis
+import structlog
+
+from ai_gateway.infrastructure.redis import get_redis
+from ai_gateway.services.tokens import payload_messages
+from ai_gateway.settings import get_settings
+
+log = structlog.get_logger()
+
+_LEADING_ROLES = {"system", "developer"}
+
+# Свои отметки «нездоров» держим и в памяти: действуют сразу, даже если Redis недоступен.
+_local_unhealthy: dict[str, float] = {}
+
+
+def prefix_key(kind: str, payload: dict[str, Any]) -> str | None:
+    """Хэш стабильного префикса запроса; `None` — префикс слишком короткий, чтобы кэшироваться."""
+    settings = get_settings()
+    if not settings.affinity_enabled:
+        return None
+
+    messages = payload_messages(kind, payload)
+    lead = 0
+    while lead < len(messages) and messages[lead].get("role") in _LEADING_ROLES:
+        lead += 1
+    prefix = {
+        "model": payload.get("model"),
+        "tools": payload.get("tools"),
+        "messages": messages[: lead + settings.affinity_prefix_messages],
+    }
+    body = json.dumps(prefix, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    if len(body) < settings.affinity_min_prefix_chars:
+        return None
+    return hashlib.blake2b(body.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _weight(key: str, member: str) -> int:
+    digest = hashlib.blake2b(f"{key}\x00{member}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def rank(key: str, members: list[str]) -> list[str]:
+    """Цели в порядке предпочтения для ключа (HRW): первая — «домашняя» для префикса."""
+    return sorted(members, key=lambda m: _weight(key, m), reverse=True)
+
+
+def _unhealthy_key(upstream: str) -> str:
+    return f"uh:{upstream}"
+
+
+def mark_unhealthy(upstream: str) -> None:
+    """Upstream только что упал по trigger'у fallback: на время уводим с него affinity-трафик."""
+    ttl = get_settings().affinity_unhealthy_seconds
+    if ttl <= 0:
+        return
+    _local_unhealthy[upstream] = time.monotonic() + ttl
+    try:
+        get_redis().set(_unhealthy_key(upstream), "1", ex=max(1, int(ttl)))
+    except redis.RedisError as e:
+        log.warning("affinity_redis_error", upstream=upstream, err=str(e))
+
+
+def healthy(members: list[str]) -> set[str]:
+    """Какие из целей сейчас не помечены нездоровыми."""
+    now = time.monotonic()
+    ok = {m for m in members if _local_unhealthy.get(m, 0.0) <= now}
+    if not ok:
+        return ok
+    try:
+        flags = get_redis().mget([_unhealthy_key(m) for m in sorted(ok)])
+    except redis.RedisError:
+        return ok
+    return {m for m, flag in zip(sorted(ok), flags, strict=True) if not flag}
+
+
+def order_members(key: str | None, members: list[str]) -> list[str]:
+    """Порядок обхода группы: по HRW для префикса (без ключа — случайный), здоровые первыми."""
+    ordered = rank(key, members) if key else random.sample(members, len(members))
+    if len(ordered) < 2:
+        return ordered
+    ok = healthy(ordered)
+    return [m for m in ordered if m in ok] + [m for m in ordered if m not in ok]
@@ -2,6 +2,7 @@
 
 from __future__ import annotations
 
+import asyncio
 from dataclasses import dataclass
 
 
@@ -13,6 +14,12 @@ class ProviderResult:
     prompt_tokens: int | None = None
     completion_tokens: int | None = None
     total_tokens: int | None = None
+    # Сколько входных токенов провайдер взял из своего prompt cache.
+    cached_tokens: int | None = None
+
+
+class UpstreamBusyError(RuntimeError):
+    """Upstream занят: запрос не дождался слота pacing до своего дедлайна."""
 
 
 class ProviderClient:
@@ -28,3 +35,10 @@ class ProviderClient:
 
     def list_models(self) -> dict:
         raise NotImplementedError
+
+    # Async-варианты для воркера на event loop. По умолчанию — sync-вызов в треде пула.
+    async def aresponses(self, payload: dict) -> ProviderResult:
+        return await asyncio.to_thread(self.responses, payload)
+
+    async def achat_completions(self, payload: dict) -> ProviderResult:
+        return await asyncio.to_thread(self.chat_completions, payload)
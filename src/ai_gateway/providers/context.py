@@ -0,0 +1,58 @@
+"""Контекст вызова провайдера (приоритет, prefix affinity), без протаскивания через сигнатуры."""
+
+from __future__ import annotations
+
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+PRIORITY_SYNC = "sync"
+PRIORITY_JOBS = "jobs"
+
+_priority: ContextVar[str] = ContextVar("provider_call_priority", default=PRIORITY_SYNC)
+_affinity: ContextVar[str | None] = ContextVar("provider_call_affinity", default=None)
+# Задержки вызовов upstream за запрос — для адаптивного лимита на входе (`services.admission`).
+_upstream_rtts: ContextVar[list[float] | None] = ContextVar("upstream_rtts", default=None)
+
+
+def current_priority() -> str:
+    """Приоритет текущего вызова: `sync` (по умолчанию) или `jobs`."""
+    return _priority.get()
+
+
+@contextmanager
+def call_priority(value: str) -> Iterator[None]:
+    """Выставляет приоритет для вызовов провайдера внутри блока."""
+    token = _priority.set(value)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_affinity() -> str | None:
+    """Хэш префикса промпта текущего вызова (для выбора ключа upstream), если есть."""
+    return _affinity.get()
+
+
+@contextmanager
+def call_affinity(value: str | None) -> Iterator[None]:
+    """Выставляет affinity-ключ для вызовов провайдера внутри блока."""
+    token = _affinity.set(value)
+    try:
+        yield
+    finally:
+        _affinity.reset(token)
+
+
+def collect_upstream_rtts() -> list[float]:
+    """Начинает сбор задержек upstream в текущем контексте (и в тредах, куда он скопирован)."""
+    rtts: list[float] = []
+    _upstream_rtts.set(rtts)
+    return rtts
+
+
+def record_upstream_rtt(seconds: float) -> None:
+    rtts = _upstream_rtts.get()
+    if rtts is not None:
+        rtts.append(seconds)
@@ -3,12 +3,13 @@
 from ai_gateway.providers.base import ProviderClient
 from ai_gateway.providers.mock import MockProvider
 from ai_gateway.providers.openai_compat import OpenAICompatibleProvider
+from ai_gateway.settings import get_settings
 
 _cache: dict[str, ProviderClient] = {}
 
 
 def get_provider(name: str) -> ProviderClient:
-    """Возвращает провайдера по имени (`mock`, `openai`)."""
+    """Возвращает провайдера по имени (`mock`, `openai` или ключ из `UPSTREAMS`)."""
     cached = _cache.get(name)
     if cached is not None:
         return cached
@@ -21,4 +22,9 @@ def get_provider(name: str) -> ProviderClient:
         p = OpenAICompatibleProvider()
         _cache[name] = p
         return p
+    upstream = get_settings().upstreams.get(name)
+    if upstream is not None:
+        p = OpenAICompatibleProvider(name, upstream)
+        _cache[name] = p
+        return p
     raise ValueError(f"Unknown provider: {name}")
@@ -0,0 +1,212 @@
+"""Fallback-цепочки: при 429/5xx/таймауте переходим на следующий upstream или модель."""
+
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import Any
+
+import httpx
+import structlog
+
+from ai_gateway.metrics import fallbacks_total
+from ai_gateway.providers.affinity import mark_unhealthy, order_members, prefix_key
+from ai_gateway.providers.base import ProviderResult
+from ai_gateway.providers.context import call_affinity, record_upstream_rtt
+from ai_gateway.providers.factory import get_provider
+from ai_gateway.services.bulkhead import aprovider_bulkhead, provider_bulkhead
+from ai_gateway.services.errors import map_provider_exception
+from ai_gateway.settings import get_settings
+
+log = structlog.get_logger()
+
+
+@dataclass(frozen=True)
+class Hop:
+    """Один шаг цепочки: куда идём и на какие ошибки переходим сюда с прошлого шага."""
+
+    provider: str
+    model: str
+    triggers: frozenset[str] = frozenset()
+
+
+@dataclass(frozen=True)
+class Served:
+    """Кто реально обслужил запрос (для meta, RequestLog и прайсинга)."""
+
+    result: ProviderResult
+    provider: str
+    model: str
+    hop: int  # 0 = основной провайдер/модель
+
+
+# Ошибки, после которых upstream временно уводим из affinity-групп.
+_UNHEALTHY_TRIGGERS = frozenset(
+    {"429", "5xx", "timeout", "unreachable", "upstream_busy", "bulkhead_full"}
+)
+
+
+def _parse_triggers(value: str) -> frozenset[str]:
+    return frozenset(t.strip().lower() for t in value.split(",") if t.strip())
+
+
+def _expand_groups(hops: list[Hop], affinity: str | None, triggers: frozenset[str]) -> list[Hop]:
+    """Hop на группу из `UPSTREAM_GROUPS` → hops на её upstream'ы в порядке affinity."""
+    groups = get_settings().upstream_groups
+    out: list[Hop] = []
+    for hop in hops:
+        members = groups.get(hop.provider)
+        if not members:
+            out.append(hop)
+            continue
+        for j, member in enumerate(order_members(affinity, members)):
+            out.append(
+                Hop(provider=member, model=hop.model, triggers=hop.triggers if j == 0 else triggers)
+            )
+    return out
+
+
+def plan_hops(provider_name: str, model: str, affinity: str | None = None) -> list[Hop]:
+    """Строит цепочку: запрошенный провайдер/модель + hops из `FALLBACK_CHAINS`.
+
+    Группы upstream'ов раскрываются в порядке prefix affinity (`affinity` — хэш префикса).
+    """
+    settings = get_settings()
+    chains = settings.fallback_chains
+    chain = chains.get(f"{provider_name}:{model}")
+    if chain is None:
+        chain = chains.get(model) or []
+
+    default_triggers = _parse_triggers(settings.fallback_triggers)
+    hops = [Hop(provider=provider_name, model=model)]
+    for h in chain:
+        triggers = (
+            frozenset(t.strip().lower() for t in h.on) if h.on is not None else default_triggers
+        )
+        hops.append(
+            Hop(
+                provider=h.provider or provider_name,
+                model=h.model or model,
+                triggers=triggers,
+            )
+        )
+    return _expand_groups(hops, affinity, default_triggers)
+
+
+def error_triggers(exc: Exception) -> set[str]:
+    """Метки ошибки для сравнения с trigger set: публичный code + `429`/`5xx`/`timeout`/..."""
+    tokens = {map_provider_exception(exc).code}
+    if isinstance(exc, httpx.HTTPStatusError):
+        sc = int(getattr(exc.response, "status_code", 0) or 0)
+        if sc:
+            tokens.add(str(sc))
+            tokens.add(f"{sc // 100}xx")
+    elif isinstance(exc, httpx.TimeoutException):
+        tokens.add("timeout")
+    elif isinstance(exc, httpx.TransportError):
+        tokens.add("unreachable")
+    return tokens
+
+
+def _invoke(kind: str, provider_name: str, payload: dict[str, Any]) -> ProviderResult:
+    provider = get_provider(provider_name)
+    with provider_bulkhead(provider_name, str(payload.get("model") or "")):
+        if kind == "chat.completions":
+            return provider.chat_completions(payload)
+        return provider.responses(payload)
+
+
+def call_with_fallback(
+    kind: str,
+    provider_name: str,
+    payload: dict[str, Any],
+    affinity: str | None = None,
+) -> Served:
+    """Вызывает провайдера по цепочке; если цепочка исчерпана — бросает последнюю ошибку.
+
+    `affinity` — готовый ключ префикса (например, из шаблона); без него считаем по payload.
+    """
+    model = str(payload.get("model") or "")
+    affinity = affinity or prefix_key(kind, payload)
+    hops = plan_hops(provider_name, model, affinity)
+    t0 = time.monotonic()
+    try:
+        with call_affinity(affinity):
+            return _call_hops(kind, hops, model, payload)
+    finally:
+        record_upstream_rtt(time.monotonic() - t0)
+
+
+async def acall_with_fallback(
+    kind: str,
+    provider_name: str,
+    payload: dict[str, Any],
+    affinity: str | None = None,
+) -> Served:
+    """`call_with_fallback` для event loop (async-клиенты провайдеров, async bulkhead)."""
+    model = str(payload.get("model") or "")
+    affinity = affinity or prefix_key(kind, payload)
+    hops = plan_hops(provider_name, model, affinity)
+    with call_affinity(affinity):
+        for i, hop in enumerate(hops):
+            try:
+                provider = get_provider(hop.provider)
+                async with aprovider_bulkhead(hop.provider, hop.model):
+                    p = _hop_payload(payload, model, hop)
+                    if kind == "chat.completions":
+                        res = await provider.achat_completions(p)
+                    else:
+                        res = await provider.aresponses(p)
+                return Served(result=res, provider=hop.provider, model=hop.model, hop=i)
+            except Exception as e:
+                _fall_through(kind, hops, i, e)
+    raise RuntimeError("fallback chain is empty")  # pragma: no cover
+
+
+def _hop_payload(payload: dict[str, Any], model: str, hop: Hop) -> dict[str, Any]:
+    if hop.model and hop.model != model:
+        p = dict(payload)
+        p["model"] = hop.model
+        return p
+    return payload
+
+
+def _fall_through(kind: str, hops: list[Hop], i: int, exc: Exception) -> None:
+    """Ошибка на hop `i`: переходим к следующему, если он ловит этот trigger, иначе — raise."""
+    hop = hops[i]
+    tokens = error_triggers(exc)
+    if tokens & _UNHEALTHY_TRIGGERS:
+        mark_unhealthy(hop.provider)
+    if i + 1 >= len(hops):
+        raise exc
+    nxt = hops[i + 1]
+    matched = tokens & nxt.triggers
+    if not matched:
+        raise exc
+    trigger = sorted(matched)[0]
+    log.warning(
+        "provider_fallback",
+        kind=kind,
+        from_provider=hop.provider,
+        from_model=hop.model,
+        to_provider=nxt.provider,
+        to_model=nxt.model,
+        trigger=trigger,
+        err=str(exc),
+    )
+    fallbacks_total.labels(
+        from_provider=hop.provider,
+        to_provider=nxt.provider,
+        trigger=trigger,
+    ).inc()
+
+
+def _call_hops(kind: str, hops: list[Hop], model: str, payload: dict[str, Any]) -> Served:
+    for i, hop in enumerate(hops):
+        try:
+            res = _invoke(kind, hop.provider, _hop_payload(payload, model, hop))
+            return Served(result=res, provider=hop.provider, model=hop.model, hop=i)
+        except Exception as e:
+            _fall_through(kind, hops, i, e)
+
+    raise RuntimeError("fallback chain is empty")  # pragma: no cover
@@ -0,0 +1,220 @@
+"""Пул upstream API-ключей: квоты из `x-ratelimit-*`, общее состояние в Redis."""
+
+from __future__ import annotations
+
+import contextlib
+import random
+import re
+import statistics
+import threading
+import time
+from collections.abc import Mapping
+
+import redis
+import structlog
+from redis.commands.core import Script
+
+from ai_gateway.metrics import upstream_key_cooldowns_total, upstream_key_headroom
+from ai_gateway.providers.affinity import rank
+from ai_gateway.services.redaction import sha256_hex
+from ai_gateway.settings import get_settings
+
+log = structlog.get_logger()
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_UNIT_SECONDS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+# Состояние ключа живёт недолго: после простоя квоты всё равно уже сбросились.
+_STATE_TTL_SECONDS = 3600
+
+# Оптимистичное списание запроса: только у уже наблюдавшегося ключа и не ниже нуля.
+# KEYS[1] = состояние ключа.
+_TAKE_REQUEST_SCRIPT = """
+local rr = tonumber(redis.call('HGET', KEYS[1], 'rr'))
+if rr and rr > 0 then
+  return redis.call('HINCRBY', KEYS[1], 'rr', -1)
+end
+return rr
+"""
+
+_take_script: Script | None = None
+
+
+def _take_request(r: redis.Redis, state_key: str) -> None:
+    global _take_script
+    if _take_script is None:
+        _take_script = r.register_script(_TAKE_REQUEST_SCRIPT)
+    _take_script(keys=[state_key], client=r)
+
+
+def parse_reset_seconds(value: str | None) -> float | None:
+    """Парсит `x-ratelimit-reset-*`/`retry-after`: `20ms`, `1s`, `6m0s`, `1h2m3.5s` или `12`."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts or "".join(n + u for n, u in parts) != value:
+        return None
+    return sum(float(n) * _UNIT_SECONDS[u] for n, u in parts)
+
+
+def _int_header(headers: Mapping[str, str], name: str) -> int | None:
+    raw = headers.get(name)
+    if raw is None:
+        return None
+    try:
+        return int(float(raw))
+    except ValueError:
+        return None
+
+
+def headroom(state: Mapping[str, str]) -> float | None:
+    """Доля оставшейся квоты (минимум по requests/tokens); `None` — запас неизвестен.
+
+    Без лимита остаток не даёт доли: известно только, исчерпан ли ключ.
+    """
+    fractions = []
+    for remaining_f, limit_f in (("rr", "lr"), ("rt", "lt")):
+        remaining = state.get(remaining_f)
+        if remaining is None:
+            continue
+        limit = state.get(limit_f)
+        if limit and float(limit) > 0:
+            fractions.append(max(0.0, float(remaining)) / float(limit))
+        elif float(remaining) <= 0:
+            fractions.append(0.0)
+    return min(fractions) if fractions else None
+
+
+def _neutral(headrooms: list[float | None]) -> list[float]:
+    """Неизвестный запас — медиана по ключам пула, у которых квота ещё есть.
+
+    Так ключ без замеров не обгоняет ключи с измеренным запасом, а исчерпанные ключи
+    не тянут оценку к нулю.
+    """
+    known = [h for h in headrooms if h]
+    fill = statistics.median(known) if known else 1.0
+    return [fill if h is None else h for h in headrooms]
+
+
+class KeyPool:
+    """Выбирает ключ с наибольшим запасом квоты; исчерпанные ключи «остывают» до reset."""
+
+    def __init__(self, upstream: str, keys: list[str], r: redis.Redis | None = None) -> None:
+        self.upstream = upstream
+        self.keys = list(dict.fromkeys(k for k in keys if k))
+        self._fps = {k: sha256_hex(k)[:12] for k in self.keys}
+        self._r = r
+        self._rr = 0
+        self._lock = threading.Lock()
+
+    def fingerprint(self, key: str) -> str:
+        return self._fps.get(key) or sha256_hex(key)[:12]
+
+    def _state_key(self, key: str) -> str:
+        return f"kp:{self.upstream}:{self.fingerprint(key)}"
+
+    def _round_robin(self) -> str:
+        with self._lock:
+            self._rr = (self._rr + 1) % len(self.keys)
+            return self.keys[self._rr]
+
+    def pick(self, affinity: str | None = None) -> str:
+        """Ключ для следующего запроса; с `affinity` — «свой» ключ префикса, пока есть запас."""
+        if len(self.keys) == 1:
+            return self.keys[0]
+        if self._r is None:
+            return rank(affinity, self.keys)[0] if affinity else self._round_robin()
+
+        try:
+            pipe = self._r.pipeline(transaction=False)
+            for k in self.keys:
+                pipe.hgetall(self._state_key(k))
+            states = pipe.execute()
+        except redis.RedisError as e:
+            log.warning("key_pool_redis_error", upstream=self.upstream, err=str(e))
+            return self._round_robin()
+
+        now = time.time()
+        ready_keys: list[str] = []
+        measured: list[float | None] = []
+        cooling: list[tuple[float, str]] = []
+        for k, st in zip(self.keys, states, strict=True):
+            cd = float(st.get("cd") or 0)
+            if cd > now:
+                cooling.append((cd, k))
+            else:
+                ready_keys.append(k)
+                measured.append(headroom(st))
+
+        if not ready_keys:
+            # Все ключи остывают — берём тот, что освободится раньше всех.
+            return min(cooling)[1]
+        ready = list(zip(_neutral(measured), ready_keys, strict=True))
+
+        chosen = None
+        if affinity:
+            # Префикс живёт в кэше конкретного ключа: идём по HRW-порядку до ключа с запасом.
+            min_headroom = get_settings().affinity_min_key_headroom
+            spare = {k for h, k in ready if h >= min_headroom}
+            chosen = next((k for k in rank(affinity, self.keys) if k in spare), None)
+        if chosen is None:
+            best = max(h for h, _ in ready)
+            chosen = random.choice([k for h, k in ready if h == best])
+        # Оптимистично списываем запрос, чтобы соседние ноды не били в тот же ключ.
+        with contextlib.suppress(redis.RedisError):
+            _take_request(self._r, self._state_key(chosen))
+        return chosen
+
+    def observe(self, key: str, status_code: int, headers: Mapping[str, str]) -> None:
+        """Обновляет квоты ключа по заголовкам ответа (и ставит cooldown при исчерпании)."""
+        if len(self.keys) == 1 or self._r is None:
+            return
+
+        now = time.time()
+        rr = _int_header(headers, "x-ratelimit-remaining-requests")
+        rt = _int_header(headers, "x-ratelimit-remaining-tokens")
+        lr = _int_header(headers, "x-ratelimit-limit-requests")
+        lt = _int_header(headers, "x-ratelimit-limit-tokens")
+        reset_r = parse_reset_seconds(headers.get("x-ratelimit-reset-requests"))
+        reset_t = parse_reset_seconds(headers.get("x-ratelimit-reset-tokens"))
+
+        mapping: dict[str, str] = {"ts": str(now)}
+        for field, value in (("rr", rr), ("rt", rt), ("lr", lr), ("lt", lt)):
+            if value is not None:
+                mapping[field] = str(value)
+
+        cooldown: float | None = None
+        if status_code == 429:
+            waits = [
+                w
+                for w in (parse_reset_seconds(headers.get("retry-after")), reset_r, reset_t)
+                if w is not None
+            ]
+            cooldown = max(waits) if waits else get_settings().key_pool_cooldown_seconds
+        elif rr == 0 and reset_r is not None:
+            cooldown = reset_r
+        elif rt == 0 and reset_t is not None:
+            cooldown = reset_t
+        if cooldown is not None:
+            mapping["cd"] = str(now + cooldown)
+
+        fp = self.fingerprint(key)
+        try:
+            pipe = self._r.pipeline(transaction=False)
+            pipe.hset(self._state_key(key), mapping=mapping)
+            pipe.expire(self._state_key(key), _STATE_TTL_SECONDS)
+            pipe.execute()
+        except redis.RedisError as e:
+            log.warning("key_pool_redis_error", upstream=self.upstream, err=str(e))
+
+        observed = headroom(mapping)
+        if observed is not None:
+            upstream_key_headroom.labels(upstream=self.upstream, key=fp).set(observed)
+        if cooldown is not None:
+            upstream_key_cooldowns_total.labels(upstream=self.upstream, key=fp).inc()
+            log.info("key_pool_cooldown", upstream=self.upstream, key=fp, seconds=cooldown)
@@ -6,6 +6,7 @@ import time
 import uuid
 
 from ai_gateway.providers.base import ProviderClient, ProviderResult
+from ai_gateway.services.tokens import count_text_tokens, estimate_prompt_tokens
 
 
 def _now_ts() -> int:
@@ -28,8 +29,8 @@ class MockProvider(ProviderClient):
                 user_text = str(last.get("content") or "")
 
         out_text = f"[mock] ok: {user_text[:120]}"
-        prompt_tokens = max(1, len(user_text) // 4)
-        completion_tokens = max(1, len(out_text) // 4)
+        prompt_tokens = estimate_prompt_tokens("responses", payload)
+        completion_tokens = count_text_tokens(out_text)
         total_tokens = prompt_tokens + completion_tokens
 
         result = {
@@ -68,8 +69,8 @@ class MockProvider(ProviderClient):
                 user_text = str(last.get("content") or "")
 
         out_text = f"[mock] ok: {user_text[:120]}"
-        prompt_tokens = max(1, len(user_text) // 4)
-        completion_tokens = max(1, len(out_text) // 4)
+        prompt_tokens = estimate_prompt_tokens("chat.completions", payload)
+        completion_tokens = count_text_tokens(out_text)
         total_tokens = prompt_tokens + completion_tokens
 
         result = {
@@ -97,6 +98,13 @@ class MockProvider(ProviderClient):
             total_tokens=total_tokens,
         )
 
+    # Без I/O: тред не нужен.
+    async def aresponses(self, payload: dict) -> ProviderResult:
+        return self.responses(payload)
+
+    async def achat_completions(self, payload: dict) -> ProviderResult:
+        return self.chat_completions(payload)
+
     def list_models(self) -> dict:
         return {
             "object": "list",
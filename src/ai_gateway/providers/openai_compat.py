@@ -2,12 +2,19 @@
 
 from __future__ import annotations
 
+import asyncio
+import itertools
 import time
 
 import httpx
 
+from ai_gateway.infrastructure.http import build_async_clients, build_client
+from ai_gateway.infrastructure.redis import get_redis
 from ai_gateway.providers.base import ProviderClient, ProviderResult
-from ai_gateway.settings import get_settings
+from ai_gateway.providers.context import current_affinity
+from ai_gateway.providers.keypool import KeyPool
+from ai_gateway.providers.pacing import UpstreamPacer
+from ai_gateway.settings import UpstreamCfg, get_settings
 
 
 def _encode_header_value(value: str) -> str | bytes:
@@ -19,86 +26,191 @@ def _encode_header_value(value: str) -> str | bytes:
         return value.encode("utf-8")
 
 
+def _cached_tokens(usage: dict, details_field: str) -> int | None:
+    """`usage.*_tokens_details.cached_tokens` (prompt caching провайдера), если есть."""
+    details = usage.get(details_field)
+    if not isinstance(details, dict):
+        return None
+    cached = details.get("cached_tokens")
+    return int(cached) if cached is not None else None
+
+
+_RETRYABLE = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+def _backoff(attempt: int) -> float:
+    return min(2.0, 0.2 * (2**attempt))
+
+
+def _usage_result(data: dict, prompt: str, completion: str, details: str) -> ProviderResult:
+    usage = data.get("usage") or {}
+    prompt_tokens = usage.get(prompt)
+    completion_tokens = usage.get(completion)
+    total_tokens = usage.get("total_tokens")
+    return ProviderResult(
+        json=data,
+        prompt_tokens=int(prompt_tokens) if prompt_tokens is not None else None,
+        completion_tokens=int(completion_tokens) if completion_tokens is not None else None,
+        total_tokens=int(total_tokens) if total_tokens is not None else None,
+        cached_tokens=_cached_tokens(usage, details),
+    )
+
+
+def _responses_result(data: dict) -> ProviderResult:
+    return _usage_result(data, "input_tokens", "output_tokens", "input_tokens_details")
+
+
+def _chat_result(data: dict) -> ProviderResult:
+    return _usage_result(data, "prompt_tokens", "completion_tokens", "prompt_tokens_details")
+
+
+def _responses_body(payload: dict) -> dict:
+    p = dict(payload)
+    if "store" not in p:
+        p["store"] = False
+    return p
+
+
 class OpenAICompatibleProvider(ProviderClient):
     name = "openai"
 
-    def __init__(self) -> None:
+    def __init__(self, name: str = "openai", cfg: UpstreamCfg | None = None) -> None:
         settings = get_settings()
-        if not settings.openai_base_url or not settings.openai_api_key:
-            raise RuntimeError("Нужны OPENAI_BASE_URL/OPENAI_API_KEY для provider=openai")
-        base = settings.openai_base_url.rstrip("/")
+        if cfg is None:
+            # Upstream по умолчанию собирается из `OPENAI_*`.
+            extra_keys = [k.strip() for k in (settings.openai_api_keys or "").split(",")]
+            extra_keys = [k for k in extra_keys if k]
+            if not settings.openai_base_url or not (settings.openai_api_key or extra_keys):
+                raise RuntimeError("Нужны OPENAI_BASE_URL/OPENAI_API_KEY для provider=openai")
+            cfg = UpstreamCfg(
+                base_url=settings.openai_base_url,
+                api_key=settings.openai_api_key,
+                api_keys=extra_keys,
+                http_referer=settings.openai_http_referer,
+                title=settings.openai_title,
+            )
+        elif not (cfg.api_key or cfg.api_keys):
+            raise RuntimeError(f"Нужен api_key в UPSTREAMS для provider={name}")
+        self.name = name
+        base = cfg.base_url.rstrip("/")
         # Разрешаем как "https://api.openai.com", так и "https://api.openai.com/v1".
         if base.endswith("/v1"):
             base = base[: -len("/v1")]
         self._base_url = base.rstrip("/")
-        self._api_key = settings.openai_api_key
-        self._timeout = float(settings.openai_timeout_seconds)
-        self._retries = int(settings.openai_retries)
-        self._headers: list[tuple[str, str | bytes]] = [
-            ("Authorization", f"Bearer {self._api_key}"),
-        ]
-        if settings.openai_http_referer:
-            self._headers.append(("HTTP-Referer", settings.openai_http_referer))
-        if settings.openai_title:
-            self._headers.append(("X-Title", _encode_header_value(settings.openai_title)))
-        self._client = httpx.Client(
-            timeout=httpx.Timeout(self._timeout),
+        keys = ([cfg.api_key] if cfg.api_key else []) + list(cfg.api_keys)
+        lanes = len(set(keys))
+        r = get_redis() if lanes > 1 or settings.pacing_enabled else None
+        # Redis нужен только для пула из нескольких ключей (общие квоты между нодами).
+        self._keys = KeyPool(name, keys, r if lanes > 1 else None)
+        self._pacer = UpstreamPacer(name, r if settings.pacing_enabled else None, lanes=lanes)
+        self._timeout = float(
+            cfg.timeout_seconds
+            if cfg.timeout_seconds is not None
+            else settings.openai_timeout_seconds
         )
+        self._retries = int(cfg.retries if cfg.retries is not None else settings.openai_retries)
+        self._headers: list[tuple[str, str | bytes]] = []
+        if cfg.http_referer:
+            self._headers.append(("HTTP-Referer", cfg.http_referer))
+        if cfg.title:
+            self._headers.append(("X-Title", _encode_header_value(cfg.title)))
+        self._client = build_client(f"upstream:{name}", self._timeout)
+        # AsyncClient'ы привязаны к event loop, на котором созданы (loop async-воркера).
+        self._aclients: tuple[asyncio.AbstractEventLoop, list[httpx.AsyncClient]] | None = None
+        self._ashard = itertools.count()
+
+    def _auth_headers(self, api_key: str) -> list[tuple[str, str | bytes]]:
+        return [("Authorization", f"Bearer {api_key}"), *self._headers]
+
+    def _must_retry(self, r: httpx.Response, attempt: int) -> bool:
+        self._pacer.observe(r.status_code, r.headers)
+        return r.status_code in _RETRYABLE and attempt < self._retries
 
     def _request(self, method: str, path: str, json_body: dict | None = None) -> httpx.Response:
         url = f"{self._base_url}{path}"
-        retryable = {408, 409, 425, 429, 500, 502, 503, 504}
+        deadline = self._pacer.deadline()
 
         for attempt in range(self._retries + 1):
+            # На 429 не спим вслепую: pacer сам подержит запрос до слота (или до дедлайна).
+            self._pacer.acquire(deadline)
+            api_key = self._keys.pick(current_affinity())
             try:
                 r = self._client.request(
                     method,
                     url,
                     json=json_body,
-                    headers=self._headers,
+                    headers=self._auth_headers(api_key),
                 )
-                if r.status_code >= 400 and r.status_code in retryable and attempt < self._retries:
-                    time.sleep(min(2.0, 0.2 * (2**attempt)))
+                self._keys.observe(api_key, r.status_code, r.headers)
+                if self._must_retry(r, attempt):
+                    if r.status_code != 429 or not self._pacer.enabled:
+                        time.sleep(_backoff(attempt))
                     continue
                 r.raise_for_status()
                 return r
             except (httpx.TimeoutException, httpx.TransportError):
                 if attempt < self._retries:
-                    time.sleep(min(2.0, 0.2 * (2**attempt)))
+                    time.sleep(_backoff(attempt))
+                    continue
+                raise
+
+    def _async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._aclients is None or self._aclients[0] is not loop:
+            clients = build_async_clients(f"upstream:{self.name}", self._timeout)
+            self._aclients = (loop, clients)
+        clients = self._aclients[1]
+        return clients[next(self._ashard) % len(clients)]
+
+    async def _arequest(
+        self,
+        method: str,
+        path: str,
+        json_body: dict | None = None,
+    ) -> httpx.Response:
+        """`_request` для event loop: ожидание pacing и backoff не занимают тред."""
+        url = f"{self._base_url}{path}"
+        deadline = self._pacer.deadline()
+        client = self._async_client()
+
+        for attempt in range(self._retries + 1):
+            await self._pacer.aacquire(deadline)
+            api_key = self._keys.pick(current_affinity())
+            try:
+                r = await client.request(
+                    method,
+                    url,
+                    json=json_body,
+                    headers=self._auth_headers(api_key),
+                )
+                self._keys.observe(api_key, r.status_code, r.headers)
+                if self._must_retry(r, attempt):
+                    if r.status_code != 429 or not self._pacer.enabled:
+                        await asyncio.sleep(_backoff(attempt))
+                    continue
+                r.raise_for_status()
+                return r
+            except (httpx.TimeoutException, httpx.TransportError):
+                if attempt < self._retries:
+                    await asyncio.sleep(_backoff(attempt))
                     continue
                 raise
 
     def responses(self, payload: dict) -> ProviderResult:
-        p = dict(payload)
-        if "store" not in p:
-            p["store"] = False
-
-        r = self._request("POST", "/v1/responses", json_body=p)
-        data = r.json()
-        usage = data.get("usage") or {}
-        prompt_tokens = usage.get("input_tokens")
-        completion_tokens = usage.get("output_tokens")
-        total_tokens = usage.get("total_tokens")
-        return ProviderResult(
-            json=data,
-            prompt_tokens=int(prompt_tokens) if prompt_tokens is not None else None,
-            completion_tokens=int(completion_tokens) if completion_tokens is not None else None,
-            total_tokens=int(total_tokens) if total_tokens is not None else None,
-        )
+        r = self._request("POST", "/v1/responses", json_body=_responses_body(payload))
+        return _responses_result(r.json())
 
     def chat_completions(self, payload: dict) -> ProviderResult:
         r = self._request("POST", "/v1/chat/completions", json_body=payload)
-        data = r.json()
-        usage = data.get("usage") or {}
-        prompt_tokens = usage.get("prompt_tokens")
-        completion_tokens = usage.get("completion_tokens")
-        total_tokens = usage.get("total_tokens")
-        return ProviderResult(
-            json=data,
-            prompt_tokens=int(prompt_tokens) if prompt_tokens is not None else None,
-            completion_tokens=int(completion_tokens) if completion_tokens is not None else None,
-            total_tokens=int(total_tokens) if total_tokens is not None else None,
-        )
+        return _chat_result(r.json())
+
+    async def aresponses(self, payload: dict) -> ProviderResult:
+        r = await self._arequest("POST", "/v1/responses", json_body=_responses_body(payload))
+        return _responses_result(r.json())
+
+    async def achat_completions(self, payload: dict) -> ProviderResult:
+        r = await self._arequest("POST", "/v1/chat/completions", json_body=payload)
+        return _chat_result(r.json())
 
     def list_models(self) -> dict:
         r = self._request("GET", "/v1/models")
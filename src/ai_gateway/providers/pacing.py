@@ -0,0 +1,201 @@
+"""Pacing перед upstream: держим запросы до дедлайна вместо гарантированного 429."""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections.abc import Generator, Mapping
+
+import redis
+import structlog
+
+from ai_gateway.metrics import (
+    upstream_pacing_rate,
+    upstream_pacing_rejected_total,
+    upstream_queue_depth,
+    upstream_queue_wait_seconds,
+)
+from ai_gateway.providers.base import UpstreamBusyError
+from ai_gateway.providers.context import PRIORITY_JOBS, current_priority
+from ai_gateway.providers.keypool import parse_reset_seconds
+from ai_gateway.settings import get_settings
+
+log = structlog.get_logger()
+
+# Token bucket в Redis (общий для всех нод).
+# KEYS[1] = pace:<upstream>; ARGV = now, burst, reserve (сколько токенов оставить sync-трафику).
+# Возвращает 0, если токен взят, иначе сколько секунд подождать; -1 — pacing выключен.
+_TAKE_SCRIPT = """
+local st = redis.call('HMGET', KEYS[1], 'rate', 'tokens', 'ts', 'hold')
+local rate = tonumber(st[1])
+if not rate or rate <= 0 then
+  return '-1'
+end
+local now = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local reserve = tonumber(ARGV[3])
+local hold = tonumber(st[4]) or 0
+if hold > now then
+  return tostring(hold - now)
+end
+local tokens = tonumber(st[2]) or burst
+local ts = tonumber(st[3]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local need = 1 + reserve
+if tokens >= need then
+  tokens = tokens - 1
+  redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+  redis.call('EXPIRE', KEYS[1], 3600)
+  return '0'
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring((need - tokens) / rate)
+"""
+
+
+class UpstreamPacer:
+    """Темп запросов к одному upstream по наблюдаемому лимиту (заголовки + частота 429)."""
+
+    def __init__(self, upstream: str, r: redis.Redis | None, lanes: int = 1) -> None:
+        # lanes — сколько ключей делят upstream: лимит из заголовков задан на один ключ.
+        self.upstream = upstream
+        self.lanes = max(1, lanes)
+        self._r = r
+        self._key = f"pace:{upstream}"
+        self._take = r.register_script(_TAKE_SCRIPT) if r is not None else None
+
+    @property
+    def enabled(self) -> bool:
+        return self._take is not None
+
+    def deadline(self) -> float:
+        """Дедлайн ожидания слота для текущего приоритета."""
+        settings = get_settings()
+        if current_priority() == PRIORITY_JOBS:
+            return time.time() + settings.pacing_jobs_max_wait_seconds
+        return time.time() + settings.pacing_max_wait_seconds
+
+    def acquire(self, deadline: float | None = None) -> float:
+        """Ждёт слот (до дедлайна) и возвращает время ожидания; иначе `UpstreamBusyError`."""
+        waits = self._waits(deadline)
+        try:
+            while True:
+                time.sleep(next(waits))
+        except StopIteration as done:
+            return float(done.value)
+
+    async def aacquire(self, deadline: float | None = None) -> float:
+        """`acquire` для event loop: ждём через `asyncio.sleep`, не блокируя другие jobs."""
+        waits = self._waits(deadline)
+        try:
+            while True:
+                await asyncio.sleep(next(waits))
+        except StopIteration as done:
+            return float(done.value)
+
+    def _waits(self, deadline: float | None) -> Generator[float, None, float]:
+        """Общее ядро `acquire`/`aacquire`: отдаёт, сколько поспать; return — слот взят."""
+        if self._take is None:
+            return 0.0
+
+        settings = get_settings()
+        priority = current_priority()
+        reserve = settings.pacing_burst * settings.pacing_jobs_reserve
+        if priority != PRIORITY_JOBS:
+            reserve = 0.0
+        t0 = time.time()
+        if deadline is None:
+            deadline = self.deadline()
+
+        depth = upstream_queue_depth.labels(upstream=self.upstream, priority=priority)
+        queued = False
+        try:
+            while True:
+                now = time.time()
+                try:
+                    wait = float(
+                        self._take(keys=[self._key], args=[now, settings.pacing_burst, reserve])
+                    )
+                except redis.RedisError as e:
+                    log.warning("pacing_redis_error", upstream=self.upstream, err=str(e))
+                    return 0.0
+                if wait <= 0:
+                    if not queued:
+                        return 0.0
+                    waited = now - t0
+                    upstream_queue_wait_seconds.labels(
+                        upstream=self.upstream,
+                        priority=priority,
+                    ).observe(waited)
+                    return waited
+                if now + wait > deadline:
+                    upstream_pacing_rejected_total.labels(
+                        upstream=self.upstream,
+                        priority=priority,
+                    ).inc()
+                    raise UpstreamBusyError(f"upstream {self.upstream} is rate limited")
+                if not queued:
+                    queued = True
+                    depth.inc()
+                yield min(wait, 1.0)
+        finally:
+            if queued:
+                depth.dec()
+
+    def observe(self, status_code: int, headers: Mapping[str, str]) -> None:
+        """Подстраивает темп: лимит из заголовков, AIMD по 429."""
+        if self._r is None:
+            return
+
+        settings = get_settings()
+        now = time.time()
+        try:
+            st = self._r.hmget(self._key, "rate", "max_rate")
+            rate = float(st[0]) if st[0] else None
+            max_rate = float(st[1]) if st[1] else None
+
+            mapping: dict[str, str] = {}
+            limit = headers.get("x-ratelimit-limit-requests")
+            if limit:
+                try:
+                    # У OpenAI-подобных API лимит запросов — в минуту.
+                    max_rate = max(float(limit) * self.lanes / 60.0, settings.pacing_min_rps)
+                    mapping["max_rate"] = str(max_rate)
+                except ValueError:
+                    pass
+
+            if status_code == 429:
+                base = rate or max_rate or settings.pacing_initial_rps
+                rate = max(settings.pacing_min_rps, base * 0.5)
+                if self.lanes == 1:
+                    # С пулом ключей 429 одного ключа не повод держать весь upstream.
+                    hold = parse_reset_seconds(headers.get("retry-after"))
+                    if hold is None:
+                        hold = parse_reset_seconds(headers.get("x-ratelimit-reset-requests"))
+                    if hold:
+                        mapping["hold"] = str(now + hold)
+                    mapping["tokens"] = "0"
+                    mapping["ts"] = str(now)
+            elif status_code < 400:
+                if self.lanes == 1 and headers.get("x-ratelimit-remaining-requests") == "0":
+                    hold = parse_reset_seconds(headers.get("x-ratelimit-reset-requests"))
+                    if hold:
+                        mapping["hold"] = str(now + hold)
+                if rate is not None:
+                    # Аддитивный рост до наблюдаемого лимита.
+                    ceiling = max_rate if max_rate is not None else rate * 2
+                    rate = min(ceiling, rate + max(settings.pacing_min_rps, ceiling * 0.05))
+                elif max_rate is not None:
+                    rate = max_rate
+
+            if rate is not None:
+                mapping["rate"] = str(rate)
+                upstream_pacing_rate.labels(upstream=self.upstream).set(rate)
+            if mapping:
+                pipe = self._r.pipeline(transaction=False)
+                pipe.hset(self._key, mapping=mapping)
+                pipe.expire(self._key, 3600)
+                pipe.execute()
+        except redis.RedisError as e:
+            log.warning("pacing_redis_error", upstream=self.upstream, err=str(e))
@@ -1 +1 @@
-"""Очередь Celery и задачи воркера (async jobs + webhooks)."""
+"""Очереди (Celery или Redis Streams) и задачи воркера (async jobs + webhooks)."""
@@ -0,0 +1,277 @@
+"""Async-исполнение jobs: много jobs на одном event loop воркера вместо процесса/треда на job.
+
+Celery-задача `process_job` при `JOB_ENGINE=async` только передаёт job сюда и ждёт, пока
+освободится место (не больше `JOB_ASYNC_CONCURRENCY` одновременно) — так воркер не выбирает
+из брокера больше, чем может выполнить. Воркер Redis Streams вызывает `run_job` напрямую.
+Вызов upstream (pacing, bulkhead, ретраи) и запись в БД — async; соединение с БД занято только
+на claim и запись итога, не на время вызова. Короткие Redis-вызовы лимитов остаются
+синхронными: это доли миллисекунды.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+import uuid
+from typing import Any
+
+import structlog
+from celery.signals import worker_shutdown
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm.exc import StaleDataError
+
+from ai_gateway.db.models import Job
+from ai_gateway.infrastructure.db import get_async_session_factory
+from ai_gateway.infrastructure.redis import get_redis
+from ai_gateway.metrics import (
+    job_engine_admission_wait_seconds,
+    job_engine_in_flight,
+    job_lease_lost_total,
+)
+from ai_gateway.providers.base import UpstreamBusyError
+from ai_gateway.providers.context import PRIORITY_JOBS, call_priority
+from ai_gateway.providers.fallback import acall_with_fallback
+from ai_gateway.queue.dispatch import enqueue_job, enqueue_webhook
+from ai_gateway.queue.execution import (
+    TERMINAL_STATUSES,
+    ClaimedJob,
+    JobMustWait,
+    JobOutcome,
+    JobRejected,
+    batch_item,
+    claim_statement,
+    count_job_outcome,
+    load_job_request,
+    record_job_outcome,
+    reject_job,
+    settle_job,
+    take_job_limits,
+    unclaim_statement,
+)
+from ai_gateway.queue.leases import aheartbeat, forget_payloads, remember_payload
+from ai_gateway.queue.tasks import process_job
+from ai_gateway.services.concurrency import Lease
+from ai_gateway.services.job_events import publish_job_status, status_entry
+from ai_gateway.services.limits import TokenReservation
+from ai_gateway.services.payloads import discard
+from ai_gateway.settings import get_settings
+
+log = structlog.get_logger()
+
+
+async def finish_job(job_id: str, job: Job | None = None, out: JobOutcome | None = None) -> None:
+    """`settle_job` с event loop: копия payload, окно fair-очереди и итог в пачке `/v1/batches`."""
+    item = batch_item(job, out) if job is not None else None
+    # Файл результатов, счётчики, постановка следующих jobs — I/O, не на event loop.
+    await asyncio.to_thread(settle_job, job_id, item)
+
+
+async def _requeue(job_id: str, payload: dict[str, Any], countdown: int, retries: int) -> None:
+    await asyncio.to_thread(enqueue_job, job_id, payload, countdown=countdown, retries=retries)
+
+
+async def _unclaim(
+    factory: async_sessionmaker[AsyncSession],
+    job_uuid: uuid.UUID,
+    attempt: int,
+) -> None:
+    """Job возвращается в очередь: снимаем `running`, выставленный при claim."""
+    async with factory() as session:
+        await session.execute(unclaim_statement(job_uuid, attempt))
+        await session.commit()
+    # Payload снова едет в задаче брокера.
+    await asyncio.to_thread(forget_payloads, get_redis(), str(job_uuid))
+    publish_job_status(str(job_uuid), "queued")
+
+
+async def run_job(job_id: str, payload: dict[str, Any], retries: int = 0) -> None:
+    """Одна попытка job — то же, что `process_job`, но без занятого треда на время вызова."""
+    try:
+        job_uuid = uuid.UUID(job_id)
+    except Exception:
+        log.warning("job_invalid_id", job_id=job_id)
+        return
+
+    factory = get_async_session_factory()
+    claim: ClaimedJob | None = None
+    lease: Lease | None = None
+    tpm: TokenReservation | None = None
+    used_tokens = 0
+    try:
+        # Claim — один UPDATE ... RETURNING: `running`, номер попытки и лимиты ключа.
+        async with factory() as session:
+            row = (await session.execute(claim_statement(job_uuid))).one_or_none()
+            await session.commit()
+            if row is None:
+                job = await session.get(Job, job_uuid)
+                if job is None:
+                    log.warning("job_not_found", job_id=job_id)
+                    await finish_job(job_id)
+                    return
+                if job.status not in TERMINAL_STATUSES:
+                    # Повтор доставки, пока job держит живой lease другой воркер: итог за ним.
+                    log.info("job_already_running", job_id=job_id)
+                    return
+                await asyncio.to_thread(discard, payload)
+                await finish_job(job_id, job)
+                return
+        claim = ClaimedJob(*row)
+        job = claim.job
+        await asyncio.to_thread(remember_payload, get_redis(), job_id, payload)
+
+        # Blob payload'а и разворот шаблона — I/O (Redis/диск/БД), не на event loop.
+        try:
+            request = await asyncio.to_thread(load_job_request, job, payload)
+            lease, tpm = take_job_limits(get_redis(), claim, request)
+        except JobRejected as e:
+            log.warning("job_rejected", job_id=job_id, code=e.code)
+            async with factory() as session:
+                job = await session.merge(job, load=False)
+                reject_job(job, e)
+                await session.commit()
+            claim = None
+            publish_job_status(job_id, job.status, entry=status_entry(job))
+            await asyncio.to_thread(discard, payload)
+            await finish_job(job_id, job)
+            return
+        publish_job_status(job_id, "running", entry=status_entry(job))
+
+        out = JobOutcome(provider=job.provider, model=job.model)
+        t0 = time.time()
+        try:
+            async with aheartbeat(factory, job_uuid, job.attempt_count):
+                with call_priority(PRIORITY_JOBS):
+                    served = await acall_with_fallback(
+                        job.kind,
+                        job.provider,
+                        request.payload,
+                        affinity=request.affinity,
+                    )
+            out.succeeded(served, job.model)
+            used_tokens = out.used_tokens(tpm)
+        except Exception as e:
+            if isinstance(e, UpstreamBusyError) and retries < process_job.max_retries:
+                # Upstream занят — job остаётся в очереди, как ретрай Celery-задачи.
+                await _unclaim(factory, job_uuid, job.attempt_count)
+                claim = None
+                await _requeue(job_id, payload, min(60, 2**retries), retries + 1)
+                return
+            out.failed(e)
+        out.latency_ms = int((time.time() - t0) * 1000)
+
+        # Строка уже прочитана при claim: итог — UPDATE и INSERT'ы без повторного SELECT.
+        async with factory() as session:
+            job = await session.merge(job, load=False)
+            cost, webhook_body = record_job_outcome(session, job, request, out)
+            try:
+                await session.commit()
+            except StaleDataError:
+                # Lease истёк во время вызова, и job уже у другой попытки: итог за ней.
+                claim = None
+                job_lease_lost_total.inc()
+                log.warning("job_lease_lost", job_id=job_id)
+                return
+        claim = None
+        publish_job_status(job_id, out.status, entry=status_entry(job))
+        count_job_outcome(out, cost)
+        await asyncio.to_thread(discard, payload)
+        await finish_job(job_id, job, out)
+
+        if webhook_body is not None:
+            await asyncio.to_thread(enqueue_webhook, job_id, webhook_body)
+    except JobMustWait as e:
+        # Ожидание слота/TPM не тратит попытки.
+        if claim is not None:
+            await _unclaim(factory, job_uuid, claim.job.attempt_count)
+        await _requeue(job_id, payload, e.countdown, retries)
+    except Exception as e:
+        log.warning("process_job_failed", job_id=job_id, err=str(e))
+        if claim is not None:
+            try:
+                await _unclaim(factory, job_uuid, claim.job.attempt_count)
+            except Exception as unclaim_err:
+                log.warning("job_unclaim_failed", job_id=job_id, err=str(unclaim_err))
+        if retries < process_job.max_retries:
+            await _requeue(job_id, payload, min(60, 2**retries), retries + 1)
+    finally:
+        if tpm is not None:
+            tpm.settle(used_tokens)
+        if lease is not None:
+            lease.release()
+
+
+class AsyncJobEngine:
+    """Event loop в отдельном треде воркера; не больше `concurrency` jobs одновременно."""
+
+    def __init__(self, concurrency: int) -> None:
+        self.concurrency = max(1, concurrency)
+        self._loop = asyncio.new_event_loop()
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._tasks: set[asyncio.Task[None]] = set()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="job-engine")
+        self._thread.daemon = True
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def submit(self, job_id: str, payload: dict[str, Any], retries: int = 0) -> None:
+        """Ставит job на loop; блокирует вызывающий тред, пока нет свободного места."""
+        t0 = time.monotonic()
+        admitted = asyncio.run_coroutine_threadsafe(
+            self._admit(job_id, payload, retries),
+            self._loop,
+        )
+        admitted.result()
+        job_engine_admission_wait_seconds.observe(time.monotonic() - t0)
+
+    async def _admit(self, job_id: str, payload: dict[str, Any], retries: int) -> None:
+        await self._slots.acquire()
+        task = asyncio.create_task(self._run(job_id, payload, retries))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job_id: str, payload: dict[str, Any], retries: int) -> None:
+        job_engine_in_flight.inc()
+        try:
+            await run_job(job_id, payload, retries)
+        except Exception as e:
+            log.warning("job_engine_task_failed", job_id=job_id, err=str(e))
+        finally:
+            job_engine_in_flight.dec()
+            self._slots.release()
+
+    async def _drain(self, timeout: float) -> int:
+        if self._tasks:
+            await asyncio.wait(set(self._tasks), timeout=timeout)
+        return len(self._tasks)
+
+    def stop(self, timeout: float) -> None:
+        """Даёт выполняющимся jobs до `timeout` секунд и останавливает loop."""
+        if not self._thread.is_alive():
+            return
+        left = asyncio.run_coroutine_threadsafe(self._drain(timeout), self._loop).result()
+        if left:
+            log.warning("job_engine_stopped_with_running_jobs", running=left)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+
+_engine: AsyncJobEngine | None = None
+_lock = threading.Lock()
+
+
+def get_engine() -> AsyncJobEngine:
+    """Движок процесса воркера (создаётся и запускается при первой job)."""
+    global _engine
+    with _lock:
+        if _engine is None:
+            _engine = AsyncJobEngine(get_settings().job_async_concurrency)
+            _engine.start()
+        return _engine
+
+
+@worker_shutdown.connect
+def _drain_on_shutdown(**_: Any) -> None:
+    if _engine is not None:
+        _engine.stop(get_settings().job_async_shutdown_seconds)
@@ -2,10 +2,14 @@
 
 from __future__ import annotations
 
+from typing import Any
+
 from celery import Celery
+from celery.signals import worker_init
 from prometheus_client import start_http_server
 
 from ai_gateway.metrics import registry
+from ai_gateway.services.payloads import check_codecs
 from ai_gateway.settings import get_settings
 
 
@@ -23,6 +27,26 @@ def create_celery() -> Celery:
         timezone="UTC",
         enable_utc=True,
     )
+    beat_schedule: dict[str, dict] = {}
+    if settings.models_refresh_interval_seconds > 0:
+        # Каталог моделей обновляется заранее, до истечения TTL (нужен `celery beat`).
+        beat_schedule["refresh-models-catalog"] = {
+            "task": "ai_gateway.refresh_models_catalog",
+            "schedule": float(settings.models_refresh_interval_seconds),
+        }
+    if settings.job_fair_queuing:
+        # Раздаёт места окна, освобождённые по истечении lease (о них никто не сообщит).
+        beat_schedule["pump-fair-queue"] = {
+            "task": "ai_gateway.pump_fair_queue",
+            "schedule": settings.job_fair_pump_interval_seconds,
+        }
+    if settings.job_reaper_interval_seconds > 0:
+        # Jobs, чей воркер умер посреди вызова (lease истёк), возвращаются в очередь.
+        beat_schedule["reap-expired-jobs"] = {
+            "task": "ai_gateway.reap_expired_jobs",
+            "schedule": settings.job_reaper_interval_seconds,
+        }
+    app.conf.beat_schedule = beat_schedule
 
     if settings.worker_metrics_port:
         # Если хочешь — можно скрейпить метрики прямо с воркера на отдельном порту.
@@ -31,4 +55,10 @@ def create_celery() -> Celery:
     return app
 
 
+@worker_init.connect
+def _check_worker_config(**_: Any) -> None:
+    # Ключ шифрования blob'ов проверяем до первой задачи, а не на первом большом payload'е.
+    check_codecs()
+
+
 celery_app = create_celery()
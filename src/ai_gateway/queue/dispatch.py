@@ -0,0 +1,124 @@
+"""Постановка задач воркерам: Celery или Redis Streams (`JOB_QUEUE`).
+
+Большие payload'ы и тела вебхуков уходят в blob store, в задаче — только ссылка.
+С `JOB_FAIR_QUEUING` новые jobs сначала ждут в справедливой очереди ключа (`queue.fair`).
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+import redis
+
+from ai_gateway.infrastructure.redis import get_redis
+from ai_gateway.services.payloads import stash, stash_many
+from ai_gateway.settings import get_settings
+
+from . import fair
+from .fair import DEFAULT_PRIORITY, Tenant
+from .streams import TASK_JOB, TASK_WEBHOOK, StreamTask, add_task, add_tasks
+
+
+def enqueue_job(
+    job_id: str,
+    payload: dict[str, Any],
+    *,
+    countdown: float = 0,
+    retries: int = 0,
+    tenant: Tenant | None = None,
+    priority: int = DEFAULT_PRIORITY,
+) -> None:
+    """Ставит (или, с `countdown`, откладывает) выполнение job.
+
+    `tenant` — у новой job: она пройдёт через справедливую очередь, если та включена.
+    """
+    payload = stash(payload, "job")
+    if tenant is not None and get_settings().job_fair_queuing:
+        r = get_redis()
+        fair.push(r, tenant, [(job_id, payload)], [priority])
+        pump_fair_queue(r)
+        return
+    if get_settings().job_queue == "streams":
+        add_task(get_redis(), StreamTask(TASK_JOB, [job_id, payload], retries), countdown)
+        return
+    from .tasks import process_job
+
+    process_job.apply_async((job_id, payload), countdown=countdown or None, retries=retries)
+
+
+def enqueue_jobs(
+    jobs: list[tuple[str, dict[str, Any]]],
+    *,
+    tenant: Tenant | None = None,
+    priorities: list[int] | None = None,
+) -> None:
+    """Пачка jobs `(job_id, payload)`: blob'ы одним pipeline, публикация одним pipeline/producer."""
+    if not jobs:
+        return
+    ids = [job_id for job_id, _ in jobs]
+    payloads = stash_many([payload for _, payload in jobs], "job")
+    if tenant is not None and get_settings().job_fair_queuing:
+        r = get_redis()
+        fair.push(
+            r,
+            tenant,
+            list(zip(ids, payloads, strict=True)),
+            priorities or [DEFAULT_PRIORITY] * len(jobs),
+        )
+        pump_fair_queue(r)
+        return
+    _publish_jobs(ids, payloads)
+
+
+def pump_fair_queue(r: redis.Redis | None = None) -> int:
+    """Отдаёт брокеру jobs из справедливой очереди на свободные места окна."""
+    jobs = fair.take(r or get_redis())
+    if jobs:
+        _publish_jobs([job_id for job_id, _ in jobs], [payload for _, payload in jobs])
+    return len(jobs)
+
+
+def renew_fair_slot(job_id: str) -> None:
+    """Продлевает место job в окне справедливой очереди (heartbeat долгого вызова)."""
+    if get_settings().job_fair_queuing:
+        fair.renew(get_redis(), job_id)
+
+
+def release_fair_slot(job_id: str) -> None:
+    """Job больше не вернётся в очередь: освобождает место в окне и раздаёт его дальше."""
+    if not get_settings().job_fair_queuing:
+        return
+    r = get_redis()
+    fair.release(r, job_id)
+    pump_fair_queue(r)
+
+
+def _publish_jobs(ids: list[str], payloads: list[dict[str, Any]]) -> None:
+    if get_settings().job_queue == "streams":
+        tasks = [StreamTask(TASK_JOB, [job_id, p]) for job_id, p in zip(ids, payloads, strict=True)]
+        add_tasks(get_redis(), tasks)
+        return
+    from .celery_app import celery_app
+    from .tasks import process_job
+
+    # Одно соединение с брокером на всю пачку вместо acquire/release на каждую задачу.
+    with celery_app.producer_or_acquire() as producer:
+        for job_id, p in zip(ids, payloads, strict=True):
+            process_job.apply_async((job_id, p), producer=producer)
+
+
+def enqueue_webhook(
+    job_id: str,
+    body: dict[str, Any],
+    *,
+    countdown: float = 0,
+    retries: int = 0,
+) -> None:
+    """Ставит доставку вебхука по итогу job."""
+    body = stash(body, "webhook")
+    if get_settings().job_queue == "streams":
+        add_task(get_redis(), StreamTask(TASK_WEBHOOK, [job_id, body], retries), countdown)
+        return
+    from .tasks import deliver_webhook
+
+    deliver_webhook.apply_async((job_id, body), countdown=countdown or None, retries=retries)
@@ -0,0 +1,346 @@
+"""Общие шаги исполнения job: лимиты ключа, итог вызова, запись в БД и метрики.
+
+Используются и Celery-задачей `process_job`, и async-движком воркера: отличаются только
+транспорт (sync/async) и то, как job ждёт в очереди.
+"""
+
+from __future__ import annotations
+
+import uuid
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Any
+
+import redis
+from sqlalchemy import Update, and_, func, or_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from ai_gateway.db.models import ApiKey, Job, JobAttempt, RequestLog
+from ai_gateway.infrastructure.redis import get_redis
+from ai_gateway.metrics import (
+    cost_rub_total,
+    jobs_total,
+    prompt_cache_savings_rub_total,
+    tokens_total,
+)
+from ai_gateway.providers.fallback import Served
+from ai_gateway.queue.dispatch import release_fair_slot
+from ai_gateway.queue.leases import forget_payloads, lease_deadline
+from ai_gateway.services.batches import BatchItem, finish_batch_item
+from ai_gateway.services.concurrency import Lease, try_acquire_slot
+from ai_gateway.services.errors import error_payload, map_provider_exception
+from ai_gateway.services.limits import (
+    TokenReservation,
+    TokensOverLimitError,
+    seconds_to_next_window,
+    try_reserve_tpm,
+)
+from ai_gateway.services.payloads import BlobMissingError, resolve
+from ai_gateway.services.pricing import cache_savings_rub, calc_cost_rub, load_pricing
+from ai_gateway.services.redaction import redact_result_summary
+from ai_gateway.services.templates import ExpandedRequest, expand_request, redact_request
+from ai_gateway.services.tokens import estimate_request_tokens
+from ai_gateway.settings import get_settings
+
+TERMINAL_STATUSES = frozenset({"succeeded", "failed"})
+
+
+class JobMustWait(Exception):
+    """Лимиты ключа сейчас выбраны (слоты `max_concurrent`, TPM) — job подождёт в очереди."""
+
+    def __init__(self, countdown: int) -> None:
+        super().__init__(countdown)
+        self.countdown = countdown
+
+
+class JobRejected(Exception):
+    """Job не выполнить ни в одной попытке (истёк payload, запрос больше TPM) — сразу `failed`."""
+
+    def __init__(self, code: str, text: str) -> None:
+        super().__init__(code, text)
+        self.code = code
+        self.text = text
+
+
+@dataclass(frozen=True)
+class ClaimedJob:
+    """Job, взятая в работу, и лимиты её ключа — из одного `UPDATE ... RETURNING`."""
+
+    job: Job
+    max_concurrent: int | None
+    tpm_limit: int | None
+
+
+def claim_statement(job_uuid: uuid.UUID) -> Update:
+    """Claim одним statement: `running`, номер попытки +1, lease, без lock на время вызова.
+
+    Берётся job в очереди или `running` с истёкшим lease (её воркер умер). Ничего не вернул —
+    job нет, она завершена или её сейчас выполняет другой воркер.
+    """
+    lease_expired = or_(Job.lease_expires_at.is_(None), Job.lease_expires_at < func.now())
+    return (
+        update(Job)
+        .where(
+            Job.id == job_uuid,
+            or_(Job.status == "queued", and_(Job.status == "running", lease_expired)),
+            ApiKey.id == Job.api_key_id,
+        )
+        .values(
+            status="running",
+            attempt_count=Job.attempt_count + 1,
+            lease_expires_at=lease_deadline(),
+        )
+        .returning(Job, ApiKey.max_concurrent, ApiKey.tpm_limit)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def unclaim_statement(job_uuid: uuid.UUID, attempt: int) -> Update:
+    """Job возвращается в очередь: снимаем `running` своей попытки, она не засчитывается."""
+    return (
+        update(Job)
+        .where(Job.id == job_uuid, Job.status == "running", Job.attempt_count == attempt)
+        .values(status="queued", attempt_count=Job.attempt_count - 1, lease_expires_at=None)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def load_job_request(job: Job, payload: dict[str, Any]) -> ExpandedRequest:
+    """Payload из задачи (inline или ссылка на blob) → развёрнутый запрос.
+
+    Blob истёк — `JobRejected`: job уже не выполнить, см. `reject_job`.
+    """
+    try:
+        return expand_request(job.kind, resolve(payload))
+    except BlobMissingError:
+        raise JobRejected(
+            "payload_expired",
+            "Payload job не найден в blob store (истёк JOB_BLOB_TTL_SECONDS)",
+        ) from None
+
+
+def reject_job(job: Job, e: JobRejected) -> None:
+    job.status = "failed"
+    job.lease_expires_at = None
+    job.error_code = e.code
+    job.error_text = e.text
+
+
+def batch_item(job: Job, out: JobOutcome | None = None) -> BatchItem | None:
+    """Итог job пачки `/v1/batches` для файла результатов; строится до commit.
+
+    Без `out` (job уже завершена раньше) тело ответа не восстановить — строка без него.
+    """
+    if job.batch_id is None:
+        return None
+    ok = job.status == "succeeded"
+    return BatchItem(
+        batch_id=str(job.batch_id),
+        job_id=str(job.id),
+        custom_id=job.custom_id or "",
+        succeeded=ok,
+        request_id=(job.result_redacted or {}).get("request_id"),
+        body=out.resp_json if out is not None and ok else None,
+        error_code=None if ok else job.error_code,
+        error_message=None if ok else (out and out.public_err_msg) or job.error_text,
+    )
+
+
+def settle_job(job_id: str, item: BatchItem | None = None) -> None:
+    """Job завершена и в очередь не вернётся: копия payload, место в окне, итог в пачке."""
+    r = get_redis()
+    forget_payloads(r, job_id)
+    release_fair_slot(job_id)
+    if item is not None:
+        finish_batch_item(r, item)
+
+
+def take_job_limits(
+    r: redis.Redis,
+    claim: ClaimedJob,
+    request: ExpandedRequest,
+) -> tuple[Lease, TokenReservation]:
+    """Слот `max_concurrent` и резерв TPM под job; не хватает — `JobMustWait`.
+
+    Запрос больше самого TPM-лимита — `JobRejected`: в очереди он не дождётся окна.
+    """
+    settings = get_settings()
+    job = claim.job
+    lease = try_acquire_slot(r, str(job.api_key_id), claim.max_concurrent)
+    if lease is None:
+        raise JobMustWait(settings.concurrency_job_retry_seconds)
+    try:
+        tpm = try_reserve_tpm(
+            r,
+            str(job.api_key_id),
+            job.model,
+            estimate_request_tokens(job.kind, request.payload),
+            claim.tpm_limit,
+        )
+    except TokensOverLimitError as e:
+        lease.release()
+        raise JobRejected("tpm_exceeds_limit", e.message()) from None
+    if tpm is None:
+        lease.release()
+        raise JobMustWait(seconds_to_next_window())
+    return lease, tpm
+
+
+@dataclass
+class JobOutcome:
+    """Итог одной попытки: кто обслужил, usage, ошибка."""
+
+    provider: str
+    model: str
+    status: str = "failed"
+    resp_json: dict[str, Any] | None = None
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+    total_tokens: int | None = None
+    cached_tokens: int | None = None
+    err_code: str | None = None
+    err_text: str | None = None
+    public_err_msg: str | None = None
+    latency_ms: int = 0
+
+    def succeeded(self, served: Served, job_model: str) -> None:
+        res = served.result
+        self.provider = served.provider
+        self.model = served.model or job_model
+        self.status = "succeeded"
+        self.resp_json = res.json
+        self.prompt_tokens = res.prompt_tokens
+        self.completion_tokens = res.completion_tokens
+        self.total_tokens = res.total_tokens
+        self.cached_tokens = res.cached_tokens
+
+    def failed(self, exc: Exception) -> None:
+        pub = map_provider_exception(exc)
+        self.err_code = pub.code
+        self.err_text = str(exc)
+        self.public_err_msg = pub.message
+        self.resp_json = error_payload(pub)
+
+    def used_tokens(self, tpm: TokenReservation) -> int:
+        """Сколько списать из TPM: факт из usage, иначе зарезервированное."""
+        return self.total_tokens if self.total_tokens is not None else tpm.reserved
+
+
+def record_job_outcome(
+    session: Session | AsyncSession,
+    job: Job,
+    request: ExpandedRequest,
+    out: JobOutcome,
+) -> tuple[Decimal | None, dict[str, Any] | None]:
+    """Добавляет RequestLog/JobAttempt и итог в job (commit — за вызывающим).
+
+    Номер попытки — `job.attempt_count`, выставленный при claim.
+
+    Возвращает стоимость и тело вебхука (`None`, если вебхук не задан).
+    """
+    cost = calc_cost_rub(
+        out.model,
+        out.prompt_tokens,
+        out.completion_tokens,
+        load_pricing(),
+        out.provider,
+        out.cached_tokens,
+    )
+    # id задаём сами: он нужен для meta/webhook до flush.
+    req_id = uuid.uuid4()
+    session.add(
+        RequestLog(
+            id=req_id,
+            api_key_id=job.api_key_id,
+            kind=job.kind,
+            provider=out.provider,
+            model=out.model,
+            status=out.status,
+            error_code=out.err_code,
+            error_text=out.err_text,
+            prompt_tokens=out.prompt_tokens,
+            completion_tokens=out.completion_tokens,
+            total_tokens=out.total_tokens,
+            cached_tokens=out.cached_tokens,
+            cost_rub=cost,
+            latency_ms=out.latency_ms,
+            request_payload_redacted=redact_request(job.kind, request.compact, request.template),
+            response_payload_redacted=redact_result_summary(out.resp_json or {}),
+        )
+    )
+    session.add(
+        JobAttempt(
+            job_id=job.id,
+            attempt=job.attempt_count,
+            status=out.status,
+            error_text=out.err_text,
+            latency_ms=out.latency_ms,
+        )
+    )
+
+    cost_rub = float(cost) if cost is not None else None
+    job.status = out.status
+    job.lease_expires_at = None
+    job.error_code = out.err_code
+    job.error_text = out.err_text
+    job.result_redacted = {
+        "request_id": str(req_id),
+        "provider": out.provider,
+        "model": out.model,
+        "latency_ms": out.latency_ms,
+        "tokens": {
+            "prompt": out.prompt_tokens,
+            "completion": out.completion_tokens,
+            "total": out.total_tokens,
+            "cached": out.cached_tokens,
+        },
+        "cost_rub": cost_rub,
+        "result": redact_result_summary(out.resp_json or {}),
+    }
+
+    if not job.webhook_url:
+        return cost, None
+    body: dict[str, Any] = {
+        "job_id": str(job.id),
+        "status": out.status,
+        "meta": {
+            "request_id": str(req_id),
+            "provider": out.provider,
+            "model": out.model,
+            "latency_ms": out.latency_ms,
+            "cost_rub": cost_rub,
+            "attempt": job.attempt_count,
+        },
+    }
+    if out.status == "succeeded":
+        body["result"] = out.resp_json
+    else:
+        body["error"] = {
+            "code": out.err_code,
+            "message": out.public_err_msg or "Ошибка провайдера",
+        }
+    return cost, body
+
+
+def count_job_outcome(out: JobOutcome, cost: Decimal | None) -> None:
+    """Метрики по завершённой попытке (после commit)."""
+    model = out.model or "-"
+    jobs_total.labels(provider=out.provider, status=out.status).inc()
+    if out.total_tokens is not None:
+        tokens_total.labels(provider=out.provider, model=model, kind="total").inc(out.total_tokens)
+    if out.prompt_tokens is not None:
+        tokens_total.labels(provider=out.provider, model=model, kind="prompt").inc(
+            out.prompt_tokens
+        )
+    if out.cached_tokens:
+        tokens_total.labels(provider=out.provider, model=model, kind="cached").inc(
+            out.cached_tokens
+        )
+        savings = cache_savings_rub(out.model, out.cached_tokens, load_pricing(), out.provider)
+        if savings:
+            prompt_cache_savings_rub_total.labels(provider=out.provider, model=model).inc(
+                float(savings)
+            )
+    if cost is not None:
+        cost_rub_total.labels(provider=out.provider, model=model).inc(float(cost))
@@ -0,0 +1,174 @@
+"""Справедливая очередь jobs по ключам (`JOB_FAIR_QUEUING`): deficit round robin перед воркерами.
+
+Новые jobs не идут в брокер сразу, а ложатся в очередь своего ключа (ZSET: сначала выше
+`priority`, внутри — FIFO). В брокере (Celery или Streams) одновременно не больше
+`JOB_FAIR_WINDOW` jobs; освободившиеся места раздаются ключам по кругу, каждому — до веса его
+класса (`JOB_FAIR_WEIGHTS` по `api_keys.priority`) за ход. Ключ с 50k jobs получает свою долю
+воркеров, а не все. Ретраи и ожидание лимитов идут в брокер напрямую: место в окне job уже
+занимает, пока не завершится (или не истечёт `JOB_FAIR_LEASE_SECONDS`; пока job выполняется,
+heartbeat воркера его продлевает).
+"""
+
+from __future__ import annotations
+
+import json
+import time
+from dataclasses import dataclass
+from typing import Any
+
+import redis
+
+from ai_gateway.metrics import job_fair_queue_depth, job_fair_wait_seconds
+from ai_gateway.settings import get_settings
+
+ACTIVE_KEY = "jobs:fair:active"
+DEFICIT_KEY = "jobs:fair:deficit"
+WEIGHT_KEY = "jobs:fair:weight"
+INFLIGHT_KEY = "jobs:fair:inflight"
+SEQ_KEY = "jobs:fair:seq"
+QUEUE_PREFIX = "jobs:fair:q:"
+
+MIN_PRIORITY = 0
+MAX_PRIORITY = 9
+DEFAULT_PRIORITY = 5
+
+# Score = полоса приоритета + сквозной номер постановки: ZPOPMIN берёт высший приоритет, затем FIFO.
+_BAND = 10**13
+
+# KEYS[1] = active list, KEYS[2] = weight hash; ARGV[1] = tenant, ARGV[2] = weight,
+# ARGV[3] = queue prefix, ARGV[4..] = пары score, member.
+ENQUEUE_SCRIPT = """
+local q = ARGV[3] .. ARGV[1]
+if redis.call('ZCARD', q) == 0 then
+  redis.call('RPUSH', KEYS[1], ARGV[1])
+end
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+for i = 4, #ARGV, 2 do
+  redis.call('ZADD', q, ARGV[i], ARGV[i + 1])
+end
+return redis.call('ZCARD', q)
+"""
+
+# KEYS[1] = active list, KEYS[2] = deficit hash, KEYS[3] = weight hash, KEYS[4] = inflight zset;
+# ARGV[1] = now, ARGV[2] = window, ARGV[3] = lease seconds, ARGV[4] = queue prefix.
+# Ключ в active ⇔ его очередь не пуста. Возвращает пары tenant, member.
+DISPATCH_SCRIPT = """
+local now = tonumber(ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[4], '-inf', now - tonumber(ARGV[3]))
+local free = tonumber(ARGV[2]) - redis.call('ZCARD', KEYS[4])
+local out = {}
+while free > 0 do
+  local tenant = redis.call('LINDEX', KEYS[1], 0)
+  if not tenant then break end
+  local q = ARGV[4] .. tenant
+  local deficit = tonumber(redis.call('HGET', KEYS[2], tenant) or '0')
+  if deficit < 1 then
+    deficit = deficit + math.max(1, tonumber(redis.call('HGET', KEYS[3], tenant) or '1'))
+  end
+  while free > 0 and deficit >= 1 do
+    local item = redis.call('ZPOPMIN', q)
+    if #item == 0 then break end
+    redis.call('ZADD', KEYS[4], now, string.match(item[1], '^([^|]+)|'))
+    table.insert(out, tenant)
+    table.insert(out, item[1])
+    deficit = deficit - 1
+    free = free - 1
+  end
+  if redis.call('ZCARD', q) == 0 then
+    redis.call('LPOP', KEYS[1])
+    redis.call('HDEL', KEYS[2], tenant)
+  else
+    redis.call('HSET', KEYS[2], tenant, deficit)
+    if deficit < 1 then
+      redis.call('LMOVE', KEYS[1], KEYS[1], 'LEFT', 'RIGHT')
+    end
+  end
+end
+return out
+"""
+
+
+@dataclass(frozen=True)
+class Tenant:
+    """Чья это job для планировщика: ключ и его вес."""
+
+    api_key_id: str
+    weight: int = 1
+
+
+def tenant_for(api_key_id: str, key_priority: str | None) -> Tenant:
+    weights = get_settings().job_fair_weights
+    return Tenant(api_key_id, max(1, int(weights.get(key_priority or "normal", 1))))
+
+
+def _score(priority: int, seq: int) -> int:
+    priority = min(MAX_PRIORITY, max(MIN_PRIORITY, priority))
+    return (MAX_PRIORITY - priority) * _BAND + seq % _BAND
+
+
+def _member(job_id: str, payload: dict[str, Any], now: float) -> str:
+    # `job_id|время постановки|payload`: id нужен скрипту, время — метрике ожидания.
+    body = json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+    return f"{job_id}|{now:.3f}|{body}"
+
+
+def push(
+    r: redis.Redis,
+    tenant: Tenant,
+    jobs: list[tuple[str, dict[str, Any]]],
+    priorities: list[int],
+) -> int:
+    """Кладёт jobs в очередь ключа; возвращает её глубину."""
+    now = time.time()
+    seq = int(r.incrby(SEQ_KEY, len(jobs))) - len(jobs)
+    args: list[Any] = [tenant.api_key_id, tenant.weight, QUEUE_PREFIX]
+    for i, ((job_id, payload), priority) in enumerate(zip(jobs, priorities, strict=True)):
+        args += [_score(priority, seq + i), _member(job_id, payload, now)]
+    return int(r.eval(ENQUEUE_SCRIPT, 2, ACTIVE_KEY, WEIGHT_KEY, *args))
+
+
+def take(r: redis.Redis) -> list[tuple[str, dict[str, Any]]]:
+    """Раздаёт свободные места окна по DRR; возвращает jobs, которые надо отдать брокеру."""
+    settings = get_settings()
+    now = time.time()
+    raw = r.eval(
+        DISPATCH_SCRIPT,
+        4,
+        ACTIVE_KEY,
+        DEFICIT_KEY,
+        WEIGHT_KEY,
+        INFLIGHT_KEY,
+        now,
+        settings.job_fair_window,
+        settings.job_fair_lease_seconds,
+        QUEUE_PREFIX,
+    )
+    jobs: list[tuple[str, dict[str, Any]]] = []
+    for i in range(0, len(raw), 2):
+        tenant, member = str(raw[i]), str(raw[i + 1])
+        job_id, queued_at, payload = member.split("|", 2)
+        jobs.append((job_id, json.loads(payload)))
+        job_fair_wait_seconds.labels(api_key_id=tenant).observe(max(0.0, now - float(queued_at)))
+    return jobs
+
+
+def renew(r: redis.Redis, job_id: str) -> None:
+    """Job ещё выполняется: продлевает её место в окне (только если оно ещё есть)."""
+    r.zadd(INFLIGHT_KEY, {job_id: time.time()}, xx=True)
+
+
+def release(r: redis.Redis, job_id: str) -> None:
+    """Job завершена: её место в окне свободно."""
+    r.zrem(INFLIGHT_KEY, job_id)
+
+
+def refresh_depth_metrics(r: redis.Redis) -> None:
+    """`job_fair_queue_depth` по ключам с непустой очередью (на scrape `/metrics`)."""
+    tenants = [str(t) for t in r.lrange(ACTIVE_KEY, 0, -1)]
+    pipe = r.pipeline(transaction=False)
+    for tenant in tenants:
+        pipe.zcard(QUEUE_PREFIX + tenant)
+    depths = pipe.execute()
+    job_fair_queue_depth.clear()
+    for tenant, depth in zip(tenants, depths, strict=True):
+        job_fair_queue_depth.labels(api_key_id=tenant).set(depth)
@@ -0,0 +1,139 @@
+"""Lease jobs в `running`: кто сейчас выполняет job и до какого момента.
+
+Claim выставляет `jobs.lease_expires_at`, воркер продлевает его heartbeat'ом, пока идёт вызов
+upstream (тем же heartbeat'ом — и место job в окне справедливой очереди). Умер воркер — lease
+истекает, и reaper (`queue.reaper`) возвращает job в очередь.
+Payload из брокера на это время лежит в Redis (`RUNNING_PAYLOADS_KEY`): без него вернуть job
+в очередь нечем, брокер свою копию уже отдал.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import threading
+import uuid
+from collections.abc import AsyncIterator
+from datetime import timedelta
+from typing import Any
+
+import redis
+import structlog
+from sqlalchemy import ColumnElement, Update, func, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from ai_gateway.db.models import Job
+from ai_gateway.infrastructure.db import SessionLocal
+from ai_gateway.settings import get_settings
+
+from .dispatch import renew_fair_slot
+
+log = structlog.get_logger()
+
+RUNNING_PAYLOADS_KEY = "jobs:running:payloads"
+
+
+def lease_deadline() -> ColumnElement[Any]:
+    """Конец lease по часам БД (часы воркеров могут расходиться)."""
+    return func.now() + timedelta(seconds=get_settings().job_lease_seconds)
+
+
+def renew_statement(job_uuid: uuid.UUID, attempt: int) -> Update:
+    return (
+        update(Job)
+        .where(Job.id == job_uuid, Job.status == "running", Job.attempt_count == attempt)
+        .values(lease_expires_at=lease_deadline())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def renew_lease(job_uuid: uuid.UUID, attempt: int) -> bool:
+    """Продлевает lease своей попытки; `False` — job уже не наша (lease забрал reaper)."""
+    session = SessionLocal()
+    try:
+        renewed = session.execute(renew_statement(job_uuid, attempt)).rowcount
+        session.commit()
+        return bool(renewed)
+    finally:
+        session.close()
+
+
+class Heartbeat:
+    """Тред, продлевающий lease, пока sync-воркер ждёт upstream."""
+
+    def __init__(self, job_uuid: uuid.UUID, attempt: int) -> None:
+        self.job_uuid = job_uuid
+        self.attempt = attempt
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="job-heartbeat", daemon=True)
+
+    def __enter__(self) -> Heartbeat:
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self._stop.set()
+        self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        interval = get_settings().job_heartbeat_seconds
+        while not self._stop.wait(interval):
+            try:
+                if not renew_lease(self.job_uuid, self.attempt):
+                    log.warning("job_lease_lost", job_id=str(self.job_uuid))
+                    return
+                renew_fair_slot(str(self.job_uuid))
+            except Exception as e:
+                # Следующий heartbeat попробует снова; lease длиннее нескольких интервалов.
+                log.warning("job_heartbeat_failed", job_id=str(self.job_uuid), err=str(e))
+
+
+@contextlib.asynccontextmanager
+async def aheartbeat(
+    factory: async_sessionmaker[AsyncSession],
+    job_uuid: uuid.UUID,
+    attempt: int,
+) -> AsyncIterator[None]:
+    """Heartbeat на event loop, пока async-движок ждёт upstream."""
+
+    async def beat() -> None:
+        interval = get_settings().job_heartbeat_seconds
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                async with factory() as session:
+                    renewed = (await session.execute(renew_statement(job_uuid, attempt))).rowcount
+                    await session.commit()
+                if renewed:
+                    await asyncio.to_thread(renew_fair_slot, str(job_uuid))
+            except Exception as e:
+                log.warning("job_heartbeat_failed", job_id=str(job_uuid), err=str(e))
+                continue
+            if not renewed:
+                log.warning("job_lease_lost", job_id=str(job_uuid))
+                return
+
+    task = asyncio.create_task(beat())
+    try:
+        yield
+    finally:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+
+def remember_payload(r: redis.Redis, job_id: str, payload: dict[str, Any]) -> None:
+    """Копия payload задачи на время `running` — для возврата job в очередь reaper'ом."""
+    r.hset(RUNNING_PAYLOADS_KEY, job_id, json.dumps(payload, separators=(",", ":")))
+
+
+def forget_payloads(r: redis.Redis, *job_ids: str) -> None:
+    if job_ids:
+        r.hdel(RUNNING_PAYLOADS_KEY, *job_ids)
+
+
+def running_payloads(r: redis.Redis, job_ids: list[str]) -> list[dict[str, Any] | None]:
+    if not job_ids:
+        return []
+    return [json.loads(raw) if raw else None for raw in r.hmget(RUNNING_PAYLOADS_KEY, job_ids)]
@@ -0,0 +1,125 @@
+"""Reaper: jobs в `running` с истёкшим lease — их воркер умер посреди вызова.
+
+Такая job возвращается в очередь с сохранённым payload (`queue.leases`); попытка при этом
+засчитана. После `JOB_MAX_ATTEMPTS` попыток или без payload job завершается ошибкой
+`worker_lost`. Запускается `celery beat` или воркером Streams (`JOB_REAPER_INTERVAL_SECONDS`);
+несколько reaper'ов не мешают друг другу (`FOR UPDATE SKIP LOCKED`).
+"""
+
+from __future__ import annotations
+
+import uuid
+from typing import Any
+
+import structlog
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.orm import Session
+
+from ai_gateway.db.models import Job
+from ai_gateway.infrastructure.db import SessionLocal
+from ai_gateway.infrastructure.redis import get_redis
+from ai_gateway.metrics import job_lease_reclaimed_total, job_stuck_running
+from ai_gateway.services.job_events import publish_job_status, status_entry
+from ai_gateway.settings import get_settings
+
+from .dispatch import enqueue_jobs
+from .execution import batch_item, settle_job
+from .leases import forget_payloads, running_payloads
+
+log = structlog.get_logger()
+
+
+def partition_expired(
+    rows: list[tuple[uuid.UUID, int]],
+    payloads: list[dict[str, Any] | None],
+    max_attempts: int,
+) -> tuple[list[tuple[str, dict[str, Any]]], dict[str, str]]:
+    """Что вернуть в очередь `(job_id, payload)`, а что завершить ошибкой `{job_id: текст}`."""
+    requeue: list[tuple[str, dict[str, Any]]] = []
+    fail: dict[str, str] = {}
+    for (job_uuid, attempts), payload in zip(rows, payloads, strict=True):
+        job_id = str(job_uuid)
+        if attempts >= max_attempts:
+            fail[job_id] = (
+                f"Воркер пропадал посреди выполнения {attempts} раз(а), попытки исчерпаны"
+            )
+        elif payload is None:
+            fail[job_id] = "Воркер пропал посреди выполнения, payload задачи не сохранился"
+        else:
+            requeue.append((job_id, payload))
+    return requeue, fail
+
+
+def _fail(session: Session, fail: dict[str, str]) -> list[Job]:
+    jobs: list[Job] = []
+    for job_id, text in fail.items():
+        jobs.extend(
+            session.scalars(
+                update(Job)
+                .where(Job.id == uuid.UUID(job_id), Job.status == "running")
+                .values(
+                    status="failed",
+                    lease_expires_at=None,
+                    error_code="worker_lost",
+                    error_text=text,
+                )
+                .returning(Job)
+                .execution_options(synchronize_session=False)
+            )
+        )
+    return jobs
+
+
+def reap_expired_jobs() -> int:
+    """Один проход: до `JOB_REAPER_BATCH` jobs; возвращает, сколько подобрано."""
+    settings = get_settings()
+    r = get_redis()
+    session: Session = SessionLocal(expire_on_commit=False)
+    try:
+        # Lease NULL у `running` — строки, взятые до появления lease: их тоже некому завершить.
+        rows = [
+            (job_id, attempts)
+            for job_id, attempts in session.execute(
+                select(Job.id, Job.attempt_count)
+                .where(
+                    Job.status == "running",
+                    or_(Job.lease_expires_at.is_(None), Job.lease_expires_at < func.now()),
+                )
+                .order_by(Job.lease_expires_at)
+                .limit(settings.job_reaper_batch)
+                .with_for_update(skip_locked=True)
+            )
+        ]
+        job_stuck_running.set(len(rows))
+        if not rows:
+            session.rollback()
+            return 0
+
+        payloads = running_payloads(r, [str(job_id) for job_id, _ in rows])
+        requeue, fail = partition_expired(rows, payloads, settings.job_max_attempts)
+        if requeue:
+            session.execute(
+                update(Job)
+                .where(Job.id.in_([uuid.UUID(job_id) for job_id, _ in requeue]))
+                .values(status="queued", lease_expires_at=None)
+                .execution_options(synchronize_session=False)
+            )
+        failed = _fail(session, fail)
+        items = [(str(job.id), batch_item(job), status_entry(job)) for job in failed]
+        session.commit()
+    finally:
+        session.close()
+
+    if requeue:
+        # Напрямую в брокер, как ретраи: место в окне fair-очереди job уже занимала.
+        enqueue_jobs(requeue)
+        forget_payloads(r, *[job_id for job_id, _ in requeue])
+        for job_id, _ in requeue:
+            publish_job_status(job_id, "queued", r)
+        job_lease_reclaimed_total.labels(action="requeued").inc(len(requeue))
+    for job_id, item, entry in items:
+        publish_job_status(job_id, "failed", r, entry=entry)
+        settle_job(job_id, item)
+    job_lease_reclaimed_total.labels(action="failed").inc(len(items))
+    log.warning("jobs_reaped", requeued=len(requeue), failed=len(items))
+    return len(rows)
@@ -0,0 +1,331 @@
+"""Воркер Redis Streams (`ai-gateway worker`): jobs и вебхуки на одном event loop.
+
+Читает consumer group, держит не больше `JOB_ASYNC_CONCURRENCY` задач одновременно и берёт
+из stream ровно столько, сколько есть свободных мест. Запись подтверждается (XACK) только
+после того, как задача отработала: записи упавшего воркера остаются в pending и через
+`JOB_STREAM_CLAIM_IDLE_SECONDS` забираются другими. Ретраи — новые записи через ZSET
+отложенных задач, а не повторная доставка старой.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import signal
+import socket
+import time
+import uuid
+
+import redis
+import redis.asyncio
+import structlog
+from sqlalchemy import update
+
+from ai_gateway.db.models import Job
+from ai_gateway.infrastructure.db import get_async_session_factory
+from ai_gateway.infrastructure.redis import get_async_redis
+from ai_gateway.metrics import (
+    job_engine_in_flight,
+    job_stream_dead_letters_total,
+    job_stream_reclaimed_total,
+)
+from ai_gateway.queue.async_engine import finish_job, run_job
+from ai_gateway.queue.dispatch import enqueue_webhook, pump_fair_queue
+from ai_gateway.queue.execution import TERMINAL_STATUSES
+from ai_gateway.queue.reaper import reap_expired_jobs
+from ai_gateway.queue.streams import (
+    DELAYED_KEY,
+    GROUP,
+    PROMOTE_SCRIPT,
+    STREAM_KEY,
+    TASK_JOB,
+    TASK_WEBHOOK,
+    StreamTask,
+)
+from ai_gateway.queue.tasks import (
+    WebhookRetry,
+    deliver_webhook,
+    send_webhook,
+    webhook_retry_countdown,
+)
+from ai_gateway.services.job_events import publish_job_status, status_entry
+from ai_gateway.services.payloads import check_codecs, discard
+from ai_gateway.settings import get_settings
+
+log = structlog.get_logger()
+
+_PROMOTE_INTERVAL_SECONDS = 0.5
+_PROMOTE_BATCH = 100
+
+
+class StreamWorker:
+    """Consumer группы `GROUP`; `run()` работает, пока не вызван `stop()`."""
+
+    def __init__(
+        self,
+        r: redis.asyncio.Redis,
+        concurrency: int,
+        consumer: str | None = None,
+    ) -> None:
+        settings = get_settings()
+        self.r = r
+        self.concurrency = max(1, concurrency)
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self._claim_idle_ms = int(settings.job_stream_claim_idle_seconds * 1000)
+        self._max_deliveries = settings.job_stream_max_deliveries
+        self._promote = r.register_script(PROMOTE_SCRIPT)
+        self._inflight: dict[str, asyncio.Task[None]] = {}
+        self._freed = asyncio.Event()
+        self._stopping = asyncio.Event()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self._freed.set()
+
+    async def run(self, shutdown_seconds: float = 30.0) -> None:
+        await self._ensure_group()
+        background = [
+            asyncio.create_task(self._promote_loop()),
+            asyncio.create_task(self._maintain_loop()),
+        ]
+        if get_settings().job_reaper_interval_seconds > 0:
+            background.append(asyncio.create_task(self._reap_loop()))
+        log.info("job_stream_worker_started", consumer=self.consumer, concurrency=self.concurrency)
+        try:
+            await self._read_loop()
+        finally:
+            for t in background:
+                t.cancel()
+            if self._inflight:
+                await asyncio.wait(set(self._inflight.values()), timeout=shutdown_seconds)
+            if self._inflight:
+                # Без ack: записи останутся в pending и достанутся другим воркерам.
+                log.warning("job_stream_stopped_with_running_tasks", running=len(self._inflight))
+
+    async def _ensure_group(self) -> None:
+        try:
+            await self.r.xgroup_create(STREAM_KEY, GROUP, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def _read_loop(self) -> None:
+        while not self._stopping.is_set():
+            free = self.concurrency - len(self._inflight)
+            if free <= 0:
+                self._freed.clear()
+                await self._freed.wait()
+                continue
+            try:
+                resp = await self.r.xreadgroup(
+                    GROUP,
+                    self.consumer,
+                    {STREAM_KEY: ">"},
+                    count=free,
+                    block=1000,
+                )
+            except redis.ConnectionError as e:
+                log.warning("job_stream_read_failed", err=str(e))
+                await asyncio.sleep(1)
+                continue
+            for _, entries in resp or []:
+                for entry_id, fields in entries:
+                    self._start(entry_id, fields)
+
+    def _start(self, entry_id: str, fields: dict[str, str]) -> None:
+        task = asyncio.create_task(self._handle(entry_id, fields))
+        self._inflight[entry_id] = task
+        job_engine_in_flight.inc()
+        task.add_done_callback(lambda _: self._done(entry_id))
+
+    def _done(self, entry_id: str) -> None:
+        self._inflight.pop(entry_id, None)
+        job_engine_in_flight.dec()
+        self._freed.set()
+
+    async def _handle(self, entry_id: str, fields: dict[str, str]) -> None:
+        try:
+            task = StreamTask.decode(fields["task"])
+        except Exception as e:
+            log.warning("job_stream_bad_entry", entry_id=entry_id, err=str(e))
+            await self._ack(entry_id)
+            return
+        try:
+            await self._execute(task)
+        except Exception as e:
+            # Без ack: запись будет доставлена снова (не больше JOB_STREAM_MAX_DELIVERIES раз).
+            log.warning("job_stream_task_failed", entry_id=entry_id, type=task.type, err=str(e))
+            return
+        await self._ack(entry_id)
+
+    async def _execute(self, task: StreamTask) -> None:
+        if task.type == TASK_JOB:
+            job_id, payload = task.args
+            await run_job(job_id, payload, task.retries)
+        elif task.type == TASK_WEBHOOK:
+            job_id, body = task.args
+            try:
+                await asyncio.to_thread(send_webhook, job_id, body)
+            except WebhookRetry:
+                if task.retries < deliver_webhook.max_retries:
+                    await asyncio.to_thread(
+                        enqueue_webhook,
+                        job_id,
+                        body,
+                        countdown=webhook_retry_countdown(task.retries),
+                        retries=task.retries + 1,
+                    )
+                    return
+            await asyncio.to_thread(discard, body)
+        else:
+            log.warning("job_stream_unknown_task", type=task.type)
+
+    async def _ack(self, entry_id: str) -> None:
+        async with self.r.pipeline(transaction=True) as pipe:
+            pipe.xack(STREAM_KEY, GROUP, entry_id)
+            pipe.xdel(STREAM_KEY, entry_id)
+            await pipe.execute()
+
+    async def _promote_loop(self) -> None:
+        fair_queuing = get_settings().job_fair_queuing
+        while True:
+            try:
+                await self.promote_due()
+                if fair_queuing:
+                    # Места, освобождённые по истечении lease, иначе никто не раздаст.
+                    await asyncio.to_thread(pump_fair_queue)
+            except Exception as e:
+                log.warning("job_stream_promote_failed", err=str(e))
+            await asyncio.sleep(_PROMOTE_INTERVAL_SECONDS)
+
+    async def promote_due(self) -> int:
+        """Переносит наступившие отложенные задачи в stream."""
+        return int(
+            await self._promote(keys=[DELAYED_KEY, STREAM_KEY], args=[time.time(), _PROMOTE_BATCH])
+        )
+
+    async def _maintain_loop(self) -> None:
+        interval = max(1.0, self._claim_idle_ms / 3000)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh_inflight()
+                await self.reclaim()
+            except Exception as e:
+                log.warning("job_stream_maintenance_failed", err=str(e))
+
+    async def _reap_loop(self) -> None:
+        interval = get_settings().job_reaper_interval_seconds
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(reap_expired_jobs)
+            except Exception as e:
+                log.warning("job_reaper_failed", err=str(e))
+
+    async def refresh_inflight(self) -> None:
+        """Сбрасывает idle своих записей: долгий вызов LLM не должен выглядеть как смерть."""
+        if self._inflight:
+            await self.r.xclaim(
+                STREAM_KEY,
+                GROUP,
+                self.consumer,
+                0,
+                list(self._inflight),
+                justid=True,
+            )
+
+    async def reclaim(self) -> int:
+        """Забирает записи, которые давно никто не подтверждает (их consumer умер)."""
+        free = self.concurrency - len(self._inflight)
+        if free <= 0 or self._stopping.is_set():
+            return 0
+        pending = await self.r.xpending_range(
+            STREAM_KEY,
+            GROUP,
+            min="-",
+            max="+",
+            count=free,
+            idle=self._claim_idle_ms,
+        )
+        stale: list[str] = []
+        for p in pending:
+            if p["message_id"] in self._inflight:
+                continue
+            if p["times_delivered"] >= self._max_deliveries:
+                await self._dead_letter(p["message_id"], p["times_delivered"])
+            else:
+                stale.append(p["message_id"])
+        if not stale:
+            return 0
+
+        claimed = await self.r.xclaim(STREAM_KEY, GROUP, self.consumer, self._claim_idle_ms, stale)
+        n = 0
+        for entry_id, fields in claimed:
+            if not fields:
+                # Запись удалили из stream, а в pending осталась ссылка.
+                await self._ack(entry_id)
+                continue
+            log.info("job_stream_reclaimed", entry_id=entry_id, consumer=self.consumer)
+            job_stream_reclaimed_total.inc()
+            self._start(entry_id, fields)
+            n += 1
+        return n
+
+    async def _dead_letter(self, entry_id: str, deliveries: int) -> None:
+        """Снимает запись, на которой воркеры падают раз за разом; job помечаем failed."""
+        entries = await self.r.xrange(STREAM_KEY, entry_id, entry_id)
+        task: StreamTask | None = None
+        if entries:
+            try:
+                task = StreamTask.decode(entries[0][1]["task"])
+            except Exception:
+                task = None
+        kind = task.type if task is not None else "unknown"
+        log.error("job_stream_dead_letter", entry_id=entry_id, type=kind, deliveries=deliveries)
+        job_stream_dead_letters_total.labels(type=kind).inc()
+        if task is not None and task.type == TASK_JOB:
+            await _fail_job(str(task.args[0]), deliveries)
+        await self._ack(entry_id)
+
+
+async def _fail_job(job_id: str, deliveries: int) -> None:
+    try:
+        job_uuid = uuid.UUID(job_id)
+    except ValueError:
+        return
+    async with get_async_session_factory()() as session:
+        job = (
+            await session.execute(
+                update(Job)
+                .where(Job.id == job_uuid, Job.status.not_in(TERMINAL_STATUSES))
+                .values(
+                    status="failed",
+                    lease_expires_at=None,
+                    error_code="worker_failed",
+                    error_text=f"Задача снята после {deliveries} доставок без подтверждения",
+                )
+                .returning(Job)
+            )
+        ).scalar_one_or_none()
+        await session.commit()
+    if job is not None:
+        publish_job_status(job_id, job.status, entry=status_entry(job))
+    await finish_job(job_id, job)
+
+
+def run_worker(concurrency: int | None = None) -> None:
+    """Запускает воркер до SIGTERM/SIGINT (процесс `ai-gateway worker`)."""
+    settings = get_settings()
+    if settings.job_queue != "streams":
+        log.warning("job_stream_worker_without_streams_queue", job_queue=settings.job_queue)
+    check_codecs()
+
+    async def main() -> None:
+        worker = StreamWorker(get_async_redis(), concurrency or settings.job_async_concurrency)
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, worker.stop)
+        await worker.run(settings.job_async_shutdown_seconds)
+
+    asyncio.run(main())
@@ -0,0 +1,78 @@
+"""Redis Streams как очередь jobs и вебхуков (`JOB_QUEUE=streams`): ключи и постановка задач.
+
+Задача — одна запись в stream (поле `task`, JSON), её читает consumer group воркеров
+`ai-gateway worker`. Отложенные задачи (ретраи с backoff, ожидание лимитов ключа) лежат в ZSET
+со временем готовности; воркер переносит наступившие в stream одним Lua-скриптом.
+"""
+
+from __future__ import annotations
+
+import json
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any
+
+import redis
+
+STREAM_KEY = "jobs:stream"
+DELAYED_KEY = "jobs:delayed"
+GROUP = "workers"
+
+TASK_JOB = "job"
+TASK_WEBHOOK = "webhook"
+
+# KEYS[1] = delayed zset, KEYS[2] = stream; ARGV[1] = now, ARGV[2] = batch.
+PROMOTE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, task in ipairs(due) do
+  redis.call('ZREM', KEYS[1], task)
+  redis.call('XADD', KEYS[2], '*', 'task', task)
+end
+return #due
+"""
+
+
+@dataclass(frozen=True)
+class StreamTask:
+    """Задача воркеру: тип, аргументы и номер ретрая (как `retries` у Celery)."""
+
+    type: str
+    args: list[Any]
+    retries: int = 0
+    # Уникальность члена ZSET: одинаковые ретраи не должны схлопываться в один.
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+
+    def encode(self) -> str:
+        return json.dumps(
+            {"id": self.id, "type": self.type, "args": self.args, "retries": self.retries},
+            separators=(",", ":"),
+            ensure_ascii=False,
+        )
+
+    @classmethod
+    def decode(cls, raw: str) -> StreamTask:
+        data = json.loads(raw)
+        return cls(
+            type=str(data["type"]),
+            args=list(data["args"]),
+            retries=int(data.get("retries") or 0),
+            id=str(data.get("id") or ""),
+        )
+
+
+def add_task(r: redis.Redis, task: StreamTask, countdown: float = 0) -> None:
+    """Кладёт задачу в stream или, с `countdown`, в отложенные."""
+    raw = task.encode()
+    if countdown > 0:
+        r.zadd(DELAYED_KEY, {raw: time.time() + countdown})
+    else:
+        r.xadd(STREAM_KEY, {"task": raw})
+
+
+def add_tasks(r: redis.Redis, tasks: list[StreamTask]) -> None:
+    """Пачка задач в stream одним pipeline."""
+    pipe = r.pipeline(transaction=False)
+    for task in tasks:
+        pipe.xadd(STREAM_KEY, {"task": task.encode()})
+    pipe.execute()
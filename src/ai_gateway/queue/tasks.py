@@ -10,50 +10,58 @@ from typing import Any
 import httpx
 import structlog
 from celery import Task
-from sqlalchemy import func
+from sqlalchemy import update
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
 
-from ai_gateway.db.models import Job, JobAttempt, RequestLog, WebhookDelivery
+from ai_gateway.db.models import Job, WebhookDelivery
 from ai_gateway.infrastructure.db import SessionLocal
-from ai_gateway.metrics import cost_rub_total, jobs_total, tokens_total, webhook_deliveries_total
-from ai_gateway.providers.factory import get_provider
-from ai_gateway.services.errors import error_payload, map_provider_exception
-from ai_gateway.services.pricing import calc_cost_rub, load_pricing
-from ai_gateway.services.redaction import (
-    redact_chat_payload,
-    redact_responses_payload,
-    redact_result_summary,
-)
+from ai_gateway.infrastructure.http import get_webhook_client
+from ai_gateway.infrastructure.redis import get_redis
+from ai_gateway.metrics import job_lease_lost_total, webhook_deliveries_total
+from ai_gateway.providers.base import UpstreamBusyError
+from ai_gateway.providers.context import PRIORITY_JOBS, call_priority
+from ai_gateway.providers.fallback import call_with_fallback
+from ai_gateway.services.concurrency import Lease
+from ai_gateway.services.job_events import publish_job_status, status_entry
+from ai_gateway.services.limits import TokenReservation
+from ai_gateway.services.models_catalog import configured_providers, refresh_models
+from ai_gateway.services.payloads import BlobMissingError, discard, resolve
 from ai_gateway.services.webhooks import hmac_sha256_signature
 from ai_gateway.settings import get_settings
 
 from .celery_app import celery_app
+from .dispatch import enqueue_job, enqueue_webhook, pump_fair_queue
+from .execution import (
+    TERMINAL_STATUSES,
+    ClaimedJob,
+    JobMustWait,
+    JobOutcome,
+    JobRejected,
+    batch_item,
+    claim_statement,
+    count_job_outcome,
+    load_job_request,
+    record_job_outcome,
+    reject_job,
+    settle_job,
+    take_job_limits,
+    unclaim_statement,
+)
+from .leases import Heartbeat, forget_payloads, remember_payload
+from .reaper import reap_expired_jobs
 
 log = structlog.get_logger()
 
 
-def _attempt_next(session: Session, job_id: uuid.UUID) -> int:
-    last = (
-        session.query(func.coalesce(func.max(JobAttempt.attempt), 0))
-        .filter(JobAttempt.job_id == job_id)
-        .scalar()
-    )
-    return int(last or 0) + 1
-
-
-def _wh_attempt_next(session: Session, job_id: uuid.UUID) -> int:
-    last = (
-        session.query(func.coalesce(func.max(WebhookDelivery.attempt), 0))
-        .filter(WebhookDelivery.job_id == job_id)
-        .scalar()
-    )
-    return int(last or 0) + 1
-
-
-def _job_payload_redacted(kind: str, payload: dict[str, Any]) -> dict:
-    if kind == "chat.completions":
-        return redact_chat_payload(payload)
-    return redact_responses_payload(payload)
+def _unclaim(session: Session, job_uuid: uuid.UUID, attempt: int) -> None:
+    """Job возвращается в очередь (ожидание лимитов, ретрай задачи)."""
+    session.rollback()
+    session.execute(unclaim_statement(job_uuid, attempt))
+    session.commit()
+    # Payload снова едет в задаче брокера.
+    forget_payloads(get_redis(), str(job_uuid))
+    publish_job_status(str(job_uuid), "queued")
 
 
 def _retryable_http_status(code: int) -> bool:
@@ -62,162 +70,170 @@ def _retryable_http_status(code: int) -> bool:
 
 @celery_app.task(bind=True, name="ai_gateway.process_job", max_retries=3)
 def process_job(self: Task, job_id: str, payload: dict[str, Any]) -> None:
+    if get_settings().job_engine == "async":
+        # Job выполнит event loop воркера; здесь только ждём свободное место (backpressure).
+        from ai_gateway.queue.async_engine import get_engine
+
+        get_engine().submit(job_id, payload, self.request.retries)
+        return
+
     try:
         job_uuid = uuid.UUID(job_id)
     except Exception:
         log.warning("job_invalid_id", job_id=job_id)
         return
 
-    session: Session = SessionLocal()
+    # Между claim и итогом транзакции нет: job не держит ни lock, ни соединение во время вызова.
+    session: Session = SessionLocal(expire_on_commit=False)
+    claim: ClaimedJob | None = None
+    lease: Lease | None = None
+    tpm: TokenReservation | None = None
+    used_tokens = 0
     try:
-        job = session.query(Job).filter(Job.id == job_uuid).with_for_update().one_or_none()
-        if job is None:
-            log.warning("job_not_found", job_id=job_id)
+        row = session.execute(claim_statement(job_uuid)).one_or_none()
+        session.commit()
+        if row is None:
+            job = session.get(Job, job_uuid)
+            if job is None:
+                log.warning("job_not_found", job_id=job_id)
+                settle_job(job_id)
+                return
+            if job.status not in TERMINAL_STATUSES:
+                # Повтор доставки, пока job держит живой lease другой воркер: итог за ним.
+                log.info("job_already_running", job_id=job_id)
+                return
+            discard(payload)
+            # Повтор задачи после падения между commit и учётом (окно, пачка).
+            settle_job(job_id, batch_item(job))
             return
+        claim = ClaimedJob(*row)
+        job = claim.job
+        remember_payload(get_redis(), job_id, payload)
 
-        if job.status in {"succeeded", "failed"}:
+        # Через брокер шла ссылка на blob или компактный payload (шаблон с версией).
+        try:
+            request = load_job_request(job, payload)
+            lease, tpm = take_job_limits(get_redis(), claim, request)
+        except JobRejected as e:
+            log.warning("job_rejected", job_id=job_id, code=e.code)
+            reject_job(job, e)
+            item = batch_item(job)
+            session.flush()
+            entry = status_entry(job)
+            session.commit()
+            claim = None
+            publish_job_status(job_id, "failed", entry=entry)
+            discard(payload)
+            settle_job(job_id, item)
             return
+        publish_job_status(job_id, "running", entry=status_entry(job))
 
-        attempt_n = _attempt_next(session, job_uuid)
-        job.status = "running"
-        session.flush()
-
+        out = JobOutcome(provider=job.provider, model=job.model)
         t0 = time.time()
-        status = "failed"
-        err_code = None
-        err_text = None
-        public_err_msg = None
-        resp_json: dict[str, Any] | None = None
-        prompt_tokens = None
-        completion_tokens = None
-        total_tokens = None
-
         try:
-            provider = get_provider(job.provider)
-            if job.kind == "chat.completions":
-                res = provider.chat_completions(payload)
-            else:
-                res = provider.responses(payload)
-            status = "succeeded"
-            resp_json = res.json
-            prompt_tokens = res.prompt_tokens
-            completion_tokens = res.completion_tokens
-            total_tokens = res.total_tokens
+            with call_priority(PRIORITY_JOBS), Heartbeat(job_uuid, job.attempt_count):
+                served = call_with_fallback(
+                    job.kind,
+                    job.provider,
+                    request.payload,
+                    affinity=request.affinity,
+                )
+            out.succeeded(served, job.model)
+            used_tokens = out.used_tokens(tpm)
         except Exception as e:
-            pub = map_provider_exception(e)
-            err_code = pub.code
-            err_text = str(e)
-            public_err_msg = pub.message
-            resp_json = error_payload(pub)
-
-        latency_ms = int((time.time() - t0) * 1000)
-        pricing = load_pricing()
-        cost = calc_cost_rub(job.model, prompt_tokens, completion_tokens, pricing)
-
-        req = RequestLog(
-            api_key_id=job.api_key_id,
-            kind=job.kind,
-            provider=job.provider,
-            model=job.model,
-            status=status,
-            error_code=err_code,
-            error_text=err_text,
-            prompt_tokens=prompt_tokens,
-            completion_tokens=completion_tokens,
-            total_tokens=total_tokens,
-            cost_rub=cost,
-            latency_ms=latency_ms,
-            request_payload_redacted=_job_payload_redacted(job.kind, payload),
-            response_payload_redacted=redact_result_summary(resp_json or {}),
-        )
-        session.add(req)
-        session.flush()  # чтобы req.id был доступен для meta/webhook
-
-        job_attempt = JobAttempt(
-            job_id=job_uuid,
-            attempt=attempt_n,
-            status=status,
-            error_text=err_text,
-            latency_ms=latency_ms,
-        )
-        session.add(job_attempt)
-
-        job.status = status
-        job.error_code = err_code
-        job.error_text = err_text
-        req_id = str(req.id) if req.id is not None else None
-        job.result_redacted = {
-            "request_id": req_id,
-            "provider": job.provider,
-            "model": job.model,
-            "latency_ms": latency_ms,
-            "tokens": {
-                "prompt": prompt_tokens,
-                "completion": completion_tokens,
-                "total": total_tokens,
-            },
-            "cost_rub": float(cost) if cost is not None else None,
-            "result": redact_result_summary(resp_json or {}),
-        }
-
+            if isinstance(e, UpstreamBusyError) and self.request.retries < self.max_retries:
+                # Upstream занят — job остаётся в очереди (ретрай задачи), а не падает.
+                raise
+            out.failed(e)
+        out.latency_ms = int((time.time() - t0) * 1000)
+
+        cost, webhook_body = record_job_outcome(session, job, request, out)
+        item = batch_item(job, out)
+        try:
+            session.flush()  # updated_at для документа статуса
+        except StaleDataError:
+            # Lease истёк во время вызова, и job уже у другой попытки: итог за ней.
+            claim = None
+            job_lease_lost_total.inc()
+            log.warning("job_lease_lost", job_id=job_id)
+            return
+        entry = status_entry(job)
         session.commit()
-
-        jobs_total.labels(provider=job.provider, status=status).inc()
-        if total_tokens is not None:
-            tokens_total.labels(
-                provider=job.provider,
-                model=job.model or "-",
-                kind="total",
-            ).inc(total_tokens)
-        if cost is not None:
-            cost_rub_total.labels(provider=job.provider, model=job.model or "-").inc(float(cost))
-
-        if job.webhook_url:
-            body: dict[str, Any] = {
-                "job_id": str(job.id),
-                "status": job.status,
-                "meta": {
-                    "request_id": req_id,
-                    "provider": job.provider,
-                    "model": job.model,
-                    "latency_ms": latency_ms,
-                    "cost_rub": float(cost) if cost is not None else None,
-                    "attempt": attempt_n,
-                },
-            }
-            if status == "succeeded":
-                body["result"] = resp_json
-            else:
-                body["error"] = {
-                    "code": err_code,
-                    "message": public_err_msg or "Ошибка провайдера",
-                }
-
-            deliver_webhook.delay(str(job.id), body)
+        claim = None
+        publish_job_status(job_id, out.status, entry=entry)
+        count_job_outcome(out, cost)
+        discard(payload)
+        settle_job(job_id, item)
+
+        if webhook_body is not None:
+            enqueue_webhook(job_id, webhook_body)
+    except JobMustWait as e:
+        # Ожидание слота/TPM не тратит попытки задачи: ставим её заново с задержкой.
+        if claim is not None:
+            _unclaim(session, job_uuid, claim.job.attempt_count)
+        enqueue_job(job_id, payload, countdown=e.countdown)
     except Exception as e:
         # Ретраим только если упала сама задача (БД/код), а не “смысл” ответа провайдера.
         log.warning("process_job_failed", job_id=job_id, err=str(e))
+        if claim is not None:
+            try:
+                _unclaim(session, job_uuid, claim.job.attempt_count)
+            except Exception as unclaim_err:
+                log.warning("job_unclaim_failed", job_id=job_id, err=str(unclaim_err))
         raise self.retry(exc=e, countdown=min(60, 2**self.request.retries))
     finally:
         session.close()
+        if tpm is not None:
+            tpm.settle(used_tokens)
+        if lease is not None:
+            lease.release()
 
 
-@celery_app.task(bind=True, name="ai_gateway.deliver_webhook", max_retries=5)
-def deliver_webhook(self: Task, job_id: str, body: dict[str, Any]) -> None:
+class WebhookRetry(Exception):
+    """Попытка доставки не удалась (записана в `WebhookDelivery`), стоит повторить."""
+
+
+def webhook_retry_countdown(retries: int) -> int:
+    return min(300, 2**retries)
+
+
+def send_webhook(job_id: str, body: dict[str, Any]) -> None:
+    """Одна попытка доставки вебхука job; ретраибельная ошибка — `WebhookRetry`.
+
+    `body` может быть ссылкой на blob (см. `services.payloads`).
+    """
     settings = get_settings()
     try:
         job_uuid = uuid.UUID(job_id)
     except Exception:
         log.warning("webhook_invalid_job_id", job_id=job_id)
         return
+    try:
+        body = resolve(body)
+    except BlobMissingError:
+        log.warning("webhook_body_missing", job_id=job_id)
+        return
 
     session: Session = SessionLocal()
     try:
-        job = session.get(Job, job_uuid)
-        if job is None or not job.webhook_url:
+        # Номер попытки и настройки вебхука — одним UPDATE ... RETURNING; транзакция не висит
+        # открытой, пока ждём ответ получателя.
+        job = session.execute(
+            update(Job)
+            .where(Job.id == job_uuid, Job.webhook_url.is_not(None))
+            .values(webhook_attempt_count=Job.webhook_attempt_count + 1)
+            .returning(
+                Job.webhook_url,
+                Job.webhook_secret,
+                Job.webhook_headers,
+                Job.webhook_attempt_count,
+            )
+        ).one_or_none()
+        if job is None:
+            session.rollback()
             return
-
-        attempt_n = _wh_attempt_next(session, job_uuid)
+        session.commit()
+        attempt_n = job.webhook_attempt_count
 
         body_bytes = json.dumps(body, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
         headers: dict[str, str] = {
@@ -238,7 +254,7 @@ def deliver_webhook(self: Task, job_id: str, body: dict[str, Any]) -> None:
         status_code = None
         err_text = None
         try:
-            r = httpx.post(
+            r = get_webhook_client().post(
                 job.webhook_url,
                 content=body_bytes,
                 headers=headers,
@@ -281,7 +297,7 @@ def deliver_webhook(self: Task, job_id: str, body: dict[str, Any]) -> None:
             )
             session.commit()
             webhook_deliveries_total.labels(status="failed").inc()
-            raise self.retry(exc=e, countdown=min(300, 2**self.request.retries))
+            raise WebhookRetry(err_text) from e
 
         latency_ms = int((time.time() - t0) * 1000)
         session.add(
@@ -298,3 +314,34 @@ def deliver_webhook(self: Task, job_id: str, body: dict[str, Any]) -> None:
         webhook_deliveries_total.labels(status="succeeded").inc()
     finally:
         session.close()
+
+
+@celery_app.task(bind=True, name="ai_gateway.deliver_webhook", max_retries=5)
+def deliver_webhook(self: Task, job_id: str, body: dict[str, Any]) -> None:
+    try:
+        send_webhook(job_id, body)
+    except WebhookRetry as e:
+        if self.request.retries >= self.max_retries:
+            discard(body)
+        raise self.retry(exc=e, countdown=webhook_retry_countdown(self.request.retries))
+    discard(body)
+
+
+@celery_app.task(name="ai_gateway.refresh_models_catalog")
+def refresh_models_catalog() -> None:
+    """Фоновое обновление каталога моделей всех провайдеров (single-flight внутри)."""
+    for name in configured_providers():
+        try:
+            refresh_models(name)
+        except Exception as e:
+            log.warning("models_refresh_failed", provider=name, err=str(e))
+
+
+@celery_app.task(name="ai_gateway.pump_fair_queue")
+def pump_fair_queue_task() -> None:
+    pump_fair_queue()
+
+
+@celery_app.task(name="ai_gateway.reap_expired_jobs")
+def reap_expired_jobs_task() -> None:
+    reap_expired_jobs()
@@ -0,0 +1,137 @@
+"""Адаптивный лимит параллельности на входе (gradient) + сброс нагрузки по приоритету ключа.
+
+Лимит учится на задержке вызовов upstream, а не всего обработчика: быстрые отказы (4xx, RPM,
+бюджет) не тянут «нормальный» RTT вниз и не раздувают лимит.
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+from collections.abc import AsyncIterator
+
+from fastapi import HTTPException
+
+from ai_gateway.auth.apikey import Authed, AuthedKey
+from ai_gateway.metrics import edge_concurrency_limit, edge_in_flight, edge_shed_total
+from ai_gateway.providers.context import collect_upstream_rtts
+from ai_gateway.settings import get_settings
+
+PRIORITIES = ("high", "normal", "low")
+
+
+class GradientLimiter:
+    """Лимит растёт, пока задержка близка к базовой, и режется, когда она уходит вверх.
+
+    Схема как у gradient2 (Netflix concurrency-limits): долгая EWMA задержки — «нормальный» RTT,
+    короткая — текущий; `gradient = tolerance * long / short` масштабирует лимит.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        min_limit: int,
+        max_limit: int,
+        tolerance: float = 1.5,
+        smoothing: float = 0.2,
+        long_window: int = 600,
+    ) -> None:
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self._long_alpha = 2.0 / (long_window + 1)
+        self._short_alpha = 0.5
+        self.long_rtt: float | None = None
+        self.short_rtt: float | None = None
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self, share: float = 1.0) -> bool:
+        """Берёт слот, если in-flight ещё в пределах `limit * share`."""
+        with self._lock:
+            if self.in_flight >= max(1.0, self.limit * share):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, rtt: float) -> None:
+        """Отпускает слот и обновляет лимит по наблюдённой задержке."""
+        with self._lock:
+            in_flight = self.in_flight
+            self.in_flight = max(0, self.in_flight - 1)
+            if rtt <= 0:
+                return
+
+            if self.long_rtt is None or self.short_rtt is None:
+                self.long_rtt = self.short_rtt = rtt
+                return
+            self.short_rtt += self._short_alpha * (rtt - self.short_rtt)
+            self.long_rtt += self._long_alpha * (rtt - self.long_rtt)
+            # Если нагрузка надолго сменилась, «нормальный» RTT не должен залипать сверху.
+            if self.long_rtt / self.short_rtt > 2:
+                self.long_rtt *= 0.95
+
+            gradient = max(0.5, min(1.0, self.tolerance * self.long_rtt / self.short_rtt))
+            new_limit = self.limit * gradient + math.sqrt(self.limit)
+            new_limit = self.limit * (1 - self.smoothing) + new_limit * self.smoothing
+            # Не растём, пока лимит не используется хотя бы наполовину (снижать можно всегда).
+            if new_limit > self.limit and in_flight < self.limit / 2:
+                return
+            self.limit = max(float(self.min_limit), min(float(self.max_limit), new_limit))
+
+    def retry_after_seconds(self) -> int:
+        return max(1, math.ceil(self.short_rtt or 1.0))
+
+
+_limiter: GradientLimiter | None = None
+_lock = threading.Lock()
+
+
+def get_edge_limiter() -> GradientLimiter:
+    global _limiter
+    with _lock:
+        if _limiter is None:
+            settings = get_settings()
+            _limiter = GradientLimiter(
+                initial=settings.edge_limit_initial,
+                min_limit=settings.edge_limit_min,
+                max_limit=settings.edge_limit_max,
+                tolerance=settings.edge_limit_tolerance,
+            )
+        return _limiter
+
+
+async def admit_request(authed: AuthedKey = Authed) -> AsyncIterator[AuthedKey]:
+    """FastAPI dependency: пускает запрос под адаптивный лимит или отвечает 503 + Retry-After.
+
+    Async: отказ отдаётся с event loop, не дожидаясь свободного треда threadpool'а
+    (`try_acquire`/`release` берут только lock).
+    """
+    settings = get_settings()
+    if not settings.edge_limiter_enabled:
+        yield authed
+        return
+
+    limiter = get_edge_limiter()
+    priority = authed.priority if authed.priority in PRIORITIES else "normal"
+    share = settings.edge_priority_shares.get(priority, 1.0)
+    if not limiter.try_acquire(share):
+        edge_shed_total.labels(priority=priority).inc()
+        raise HTTPException(
+            status_code=503,
+            detail="Шлюз перегружен, повторите запрос позже",
+            headers={"Retry-After": str(limiter.retry_after_seconds())},
+        )
+
+    edge_in_flight.inc()
+    edge_concurrency_limit.set(limiter.limit)
+    rtts = collect_upstream_rtts()
+    try:
+        yield authed
+    finally:
+        # Без вызова upstream (отказ, spillover в очередь) — только освобождаем слот.
+        limiter.release(sum(rtts))
+        edge_in_flight.dec()
+        edge_concurrency_limit.set(limiter.limit)
@@ -0,0 +1,475 @@
+"""Batch API (`/v1/batches`): JSONL-файл запросов → jobs пачки → JSONL-файлы результатов.
+
+Строки входного файла проверяются и сразу становятся jobs (`Job.batch_id`), но в очередь
+уходят не все: не больше `BATCH_MAX_IN_FLIGHT` одновременно, следующая — по завершении
+предыдущей. Очередь пачки — список Redis со ссылками на строки нормализованного файла
+на диске, счётчики прогресса — hash Redis. Каждый итог сразу дописывается в файл
+результатов: упавший воркер не теряет уже сделанное, а повторный итог той же job не
+считается дважды.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import fcntl
+import json
+import os
+import uuid
+from collections.abc import AsyncIterator, Iterator
+from dataclasses import dataclass
+from typing import Any
+
+import redis
+import structlog
+from fastapi import HTTPException
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+
+from ai_gateway.db.models import Batch, Job, StoredFile, utcnow
+from ai_gateway.infrastructure.db import SessionLocal
+from ai_gateway.metrics import batch_items_total
+from ai_gateway.queue.dispatch import enqueue_jobs
+from ai_gateway.queue.fair import Tenant, tenant_for
+from ai_gateway.services.job_events import publish_job_status
+from ai_gateway.services.jobs import NewJob, job_row
+from ai_gateway.services.templates import expand_request
+from ai_gateway.settings import get_settings
+
+log = structlog.get_logger()
+
+ENDPOINT_KINDS = {"/v1/responses": "responses", "/v1/chat/completions": "chat.completions"}
+ACTIVE_STATUSES = frozenset({"in_progress", "cancelling"})
+
+_INSERT_CHUNK = 1000
+_MAX_REPORTED_ERRORS = 20
+# Ключи пачки живут ещё сутки после завершения (повторные итоги отбрасываются по `done`).
+_FINISHED_TTL_SECONDS = 86400
+
+# KEYS[1] = done set, KEYS[2] = progress hash; ARGV[1] = поле счётчика, ARGV[2..] = job id.
+COUNT_SCRIPT = """
+local added = 0
+for i = 2, #ARGV do
+  added = added + redis.call('SADD', KEYS[1], ARGV[i])
+end
+if added > 0 then
+  redis.call('HINCRBY', KEYS[2], ARGV[1], added)
+end
+local c = redis.call('HMGET', KEYS[2], 'total', 'completed', 'failed')
+return {added, tonumber(c[1]) or 0, tonumber(c[2]) or 0, tonumber(c[3]) or 0}
+"""
+
+
+def _pending_key(batch_id: str) -> str:
+    return f"batch:{batch_id}:pending"
+
+
+def _progress_key(batch_id: str) -> str:
+    return f"batch:{batch_id}:progress"
+
+
+def _done_key(batch_id: str) -> str:
+    return f"batch:{batch_id}:done"
+
+
+def _written_key(batch_id: str) -> str:
+    return f"batch:{batch_id}:written"
+
+
+def file_path(file_id: uuid.UUID | str) -> str:
+    return os.path.join(get_settings().batch_files_dir, f"{file_id}.jsonl")
+
+
+def _queue_path(batch_id: str) -> str:
+    return os.path.join(get_settings().batch_files_dir, f"{batch_id}.queue.jsonl")
+
+
+def result_file_ids(batch_id: uuid.UUID | str) -> tuple[uuid.UUID, uuid.UUID]:
+    """id файлов результатов и ошибок: известны заранее, строки пишутся по мере итогов."""
+    base = uuid.UUID(str(batch_id))
+    return uuid.uuid5(base, "output"), uuid.uuid5(base, "errors")
+
+
+def _dumps(obj: Any) -> bytes:
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+def append_lines(path: str, lines: list[bytes]) -> None:
+    """Дописывает строки под flock: итоги пишут несколько воркеров одновременно."""
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o640)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        os.write(fd, b"".join(lines))
+    finally:
+        os.close(fd)
+
+
+async def save_upload(file_id: uuid.UUID, chunks: AsyncIterator[bytes]) -> int:
+    """Тело запроса → файл на диске по частям; больше `BATCH_MAX_FILE_BYTES` — 413."""
+    settings = get_settings()
+    os.makedirs(settings.batch_files_dir, exist_ok=True)
+    path = file_path(file_id)
+    tmp = f"{path}.part"
+    size = 0
+    try:
+        with open(tmp, "wb") as f:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > settings.batch_max_file_bytes:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Файл больше {settings.batch_max_file_bytes} байт",
+                    )
+                await asyncio.to_thread(f.write, chunk)
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp)
+        raise
+    return size
+
+
+@dataclass(frozen=True)
+class _Line:
+    custom_id: str
+    model: str
+    payload: dict[str, Any]  # компактная форма (версия шаблона зафиксирована)
+    offset: int  # начало строки в нормализованном файле
+
+
+def _check_line(raw: bytes, endpoint: str, kind: str, seen: set[str]) -> tuple[str, Any]:
+    try:
+        item = json.loads(raw)
+    except ValueError as e:
+        raise ValueError(f"невалидный JSON: {e}") from None
+    if not isinstance(item, dict):
+        raise ValueError("ожидается объект")
+    custom_id = item.get("custom_id")
+    if not isinstance(custom_id, str) or not custom_id or len(custom_id) > 200:
+        raise ValueError("custom_id: непустая строка до 200 символов")
+    if custom_id in seen:
+        raise ValueError(f"custom_id {custom_id!r} повторяется")
+    if item.get("method", "POST") != "POST":
+        raise ValueError("method: поддерживается только POST")
+    if item.get("url", endpoint) != endpoint:
+        raise ValueError(f"url должен совпадать с endpoint пачки ({endpoint})")
+    body = item.get("body")
+    if not isinstance(body, dict):
+        raise ValueError("body: ожидается объект")
+    try:
+        request = expand_request(kind, body)
+    except HTTPException as e:
+        raise ValueError(str(e.detail)) from None
+    return custom_id, request
+
+
+def scan_input(input_path: str, queue_path: str, endpoint: str) -> Iterator[_Line]:
+    """Читает входной JSONL по строке и пишет нормализованный файл для воркеров.
+
+    Версия шаблона фиксируется здесь: jobs пачки, поставленные позже, её не меняют.
+    Ошибки строк копятся и поднимаются одним 422 в конце.
+    """
+    kind = ENDPOINT_KINDS[endpoint]
+    limit = get_settings().batch_max_requests
+    count = 0
+    errors: list[dict[str, Any]] = []
+    seen: set[str] = set()
+    with open(input_path, "rb") as src, open(queue_path, "wb") as dst:
+        for n, raw in enumerate(src, start=1):
+            if not raw.strip():
+                continue
+            count += 1
+            if count > limit:
+                raise HTTPException(status_code=413, detail=f"Не больше {limit} запросов в пачке")
+            try:
+                custom_id, request = _check_line(raw, endpoint, kind, seen)
+            except ValueError as e:
+                if len(errors) < _MAX_REPORTED_ERRORS:
+                    errors.append({"line": n, "message": str(e)})
+                continue
+            seen.add(custom_id)
+            offset = dst.tell()
+            dst.write(_dumps(request.compact))
+            yield _Line(custom_id, request.model, request.compact, offset)
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
+    if count == 0:
+        raise HTTPException(status_code=422, detail="Во входном файле нет запросов")
+
+
+def create_batch(
+    session: Session,
+    r: redis.Redis,
+    api_key_id: str,
+    input_file: StoredFile,
+    endpoint: str,
+    provider: str,
+    metadata: dict[str, str] | None = None,
+    key_priority: str | None = None,
+) -> Batch:
+    """Проверяет файл, создаёт пачку и её jobs и ставит в очередь первые `BATCH_MAX_IN_FLIGHT`.
+
+    Jobs вставляются кусками по ходу чтения файла в одной транзакции: в памяти не держим
+    весь файл, а ошибка в любой строке откатывает пачку целиком.
+    """
+    api_key_uuid = uuid.UUID(api_key_id)
+    batch_id = uuid.uuid4()
+    kind = ENDPOINT_KINDS[endpoint]
+    queue_path = _queue_path(str(batch_id))
+    batch = Batch(
+        id=batch_id,
+        api_key_id=api_key_uuid,
+        kind=kind,
+        status="in_progress",
+        input_file_id=input_file.id,
+        total=0,
+        completed=0,
+        failed=0,
+        metadata_=metadata,
+    )
+    pending: list[str] = []  # `job_id:offset` в порядке файла
+    try:
+        session.add(batch)
+        session.flush()
+        rows: list[dict[str, Any]] = []
+        for line in scan_input(file_path(input_file.id), queue_path, endpoint):
+            job = NewJob(
+                kind=kind,
+                provider=provider,
+                model=line.model,
+                payload=line.payload,
+                batch_id=batch_id,
+                custom_id=line.custom_id,
+            )
+            rows.append(job_row(api_key_uuid, job))
+            pending.append(f"{rows[-1]['id']}:{line.offset}")
+            if len(rows) >= _INSERT_CHUNK:
+                session.execute(insert(Job), rows)
+                rows = []
+        if rows:
+            session.execute(insert(Job), rows)
+        batch.total = len(pending)
+        session.commit()
+    except BaseException:
+        session.rollback()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(queue_path)
+        raise
+
+    pipe = r.pipeline(transaction=False)
+    pipe.hset(
+        _progress_key(str(batch_id)),
+        mapping={
+            "total": len(pending),
+            "completed": 0,
+            "failed": 0,
+            # Чьи это jobs для справедливой очереди (их ставит воркер, не API).
+            "api_key_id": api_key_id,
+            "weight": tenant_for(api_key_id, key_priority).weight,
+        },
+    )
+    for start in range(0, len(pending), _INSERT_CHUNK):
+        pipe.rpush(_pending_key(str(batch_id)), *pending[start : start + _INSERT_CHUNK])
+    pipe.execute()
+
+    feed_batch(r, str(batch_id), get_settings().batch_max_in_flight)
+    return batch
+
+
+def feed_batch(r: redis.Redis, batch_id: str, n: int) -> int:
+    """Ставит в очередь воркеров до `n` следующих jobs пачки."""
+    entries = r.lpop(_pending_key(batch_id), n) if n > 0 else None
+    if not entries:
+        return 0
+    api_key_id, weight = r.hmget(_progress_key(batch_id), "api_key_id", "weight")
+    tenant = Tenant(str(api_key_id), int(weight or 1)) if api_key_id else None
+    jobs: list[tuple[str, dict[str, Any]]] = []
+    with open(_queue_path(batch_id), "rb") as f:
+        for entry in entries:
+            job_id, offset = str(entry).rsplit(":", 1)
+            f.seek(int(offset))
+            jobs.append((job_id, json.loads(f.readline())))
+    enqueue_jobs(jobs, tenant=tenant)
+    return len(jobs)
+
+
+@dataclass(frozen=True)
+class BatchItem:
+    """Итог одной job пачки — строка файла результатов (или ошибок)."""
+
+    batch_id: str
+    job_id: str
+    custom_id: str
+    succeeded: bool
+    request_id: str | None = None
+    body: dict[str, Any] | None = None
+    error_code: str | None = None
+    error_message: str | None = None
+
+    def line(self) -> bytes:
+        # Формат строк — как у OpenAI Batch API.
+        if self.succeeded:
+            response: dict[str, Any] | None = {
+                "status_code": 200,
+                "request_id": self.request_id,
+                "body": self.body,
+            }
+            error = None
+        else:
+            response = None
+            error = {"code": self.error_code, "message": self.error_message}
+        return _dumps(
+            {
+                "id": f"batch_req_{self.job_id}",
+                "custom_id": self.custom_id,
+                "response": response,
+                "error": error,
+            }
+        )
+
+
+def _count(
+    r: redis.Redis, batch_id: str, field: str, job_ids: list[str]
+) -> tuple[int, bool]:
+    """Учитывает итоги (каждую job — один раз, атомарно); возвращает (новых, пачка закончена)."""
+    added, total, completed, failed = r.eval(
+        COUNT_SCRIPT,
+        2,
+        _done_key(batch_id),
+        _progress_key(batch_id),
+        field,
+        *job_ids,
+    )
+    return int(added), int(completed) + int(failed) >= int(total)
+
+
+def finish_batch_item(r: redis.Redis, item: BatchItem) -> None:
+    """После commit итога job: строка в файл результатов, следующая job пачки, счётчик.
+
+    Каждый шаг переживает повтор (ретрай задачи после сбоя посередине): строка дописывается,
+    пока job нет в `written`, следующая job ставится, пока job не учтена в `done`. Учёт —
+    последним, поэтому пачка закончена, только когда все её строки уже в файлах.
+    """
+    if not r.sismember(_written_key(item.batch_id), item.job_id):
+        output_id, errors_id = result_file_ids(item.batch_id)
+        append_lines(file_path(output_id if item.succeeded else errors_id), [item.line()])
+        r.sadd(_written_key(item.batch_id), item.job_id)
+    if not r.sismember(_done_key(item.batch_id), item.job_id):
+        # Сбой между постановкой и учётом даст на ретрае лишнюю job в работе, а не зависшую пачку.
+        feed_batch(r, item.batch_id, 1)
+
+    field = "completed" if item.succeeded else "failed"
+    added, finished = _count(r, item.batch_id, field, [item.job_id])
+    if added:
+        batch_items_total.labels(status=field).inc()
+    if finished:
+        # И на повторе: финал мог упасть в прошлый раз; завершённую пачку он пропустит.
+        finalize_batch(r, item.batch_id)
+
+
+def finalize_batch(r: redis.Redis, batch_id: str) -> None:
+    """Все jobs пачки учтены: счётчики и файлы результатов — в БД, ключи Redis — на TTL."""
+    total, completed, failed = (
+        int(v or 0) for v in r.hmget(_progress_key(batch_id), "total", "completed", "failed")
+    )
+    session: Session = SessionLocal()
+    try:
+        batch = session.get(Batch, uuid.UUID(batch_id), with_for_update=True)
+        if batch is None or batch.status not in ACTIVE_STATUSES:
+            return
+        output_id, errors_id = result_file_ids(batch_id)
+        for file_id, name in ((output_id, "output"), (errors_id, "errors")):
+            path = file_path(file_id)
+            if not os.path.exists(path):
+                continue
+            session.add(
+                StoredFile(
+                    id=file_id,
+                    api_key_id=batch.api_key_id,
+                    purpose="batch_output",
+                    filename=f"batch_{batch_id}_{name}.jsonl",
+                    bytes=os.path.getsize(path),
+                )
+            )
+            if name == "output":
+                batch.output_file_id = file_id
+            else:
+                batch.error_file_id = file_id
+        batch.status = "cancelled" if batch.status == "cancelling" else "completed"
+        batch.total, batch.completed, batch.failed = total, completed, failed
+        batch.finished_at = utcnow()
+        session.commit()
+        log.info("batch_finished", batch_id=batch_id, status=batch.status, total=total)
+    finally:
+        session.close()
+
+    pipe = r.pipeline(transaction=False)
+    keys = (_pending_key(batch_id), _progress_key(batch_id), _done_key(batch_id))
+    for key in (*keys, _written_key(batch_id)):
+        pipe.expire(key, _FINISHED_TTL_SECONDS)
+    pipe.execute()
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(_queue_path(batch_id))
+
+
+def cancel_batch(session: Session, r: redis.Redis, batch: Batch) -> None:
+    """Снимает ещё не поставленные jobs (failed, `batch_cancelled`); начатые доработают."""
+    if batch.status not in ACTIVE_STATUSES:
+        return
+    batch_id = str(batch.id)
+    batch.status = "cancelling"
+    session.commit()
+
+    pipe = r.pipeline(transaction=True)
+    pipe.lrange(_pending_key(batch_id), 0, -1)
+    pipe.delete(_pending_key(batch_id))
+    entries, _ = pipe.execute()
+    job_ids = [str(entry).rsplit(":", 1)[0] for entry in entries]
+
+    if job_ids:
+        message = "Пачка отменена до начала выполнения запроса"
+        items: list[BatchItem] = []
+        for start in range(0, len(job_ids), _INSERT_CHUNK):
+            chunk = [uuid.UUID(j) for j in job_ids[start : start + _INSERT_CHUNK]]
+            cancelled = session.execute(
+                update(Job)
+                .where(Job.id.in_(chunk), Job.status == "queued")
+                .values(status="failed", error_code="batch_cancelled", error_text=message)
+                .returning(Job.id, Job.custom_id)
+            )
+            items.extend(
+                BatchItem(
+                    batch_id=batch_id,
+                    job_id=str(job_id),
+                    custom_id=custom_id or "",
+                    succeeded=False,
+                    error_code="batch_cancelled",
+                    error_message=message,
+                )
+                for job_id, custom_id in cancelled
+            )
+        session.commit()
+        for item in items:
+            publish_job_status(item.job_id, "failed", r)
+        if items:
+            _, errors_id = result_file_ids(batch_id)
+            append_lines(file_path(errors_id), [item.line() for item in items])
+            added, _ = _count(r, batch_id, "failed", [item.job_id for item in items])
+            batch_items_total.labels(status="cancelled").inc(added)
+
+    # Финал — здесь, если в работе ничего не осталось, иначе — по итогу последней job.
+    total, completed, failed = (
+        int(v or 0) for v in r.hmget(_progress_key(batch_id), "total", "completed", "failed")
+    )
+    if completed + failed >= total:
+        finalize_batch(r, batch_id)
+
+
+def batch_progress(r: redis.Redis, batch: Batch) -> dict[str, int]:
+    """Счётчики пачки: пока она идёт — из Redis, после завершения — из БД."""
+    if batch.status in ACTIVE_STATUSES:
+        vals = r.hmget(_progress_key(str(batch.id)), "total", "completed", "failed")
+        if vals[0] is not None:
+            total, completed, failed = (int(v or 0) for v in vals)
+            return {"total": total, "completed": completed, "failed": failed}
+    return {"total": batch.total, "completed": batch.completed, "failed": batch.failed}
@@ -0,0 +1,156 @@
+"""Bulkhead'ы: свой лимит параллельности и короткая очередь на провайдера (и модель)."""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections.abc import AsyncIterator, Iterator
+from contextlib import AsyncExitStack, ExitStack, asynccontextmanager, contextmanager
+
+from ai_gateway.metrics import (
+    bulkhead_in_flight,
+    bulkhead_limit,
+    bulkhead_queued,
+    bulkhead_rejected_total,
+)
+from ai_gateway.settings import get_settings
+
+
+class BulkheadFullError(RuntimeError):
+    """Bulkhead переполнен: быстрый отказ вместо занятого воркер-треда."""
+
+
+class Bulkhead:
+    """Семафор с ограниченной очередью ожидания (сколько тредов может держать один провайдер)."""
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, max_wait: float) -> None:
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.max_wait = max_wait
+        self._active = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+        bulkhead_limit.labels(bulkhead=name).set(self.max_concurrent)
+
+    def _reject(self, reason: str) -> BulkheadFullError:
+        bulkhead_rejected_total.labels(bulkhead=self.name, reason=reason).inc()
+        return BulkheadFullError(f"bulkhead {self.name} is full ({reason})")
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        with self._cond:
+            if self._active >= self.max_concurrent:
+                if self._waiting >= self.max_queue:
+                    raise self._reject("queue_full")
+                self._waiting += 1
+                bulkhead_queued.labels(bulkhead=self.name).set(self._waiting)
+                deadline = time.monotonic() + self.max_wait
+                try:
+                    while self._active >= self.max_concurrent:
+                        left = deadline - time.monotonic()
+                        if left <= 0:
+                            raise self._reject("timeout")
+                        self._cond.wait(left)
+                finally:
+                    self._waiting -= 1
+                    bulkhead_queued.labels(bulkhead=self.name).set(self._waiting)
+            self._enter()
+        try:
+            yield
+        finally:
+            self._leave()
+
+    @asynccontextmanager
+    async def aslot(self) -> AsyncIterator[None]:
+        """`slot` для event loop: ждём опросом через `asyncio.sleep` (счётчики общие с тредами)."""
+        with self._cond:
+            if self._active < self.max_concurrent:
+                self._enter()
+                queued = False
+            elif self._waiting >= self.max_queue:
+                raise self._reject("queue_full")
+            else:
+                self._waiting += 1
+                bulkhead_queued.labels(bulkhead=self.name).set(self._waiting)
+                queued = True
+
+        if queued:
+            deadline = time.monotonic() + self.max_wait
+            while True:
+                with self._cond:
+                    left = deadline - time.monotonic()
+                    if self._active < self.max_concurrent or left <= 0:
+                        self._waiting -= 1
+                        bulkhead_queued.labels(bulkhead=self.name).set(self._waiting)
+                        if self._active >= self.max_concurrent:
+                            raise self._reject("timeout")
+                        self._enter()
+                        break
+                await asyncio.sleep(min(left, 0.02))
+        try:
+            yield
+        finally:
+            self._leave()
+
+    def _enter(self) -> None:
+        self._active += 1
+        bulkhead_in_flight.labels(bulkhead=self.name).set(self._active)
+
+    def _leave(self) -> None:
+        with self._cond:
+            self._active -= 1
+            bulkhead_in_flight.labels(bulkhead=self.name).set(self._active)
+            self._cond.notify()
+
+
+_bulkheads: dict[str, Bulkhead] = {}
+_lock = threading.Lock()
+
+
+def get_bulkhead(name: str) -> Bulkhead:
+    """Bulkhead по имени (`provider` или `provider:model`), лимиты — из settings."""
+    bh = _bulkheads.get(name)
+    if bh is not None:
+        return bh
+    settings = get_settings()
+    with _lock:
+        bh = _bulkheads.get(name)
+        if bh is None:
+            bh = Bulkhead(
+                name,
+                max_concurrent=settings.bulkhead_limits.get(name, settings.bulkhead_max_concurrent),
+                max_queue=settings.bulkhead_max_queue,
+                max_wait=settings.bulkhead_max_wait_seconds,
+            )
+            _bulkheads[name] = bh
+    return bh
+
+
+@contextmanager
+def provider_bulkhead(provider: str, model: str) -> Iterator[None]:
+    """Занимает слот bulkhead'а провайдера (и модели, если `BULKHEAD_PER_MODEL`)."""
+    settings = get_settings()
+    if not settings.bulkhead_enabled:
+        yield
+        return
+    with ExitStack() as stack:
+        stack.enter_context(get_bulkhead(provider).slot())
+        if settings.bulkhead_per_model and model:
+            stack.enter_context(get_bulkhead(f"{provider}:{model}").slot())
+        yield
+
+
+@asynccontextmanager
+async def aprovider_bulkhead(provider: str, model: str) -> AsyncIterator[None]:
+    """`provider_bulkhead` для async-воркера (те же bulkhead'ы и лимиты)."""
+    settings = get_settings()
+    if not settings.bulkhead_enabled:
+        yield
+        return
+    async with AsyncExitStack() as stack:
+        await stack.enter_async_context(get_bulkhead(provider).aslot())
+        if settings.bulkhead_per_model and model:
+            await stack.enter_async_context(get_bulkhead(f"{provider}:{model}").aslot())
+        yield
@@ -0,0 +1,162 @@
+"""Лимит одновременных запросов на ключ: распределённый семафор в Redis с lease'ами.
+
+Пока слот занят, lease продлевает общий тред процесса (`_Renewer`): вызов с ретраями,
+fallback'ом и паузами pacing может идти дольше `CONCURRENCY_LEASE_SECONDS`, а слот не теряет.
+Упал процесс — продлевать некому, и lease протухает сам.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+
+import redis
+import structlog
+from fastapi import HTTPException
+from redis.commands.core import Script
+
+from ai_gateway.settings import get_settings
+
+log = structlog.get_logger()
+
+# KEYS[1] = zset lease'ов ключа (score = когда lease протухнет).
+# ARGV = now, expires_at, limit, lease_id, ttl. Протухшие lease'ы (упавшие воркеры) чистим сразу.
+_ACQUIRE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+local n = redis.call('ZCARD', KEYS[1])
+if n >= tonumber(ARGV[3]) then
+  return {0, n}
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[4])
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[5]))
+return {1, n + 1}
+"""
+
+
+_acquire_script: Script | None = None
+
+
+def _acquire(r: redis.Redis, keys: list[str], args: list) -> list:
+    global _acquire_script
+    if _acquire_script is None:
+        _acquire_script = r.register_script(_ACQUIRE_SCRIPT)
+    return _acquire_script(keys=keys, args=args, client=r)
+
+
+def _slots_key(api_key_id: str) -> str:
+    return f"conc:{api_key_id}"
+
+
+@dataclass
+class Lease:
+    """Занятый слот. `limit is None` — у ключа нет лимита (lease ничего не держит)."""
+
+    r: redis.Redis | None
+    api_key_id: str
+    lease_id: str
+    limit: int | None
+    in_use: int
+
+    def headers(self) -> dict[str, str]:
+        if self.limit is None:
+            return {}
+        return {
+            "X-Concurrency-Limit": str(self.limit),
+            "X-Concurrency-Remaining": str(max(0, self.limit - self.in_use)),
+        }
+
+    def renew(self) -> None:
+        """Продлевает lease (его зовёт `_Renewer`, пока слот занят)."""
+        r = self.r
+        if r is None or self.limit is None:
+            return
+        ttl = get_settings().concurrency_lease_seconds
+        key = _slots_key(self.api_key_id)
+        pipe = r.pipeline(transaction=False)
+        pipe.zadd(key, {self.lease_id: time.time() + ttl}, xx=True)
+        pipe.expire(key, int(ttl) + 60)
+        pipe.execute()
+
+    def release(self) -> None:
+        if self.r is None or self.limit is None:
+            return
+        _renewer.discard(self)
+        # Если Redis недоступен, lease всё равно протухнет сам.
+        with contextlib.suppress(redis.RedisError):
+            self.r.zrem(_slots_key(self.api_key_id), self.lease_id)
+        self.r = None
+
+
+class _Renewer:
+    """Один тред на процесс: раз в треть `CONCURRENCY_LEASE_SECONDS` продлевает занятые слоты."""
+
+    def __init__(self) -> None:
+        self._leases: dict[str, Lease] = {}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def add(self, lease: Lease) -> None:
+        with self._lock:
+            self._leases[lease.lease_id] = lease
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="slot-renewer", daemon=True)
+                self._thread.start()
+
+    def discard(self, lease: Lease) -> None:
+        with self._lock:
+            self._leases.pop(lease.lease_id, None)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(max(0.05, get_settings().concurrency_lease_seconds / 3))
+            with self._lock:
+                leases = list(self._leases.values())
+            for lease in leases:
+                try:
+                    lease.renew()
+                except redis.RedisError as e:
+                    # Следующий проход попробует снова: lease длиннее трёх интервалов.
+                    log.warning("concurrency_lease_renew_failed", err=str(e))
+
+
+_renewer = _Renewer()
+
+
+def try_acquire_slot(r: redis.Redis, api_key_id: str, limit: int | None) -> Lease | None:
+    """Пытается занять слот; `None` — все слоты ключа заняты."""
+    if limit is None or limit <= 0:
+        return Lease(r=None, api_key_id=api_key_id, lease_id="", limit=None, in_use=0)
+
+    ttl = get_settings().concurrency_lease_seconds
+    now = time.time()
+    lease_id = uuid.uuid4().hex
+    ok, n = _acquire(
+        r,
+        [_slots_key(api_key_id)],
+        [now, now + ttl, limit, lease_id, int(ttl) + 60],
+    )
+    if not int(ok):
+        return None
+    lease = Lease(r=r, api_key_id=api_key_id, lease_id=lease_id, limit=limit, in_use=int(n))
+    _renewer.add(lease)
+    return lease
+
+
+def acquire_concurrency_slot(r: redis.Redis, api_key_id: str, limit: int | None) -> Lease:
+    """Как `try_acquire_slot`, но для HTTP: если слотов нет — 429."""
+    lease = try_acquire_slot(r, api_key_id, limit)
+    if lease is None:
+        raise HTTPException(
+            status_code=429,
+            detail="Превышен лимит параллельных запросов",
+            headers={"X-Concurrency-Limit": str(limit), "X-Concurrency-Remaining": "0"},
+        )
+    return lease
+
+
+def concurrency_usage(r: redis.Redis, api_key_id: str) -> int:
+    """Сколько слотов ключа занято сейчас (без протухших lease'ов)."""
+    return int(r.zcount(_slots_key(api_key_id), time.time(), "+inf"))
@@ -6,6 +6,10 @@ from dataclasses import dataclass
 
 import httpx
 
+from ai_gateway.providers.base import UpstreamBusyError
+from ai_gateway.services.bulkhead import BulkheadFullError
+from ai_gateway.services.models_catalog import ModelsUnavailableError
+
 
 @dataclass(frozen=True)
 class PublicError:
@@ -27,15 +31,38 @@ def map_provider_exception(exc: Exception) -> PublicError:
             type="invalid_request_error",
         )
 
+    if isinstance(exc, ModelsUnavailableError):
+        return PublicError(
+            status_code=503,
+            code="models_unavailable",
+            message="Каталог моделей временно недоступен, повторите запрос позже",
+            type="upstream_error",
+        )
+
     if isinstance(exc, RuntimeError):
         text = str(exc)
-        if "OPENAI_BASE_URL" in text or "OPENAI_API_KEY" in text:
+        if "OPENAI_BASE_URL" in text or "OPENAI_API_KEY" in text or "UPSTREAMS" in text:
             return PublicError(
                 status_code=500,
                 code="provider_not_configured",
                 message="Провайдер не настроен",
             )
 
+    if isinstance(exc, BulkheadFullError):
+        return PublicError(
+            status_code=503,
+            code="bulkhead_full",
+            message="Провайдер перегружен, повторите запрос позже",
+        )
+
+    if isinstance(exc, UpstreamBusyError):
+        return PublicError(
+            status_code=503,
+            code="upstream_busy",
+            message="Upstream перегружен, повторите запрос позже",
+            type="upstream_error",
+        )
+
     if isinstance(exc, httpx.TimeoutException):
         return PublicError(
             status_code=502,
@@ -0,0 +1,233 @@
+"""`Idempotency-Key` для sync-эндпоинтов: готовый ответ хранится в Redis и отдаётся повтору.
+
+Первый запрос с ключом ставит маркер `in_progress` (`SET NX`); дубли ждут его результат,
+а не идут в upstream второй раз. Пока запрос выполняется, маркер продлевается (вызов с pacing,
+ретраями и fallback'ом бывает дольше `IDEMPOTENCY_LOCK_SECONDS`). Ретраябельные ошибки
+(429/5xx) не сохраняем — ключ освобождается, и повтор выполнится заново.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import json
+import threading
+import time
+import uuid
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+from typing import Any
+
+import redis
+from fastapi import HTTPException, Response
+from fastapi.responses import JSONResponse
+
+from ai_gateway.settings import get_settings
+
+REPLAY_HEADER = "Idempotent-Replayed"
+# Заголовки исходного ответа, которые повтор отдаёт вместе с телом.
+_STORED_HEADER_PREFIXES = ("x-concurrency-",)
+
+# Удаляем маркер, только если он ещё наш и запрос не завершён.
+_ABANDON_SCRIPT = """
+local raw = redis.call('GET', KEYS[1])
+if raw and cjson.decode(raw)['owner'] == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Продлеваем маркер, только если он ещё наш и запрос не завершён. ARGV = owner, ttl.
+_RENEW_SCRIPT = """
+local raw = redis.call('GET', KEYS[1])
+if raw then
+  local doc = cjson.decode(raw)
+  if doc['owner'] == ARGV[1] and doc['state'] == 'in_progress' then
+    return redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]))
+  end
+end
+return 0
+"""
+
+
+def _fingerprint(request: Any) -> str:
+    body = json.dumps(request, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+def _storage_key(api_key_id: str, endpoint: str, idempotency_key: str) -> str:
+    digest = hashlib.sha256(idempotency_key.encode("utf-8")).hexdigest()
+    return f"idem:{api_key_id}:{endpoint}:{digest}"
+
+
+def _cacheable(status_code: int) -> bool:
+    return status_code < 500 and status_code != 429
+
+
+def _stored_headers(headers: Any) -> dict[str, str]:
+    return {
+        k.lower(): v for k, v in headers.items() if k.lower().startswith(_STORED_HEADER_PREFIXES)
+    }
+
+
+def _lock_ttl() -> int:
+    return max(1, int(get_settings().idempotency_lock_seconds))
+
+
+@dataclass(frozen=True)
+class StoredResponse:
+    status_code: int
+    body: Any
+    headers: dict[str, str]
+
+    def response(self) -> JSONResponse:
+        return JSONResponse(
+            status_code=self.status_code,
+            content=self.body,
+            headers={**self.headers, REPLAY_HEADER: "true"},
+        )
+
+
+class IdempotencyClaim:
+    """Маркер «запрос выполняется»: `complete` сохраняет ответ, `abandon` освобождает ключ."""
+
+    def __init__(self, r: redis.Redis, key: str, fingerprint: str, owner: str) -> None:
+        self._r = r
+        self._key = key
+        self._fp = fingerprint
+        self._owner = owner
+        self._done = False
+
+    @contextlib.contextmanager
+    def kept_alive(self) -> Iterator[None]:
+        """Тред продлевает маркер раз в треть `IDEMPOTENCY_LOCK_SECONDS`, пока идёт запрос."""
+        stop = threading.Event()
+
+        def run() -> None:
+            ttl = _lock_ttl()
+            while not stop.wait(ttl / 3):
+                # Если Redis недоступен — попробуем на следующем интервале.
+                with contextlib.suppress(redis.RedisError):
+                    self._r.register_script(_RENEW_SCRIPT)(
+                        keys=[self._key], args=[self._owner, ttl], client=self._r
+                    )
+
+        thread = threading.Thread(target=run, name="idempotency-renew", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+
+    def complete(self, status_code: int, body: Any, headers: dict[str, str] | None = None) -> None:
+        if not _cacheable(status_code):
+            self.abandon()
+            return
+        doc = {
+            "state": "done",
+            "fp": self._fp,
+            "status_code": status_code,
+            "body": body,
+            "headers": headers or {},
+        }
+        self._r.set(
+            self._key,
+            json.dumps(doc, ensure_ascii=False),
+            ex=get_settings().idempotency_ttl_seconds,
+        )
+        self._done = True
+
+    def abandon(self) -> None:
+        if self._done:
+            return
+        self._done = True
+        # Если Redis недоступен — маркер сам истечёт через IDEMPOTENCY_LOCK_SECONDS.
+        with contextlib.suppress(redis.RedisError):
+            self._r.register_script(_ABANDON_SCRIPT)(
+                keys=[self._key], args=[self._owner], client=self._r
+            )
+
+
+def begin_idempotent(
+    r: redis.Redis,
+    api_key_id: str,
+    endpoint: str,
+    idempotency_key: str,
+    request: Any,
+) -> IdempotencyClaim | StoredResponse:
+    """Либо забираем ключ под себя, либо ждём/отдаём результат первого запроса."""
+    settings = get_settings()
+    if len(idempotency_key) > 255:
+        raise HTTPException(status_code=400, detail="Слишком длинный Idempotency-Key")
+
+    key = _storage_key(api_key_id, endpoint, idempotency_key)
+    fp = _fingerprint(request)
+    owner = uuid.uuid4().hex
+    marker = json.dumps({"state": "in_progress", "fp": fp, "owner": owner})
+
+    deadline = time.monotonic() + settings.idempotency_wait_seconds
+    delay = 0.05
+    while True:
+        if r.set(key, marker, nx=True, ex=_lock_ttl()):
+            return IdempotencyClaim(r, key, fp, owner)
+
+        raw = r.get(key)
+        if raw is None:
+            continue  # первый запрос только что освободил ключ — пробуем снова
+        doc = json.loads(raw)
+        if doc.get("fp") != fp:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key уже использован с другим телом запроса",
+            )
+        if doc.get("state") == "done":
+            return StoredResponse(
+                status_code=int(doc["status_code"]),
+                body=doc["body"],
+                headers=doc.get("headers") or {},
+            )
+
+        if time.monotonic() >= deadline:
+            raise HTTPException(
+                status_code=409,
+                detail="Запрос с этим Idempotency-Key ещё выполняется",
+                headers={"Retry-After": "1"},
+            )
+        time.sleep(delay)
+        delay = min(0.5, delay * 2)
+
+
+def with_idempotency(
+    r: redis.Redis,
+    api_key_id: str,
+    endpoint: str,
+    idempotency_key: str | None,
+    request: Any,
+    handler: Callable[[], Any],
+    response: Response | None = None,
+) -> Any:
+    """Выполняет `handler` не более одного раза на ключ; повтору отдаёт сохранённый ответ.
+
+    `response` — ответ эндпоинта, в который `handler` пишет заголовки (`X-Concurrency-*`).
+    """
+    if not idempotency_key:
+        return handler()
+
+    started = begin_idempotent(r, api_key_id, endpoint, idempotency_key, request)
+    if isinstance(started, StoredResponse):
+        return started.response()
+
+    try:
+        with started.kept_alive():
+            result = handler()
+    except BaseException:
+        started.abandon()
+        raise
+
+    if isinstance(result, JSONResponse):
+        headers = _stored_headers(result.headers)
+        started.complete(result.status_code, json.loads(bytes(result.body)), headers)
+    else:
+        headers = _stored_headers(response.headers) if response is not None else {}
+        started.complete(200, result, headers)
+    return result
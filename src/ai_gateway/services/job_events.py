@@ -0,0 +1,165 @@
+"""Смена статуса job: кэш документа статуса в Redis и pub/sub для long-poll и SSE в `/v1/jobs`.
+
+Воркер после каждого commit перехода (`running`, `queued` при возврате в очередь, итог) кладёт
+документ статуса в Redis (`JOBS_STATUS_CACHE_TTL_SECONDS`) и публикует статус в канал job.
+`GET /v1/jobs` читает документ сначала из кэша: опрос завершённых jobs не доходит до Postgres.
+API держит одну pub/sub-подписку на процесс и подписывается только на каналы jobs, которых
+сейчас кто-то ждёт: ожидающий клиент не занимает ни тред, ни соединение с БД и просыпается
+ровно на смене статуса.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+from collections.abc import AsyncIterator
+from typing import Any
+
+import redis
+import redis.asyncio
+import structlog
+
+from ai_gateway.db.models import Job
+from ai_gateway.infrastructure.redis import get_async_redis, get_redis
+from ai_gateway.metrics import job_status_waiters
+from ai_gateway.settings import get_settings
+
+log = structlog.get_logger()
+
+
+def channel(job_id: str) -> str:
+    return f"jobs:events:{job_id}"
+
+
+def doc_key(job_id: str) -> str:
+    return f"jobs:doc:{job_id}"
+
+
+def job_document(job: Job) -> dict[str, Any]:
+    """Статус/результат job для клиента (`GET /v1/jobs/{id}`, long-poll, SSE)."""
+    return {
+        "job_id": str(job.id),
+        "status": job.status,
+        "kind": job.kind,
+        "provider": job.provider,
+        "model": job.model,
+        "priority": job.priority,
+        "error_code": job.error_code,
+        "error_text": job.error_text,
+        "result": job.result_redacted,
+        "created_at": job.created_at.isoformat(),
+        "updated_at": job.updated_at.isoformat(),
+        "webhook_url": job.webhook_url,
+    }
+
+
+def status_entry(job: Job) -> dict[str, Any]:
+    """Запись кэша: документ и владелец (для проверки ключа без БД).
+
+    Строится до commit, как и `batch_item`: после commit sync-сессия перечитала бы строку.
+    """
+    return {"api_key_id": str(job.api_key_id), "doc": job_document(job)}
+
+
+def cache_status(pipe: Any, entry: dict[str, Any]) -> None:
+    ttl = get_settings().jobs_status_cache_ttl_seconds
+    if ttl > 0:
+        key = doc_key(entry["doc"]["job_id"])
+        pipe.set(key, json.dumps(entry, ensure_ascii=False, default=str), ex=ttl)
+
+
+def publish_job_status(
+    job_id: str,
+    status: str,
+    r: redis.Redis | None = None,
+    entry: dict[str, Any] | None = None,
+) -> None:
+    """После commit перехода: обновляет кэш и сообщает ожидающим клиентам новый статус.
+
+    Без `entry` (переход одним UPDATE, строки под рукой нет) кэш сбрасывается — следующее
+    чтение пойдёт в БД.
+    """
+    try:
+        pipe = (r or get_redis()).pipeline(transaction=False)
+        if entry is not None:
+            cache_status(pipe, entry)
+        else:
+            pipe.delete(doc_key(job_id))
+        pipe.publish(channel(job_id), json.dumps({"job_id": job_id, "status": status}))
+        pipe.execute()
+    except Exception as e:
+        # Ожидающие всё равно проснутся по таймауту и прочитают статус сами; кэш — по TTL.
+        log.warning("job_event_publish_failed", job_id=job_id, err=str(e))
+
+
+class JobEventHub:
+    """Одна pub/sub-подписка процесса; каналы jobs — пока их ждёт хотя бы один клиент."""
+
+    def __init__(self, r: redis.asyncio.Redis) -> None:
+        self._pubsub = r.pubsub(ignore_subscribe_messages=True)
+        self._waiters: dict[str, set[asyncio.Queue[str]]] = {}
+        self._lock = asyncio.Lock()
+        self._has_channels = asyncio.Event()
+        self._reader: asyncio.Task[None] | None = None
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self, job_id: str) -> AsyncIterator[asyncio.Queue[str]]:
+        """Очередь статусов job; подписка — до выхода из блока.
+
+        Подписываться нужно до чтения текущего статуса: так смена между чтением и
+        подпиской не потеряется.
+        """
+        q: asyncio.Queue[str] = asyncio.Queue()
+        async with self._lock:
+            waiters = self._waiters.setdefault(job_id, set())
+            if not waiters:
+                await self._pubsub.subscribe(channel(job_id))
+            waiters.add(q)
+            self._has_channels.set()
+            if self._reader is None or self._reader.done():
+                self._reader = asyncio.create_task(self._read())
+        job_status_waiters.inc()
+        try:
+            yield q
+        finally:
+            job_status_waiters.dec()
+            async with self._lock:
+                waiters.discard(q)
+                if not waiters:
+                    self._waiters.pop(job_id, None)
+                    await self._pubsub.unsubscribe(channel(job_id))
+                    if not self._waiters:
+                        self._has_channels.clear()
+
+    async def _read(self) -> None:
+        while True:
+            await self._has_channels.wait()
+            try:
+                msg = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except (redis.ConnectionError, redis.TimeoutError) as e:
+                # Клиент переподключится и восстановит подписки сам.
+                log.warning("job_events_read_failed", err=str(e))
+                await asyncio.sleep(1)
+                continue
+            if msg is None or msg.get("type") != "message":
+                continue
+            try:
+                event = json.loads(msg["data"])
+                job_id, status = str(event["job_id"]), str(event["status"])
+            except (ValueError, KeyError, TypeError):
+                continue
+            for q in self._waiters.get(job_id, ()):
+                q.put_nowait(status)
+
+
+_hub: tuple[asyncio.AbstractEventLoop, JobEventHub] | None = None
+
+
+def get_job_events() -> JobEventHub:
+    """Hub текущего event loop (создаётся при первом ожидании)."""
+    global _hub
+    loop = asyncio.get_running_loop()
+    if _hub is None or _hub[0] is not loop:
+        _hub = (loop, JobEventHub(get_async_redis()))
+    return _hub[1]
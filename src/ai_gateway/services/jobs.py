@@ -0,0 +1,197 @@
+"""Постановка job в очередь (общая для `/v1/jobs`, `/v1/jobs/batch` и spillover sync-запросов)."""
+
+from __future__ import annotations
+
+import uuid
+from dataclasses import dataclass
+from typing import Any
+
+from sqlalchemy import and_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from ai_gateway.db.models import Job
+from ai_gateway.queue.dispatch import enqueue_job, enqueue_jobs
+from ai_gateway.queue.fair import DEFAULT_PRIORITY, tenant_for
+from ai_gateway.services.templates import redact_request
+
+
+@dataclass(frozen=True)
+class SubmittedJob:
+    job_id: str
+    status: str
+    created: bool  # False — вернули существующую job по idempotency key
+
+
+@dataclass(frozen=True)
+class NewJob:
+    """Одна job пачки `submit_jobs` (payload уже в компактной форме)."""
+
+    kind: str
+    provider: str
+    model: str
+    payload: dict[str, Any]
+    idempotency_key: str | None = None
+    webhook_url: str | None = None
+    webhook_secret: str | None = None
+    webhook_headers: dict[str, str] | None = None
+    priority: int = DEFAULT_PRIORITY
+    batch_id: uuid.UUID | None = None
+    custom_id: str | None = None
+
+
+def job_row(api_key_uuid: uuid.UUID, job: NewJob) -> dict[str, Any]:
+    return {
+        "id": uuid.uuid4(),
+        "api_key_id": api_key_uuid,
+        "kind": job.kind,
+        "provider": job.provider,
+        "model": job.model,
+        "status": "queued",
+        "priority": job.priority,
+        "idempotency_key": job.idempotency_key,
+        "payload_redacted": redact_request(job.kind, job.payload),
+        "webhook_url": job.webhook_url,
+        "webhook_secret": job.webhook_secret,
+        "webhook_headers": job.webhook_headers,
+        "batch_id": job.batch_id,
+        "custom_id": job.custom_id,
+    }
+
+
+def submit_job(
+    session: Session,
+    api_key_id: str,
+    kind: str,
+    provider: str,
+    model: str,
+    payload: dict[str, Any],
+    *,
+    idempotency_key: str | None = None,
+    webhook_url: str | None = None,
+    webhook_secret: str | None = None,
+    webhook_headers: dict[str, str] | None = None,
+    priority: int = DEFAULT_PRIORITY,
+    key_priority: str | None = None,
+) -> SubmittedJob:
+    """Создаёт job (или находит по idempotency key) и ставит её в очередь воркеров.
+
+    `key_priority` — класс ключа (`api_keys.priority`): вес ключа в справедливой очереди.
+    """
+    api_key_uuid = uuid.UUID(api_key_id)
+    row = job_row(
+        api_key_uuid,
+        NewJob(
+            kind=kind,
+            provider=provider,
+            model=model,
+            payload=payload,
+            idempotency_key=idempotency_key,
+            webhook_url=webhook_url,
+            webhook_secret=webhook_secret,
+            webhook_headers=webhook_headers,
+            priority=priority,
+        ),
+    )
+    # Один INSERT ... ON CONFLICT DO NOTHING: параллельные create с одним ключом не гоняются.
+    stmt = (
+        pg_insert(Job)
+        .values(**row)
+        .on_conflict_do_nothing(constraint="uq_jobs_api_key_id_idempotency_key")
+        .returning(Job.id)
+    )
+    job_id = session.execute(stmt).scalar_one_or_none()
+    session.commit()
+
+    if job_id is None:
+        existing = (
+            session.query(Job)
+            .filter(and_(Job.api_key_id == api_key_uuid, Job.idempotency_key == idempotency_key))
+            .one()
+        )
+        return SubmittedJob(job_id=str(existing.id), status=existing.status, created=False)
+
+    # Сырой payload уходит через брокер (Redis), а в БД мы храним только redacted.
+    # С шаблоном это компактная форма (`template_id@version` + переменные): разворачивает воркер.
+    enqueue_job(
+        str(job_id),
+        payload,
+        tenant=tenant_for(api_key_id, key_priority),
+        priority=priority,
+    )
+    return SubmittedJob(job_id=str(job_id), status="queued", created=True)
+
+
+def submit_jobs(
+    session: Session,
+    api_key_id: str,
+    jobs: list[NewJob],
+    key_priority: str | None = None,
+) -> list[SubmittedJob]:
+    """Пачка jobs: один многострочный INSERT ... ON CONFLICT, один commit, одна публикация.
+
+    Результаты — в порядке `jobs`; повтор idempotency key (в пачке или из прошлых запросов)
+    возвращает существующую job с `created=False`.
+    """
+    api_key_uuid = uuid.UUID(api_key_id)
+    rows: list[dict[str, Any]] = []
+    row_payloads: list[dict[str, Any]] = []
+    first_by_key: dict[str, int] = {}
+    slots: list[int] = []  # индекс строки INSERT для каждой job
+    for job in jobs:
+        key = job.idempotency_key
+        if key is not None and key in first_by_key:
+            slots.append(first_by_key[key])
+            continue
+        if key is not None:
+            first_by_key[key] = len(rows)
+        slots.append(len(rows))
+        rows.append(job_row(api_key_uuid, job))
+        row_payloads.append(job.payload)
+
+    inserted: set[uuid.UUID] = set()
+    if rows:
+        # executemany с RETURNING: SQLAlchemy режет на пачки (insertmanyvalues) сам.
+        stmt = (
+            pg_insert(Job)
+            .on_conflict_do_nothing(constraint="uq_jobs_api_key_id_idempotency_key")
+            .returning(Job.id)
+        )
+        inserted = set(session.execute(stmt, rows).scalars())
+    session.commit()
+
+    existing: dict[str, tuple[str, str]] = {}
+    lost = [r["idempotency_key"] for r in rows if r["id"] not in inserted]
+    if lost:
+        found = session.execute(
+            select(Job.idempotency_key, Job.id, Job.status).where(
+                Job.api_key_id == api_key_uuid,
+                Job.idempotency_key.in_(lost),
+            )
+        )
+        existing = {key: (str(job_id), status) for key, job_id, status in found}
+
+    results: list[SubmittedJob] = []
+    seen: set[int] = set()
+    for slot in slots:
+        row = rows[slot]
+        if row["id"] in inserted:
+            results.append(
+                SubmittedJob(job_id=str(row["id"]), status="queued", created=slot not in seen)
+            )
+        else:
+            job_id, status = existing[row["idempotency_key"]]
+            results.append(SubmittedJob(job_id=job_id, status=status, created=False))
+        seen.add(slot)
+
+    fresh = [
+        (row, payload)
+        for row, payload in zip(rows, row_payloads, strict=True)
+        if row["id"] in inserted
+    ]
+    enqueue_jobs(
+        [(str(row["id"]), payload) for row, payload in fresh],
+        tenant=tenant_for(api_key_id, key_priority),
+        priorities=[row["priority"] for row, _ in fresh],
+    )
+    return results
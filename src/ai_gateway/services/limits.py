@@ -1,16 +1,96 @@
-"""Rate limit (requests per minute) через Redis."""
+"""Rate limits через Redis: запросы (RPM) и токены (TPM) в минутных окнах."""
 
+from __future__ import annotations
+
+import contextlib
+from dataclasses import dataclass, field
 from datetime import UTC, datetime
 
 import redis
 from fastapi import HTTPException
+from redis.commands.core import Script
 
 from ai_gateway.settings import get_settings
 
+# Атомарно: проверяем все счётчики окна и только потом списываем `amount` со всех сразу.
+# KEYS = счётчики; ARGV = amount, ttl, limit_1..limit_n (0 = без лимита).
+# Возвращает {1, 0} или {0, номер счётчика, который упёрся в лимит}.
+_WINDOW_TAKE_SCRIPT = """
+local amount = tonumber(ARGV[1])
+for i, key in ipairs(KEYS) do
+  local limit = tonumber(ARGV[i + 2])
+  if limit > 0 then
+    local cur = tonumber(redis.call('GET', key) or '0')
+    if cur + amount > limit then
+      return {0, i}
+    end
+  end
+end
+for _, key in ipairs(KEYS) do
+  if redis.call('INCRBY', key, amount) == amount then
+    redis.call('EXPIRE', key, tonumber(ARGV[2]))
+  end
+end
+return {1, 0}
+"""
+
+# Поправка резерва на факт: только в ещё живых окнах. INCRBY по протухшему ключу создал бы
+# счётчик без TTL. KEYS = счётчики; ARGV = delta.
+_WINDOW_ADJUST_SCRIPT = """
+for _, key in ipairs(KEYS) do
+  if redis.call('EXISTS', key) == 1 then
+    redis.call('INCRBY', key, tonumber(ARGV[1]))
+  end
+end
+return 0
+"""
+
+# TTL чуть больше минуты, чтобы не ловить дрейф по времени.
+_WINDOW_TTL_SECONDS = 120
+
+_take_script: Script | None = None
+_adjust_script: Script | None = None
+
+
+class TokensOverLimitError(Exception):
+    """Оценка запроса больше самого TPM-лимита: в минутное окно он не влезет никогда."""
+
+    def __init__(self, tokens: int, limit: int) -> None:
+        super().__init__(tokens, limit)
+        self.tokens = tokens
+        self.limit = limit
+
+    def message(self) -> str:
+        return f"Запрос (~{self.tokens} токенов) больше лимита {self.limit} токенов в минуту"
+
+
+def _window_take(r: redis.Redis, keys: list[str], amount: int, limits: list[int]) -> int:
+    """0 — списали; иначе номер (с 1) счётчика, который упёрся в лимит."""
+    global _take_script
+    if _take_script is None:
+        _take_script = r.register_script(_WINDOW_TAKE_SCRIPT)
+    ok, idx = _take_script(keys=keys, args=[amount, _WINDOW_TTL_SECONDS, *limits], client=r)
+    return 0 if int(ok) else int(idx)
+
+
+def _window_adjust(r: redis.Redis, keys: list[str], delta: int) -> None:
+    global _adjust_script
+    if _adjust_script is None:
+        _adjust_script = r.register_script(_WINDOW_ADJUST_SCRIPT)
+    _adjust_script(keys=keys, args=[delta], client=r)
+
+
+def _minute(now: datetime) -> str:
+    return now.strftime("%Y%m%d%H%M")
+
 
 def _minute_key(api_key_id: str, endpoint: str, now: datetime) -> str:
-    ts = now.strftime("%Y%m%d%H%M")
-    return f"rl:{api_key_id}:{endpoint}:{ts}"
+    return f"rl:{api_key_id}:{endpoint}:{_minute(now)}"
+
+
+def seconds_to_next_window() -> int:
+    """Сколько секунд до следующего минутного окна (для `Retry-After` и отложенных jobs)."""
+    return max(1, 60 - datetime.now(UTC).second)
 
 
 def enforce_rpm_limit(
@@ -26,11 +106,76 @@ def enforce_rpm_limit(
         return
 
     now = datetime.now(UTC)
-    key = _minute_key(api_key_id, endpoint, now)
-    value = int(r.incr(key))
-    if value == 1:
-        # TTL чуть больше минуты, чтобы не ловить дрейф по времени.
-        r.expire(key, 120)
-
-    if value > limit:
+    if _window_take(r, [_minute_key(api_key_id, endpoint, now)], 1, [limit]):
         raise HTTPException(status_code=429, detail="Превышен лимит запросов")
+
+
+@dataclass
+class TokenReservation:
+    """Токены, списанные в TPM-окна до вызова; после ответа поправляем на фактический usage."""
+
+    r: redis.Redis | None
+    keys: list[str] = field(default_factory=list)
+    reserved: int = 0
+
+    def settle(self, actual_tokens: int) -> None:
+        """Корректирует счётчики на `actual - reserved` (0 — запрос не состоялся, возврат)."""
+        if self.r is None or not self.keys:
+            return
+        delta = actual_tokens - self.reserved
+        if delta:
+            # Если Redis недоступен, окно всё равно закончится через минуту.
+            with contextlib.suppress(redis.RedisError):
+                _window_adjust(self.r, self.keys, delta)
+        self.r = None
+
+
+def try_reserve_tpm(
+    r: redis.Redis,
+    api_key_id: str,
+    model: str,
+    tokens: int,
+    tpm_limit: int | None,
+) -> TokenReservation | None:
+    """Резервирует `tokens` в TPM ключа и модели; `None` — какой-то из лимитов выбит.
+
+    Запрос больше самого лимита — `TokensOverLimitError`: ждать следующей минуты бесполезно.
+    """
+    settings = get_settings()
+    key_limit = tpm_limit if tpm_limit is not None else settings.default_tpm_limit
+    model_limit = settings.model_tpm_limits.get(model, 0) if model else 0
+    if key_limit <= 0 and model_limit <= 0:
+        return TokenReservation(r=None)
+    limit = min(x for x in (key_limit, model_limit) if x > 0)
+    if tokens > limit:
+        raise TokensOverLimitError(tokens, limit)
+
+    minute = _minute(datetime.now(UTC))
+    keys = [f"tpm:key:{api_key_id}:{minute}", f"tpm:model:{model or '-'}:{minute}"]
+    if _window_take(r, keys, tokens, [max(0, key_limit), max(0, model_limit)]):
+        return None
+    return TokenReservation(r=r, keys=keys, reserved=tokens)
+
+
+def enforce_tpm_limit(
+    r: redis.Redis,
+    api_key_id: str,
+    model: str,
+    tokens: int,
+    tpm_limit: int | None,
+) -> TokenReservation:
+    """Как `try_reserve_tpm`, но для HTTP: если лимит выбит — 429 c `Retry-After`.
+
+    Запрос больше лимита — 413: повтор не поможет.
+    """
+    try:
+        reservation = try_reserve_tpm(r, api_key_id, model, tokens, tpm_limit)
+    except TokensOverLimitError as e:
+        raise HTTPException(status_code=413, detail=e.message()) from None
+    if reservation is None:
+        raise HTTPException(
+            status_code=429,
+            detail="Превышен лимит токенов в минуту",
+            headers={"Retry-After": str(seconds_to_next_window())},
+        )
+    return reservation
@@ -0,0 +1,262 @@
+"""Каталог моделей: кэш в памяти процесса → Redis → upstream `/v1/models`.
+
+Устаревшая запись отдаётся сразу (stale-while-revalidate), а обновляет её один процесс
+(single-flight: lock в процессе + `SET NX` в Redis). Остальные в это время отдают stale.
+Неудачная загрузка запоминается на `MODELS_REFRESH_LOCK_SECONDS`: холодные запросы в это время
+сразу получают ошибку, а не ждут и не идут в upstream сами.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any
+
+import redis
+import structlog
+
+from ai_gateway.infrastructure.redis import get_redis
+from ai_gateway.metrics import models_catalog_lookups_total, models_catalog_refresh_total
+from ai_gateway.providers.factory import get_provider
+from ai_gateway.services.redaction import sha256_hex
+from ai_gateway.settings import get_settings
+
+log = structlog.get_logger()
+
+# Снимаем lock, только если он всё ещё наш.
+_UNLOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class ModelsUnavailableError(RuntimeError):
+    """Каталога нет даже устаревшего, а upstream недавно не ответил (или каталог ещё грузится)."""
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    data: dict[str, Any]
+    etag: str
+    fetched_at: float
+
+    def age(self) -> float:
+        return max(0.0, time.time() - self.fetched_at)
+
+
+@dataclass(frozen=True)
+class ModelsLookup:
+    entry: CatalogEntry
+    source: str  # memory | redis | upstream
+    stale: bool
+
+
+def make_etag(payload: Any) -> str:
+    body = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return '"' + hashlib.sha256(body.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Сравнение для `If-None-Match` (список через запятую, `*`, weak `W/`)."""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def configured_providers() -> list[str]:
+    """Провайдеры для общего каталога: дефолтный, `openai` (если задан ключ) и `UPSTREAMS`."""
+    settings = get_settings()
+    names = [settings.default_provider]
+    if settings.openai_api_key or settings.openai_api_keys:
+        names.append("openai")
+    names.extend(settings.upstreams)
+    return list(dict.fromkeys(names))
+
+
+def _base_url(provider: str) -> str | None:
+    settings = get_settings()
+    if provider == "openai":
+        return settings.openai_base_url
+    upstream = settings.upstreams.get(provider)
+    return upstream.base_url if upstream is not None else None
+
+
+def _cache_key(provider: str) -> str:
+    base_url = _base_url(provider)
+    suffix = sha256_hex(base_url) if base_url else "-"
+    return f"models:v2:{provider}:{suffix}"
+
+
+def _error_key(provider: str) -> str:
+    return f"models:error:{provider}"
+
+
+class _LocalCache:
+    """Первый уровень: запись из Redis живёт в памяти `MODELS_LOCAL_TTL_SECONDS`."""
+
+    def __init__(self) -> None:
+        self._data: dict[str, tuple[CatalogEntry, float]] = {}
+        self._locks: dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get(self, provider: str) -> CatalogEntry | None:
+        item = self._data.get(provider)
+        if item is None:
+            return None
+        entry, loaded_at = item
+        if time.monotonic() - loaded_at > get_settings().models_local_ttl_seconds:
+            return None
+        return entry
+
+    def put(self, provider: str, entry: CatalogEntry) -> None:
+        self._data[provider] = (entry, time.monotonic())
+
+    def refresh_lock(self, provider: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(provider, threading.Lock())
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+_local = _LocalCache()
+
+
+def _redis_get(r: redis.Redis, provider: str) -> CatalogEntry | None:
+    raw = r.get(_cache_key(provider))
+    if not raw:
+        return None
+    try:
+        d = json.loads(raw)
+        entry = CatalogEntry(data=d["data"], etag=d["etag"], fetched_at=float(d["fetched_at"]))
+    except (ValueError, KeyError, TypeError):
+        return None
+    _local.put(provider, entry)
+    return entry
+
+
+def _fetch(r: redis.Redis, provider: str) -> CatalogEntry:
+    settings = get_settings()
+    try:
+        data = get_provider(provider).list_models()
+    except Exception:
+        models_catalog_refresh_total.labels(provider=provider, status="failed").inc()
+        raise
+    models_catalog_refresh_total.labels(provider=provider, status="succeeded").inc()
+
+    entry = CatalogEntry(data=data, etag=make_etag(data), fetched_at=time.time())
+    # Stale-запись держим дольше TTL свежести: её отдаём, пока идёт обновление.
+    ttl = settings.models_cache_ttl_seconds + settings.models_cache_stale_seconds
+    r.set(
+        _cache_key(provider),
+        json.dumps({"data": data, "etag": entry.etag, "fetched_at": entry.fetched_at}),
+        ex=max(1, ttl),
+    )
+    _local.put(provider, entry)
+    return entry
+
+
+def refresh_models(provider: str) -> CatalogEntry | None:
+    """Обновляет каталог провайдера, если этот вызов взял lock; иначе `None` (обновляет другой).
+
+    При ошибке upstream Redis-lock не снимаем: следующая попытка — не раньше, чем он истечёт.
+    Саму ошибку на это же время запоминаем для холодных запросов (`get_models`).
+    """
+    tlock = _local.refresh_lock(provider)
+    if not tlock.acquire(blocking=False):
+        return None
+    try:
+        r = get_redis()
+        lock_key = f"models:lock:{provider}"
+        token = uuid.uuid4().hex
+        ttl = max(1, int(get_settings().models_refresh_lock_seconds))
+        if not r.set(lock_key, token, nx=True, ex=ttl):
+            return None
+        try:
+            entry = _fetch(r, provider)
+        except Exception as e:
+            r.set(_error_key(provider), str(e)[:300] or type(e).__name__, ex=ttl)
+            raise
+        r.delete(_error_key(provider))
+        r.register_script(_UNLOCK_SCRIPT)(keys=[lock_key], args=[token], client=r)
+        return entry
+    finally:
+        tlock.release()
+
+
+def _refresh_quietly(provider: str) -> None:
+    try:
+        refresh_models(provider)
+    except Exception as e:
+        log.warning("models_refresh_failed", provider=provider, err=str(e))
+
+
+def _refresh_in_background(provider: str) -> None:
+    if _local.refresh_lock(provider).locked():
+        return
+    threading.Thread(target=_refresh_quietly, args=(provider,), daemon=True).start()
+
+
+def get_models(provider: str) -> ModelsLookup:
+    """Каталог провайдера; upstream зовём синхронно только на холодном старте (нет даже stale).
+
+    Холодный старт, а upstream недавно не ответил или каталог дольше
+    `MODELS_REFRESH_WAIT_SECONDS` грузит другой процесс — `ModelsUnavailableError`.
+    """
+    settings = get_settings()
+    get_provider(provider)  # неизвестный провайдер — ошибка сразу, без lock'а и ожидания
+    r = get_redis()
+
+    entry = _local.get(provider)
+    source = "memory"
+    if entry is None:
+        entry = _redis_get(r, provider)
+        source = "redis"
+
+    if entry is None:
+        deadline = time.monotonic() + settings.models_refresh_wait_seconds
+        while entry is None:
+            err = r.get(_error_key(provider))
+            if err is not None:
+                raise ModelsUnavailableError(f"Каталог {provider} недоступен: {err}")
+            fresh = refresh_models(provider)
+            if fresh is not None:
+                models_catalog_lookups_total.labels(source="upstream").inc()
+                return ModelsLookup(entry=fresh, source="upstream", stale=False)
+            if time.monotonic() >= deadline:
+                # Держатель lock'а не успел: в upstream сами не идём, lock скоро истечёт.
+                raise ModelsUnavailableError(f"Каталог {provider} ещё загружается")
+            time.sleep(0.05)
+            entry = _redis_get(r, provider)
+        source = "redis"
+
+    stale = entry.age() > settings.models_cache_ttl_seconds
+    if stale:
+        _refresh_in_background(provider)
+    models_catalog_lookups_total.labels(source=source).inc()
+    return ModelsLookup(entry=entry, source=source, stale=stale)
+
+
+def merge_catalogs(items: list[tuple[str, CatalogEntry]]) -> tuple[dict[str, Any], str]:
+    """Общий список моделей: дубликаты по `id` схлопываются, в `providers` — где модель есть."""
+    merged: dict[str, dict[str, Any]] = {}
+    for provider, entry in items:
+        for model in entry.data.get("data") or []:
+            if not isinstance(model, dict) or "id" not in model:
+                continue
+            key = str(model["id"])
+            if key not in merged:
+                merged[key] = {**model, "providers": []}
+            merged[key]["providers"].append(provider)
+    etag = make_etag([[provider, entry.etag] for provider, entry in items])
+    return {"object": "list", "data": list(merged.values())}, etag
@@ -0,0 +1,215 @@
+"""Payload'ы jobs и тела вебхуков вне брокера: в очередь уходит только ссылка на blob.
+
+Большой JSON один раз сжимается (zstd, без extra `blobs` — zlib), при заданном
+`JOB_BLOB_ENCRYPTION_KEY` шифруется (AES-GCM; без ключа — открытым текстом) и кладётся
+в blob store с TTL. Ретраи задачи гоняют через брокер ссылку, а не промпт целиком;
+после завершения blob удаляется.
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import json
+import os
+import threading
+import uuid
+import zlib
+from typing import Any
+
+import structlog
+
+from ai_gateway.infrastructure.blobs import get_blob_store
+from ai_gateway.metrics import payload_blob_bytes_total
+from ai_gateway.settings import get_settings
+
+log = structlog.get_logger()
+
+BLOB_REF_FIELD = "$blob"
+
+_MAGIC = b"agb1"
+_CODEC_ZSTD = b"z"
+_CODEC_ZLIB = b"d"
+_FLAG_PLAIN = b"\x00"
+_FLAG_AESGCM = b"\x01"
+_NONCE_BYTES = 12
+
+
+class BlobMissingError(Exception):
+    """Blob по ссылке не найден (истёк TTL или уже удалён)."""
+
+
+class _Codecs:
+    """Ленивая загрузка zstd/AES-GCM (extra `blobs`); без zstd пишем zlib."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._zstd: Any = None
+        self._aead: Any = None
+
+    def _load(self) -> None:
+        with self._lock:
+            if self._loaded:
+                return
+            try:
+                import zstandard  # type: ignore[import-not-found]
+
+                self._zstd = zstandard
+            except ImportError:
+                log.warning("zstd_unavailable", hint="pip install 'ai-gateway[blobs]'")
+            key = get_settings().job_blob_encryption_key
+            if key:
+                self._aead = _aead(key)
+            self._loaded = True
+
+    def compress(self, raw: bytes) -> bytes:
+        self._load()
+        if self._zstd is not None:
+            return _CODEC_ZSTD + self._zstd.ZstdCompressor(level=3).compress(raw)
+        return _CODEC_ZLIB + zlib.compress(raw, 6)
+
+    def decompress(self, data: bytes) -> bytes:
+        self._load()
+        codec, body = data[:1], data[1:]
+        if codec == _CODEC_ZLIB:
+            return zlib.decompress(body)
+        if codec == _CODEC_ZSTD:
+            if self._zstd is None:
+                raise RuntimeError("blob сжат zstd, нужен `pip install 'ai-gateway[blobs]'`")
+            return self._zstd.ZstdDecompressor().decompress(body)
+        raise ValueError(f"unknown blob codec: {codec!r}")
+
+    def seal(self, key: str, data: bytes) -> bytes:
+        self._load()
+        if self._aead is None:
+            return _FLAG_PLAIN + data
+        nonce = os.urandom(_NONCE_BYTES)
+        # Ключ blob'а — associated data: подменить содержимое одного blob'а другим нельзя.
+        return _FLAG_AESGCM + nonce + self._aead.encrypt(nonce, data, key.encode())
+
+    def open(self, key: str, data: bytes) -> bytes:
+        self._load()
+        flag, body = data[:1], data[1:]
+        if flag == _FLAG_PLAIN:
+            return body
+        if flag != _FLAG_AESGCM:
+            raise ValueError(f"unknown blob flag: {flag!r}")
+        if self._aead is None:
+            raise RuntimeError("blob зашифрован, а JOB_BLOB_ENCRYPTION_KEY не задан")
+        nonce, sealed = body[:_NONCE_BYTES], body[_NONCE_BYTES:]
+        return self._aead.decrypt(nonce, sealed, key.encode())
+
+
+def _aead(key: str) -> Any:
+    try:
+        raw = base64.urlsafe_b64decode(key + "=" * (-len(key) % 4))
+    except (binascii.Error, ValueError) as e:
+        raise RuntimeError("JOB_BLOB_ENCRYPTION_KEY: ожидается base64 от 32 байт") from e
+    if len(raw) != 32:
+        raise RuntimeError("JOB_BLOB_ENCRYPTION_KEY: ожидается base64 от 32 байт")
+    try:
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    except ImportError as e:
+        # Ключ задан — писать открытым текстом молча нельзя.
+        raise RuntimeError(
+            "JOB_BLOB_ENCRYPTION_KEY задан, нужен `pip install 'ai-gateway[blobs]'`"
+        ) from e
+    return AESGCM(raw)
+
+
+_codecs = _Codecs()
+
+
+def check_codecs() -> None:
+    """Проверка на старте API и воркеров: плохой `JOB_BLOB_ENCRYPTION_KEY` — процесс не стартует.
+
+    Иначе ошибка всплыла бы на первом большом payload'е, когда job уже записана в БД.
+    Шифрование opt-in: без ключа blob'ы лежат открытым текстом, об этом — warning в лог.
+    """
+    _codecs._load()
+    settings = get_settings()
+    if settings.job_blob_store != "off" and not settings.job_blob_encryption_key:
+        log.warning(
+            "job_blobs_unencrypted",
+            store=settings.job_blob_store,
+            hint="задайте JOB_BLOB_ENCRYPTION_KEY",
+        )
+
+
+def _dumps(obj: Any) -> bytes:
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def encode_blob(key: str, raw: bytes) -> bytes:
+    """JSON-байты → blob (заголовок, сжатие, шифрование)."""
+    data = _MAGIC + _codecs.seal(key, _codecs.compress(raw))
+    payload_blob_bytes_total.labels(stage="raw").inc(len(raw))
+    payload_blob_bytes_total.labels(stage="stored").inc(len(data))
+    return data
+
+
+def decode_blob(key: str, data: bytes) -> Any:
+    """Blob → исходный JSON-объект."""
+    if not data.startswith(_MAGIC):
+        raise ValueError("not a payload blob")
+    return json.loads(_codecs.decompress(_codecs.open(key, data[len(_MAGIC) :])))
+
+
+def is_blob_ref(obj: Any) -> bool:
+    return isinstance(obj, dict) and len(obj) == 1 and isinstance(obj.get(BLOB_REF_FIELD), str)
+
+
+def stash(obj: dict[str, Any], prefix: str = "job") -> dict[str, Any]:
+    """Кладёт большой dict в blob store и возвращает ссылку; маленький — как есть."""
+    settings = get_settings()
+    if settings.job_blob_store == "off" or is_blob_ref(obj):
+        return obj
+    raw = _dumps(obj)
+    if len(raw) < settings.job_blob_min_bytes:
+        return obj
+    key = f"{prefix}-{uuid.uuid4().hex}"
+    get_blob_store().put(key, encode_blob(key, raw), settings.job_blob_ttl_seconds)
+    return {BLOB_REF_FIELD: key}
+
+
+def stash_many(objs: list[dict[str, Any]], prefix: str = "job") -> list[dict[str, Any]]:
+    """`stash` для пачки: все blob'ы пишутся одним вызовом хранилища."""
+    settings = get_settings()
+    if settings.job_blob_store == "off":
+        return objs
+    out: list[dict[str, Any]] = []
+    blobs: list[tuple[str, bytes]] = []
+    for obj in objs:
+        raw = None if is_blob_ref(obj) else _dumps(obj)
+        if raw is None or len(raw) < settings.job_blob_min_bytes:
+            out.append(obj)
+            continue
+        key = f"{prefix}-{uuid.uuid4().hex}"
+        blobs.append((key, encode_blob(key, raw)))
+        out.append({BLOB_REF_FIELD: key})
+    if blobs:
+        get_blob_store().put_many(blobs, settings.job_blob_ttl_seconds)
+    return out
+
+
+def resolve(obj: dict[str, Any]) -> dict[str, Any]:
+    """Ссылка → исходный dict; обычный dict возвращается как есть."""
+    if not is_blob_ref(obj):
+        return obj
+    key = obj[BLOB_REF_FIELD]
+    data = get_blob_store().get(key)
+    if data is None:
+        raise BlobMissingError(key)
+    return decode_blob(key, data)
+
+
+def discard(obj: dict[str, Any]) -> None:
+    """Удаляет blob по ссылке (задача завершена, ретраев больше не будет)."""
+    if not is_blob_ref(obj):
+        return
+    try:
+        get_blob_store().delete(obj[BLOB_REF_FIELD])
+    except Exception as e:
+        # Не критично: blob всё равно истечёт по TTL.
+        log.warning("payload_blob_delete_failed", key=obj[BLOB_REF_FIELD], err=str(e))
@@ -1,56 +1,282 @@
-"""Best-effort расчёт стоимости по `pricing.json` (RUB)."""
+"""Best-effort расчёт стоимости по `pricing.json` (RUB).
 
+Правила компилируются один раз в индекс: точные имена → dict, `префикс.*` → trie, остальное —
+заранее скомпилированные regex. Побеждает первая по порядку подходящая строка, как и раньше.
+Файл (`PRICING_PATH` или встроенный) перечитывается при изменении mtime и по SIGHUP.
+"""
+
+from __future__ import annotations
+
+import contextlib
 import json
+import os
 import re
+import signal
+import threading
+import time
 from dataclasses import dataclass
 from decimal import Decimal
-from functools import lru_cache
 from importlib import resources
+from typing import Any
+
+import structlog
+
+from ai_gateway.settings import get_settings
+
+log = structlog.get_logger()
 
 
 @dataclass(frozen=True)
 class ModelPrice:
     prompt_per_1k_rub: Decimal
     completion_per_1k_rub: Decimal
+    # Входные токены из prompt cache провайдера (по умолчанию — как обычные).
+    cached_prompt_per_1k_rub: Decimal | None = None
+
+    @property
+    def cached_rate(self) -> Decimal:
+        if self.cached_prompt_per_1k_rub is None:
+            return self.prompt_per_1k_rub
+        return self.cached_prompt_per_1k_rub
+
+
+# Литерал: обычные символы или экранированные «не-буквы» (`\.`, `\-`).
+_LITERAL = re.compile(r"(?:[^.^$*+?{}\[\]\\|()]|\\[^A-Za-z0-9])*")
+_UNESCAPE = re.compile(r"\\(.)")
+
+_MEMO_MAX = 4096
+
+
+@dataclass(frozen=True)
+class _Row:
+    order: int
+    provider: str | None
+    price: ModelPrice
+
 
+class _TrieNode:
+    __slots__ = ("children", "rows")
 
-@lru_cache(maxsize=1)
-def load_pricing() -> dict:
-    text = resources.files("ai_gateway").joinpath("data/pricing.json").read_text(encoding="utf-8")
-    return json.loads(text)
-
-
-def price_for_model(model: str, pricing: dict) -> ModelPrice:
-    defaults = pricing.get("defaults") or {}
-    prompt_default = Decimal(str(defaults.get("prompt_per_1k_rub", 0.0)))
-    completion_default = Decimal(str(defaults.get("completion_per_1k_rub", 0.0)))
-
-    for row in pricing.get("models") or []:
-        if not isinstance(row, dict):
-            continue
-        pat = row.get("match")
-        if not isinstance(pat, str):
-            continue
-        if re.fullmatch(pat, model or ""):
-            return ModelPrice(
-                prompt_per_1k_rub=Decimal(str(row.get("prompt_per_1k_rub", prompt_default))),
-                completion_per_1k_rub=Decimal(
-                    str(row.get("completion_per_1k_rub", completion_default))
+    def __init__(self) -> None:
+        self.children: dict[str, _TrieNode] = {}
+        self.rows: list[_Row] = []
+
+
+def _literal(pattern: str) -> str | None:
+    if _LITERAL.fullmatch(pattern) is None:
+        return None
+    return _UNESCAPE.sub(r"\1", pattern)
+
+
+class PricingIndex:
+    """Скомпилированный `pricing.json`: O(1) на запрос после первого обращения к модели."""
+
+    def __init__(self, pricing: dict[str, Any]) -> None:
+        defaults = pricing.get("defaults") or {}
+        prompt_default = Decimal(str(defaults.get("prompt_per_1k_rub", 0.0)))
+        completion_default = Decimal(str(defaults.get("completion_per_1k_rub", 0.0)))
+        cached_default = defaults.get("cached_prompt_per_1k_rub")
+        self.default = ModelPrice(
+            prompt_per_1k_rub=prompt_default,
+            completion_per_1k_rub=completion_default,
+            cached_prompt_per_1k_rub=(
+                Decimal(str(cached_default)) if cached_default is not None else None
+            ),
+        )
+
+        self._exact: dict[str, list[_Row]] = {}
+        self._trie = _TrieNode()
+        self._regex: list[tuple[re.Pattern[str], _Row]] = []
+        self._memo: dict[tuple[str, str | None], ModelPrice] = {}
+
+        for order, row in enumerate(pricing.get("models") or []):
+            if not isinstance(row, dict):
+                continue
+            pat = row.get("match")
+            if not isinstance(pat, str):
+                continue
+            cached = row.get("cached_prompt_per_1k_rub", cached_default)
+            compiled = _Row(
+                order=order,
+                provider=row.get("provider"),
+                price=ModelPrice(
+                    prompt_per_1k_rub=Decimal(str(row.get("prompt_per_1k_rub", prompt_default))),
+                    completion_per_1k_rub=Decimal(
+                        str(row.get("completion_per_1k_rub", completion_default))
+                    ),
+                    cached_prompt_per_1k_rub=Decimal(str(cached)) if cached is not None else None,
                 ),
             )
+            exact = _literal(pat)
+            prefix = _literal(pat[:-2]) if pat.endswith(".*") else None
+            if exact is not None:
+                self._exact.setdefault(exact, []).append(compiled)
+            elif prefix is not None:
+                node = self._trie
+                for ch in prefix:
+                    node = node.children.setdefault(ch, _TrieNode())
+                node.rows.append(compiled)
+            else:
+                self._regex.append((re.compile(pat), compiled))
+
+    @staticmethod
+    def _first(rows: list[_Row], provider: str | None, best: _Row | None) -> _Row | None:
+        for row in rows:
+            if best is not None and row.order >= best.order:
+                break
+            if row.provider is None or row.provider == provider:
+                return row
+        return best
+
+    def _lookup(self, model: str, provider: str | None) -> ModelPrice:
+        best = self._first(self._exact.get(model, []), provider, None)
+
+        # `.*` не матчит перевод строки — как `re.fullmatch` у исходного правила.
+        node: _TrieNode | None = self._trie
+        for i in range(len(model) + 1):
+            if node is None:
+                break
+            if node.rows and "\n" not in model[i:]:
+                best = self._first(node.rows, provider, best)
+            node = node.children.get(model[i]) if i < len(model) else None
+
+        for pat, row in self._regex:
+            if best is not None and row.order >= best.order:
+                break
+            if (row.provider is None or row.provider == provider) and pat.fullmatch(model):
+                best = row
+                break
+        return best.price if best is not None else self.default
 
-    return ModelPrice(prompt_per_1k_rub=prompt_default, completion_per_1k_rub=completion_default)
+    def price(self, model: str, provider: str | None = None) -> ModelPrice:
+        key = (model, provider)
+        hit = self._memo.get(key)
+        if hit is not None:
+            return hit
+        price = self._lookup(model, provider)
+        if len(self._memo) >= _MEMO_MAX:
+            self._memo.clear()
+        self._memo[key] = price
+        return price
+
+
+class _PricingStore:
+    """Текущий индекс + перечитывание файла: новый индекс строится целиком и подменяется разом."""
+
+    def __init__(self) -> None:
+        self._index: PricingIndex | None = None
+        self._mtime: float | None = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _path() -> str:
+        path = get_settings().pricing_path
+        if path:
+            return path
+        return str(resources.files("ai_gateway").joinpath("data/pricing.json"))
+
+    def reload(self) -> PricingIndex | None:
+        path = self._path()
+        with self._lock:
+            try:
+                mtime = os.stat(path).st_mtime
+                with open(path, encoding="utf-8") as f:
+                    index = PricingIndex(json.load(f))
+            except (OSError, ValueError, ArithmeticError, re.error) as e:
+                # Битый файл не должен ронять учёт: остаёмся на прошлой версии.
+                log.warning("pricing_reload_failed", path=path, err=str(e))
+                if self._index is None:
+                    raise
+                return self._index
+            self._index = index
+            self._mtime = mtime
+            self._checked_at = time.monotonic()
+            log.info("pricing_loaded", path=path)
+            return index
+
+    def mark_stale(self) -> None:
+        """Перечитать при следующем обращении (безопасно звать из обработчика сигнала)."""
+        self._mtime = None
+        self._checked_at = float("-inf")
+
+    def current(self) -> PricingIndex:
+        index = self._index
+        if index is None:
+            return self.reload() or PricingIndex({})
+
+        interval = get_settings().pricing_reload_check_seconds
+        now = time.monotonic()
+        if self._mtime is None or (interval > 0 and now - self._checked_at >= interval):
+            self._checked_at = now
+            try:
+                changed = os.stat(self._path()).st_mtime != self._mtime
+            except OSError:
+                changed = False
+            if changed:
+                return self.reload() or index
+        return index
+
+
+_store = _PricingStore()
+
+
+def load_pricing() -> PricingIndex:
+    """Актуальный индекс цен (дёшево: раз в `PRICING_RELOAD_CHECK_SECONDS` сверяем mtime)."""
+    return _store.current()
+
+
+def reload_pricing() -> None:
+    """Принудительно перечитать файл цен."""
+    _store.reload()
+
+
+def install_sighup_reload() -> None:
+    """`kill -HUP <pid>` перечитывает цены (только из главного потока)."""
+    if not hasattr(signal, "SIGHUP"):
+        return
+    # Не главный поток (ValueError) — остаётся проверка mtime.
+    with contextlib.suppress(ValueError):
+        signal.signal(signal.SIGHUP, lambda _signum, _frame: _store.mark_stale())
+
+
+def price_for_model(
+    model: str,
+    pricing: PricingIndex | dict,
+    provider: str | None = None,
+) -> ModelPrice:
+    """Первая подходящая строка `models` (строки с `provider` — только для этого провайдера)."""
+    index = pricing if isinstance(pricing, PricingIndex) else PricingIndex(pricing)
+    return index.price(model or "", provider)
 
 
 def calc_cost_rub(
     model: str,
     prompt_tokens: int | None,
     completion_tokens: int | None,
-    pricing: dict,
+    pricing: PricingIndex | dict,
+    provider: str | None = None,
+    cached_tokens: int | None = None,
 ) -> Decimal | None:
+    """Стоимость запроса; `cached_tokens` (часть `prompt_tokens`) — по цене prompt cache."""
     if prompt_tokens is None and completion_tokens is None:
         return None
-    p = price_for_model(model, pricing)
-    pt = Decimal(prompt_tokens or 0) / Decimal(1000)
+    p = price_for_model(model, pricing, provider)
+    cached = min(cached_tokens or 0, prompt_tokens or 0)
+    pt = Decimal((prompt_tokens or 0) - cached) / Decimal(1000)
+    cht = Decimal(cached) / Decimal(1000)
     ct = Decimal(completion_tokens or 0) / Decimal(1000)
-    return (pt * p.prompt_per_1k_rub) + (ct * p.completion_per_1k_rub)
+    return (pt * p.prompt_per_1k_rub) + (cht * p.cached_rate) + (ct * p.completion_per_1k_rub)
+
+
+def cache_savings_rub(
+    model: str,
+    cached_tokens: int | None,
+    pricing: PricingIndex | dict,
+    provider: str | None = None,
+) -> Decimal | None:
+    """Сколько сэкономил prompt cache провайдера относительно обычной цены входа."""
+    if not cached_tokens:
+        return None
+    p = price_for_model(model, pricing, provider)
+    return Decimal(cached_tokens) / Decimal(1000) * (p.prompt_per_1k_rub - p.cached_rate)
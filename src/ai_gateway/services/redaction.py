@@ -51,6 +51,11 @@ def _redact_any(value: Any) -> Any:
     return value
 
 
+def redact_values(value: Any) -> Any:
+    """Все строки внутри значения → длина + sha256 (например, переменные шаблона)."""
+    return _redact_any(value)
+
+
 def redact_responses_payload(payload: dict) -> dict:
     return _redact_any(payload) if isinstance(payload, dict) else {"redacted": True}
 
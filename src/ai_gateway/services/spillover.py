@@ -0,0 +1,107 @@
+"""Spillover: тяжёлый sync-запрос уходит в очередь как job, клиенту — `202` + ссылка на job.
+
+Критерии: клиент сам попросил (`Prefer: respond-async`), оценка токенов выше порога,
+большой `max_output_tokens`/`max_tokens` или модель из `SPILLOVER_MODELS`.
+"""
+
+from __future__ import annotations
+
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Session
+
+from ai_gateway.auth.apikey import AuthedKey
+from ai_gateway.infrastructure.db import SessionLocal
+from ai_gateway.metrics import spillover_total
+from ai_gateway.services.budgets import BudgetLimits, enforce_budgets
+from ai_gateway.services.jobs import submit_job
+from ai_gateway.services.redaction import sha256_hex
+from ai_gateway.services.templates import ExpandedRequest
+from ai_gateway.services.tokens import estimate_request_tokens, max_output_tokens
+from ai_gateway.settings import get_settings
+
+
+def prefers_async(prefer: str | None) -> bool:
+    """`Prefer: respond-async` (RFC 7240), в том числе в списке с другими предпочтениями."""
+    if not prefer:
+        return False
+    return any(p.split(";")[0].strip().lower() == "respond-async" for p in prefer.split(","))
+
+
+def spillover_reason(kind: str, payload: dict, prefer: str | None) -> str | None:
+    """Почему запрос надо увести в очередь (`None` — обслуживаем синхронно)."""
+    if prefers_async(prefer):
+        return "prefer"
+
+    settings = get_settings()
+    if not settings.spillover_enabled:
+        return None
+    model = str(payload.get("model") or "")
+    if model and model in settings.spillover_models:
+        return "model"
+    out_limit = settings.spillover_max_output_tokens
+    if out_limit > 0 and (max_output_tokens(payload) or 0) > out_limit:
+        return "output_tokens"
+    tokens_limit = settings.spillover_max_tokens
+    if tokens_limit > 0 and estimate_request_tokens(kind, payload) > tokens_limit:
+        return "tokens"
+    return None
+
+
+def job_idempotency_key(kind: str, idempotency_key: str | None) -> str | None:
+    """Ключ job из sync `Idempotency-Key`: своё пространство, не пересекается с ключами `/v1/jobs`.
+
+    Хэш держит длину в пределах колонки (`String(200)`) для любого ключа до 255 символов.
+    """
+    if not idempotency_key:
+        return None
+    return f"sync:{kind}:{sha256_hex(idempotency_key)}"
+
+
+def spill_to_job(
+    authed: AuthedKey,
+    kind: str,
+    provider_name: str,
+    request: ExpandedRequest,
+    reason: str,
+    idempotency_key: str | None = None,
+) -> JSONResponse:
+    """Создаёт job тем же путём, что `POST /v1/jobs`, и отвечает `202` с `Location`."""
+    session: Session = SessionLocal()
+    try:
+        enforce_budgets(
+            session,
+            authed.api_key_id,
+            BudgetLimits(
+                daily_budget_rub=authed.daily_budget_rub,
+                monthly_budget_rub=authed.monthly_budget_rub,
+            ),
+        )
+        job = submit_job(
+            session,
+            authed.api_key_id,
+            kind,
+            provider_name,
+            request.model,
+            request.compact,
+            idempotency_key=job_idempotency_key(kind, idempotency_key),
+            key_priority=authed.priority,
+        )
+    finally:
+        session.close()
+
+    spillover_total.labels(endpoint=kind, reason=reason).inc()
+    url = f"/v1/jobs/{job.job_id}"
+    headers = {"Location": url}
+    if reason == "prefer":
+        headers["Preference-Applied"] = "respond-async"
+    return JSONResponse(
+        status_code=202,
+        content={
+            "object": "job",
+            "job_id": job.job_id,
+            "status": job.status,
+            "url": url,
+            "meta": {"spillover": reason},
+        },
+        headers=headers,
+    )
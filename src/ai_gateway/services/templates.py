@@ -0,0 +1,425 @@
+"""Серверные шаблоны промптов: клиент шлёт `template_id` + переменные вместо 5–20KB system/tools.
+
+Шаблон — версионированная строка в Postgres (`prompt_templates`), версии неизменяемы.
+Поиск: память процесса → Redis → Postgres. Тело компилируется один раз на версию:
+подстановки `{{name}}` разобраны заранее, неизменяемые части отдаются как есть, а sha256
+и ссылка для логов (вместо redaction развёрнутых частей) тоже считаются один раз.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+import redis
+import structlog
+from fastapi import HTTPException
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ai_gateway.db.models import PromptTemplate
+from ai_gateway.infrastructure.db import SessionLocal
+from ai_gateway.infrastructure.redis import get_redis
+from ai_gateway.metrics import template_lookups_total
+from ai_gateway.services.redaction import (
+    redact_chat_payload,
+    redact_responses_payload,
+    redact_values,
+)
+from ai_gateway.settings import get_settings
+
+log = structlog.get_logger()
+
+TEMPLATE_ID_FIELD = "template_id"
+TEMPLATE_VARIABLES_FIELD = "template_variables"
+
+_VAR = re.compile(r"\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}")
+# Поля, из которых складывается кэшируемый провайдером префикс.
+_PREFIX_FIELDS = ("messages", "input", "instructions", "tools")
+# Списки сообщений: части шаблона идут перед сообщениями клиента.
+_LIST_FIELDS = ("messages", "input")
+
+
+@dataclass(frozen=True)
+class _Text:
+    """Строка с подстановками: `parts[0] + v(names[0]) + parts[1] + ...`."""
+
+    parts: tuple[str, ...]
+    names: tuple[str, ...]
+
+
+@dataclass(frozen=True)
+class _List:
+    items: tuple[Any, ...]
+
+
+@dataclass(frozen=True)
+class _Dict:
+    items: tuple[tuple[str, Any], ...]
+
+
+def _compile(value: Any, names: set[str]) -> Any:
+    """Неизменяемые поддеревья возвращаются как есть, с подстановками — в `_Text/_List/_Dict`."""
+    if isinstance(value, str):
+        chunks = _VAR.split(value)
+        if len(chunks) == 1:
+            return value
+        names.update(chunks[1::2])
+        return _Text(parts=tuple(chunks[0::2]), names=tuple(chunks[1::2]))
+    if isinstance(value, list):
+        items = [_compile(v, names) for v in value]
+        if any(isinstance(v, (_Text, _List, _Dict)) for v in items):
+            return _List(items=tuple(items))
+        return value
+    if isinstance(value, dict):
+        pairs = [(k, _compile(v, names)) for k, v in value.items()]
+        if any(isinstance(v, (_Text, _List, _Dict)) for _, v in pairs):
+            return _Dict(items=tuple(pairs))
+        return value
+    return value
+
+
+def _render(node: Any, variables: dict[str, str]) -> Any:
+    if isinstance(node, _Text):
+        out = [node.parts[0]]
+        for name, tail in zip(node.names, node.parts[1:], strict=True):
+            out.append(variables[name])
+            out.append(tail)
+        return "".join(out)
+    if isinstance(node, _List):
+        return [_render(v, variables) for v in node.items]
+    if isinstance(node, _Dict):
+        return {k: _render(v, variables) for k, v in node.items}
+    return node
+
+
+def _canonical(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+class TemplateVersion:
+    """Скомпилированная версия шаблона (всё, что не зависит от переменных, посчитано здесь)."""
+
+    def __init__(self, name: str, version: int, kind: str | None, body: dict[str, Any]) -> None:
+        if not isinstance(body, dict):
+            raise ValueError("Тело шаблона должно быть JSON-объектом")
+        self.name = name
+        self.version = version
+        self.kind = kind
+        self.body = body
+
+        names: set[str] = set()
+        self._fields = {k: _compile(v, names) for k, v in body.items()}
+        self.variables = frozenset(names)
+
+        canonical = _canonical(body)
+        self.digest = hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+        # Пишем в RequestLog вместо redaction развёрнутых частей шаблона.
+        self.ref = {"id": name, "version": version, "sha256": self.digest}
+
+        prefix = {k: body[k] for k in _PREFIX_FIELDS if k in body}
+        self._static_prefix = not any(
+            isinstance(self._fields[k], (_Text, _List, _Dict)) for k in prefix
+        )
+        self._prefix_chars = len(_canonical(prefix))
+
+    def overrides_prefix(self, client: dict[str, Any]) -> bool:
+        """Клиент заменил часть префикса (`tools`, `instructions`, сообщения без списка в шаблоне).
+
+        Дописать сообщения после сообщений шаблона — можно: префикс от этого не меняется.
+        """
+        return any(
+            k in client and not (k in _LIST_FIELDS and isinstance(self.body.get(k), list))
+            for k in _PREFIX_FIELDS
+        )
+
+    def affinity_key(self, model: str, client: dict[str, Any] | None = None) -> str | None:
+        """Ключ prefix affinity без хэширования тела на каждый запрос (префикс без переменных).
+
+        `client` — payload клиента: если он переопределил префикс, ключ по шаблону врёт — `None`
+        (ключ посчитают по развёрнутому payload'у).
+        """
+        settings = get_settings()
+        if not settings.affinity_enabled or not self._static_prefix:
+            return None
+        if client is not None and self.overrides_prefix(client):
+            return None
+        if self._prefix_chars < settings.affinity_min_prefix_chars:
+            return None
+        return hashlib.blake2b(f"tpl:{self.digest}:{model}".encode(), digest_size=16).hexdigest()
+
+    def expand(self, payload: dict[str, Any], variables: dict[str, str]) -> dict[str, Any]:
+        """Поля шаблона — по умолчанию; `messages`/`input` шаблона идут перед клиентскими."""
+        missing = self.variables - variables.keys()
+        if missing:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Не заданы переменные шаблона: {', '.join(sorted(missing))}",
+            )
+
+        out = {k: _render(v, variables) for k, v in self._fields.items()}
+        for key, value in payload.items():
+            if key in (TEMPLATE_ID_FIELD, TEMPLATE_VARIABLES_FIELD):
+                continue
+            head = out.get(key)
+            if key in _LIST_FIELDS and isinstance(head, list):
+                tail = value if isinstance(value, list) else [{"role": "user", "content": value}]
+                out[key] = [*head, *tail]
+            else:
+                out[key] = value
+        return out
+
+
+@dataclass(frozen=True)
+class ExpandedRequest:
+    payload: dict[str, Any]  # уходит провайдеру
+    compact: dict[str, Any]  # как прислал клиент (версия шаблона зафиксирована) — в очередь/логи
+    template: TemplateVersion | None = None
+
+    @property
+    def model(self) -> str:
+        return str(self.payload.get("model") or "")
+
+    @property
+    def affinity(self) -> str | None:
+        if self.template is None:
+            return None
+        return self.template.affinity_key(self.model, self.compact)
+
+
+class _TemplateCache:
+    """Версии в памяти процесса (LRU, версии неизменяемы) + короткий TTL для «последней версии»."""
+
+    def __init__(self) -> None:
+        self._versions: OrderedDict[tuple[str, int], TemplateVersion] = OrderedDict()
+        self._latest: dict[str, tuple[int, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str, version: int) -> TemplateVersion | None:
+        with self._lock:
+            tpl = self._versions.get((name, version))
+            if tpl is not None:
+                self._versions.move_to_end((name, version))
+            return tpl
+
+    def put(self, tpl: TemplateVersion) -> None:
+        size = get_settings().template_cache_size
+        if size <= 0:
+            return
+        with self._lock:
+            self._versions[(tpl.name, tpl.version)] = tpl
+            self._versions.move_to_end((tpl.name, tpl.version))
+            while len(self._versions) > size:
+                self._versions.popitem(last=False)
+
+    def latest(self, name: str) -> int | None:
+        item = self._latest.get(name)
+        if item is None or item[1] < time.monotonic():
+            return None
+        return item[0]
+
+    def set_latest(self, name: str, version: int) -> None:
+        ttl = get_settings().template_latest_ttl_seconds
+        self._latest[name] = (version, time.monotonic() + ttl)
+
+    def forget_latest(self, name: str) -> None:
+        self._latest.pop(name, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._versions.clear()
+            self._latest.clear()
+
+
+_local = _TemplateCache()
+
+
+def _version_key(name: str, version: int) -> str:
+    return f"tpl:v1:{name}:{version}"
+
+
+def _latest_key(name: str) -> str:
+    return f"tpl:v1:{name}:latest"
+
+
+def _db_latest(name: str) -> int | None:
+    session: Session = SessionLocal()
+    try:
+        return (
+            session.query(func.max(PromptTemplate.version))
+            .filter(PromptTemplate.name == name)
+            .scalar()
+        )
+    finally:
+        session.close()
+
+
+def _db_load(name: str, version: int) -> dict[str, Any] | None:
+    session: Session = SessionLocal()
+    try:
+        row = (
+            session.query(PromptTemplate)
+            .filter(PromptTemplate.name == name, PromptTemplate.version == version)
+            .one_or_none()
+        )
+        if row is None:
+            return None
+        return {"kind": row.kind, "body": row.body}
+    finally:
+        session.close()
+
+
+def _not_found(name: str, version: int | None = None) -> HTTPException:
+    ref = name if version is None else f"{name}@{version}"
+    return HTTPException(status_code=404, detail=f"Шаблон не найден: {ref}")
+
+
+def _latest_version(name: str) -> int:
+    version = _local.latest(name)
+    if version is not None:
+        return version
+
+    settings = get_settings()
+    try:
+        raw = get_redis().get(_latest_key(name))
+    except redis.RedisError as e:
+        log.warning("template_redis_error", template=name, err=str(e))
+        raw = None
+    if raw is not None:
+        version = int(raw)
+    else:
+        version = _db_latest(name)
+        if version is None:
+            raise _not_found(name)
+        try:
+            get_redis().set(
+                _latest_key(name),
+                str(version),
+                ex=max(1, int(settings.template_latest_ttl_seconds)),
+            )
+        except redis.RedisError as e:
+            log.warning("template_redis_error", template=name, err=str(e))
+    _local.set_latest(name, version)
+    return version
+
+
+def get_template(name: str, version: int | None = None) -> TemplateVersion:
+    """Скомпилированная версия шаблона (без `version` — последняя)."""
+    if version is None:
+        version = _latest_version(name)
+
+    tpl = _local.get(name, version)
+    if tpl is not None:
+        template_lookups_total.labels(source="memory").inc()
+        return tpl
+
+    settings = get_settings()
+    doc = None
+    source = "redis"
+    try:
+        raw = get_redis().get(_version_key(name, version))
+        doc = json.loads(raw) if raw else None
+    except redis.RedisError as e:
+        log.warning("template_redis_error", template=name, err=str(e))
+    if doc is None:
+        source = "db"
+        doc = _db_load(name, version)
+        if doc is None:
+            raise _not_found(name, version)
+        try:
+            get_redis().set(
+                _version_key(name, version),
+                json.dumps(doc, ensure_ascii=False),
+                ex=max(1, settings.template_redis_ttl_seconds),
+            )
+        except redis.RedisError as e:
+            log.warning("template_redis_error", template=name, err=str(e))
+
+    tpl = TemplateVersion(name, version, doc.get("kind"), doc["body"])
+    _local.put(tpl)
+    template_lookups_total.labels(source=source).inc()
+    return tpl
+
+
+def forget_latest(name: str) -> None:
+    """После публикации новой версии: `template_id` без версии сразу увидит её (в этом процессе)."""
+    _local.forget_latest(name)
+    try:
+        get_redis().delete(_latest_key(name))
+    except redis.RedisError as e:
+        log.warning("template_redis_error", template=name, err=str(e))
+
+
+def parse_template_id(value: Any) -> tuple[str, int | None]:
+    """`name` или `name@version`."""
+    if not isinstance(value, str) or not value.strip():
+        raise HTTPException(status_code=422, detail="template_id должен быть непустой строкой")
+    name, sep, version = value.strip().partition("@")
+    if not sep:
+        return name, None
+    if not version.isdigit() or not name:
+        raise HTTPException(status_code=422, detail=f"Некорректный template_id: {value}")
+    return name, int(version)
+
+
+def _variables(payload: dict[str, Any]) -> dict[str, str]:
+    raw = payload.get(TEMPLATE_VARIABLES_FIELD) or {}
+    if not isinstance(raw, dict):
+        raise HTTPException(status_code=422, detail="template_variables должен быть объектом")
+    out: dict[str, str] = {}
+    for key, value in raw.items():
+        if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            raise HTTPException(
+                status_code=422,
+                detail=f"Переменная шаблона {key} должна быть строкой или числом",
+            )
+        out[str(key)] = str(value)
+    return out
+
+
+def expand_request(kind: str | None, payload: dict[str, Any]) -> ExpandedRequest:
+    """Разворачивает `template_id` + `template_variables`; без шаблона payload не трогаем."""
+    if TEMPLATE_ID_FIELD not in payload:
+        return ExpandedRequest(payload=payload, compact=payload)
+
+    name, version = parse_template_id(payload[TEMPLATE_ID_FIELD])
+    tpl = get_template(name, version)
+    if kind is not None and tpl.kind is not None and tpl.kind != kind:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Шаблон {tpl.name} предназначен для {tpl.kind}, а не для {kind}",
+        )
+
+    expanded = tpl.expand(payload, _variables(payload))
+    compact = dict(payload)
+    compact[TEMPLATE_ID_FIELD] = f"{tpl.name}@{tpl.version}"
+    return ExpandedRequest(payload=expanded, compact=compact, template=tpl)
+
+
+def redact_request(
+    kind: str,
+    payload: dict[str, Any],
+    template: TemplateVersion | None = None,
+) -> dict:
+    """Redacted payload для БД: части шаблона заменяются заранее посчитанной ссылкой на версию."""
+    if template is None and TEMPLATE_ID_FIELD in payload:
+        template = get_template(*parse_template_id(payload[TEMPLATE_ID_FIELD]))
+
+    own = payload
+    if template is not None:
+        own = {
+            k: v
+            for k, v in payload.items()
+            if k not in (TEMPLATE_ID_FIELD, TEMPLATE_VARIABLES_FIELD)
+        }
+    out = redact_chat_payload(own) if kind == "chat.completions" else redact_responses_payload(own)
+    if template is not None:
+        out["template"] = template.ref
+        out[TEMPLATE_VARIABLES_FIELD] = redact_values(payload.get(TEMPLATE_VARIABLES_FIELD) or {})
+    return out
@@ -0,0 +1,205 @@
+"""Локальная оценка числа токенов (без сети): эвристика или локальный tokenizer.json."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import re
+import threading
+from collections import OrderedDict
+from typing import Any
+
+import structlog
+
+from ai_gateway.settings import get_settings
+
+log = structlog.get_logger()
+
+# Слова, числа и отдельные знаки: грубое приближение к тому, как режет BPE.
+_PIECES = re.compile(r"[A-Za-z]+|\d{1,3}|[^\W\d_]+|[^\w\s]|_", re.UNICODE)
+
+# Накладные расходы формата сообщений (роль, разделители), как у OpenAI chat format.
+_PER_MESSAGE_TOKENS = 4
+_PRIMING_TOKENS = 3
+
+
+def _heuristic_tokens(text: str) -> int:
+    n = 0
+    for piece in _PIECES.findall(text):
+        if piece.isascii():
+            # Латиница: короткое слово — один токен, длинное ~5 букв на токен; знаки — по одному.
+            n += max(1, math.ceil(len(piece) / 5)) if piece[0].isalpha() else 1
+        else:
+            # Кириллица и прочие алфавиты в BPE заметно «дороже» латиницы.
+            n += max(1, math.ceil(len(piece) / 3))
+    return n
+
+
+class _Tokenizer:
+    """Ленивая загрузка `tokenizers` по `TOKENIZER_PATH` (опционально, файл лежит локально)."""
+
+    def __init__(self) -> None:
+        self._loaded = False
+        self._tok: Any = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Any:
+        if self._loaded:
+            return self._tok
+        with self._lock:
+            if not self._loaded:
+                path = get_settings().tokenizer_path
+                if path:
+                    try:
+                        from tokenizers import Tokenizer  # type: ignore[import-not-found]
+
+                        self._tok = Tokenizer.from_file(path)
+                    except Exception as e:  # ImportError или битый файл — остаёмся на эвристике
+                        log.warning("tokenizer_unavailable", path=path, err=str(e))
+                self._loaded = True
+        return self._tok
+
+
+_tokenizer = _Tokenizer()
+
+# Короткие тексты считать дешевле, чем хэшировать; кэшируем только длинные (system prompts и т.п.).
+_CACHE_MIN_CHARS = 256
+
+
+class _CountCache:
+    """LRU «хэш текста → число токенов»: повторяющиеся system prompts не токенизируем заново."""
+
+    def __init__(self) -> None:
+        self._data: OrderedDict[bytes, int] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def get(self, key: bytes) -> int | None:
+        with self._lock:
+            n = self._data.get(key)
+            if n is not None:
+                self._data.move_to_end(key)
+            return n
+
+    def put(self, key: bytes, n: int) -> None:
+        size = get_settings().token_count_cache_size
+        if size <= 0:
+            return
+        with self._lock:
+            self._data[key] = n
+            self._data.move_to_end(key)
+            while len(self._data) > size:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+_cache = _CountCache()
+
+
+def tokenizer_kind() -> str:
+    """`tokenizer` — точный подсчёт по `TOKENIZER_PATH`, `heuristic` — приближённый."""
+    return "tokenizer" if _tokenizer.get() is not None else "heuristic"
+
+
+def count_texts_tokens(texts: list[str]) -> list[int]:
+    """Токены для списка текстов одним батчем (tokenizer режет их параллельно), с LRU-кэшем."""
+    out = [0] * len(texts)
+    todo: list[int] = []
+    keys: dict[int, bytes] = {}
+    for i, text in enumerate(texts):
+        if not text:
+            continue
+        if len(text) >= _CACHE_MIN_CHARS:
+            key = _cache.key(text)
+            n = _cache.get(key)
+            if n is not None:
+                out[i] = n
+                continue
+            keys[i] = key
+        todo.append(i)
+    if not todo:
+        return out
+
+    tok = _tokenizer.get()
+    if tok is not None:
+        encoded = tok.encode_batch([texts[i] for i in todo], add_special_tokens=False)
+        counts = [len(e.ids) for e in encoded]
+    else:
+        counts = [_heuristic_tokens(texts[i]) for i in todo]
+    for i, n in zip(todo, counts, strict=True):
+        out[i] = n
+        if i in keys:
+            _cache.put(keys[i], n)
+    return out
+
+
+def count_text_tokens(text: str) -> int:
+    """Токены в тексте: точный подсчёт локальным tokenizer'ом, если он настроен, иначе эвристика."""
+    return count_texts_tokens([text])[0] if text else 0
+
+
+def _content_texts(content: Any) -> list[str]:
+    """Тексты из `content`: строка или список частей (`text`/`input_text`/...)."""
+    if isinstance(content, str):
+        return [content]
+    out: list[str] = []
+    if isinstance(content, list):
+        for part in content:
+            if isinstance(part, str):
+                out.append(part)
+            elif isinstance(part, dict):
+                text = part.get("text")
+                if isinstance(text, str):
+                    out.append(text)
+    return out
+
+
+def payload_messages(kind: str, payload: dict[str, Any]) -> list[dict[str, Any]]:
+    """Сообщения запроса в виде списка dict (для responses строковый `input` — одно сообщение)."""
+    if kind == "chat.completions":
+        msgs = payload.get("messages")
+        return [m for m in msgs if isinstance(m, dict)] if isinstance(msgs, list) else []
+
+    out: list[dict[str, Any]] = []
+    if isinstance(payload.get("instructions"), str):
+        out.append({"role": "system", "content": payload["instructions"]})
+    inp = payload.get("input")
+    if isinstance(inp, str):
+        out.append({"role": "user", "content": inp})
+    elif isinstance(inp, list):
+        out.extend(m for m in inp if isinstance(m, dict))
+    return out
+
+
+def estimate_prompt_tokens(kind: str, payload: dict[str, Any]) -> int:
+    """Оценка входных токенов запроса (сообщения + tools)."""
+    messages = payload_messages(kind, payload)
+    texts = [text for m in messages for text in _content_texts(m.get("content"))]
+    tools = payload.get("tools")
+    if tools:
+        texts.append(json.dumps(tools, ensure_ascii=False, separators=(",", ":")))
+    return _PRIMING_TOKENS + _PER_MESSAGE_TOKENS * len(messages) + sum(count_texts_tokens(texts))
+
+
+def max_output_tokens(payload: dict[str, Any]) -> int | None:
+    """Лимит выходных токенов из запроса (`max_output_tokens` / `max_tokens` / ...)."""
+    for field in ("max_output_tokens", "max_completion_tokens", "max_tokens"):
+        value = payload.get(field)
+        if isinstance(value, int) and value > 0:
+            return value
+    return None
+
+
+def estimate_request_tokens(kind: str, payload: dict[str, Any]) -> int:
+    """Сколько токенов резервировать под запрос: вход + ожидаемый выход."""
+    out = max_output_tokens(payload)
+    if out is None:
+        out = get_settings().tpm_default_output_tokens
+    return estimate_prompt_tokens(kind, payload) + out
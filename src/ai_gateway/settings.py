@@ -1,9 +1,31 @@
 """Настройки приложения (env + `.env`)."""
 
-from pydantic import Field
+from typing import Literal
+
+from pydantic import BaseModel, Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
+class UpstreamCfg(BaseModel):
+    """Дополнительный OpenAI-compatible upstream (элемент `UPSTREAMS`)."""
+
+    base_url: str
+    api_key: str | None = None
+    api_keys: list[str] = Field(default_factory=list)  # пул ключей (вместе с `api_key`)
+    timeout_seconds: float | None = None
+    retries: int | None = None
+    http_referer: str | None = None
+    title: str | None = None
+
+
+class FallbackHop(BaseModel):
+    """Следующий hop fallback-цепочки (элемент `FALLBACK_CHAINS`)."""
+
+    provider: str | None = None  # None = тот же провайдер
+    model: str | None = None  # None = та же модель
+    on: list[str] | None = None  # None = FALLBACK_TRIGGERS
+
+
 class Settings(BaseSettings):
     """Pydantic-настройки (всё, что обычно лежит в `.env`)."""
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra="ignore")
@@ -21,17 +43,192 @@ class Settings(BaseSettings):
 
     openai_base_url: str | None = Field(default=None, validation_alias="OPENAI_BASE_URL")
     openai_api_key: str | None = Field(default=None, validation_alias="OPENAI_API_KEY")
+    # Дополнительные ключи через запятую: запросы распределяются по запасу квоты.
+    openai_api_keys: str | None = Field(default=None, validation_alias="OPENAI_API_KEYS")
     openai_timeout_seconds: float = Field(default=30.0, validation_alias="OPENAI_TIMEOUT_SECONDS")
     openai_retries: int = Field(default=2, validation_alias="OPENAI_RETRIES")
     openai_http_referer: str | None = Field(default=None, validation_alias="OPENAI_HTTP_REFERER")
     openai_title: str | None = Field(default=None, validation_alias="OPENAI_TITLE")
 
+    # Именованные upstream'ы: `{"openrouter": {"base_url": "...", "api_key": "..."}}`.
+    upstreams: dict[str, UpstreamCfg] = Field(default_factory=dict, validation_alias="UPSTREAMS")
+    # Цепочки по модели (или `provider:model`): `{"gpt-4o": [{"provider": "openrouter"}, ...]}`.
+    fallback_chains: dict[str, list[FallbackHop]] = Field(
+        default_factory=dict,
+        validation_alias="FALLBACK_CHAINS",
+    )
+    fallback_triggers: str = Field(
+        default="429,5xx,timeout,unreachable,upstream_busy,bulkhead_full",
+        validation_alias="FALLBACK_TRIGGERS",
+    )
+    # Сколько «остывает» ключ после 429, если upstream не прислал reset/retry-after.
+    key_pool_cooldown_seconds: float = Field(
+        default=20.0,
+        validation_alias="KEY_POOL_COOLDOWN_SECONDS",
+    )
+    # Группы равноценных upstream'ов: {"gpt-pool": ["openai-a", "openai-b"]}. Имя группы можно
+    # передать как провайдера (X-Provider) или hop'а; внутри группы запросы с одинаковым
+    # префиксом промпта идут на один upstream (prefix affinity), остальные upstream'ы — fallback.
+    upstream_groups: dict[str, list[str]] = Field(
+        default_factory=dict,
+        validation_alias="UPSTREAM_GROUPS",
+    )
+    affinity_enabled: bool = Field(default=True, validation_alias="AFFINITY_ENABLED")
+    # Префикс: system/developer + tools + столько первых сообщений после них.
+    affinity_prefix_messages: int = Field(default=1, validation_alias="AFFINITY_PREFIX_MESSAGES")
+    # Короткие префиксы провайдеры не кэшируют — для них affinity не считаем.
+    affinity_min_prefix_chars: int = Field(
+        default=2048,
+        validation_alias="AFFINITY_MIN_PREFIX_CHARS",
+    )
+    # Upstream, упавший по 429/5xx/таймауту, столько секунд не выбирается первым в группе.
+    affinity_unhealthy_seconds: float = Field(
+        default=30.0,
+        validation_alias="AFFINITY_UNHEALTHY_SECONDS",
+    )
+    # Ключ «своего» префикса берём, пока у него осталась хотя бы такая доля квоты.
+    affinity_min_key_headroom: float = Field(
+        default=0.1,
+        validation_alias="AFFINITY_MIN_KEY_HEADROOM",
+    )
+
+    # Pacing перед upstream: держим запрос до дедлайна, если лимит провайдера выбран.
+    pacing_enabled: bool = Field(default=True, validation_alias="PACING_ENABLED")
+    pacing_max_wait_seconds: float = Field(default=5.0, validation_alias="PACING_MAX_WAIT_SECONDS")
+    pacing_jobs_max_wait_seconds: float = Field(
+        default=60.0,
+        validation_alias="PACING_JOBS_MAX_WAIT_SECONDS",
+    )
+    pacing_burst: float = Field(default=5.0, validation_alias="PACING_BURST")
+    # Доля burst, которую jobs-трафик не трогает (резерв под sync).
+    pacing_jobs_reserve: float = Field(default=0.4, validation_alias="PACING_JOBS_RESERVE")
+    pacing_min_rps: float = Field(default=0.5, validation_alias="PACING_MIN_RPS")
+    pacing_initial_rps: float = Field(default=5.0, validation_alias="PACING_INITIAL_RPS")
+
+    # Bulkhead'ы: сколько sync-тредов может одновременно держать один провайдер (и модель).
+    bulkhead_enabled: bool = Field(default=True, validation_alias="BULKHEAD_ENABLED")
+    bulkhead_max_concurrent: int = Field(default=16, validation_alias="BULKHEAD_MAX_CONCURRENT")
+    bulkhead_max_queue: int = Field(default=8, validation_alias="BULKHEAD_MAX_QUEUE")
+    bulkhead_max_wait_seconds: float = Field(
+        default=1.0,
+        validation_alias="BULKHEAD_MAX_WAIT_SECONDS",
+    )
+    bulkhead_per_model: bool = Field(default=False, validation_alias="BULKHEAD_PER_MODEL")
+    # Переопределения: `{"openai": 32, "openai:gpt-4o": 8}`.
+    bulkhead_limits: dict[str, int] = Field(
+        default_factory=dict,
+        validation_alias="BULKHEAD_LIMITS",
+    )
+    # Общий threadpool sync-эндпоинтов (anyio, по умолчанию 40).
+    sync_threadpool_size: int = Field(default=64, validation_alias="SYNC_THREADPOOL_SIZE")
+
+    # Адаптивный лимит параллельности на входе (sync-запросы к моделям).
+    edge_limiter_enabled: bool = Field(default=True, validation_alias="EDGE_LIMITER_ENABLED")
+    edge_limit_initial: int = Field(default=32, validation_alias="EDGE_LIMIT_INITIAL")
+    edge_limit_min: int = Field(default=4, validation_alias="EDGE_LIMIT_MIN")
+    edge_limit_max: int = Field(default=256, validation_alias="EDGE_LIMIT_MAX")
+    edge_limit_tolerance: float = Field(default=1.5, validation_alias="EDGE_LIMIT_TOLERANCE")
+    # Какую долю лимита может занять каждый класс приоритета ключа (low режется первым).
+    edge_priority_shares: dict[str, float] = Field(
+        default_factory=lambda: {"high": 1.0, "normal": 0.9, "low": 0.6},
+        validation_alias="EDGE_PRIORITY_SHARES",
+    )
+
     dashboard_login: str = Field(default="admin", validation_alias="DASHBOARD_LOGIN")
     dashboard_password: str = Field(default="admin", validation_alias="DASHBOARD_PASSWORD")
 
     default_rpm_limit: int = Field(default=60, validation_alias="DEFAULT_RPM_LIMIT")
+    # Lease слота `max_concurrent`: если воркер упал, слот освободится сам через это время.
+    concurrency_lease_seconds: float = Field(
+        default=300.0,
+        validation_alias="CONCURRENCY_LEASE_SECONDS",
+    )
+    # Через сколько job перепроверит свободный слот, если все слоты ключа заняты.
+    concurrency_job_retry_seconds: int = Field(
+        default=5,
+        validation_alias="CONCURRENCY_JOB_RETRY_SECONDS",
+    )
+
+    # TPM: 0 — без лимита. Лимиты на модели (суммарно по всем ключам): {"gpt-4o": 200000}.
+    default_tpm_limit: int = Field(default=0, validation_alias="DEFAULT_TPM_LIMIT")
+    model_tpm_limits: dict[str, int] = Field(
+        default_factory=dict,
+        validation_alias="MODEL_TPM_LIMITS",
+    )
+    # Сколько выходных токенов резервировать, если в запросе нет `max_tokens`/`max_output_tokens`.
+    tpm_default_output_tokens: int = Field(
+        default=256,
+        validation_alias="TPM_DEFAULT_OUTPUT_TOKENS",
+    )
+    # Локальный tokenizer.json (пакет `tokenizers`) для точного подсчёта; пусто — эвристика.
+    tokenizer_path: str = Field(default="", validation_alias="TOKENIZER_PATH")
+    # LRU счётчиков токенов для длинных повторяющихся текстов (system prompts); 0 — выключен.
+    token_count_cache_size: int = Field(default=4096, validation_alias="TOKEN_COUNT_CACHE_SIZE")
+
+    # Свой pricing.json вместо встроенного; перечитывается при изменении файла и по SIGHUP.
+    pricing_path: str = Field(default="", validation_alias="PRICING_PATH")
+    pricing_reload_check_seconds: float = Field(
+        default=5.0,
+        validation_alias="PRICING_RELOAD_CHECK_SECONDS",
+    )
+
+    # Spillover: тяжёлые sync-запросы уходят в очередь (202 + job). 0 / пусто — критерий выключен.
+    # `Prefer: respond-async` от клиента работает всегда.
+    spillover_enabled: bool = Field(default=True, validation_alias="SPILLOVER_ENABLED")
+    spillover_max_tokens: int = Field(default=0, validation_alias="SPILLOVER_MAX_TOKENS")
+    spillover_max_output_tokens: int = Field(
+        default=0,
+        validation_alias="SPILLOVER_MAX_OUTPUT_TOKENS",
+    )
+    spillover_models: list[str] = Field(default_factory=list, validation_alias="SPILLOVER_MODELS")
+
+    # Idempotency-Key (sync): сколько хранить ответ; TTL маркера «выполняется»; ожидание дубля.
+    idempotency_ttl_seconds: int = Field(default=86400, validation_alias="IDEMPOTENCY_TTL_SECONDS")
+    idempotency_lock_seconds: float = Field(
+        default=300.0,
+        validation_alias="IDEMPOTENCY_LOCK_SECONDS",
+    )
+    idempotency_wait_seconds: float = Field(
+        default=60.0,
+        validation_alias="IDEMPOTENCY_WAIT_SECONDS",
+    )
+
+    # Шаблоны промптов: LRU версий в памяти, TTL «последней версии» и копии версии в Redis.
+    template_cache_size: int = Field(default=256, validation_alias="TEMPLATE_CACHE_SIZE")
+    template_latest_ttl_seconds: float = Field(
+        default=30.0,
+        validation_alias="TEMPLATE_LATEST_TTL_SECONDS",
+    )
+    template_redis_ttl_seconds: int = Field(
+        default=86400,
+        validation_alias="TEMPLATE_REDIS_TTL_SECONDS",
+    )
 
     models_cache_ttl_seconds: int = Field(default=3600, validation_alias="MODELS_CACHE_TTL_SECONDS")
+    # Сколько после TTL ещё отдаём устаревший каталог, пока он обновляется в фоне.
+    models_cache_stale_seconds: int = Field(
+        default=86400,
+        validation_alias="MODELS_CACHE_STALE_SECONDS",
+    )
+    # Кэш каталога в памяти процесса (перед Redis).
+    models_local_ttl_seconds: float = Field(
+        default=5.0,
+        validation_alias="MODELS_LOCAL_TTL_SECONDS",
+    )
+    models_refresh_lock_seconds: float = Field(
+        default=30.0,
+        validation_alias="MODELS_REFRESH_LOCK_SECONDS",
+    )
+    # Холодный старт: сколько ждать, пока каталог загрузит другой процесс.
+    models_refresh_wait_seconds: float = Field(
+        default=5.0,
+        validation_alias="MODELS_REFRESH_WAIT_SECONDS",
+    )
+    # Период фонового обновления каталога из Celery beat (0 — не обновлять).
+    models_refresh_interval_seconds: int = Field(
+        default=1800,
+        validation_alias="MODELS_REFRESH_INTERVAL_SECONDS",
+    )
 
     celery_broker_url: str | None = Field(default=None, validation_alias="CELERY_BROKER_URL")
     celery_result_backend: str | None = Field(
@@ -39,7 +236,118 @@ class Settings(BaseSettings):
         validation_alias="CELERY_RESULT_BACKEND",
     )
 
+    # Исполнение jobs в воркере: `sync` — одна job на процесс/тред Celery (как раньше),
+    # `async` — jobs идут конкурентно на event loop воркера (запускать с `-P solo`).
+    job_engine: Literal["sync", "async"] = Field(default="sync", validation_alias="JOB_ENGINE")
+    job_async_concurrency: int = Field(default=200, validation_alias="JOB_ASYNC_CONCURRENCY")
+    # Соединения к БД держатся только на claim и запись итога, не на время вызова upstream.
+    job_async_db_pool_size: int = Field(default=10, validation_alias="JOB_ASYNC_DB_POOL_SIZE")
+    # Сколько при остановке воркера ждать jobs, которые уже выполняются.
+    job_async_shutdown_seconds: float = Field(
+        default=30.0,
+        validation_alias="JOB_ASYNC_SHUTDOWN_SECONDS",
+    )
+    # Long-poll `GET /v1/jobs/{id}?wait=`: больший `wait` урезается до этого.
+    jobs_wait_max_seconds: float = Field(default=60.0, validation_alias="JOBS_WAIT_MAX_SECONDS")
+    # SSE `/v1/jobs/{id}/events`: комментарий-keepalive, если статус долго не меняется.
+    jobs_events_keepalive_seconds: float = Field(
+        default=15.0,
+        validation_alias="JOBS_EVENTS_KEEPALIVE_SECONDS",
+    )
+    # Кэш документа статуса job в Redis (пишет воркер на каждом переходе); 0 — выключен.
+    jobs_status_cache_ttl_seconds: int = Field(
+        default=3600,
+        validation_alias="JOBS_STATUS_CACHE_TTL_SECONDS",
+    )
+    # Максимум id в `GET /v1/jobs?ids=...`.
+    jobs_status_max_ids: int = Field(default=500, validation_alias="JOBS_STATUS_MAX_IDS")
+    # Максимум jobs в одном `POST /v1/jobs/batch`.
+    jobs_batch_max_items: int = Field(default=10000, validation_alias="JOBS_BATCH_MAX_ITEMS")
+    # Очередь jobs и вебхуков: Celery или Redis Streams (воркер `ai-gateway worker`, он же
+    # использует JOB_ASYNC_*). API и воркеры должны смотреть на одну и ту же очередь.
+    job_queue: Literal["celery", "streams"] = Field(default="celery", validation_alias="JOB_QUEUE")
+    # Запись без движения дольше этого — её consumer умер: забираем себе. Свои записи воркер
+    # «освежает» чаще, поэтому долгие вызовы LLM не уходят другим.
+    job_stream_claim_idle_seconds: float = Field(
+        default=60.0,
+        validation_alias="JOB_STREAM_CLAIM_IDLE_SECONDS",
+    )
+    # После стольких доставок без ack запись снимается (воркер падает на ней каждый раз).
+    job_stream_max_deliveries: int = Field(default=5, validation_alias="JOB_STREAM_MAX_DELIVERIES")
+
+    # Lease job в `running`: воркер продлевает его heartbeat'ом, пока идёт вызов; истёкший lease
+    # (воркер умер) reaper возвращает в очередь, после `JOB_MAX_ATTEMPTS` попыток — в failed.
+    job_lease_seconds: float = Field(default=120.0, validation_alias="JOB_LEASE_SECONDS")
+    job_heartbeat_seconds: float = Field(default=30.0, validation_alias="JOB_HEARTBEAT_SECONDS")
+    job_max_attempts: int = Field(default=5, validation_alias="JOB_MAX_ATTEMPTS")
+    # Как часто искать истёкшие lease (`celery beat` или воркер Streams); 0 — не искать.
+    job_reaper_interval_seconds: float = Field(
+        default=30.0,
+        validation_alias="JOB_REAPER_INTERVAL_SECONDS",
+    )
+    job_reaper_batch: int = Field(default=500, validation_alias="JOB_REAPER_BATCH")
+
+    # Справедливая очередь: новые jobs ждут в очереди своего ключа, в брокере — не больше окна
+    # (≈ суммарная ёмкость воркеров), места раздаются ключам по кругу с весом класса ключа.
+    job_fair_queuing: bool = Field(default=False, validation_alias="JOB_FAIR_QUEUING")
+    job_fair_window: int = Field(default=200, validation_alias="JOB_FAIR_WINDOW")
+    job_fair_weights: dict[str, int] = Field(
+        default_factory=lambda: {"high": 4, "normal": 2, "low": 1},
+        validation_alias="JOB_FAIR_WEIGHTS",
+    )
+    # Место job, о завершении которой никто не сообщил (воркер умер), освобождается через это время.
+    job_fair_lease_seconds: float = Field(default=900.0, validation_alias="JOB_FAIR_LEASE_SECONDS")
+    # Как часто `celery beat` подталкивает очередь (воркер Streams делает это сам).
+    job_fair_pump_interval_seconds: float = Field(
+        default=5.0,
+        validation_alias="JOB_FAIR_PUMP_INTERVAL_SECONDS",
+    )
+
+    # Payload'ы jobs и тела вебхуков — в blob store с TTL, через очередь идёт только ссылка.
+    # `disk` — каталог `JOB_BLOB_DIR`, общий у API и воркеров; `off` — всё через брокер.
+    job_blob_store: Literal["redis", "disk", "off"] = Field(
+        default="redis",
+        validation_alias="JOB_BLOB_STORE",
+    )
+    job_blob_dir: str = Field(default="./data/blobs", validation_alias="JOB_BLOB_DIR")
+    # Меньше этого (байт JSON) payload идёт inline: лишний round-trip дороже экономии.
+    job_blob_min_bytes: int = Field(default=4096, validation_alias="JOB_BLOB_MIN_BYTES")
+    job_blob_ttl_seconds: int = Field(default=86400, validation_alias="JOB_BLOB_TTL_SECONDS")
+    # base64 от 32 байт: blob'ы шифруются AES-GCM (extra `blobs`). Не задан — хранятся открыто.
+    job_blob_encryption_key: str | None = Field(
+        default=None,
+        validation_alias="JOB_BLOB_ENCRYPTION_KEY",
+    )
+
+    # Batch API: входные JSONL и файлы результатов на локальном диске (общем у API и воркеров).
+    batch_files_dir: str = Field(default="./data/files", validation_alias="BATCH_FILES_DIR")
+    batch_max_file_bytes: int = Field(
+        default=200 * 1024 * 1024,
+        validation_alias="BATCH_MAX_FILE_BYTES",
+    )
+    batch_max_requests: int = Field(default=50000, validation_alias="BATCH_MAX_REQUESTS")
+    # Сколько jobs одной пачки одновременно в очереди/работе: пачка не вытесняет обычные jobs.
+    batch_max_in_flight: int = Field(default=50, validation_alias="BATCH_MAX_IN_FLIGHT")
+
     webhook_timeout_seconds: float = Field(default=10.0, validation_alias="WEBHOOK_TIMEOUT_SECONDS")
+
+    # Исходящие HTTP-клиенты (upstream'ы и вебхуки).
+    http_max_connections: int = Field(default=100, validation_alias="HTTP_MAX_CONNECTIONS")
+    http_max_keepalive_connections: int = Field(
+        default=20,
+        validation_alias="HTTP_MAX_KEEPALIVE_CONNECTIONS",
+    )
+    http_keepalive_expiry_seconds: float = Field(
+        default=30.0,
+        validation_alias="HTTP_KEEPALIVE_EXPIRY_SECONDS",
+    )
+    http_pool_timeout_seconds: float = Field(
+        default=5.0,
+        validation_alias="HTTP_POOL_TIMEOUT_SECONDS",
+    )
+    # Нужен extra `http2` (пакет h2); без него остаёмся на HTTP/1.1.
+    http2_enabled: bool = Field(default=False, validation_alias="HTTP2_ENABLED")
+    dns_cache_ttl_seconds: float = Field(default=60.0, validation_alias="DNS_CACHE_TTL_SECONDS")
     worker_metrics_port: int | None = Field(default=None, validation_alias="WORKER_METRICS_PORT")
 
 
@@ -0,0 +1,80 @@
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from ai_gateway.auth.apikey import AuthedKey, require_api_key
+from ai_gateway.providers.context import record_upstream_rtt
+from ai_gateway.services import admission
+from ai_gateway.services.admission import GradientLimiter, admit_request
+
+Admitted = Depends(admit_request)
+
+
+def test_gradient_limiter_sheds_low_priority_first() -> None:
+    lim = GradientLimiter(initial=10, min_limit=1, max_limit=100)
+    for _ in range(6):
+        assert lim.try_acquire(share=0.6)
+    assert not lim.try_acquire(share=0.6)
+    assert lim.try_acquire(share=1.0)
+
+
+def test_gradient_limiter_shrinks_when_latency_grows() -> None:
+    lim = GradientLimiter(initial=20, min_limit=2, max_limit=100)
+    for _ in range(50):
+        lim.in_flight = 20
+        lim.release(0.1)
+    steady = lim.limit
+    for _ in range(20):
+        lim.in_flight = 20
+        lim.release(1.0)
+    assert lim.limit < steady
+
+
+def test_admit_request_returns_503_with_retry_after(monkeypatch) -> None:
+    lim = GradientLimiter(initial=1, min_limit=1, max_limit=1)
+    lim.in_flight = 1
+    monkeypatch.setattr(admission, "_limiter", lim)
+
+    app = FastAPI()
+
+    @app.get("/x")
+    def x(authed: AuthedKey = Admitted) -> dict:
+        return {"ok": True}
+
+    app.dependency_overrides[require_api_key] = lambda: AuthedKey(
+        api_key_id="k",
+        rpm_limit=None,
+        daily_budget_rub=None,
+        monthly_budget_rub=None,
+        priority="low",
+    )
+    r = TestClient(app).get("/x")
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == "1"
+
+
+def test_limiter_learns_only_from_upstream_latency(monkeypatch) -> None:
+    lim = GradientLimiter(initial=10, min_limit=1, max_limit=100)
+    monkeypatch.setattr(admission, "_limiter", lim)
+
+    app = FastAPI()
+
+    @app.get("/reject")
+    def reject(authed: AuthedKey = Admitted) -> dict:
+        return {"ok": False}
+
+    @app.get("/call")
+    def call(authed: AuthedKey = Admitted) -> dict:
+        record_upstream_rtt(0.3)  # sync-эндпоинт в threadpool, как вызов провайдера
+        return {"ok": True}
+
+    app.dependency_overrides[require_api_key] = lambda: AuthedKey(
+        api_key_id="k",
+        rpm_limit=None,
+        daily_budget_rub=None,
+        monthly_budget_rub=None,
+    )
+    client = TestClient(app)
+    client.get("/reject")
+    assert lim.short_rtt is None and lim.in_flight == 0
+    client.get("/call")
+    assert lim.short_rtt == 0.3 and lim.in_flight == 0
@@ -0,0 +1,76 @@
+import json
+
+import fakeredis
+import pytest
+
+import ai_gateway.providers.affinity as affinity
+import ai_gateway.settings as settings_mod
+from ai_gateway.providers.fallback import plan_hops
+from ai_gateway.providers.keypool import KeyPool
+from ai_gateway.services.pricing import cache_savings_rub, calc_cost_rub
+
+SYSTEM = "Ты — помощник службы поддержки. " * 100
+
+
+@pytest.fixture
+def groups(monkeypatch):
+    monkeypatch.setenv("UPSTREAM_GROUPS", json.dumps({"pool": ["u1", "u2", "u3"]}))
+    monkeypatch.setattr(settings_mod, "_settings", None)
+    r = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(affinity, "get_redis", lambda: r)
+    monkeypatch.setattr(affinity, "_local_unhealthy", {})
+    yield
+    monkeypatch.setattr(settings_mod, "_settings", None)
+
+
+def _chat(question: str) -> dict:
+    return {
+        "model": "m",
+        "messages": [
+            {"role": "system", "content": SYSTEM},
+            {"role": "user", "content": "Контекст клиента"},
+            {"role": "user", "content": question},
+        ],
+    }
+
+
+def test_prefix_key_ignores_tail_and_short_prompts(groups) -> None:
+    key = affinity.prefix_key("chat.completions", _chat("вопрос 1"))
+    assert key is not None
+    assert key == affinity.prefix_key("chat.completions", _chat("вопрос 2"))
+    short = {"model": "m", "messages": [{"role": "user", "content": "hi"}]}
+    assert affinity.prefix_key("chat.completions", short) is None
+
+
+def test_group_hops_follow_affinity_and_health(groups) -> None:
+    key = affinity.prefix_key("chat.completions", _chat("q"))
+    hops = [h.provider for h in plan_hops("pool", "m", key)]
+    assert sorted(hops) == ["u1", "u2", "u3"]
+    assert hops == [h.provider for h in plan_hops("pool", "m", key)]
+
+    # «Домашний» upstream упал — префикс временно уезжает на следующий по HRW.
+    affinity.mark_unhealthy(hops[0])
+    assert [h.provider for h in plan_hops("pool", "m", key)] == [*hops[1:], hops[0]]
+
+
+def test_key_pool_prefers_affinity_key() -> None:
+    r = fakeredis.FakeRedis(decode_responses=True)
+    pool = KeyPool("up", ["k1", "k2", "k3"], r)
+    home = affinity.rank("prefix", pool.keys)[0]
+    assert {pool.pick("prefix") for _ in range(10)} == {home}
+
+    # У «своего» ключа кончилась квота — берём следующий.
+    headers = {"x-ratelimit-remaining-requests": "0", "x-ratelimit-limit-requests": "100"}
+    pool.observe(home, 200, headers)
+    assert pool.pick("prefix") != home
+
+
+def test_cached_tokens_pricing() -> None:
+    pricing = {
+        "models": [
+            {"match": ".*", "prompt_per_1k_rub": 1, "cached_prompt_per_1k_rub": 0.25},
+        ]
+    }
+    assert float(calc_cost_rub("m", 2000, 0, pricing, None, 1000)) == 1.25
+    assert float(cache_savings_rub("m", 1000, pricing)) == 0.75
+    assert cache_savings_rub("m", 0, pricing) is None
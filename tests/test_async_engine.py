@@ -0,0 +1,91 @@
+import asyncio
+import threading
+
+import httpx
+import pytest
+
+import ai_gateway.queue.async_engine as engine_mod
+from ai_gateway import settings as settings_mod
+from ai_gateway.providers import factory
+from ai_gateway.providers.base import ProviderClient, ProviderResult
+from ai_gateway.providers.fallback import acall_with_fallback
+from ai_gateway.services.bulkhead import Bulkhead, BulkheadFullError
+
+
+class _Slow(ProviderClient):
+    def __init__(self, name: str, status_code: int = 200) -> None:
+        self.name = name
+        self.status_code = status_code
+
+    async def aresponses(self, payload: dict) -> ProviderResult:
+        await asyncio.sleep(0.01)
+        if self.status_code != 200:
+            req = httpx.Request("POST", "http://upstream/v1/responses")
+            resp = httpx.Response(self.status_code, request=req)
+            raise httpx.HTTPStatusError("boom", request=req, response=resp)
+        return ProviderResult(json={"model": payload.get("model")}, total_tokens=1)
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    monkeypatch.setenv("FALLBACK_CHAINS", '{"m": [{"provider": "up2"}]}')
+    monkeypatch.setenv("BULKHEAD_ENABLED", "false")
+    monkeypatch.setenv("AFFINITY_ENABLED", "false")
+    monkeypatch.setattr(settings_mod, "_settings", None)
+    yield
+    monkeypatch.setattr(settings_mod, "_settings", None)
+
+
+async def test_async_fallback_runs_calls_concurrently(settings, monkeypatch) -> None:
+    providers = {"up1": _Slow("up1", 503), "up2": _Slow("up2")}
+    monkeypatch.setattr(factory, "_cache", providers)
+    monkeypatch.setattr("ai_gateway.providers.fallback.mark_unhealthy", lambda name: None)
+
+    served = await asyncio.gather(
+        *(acall_with_fallback("responses", "up1", {"model": "m"}) for _ in range(50))
+    )
+    assert {(s.provider, s.hop) for s in served} == {("up2", 1)}
+
+
+async def test_async_bulkhead_limits_and_rejects() -> None:
+    bh = Bulkhead("t", max_concurrent=2, max_queue=1, max_wait=0.05)
+    active = 0
+    peak = 0
+
+    async def hold() -> None:
+        nonlocal active, peak
+        async with bh.aslot():
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.2)
+            active -= 1
+
+    results = await asyncio.gather(*(hold() for _ in range(4)), return_exceptions=True)
+    assert peak == 2
+    assert sum(isinstance(r, BulkheadFullError) for r in results) == 2
+
+
+def test_engine_caps_concurrency(monkeypatch) -> None:
+    running = 0
+    peak = 0
+    done = []
+
+    async def fake_run_job(job_id: str, payload: dict, retries: int = 0) -> None:
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+        done.append(job_id)
+
+    monkeypatch.setattr(engine_mod, "run_job", fake_run_job)
+    engine = engine_mod.AsyncJobEngine(concurrency=3)
+    engine.start()
+    threads = [threading.Thread(target=engine.submit, args=(f"job-{i}", {})) for i in range(12)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    engine.stop(timeout=5)
+    assert peak == 3
+    assert len(done) == 12
@@ -0,0 +1,121 @@
+import json
+import uuid
+
+import fakeredis
+import pytest
+from fastapi import HTTPException
+
+import ai_gateway.services.batches as batches
+import ai_gateway.settings as settings_mod
+from ai_gateway.services.batches import (
+    BatchItem,
+    feed_batch,
+    file_path,
+    finish_batch_item,
+    result_file_ids,
+    scan_input,
+)
+
+
+@pytest.fixture
+def env(monkeypatch, tmp_path):
+    monkeypatch.setenv("BATCH_FILES_DIR", str(tmp_path))
+    monkeypatch.setattr(settings_mod, "_settings", None)
+    queued: list[tuple[str, dict]] = []
+    finalized: list[str] = []
+    monkeypatch.setattr(batches, "enqueue_jobs", lambda jobs, **_: queued.extend(jobs))
+    monkeypatch.setattr(batches, "finalize_batch", lambda r, batch_id: finalized.append(batch_id))
+    yield fakeredis.FakeRedis(decode_responses=True), queued, finalized
+    monkeypatch.setattr(settings_mod, "_settings", None)
+
+
+def _write(path, rows) -> None:
+    with open(path, "w") as f:
+        for row in rows:
+            f.write((row if isinstance(row, str) else json.dumps(row)) + "\n")
+
+
+def _req(custom_id: str, text: str = "hi") -> dict:
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/responses",
+        "body": {"model": "m", "input": text},
+    }
+
+
+def test_scan_reports_bad_lines_with_numbers(env, tmp_path) -> None:
+    src = tmp_path / "in.jsonl"
+    _write(src, [_req("a"), "{oops", _req("a"), {**_req("b"), "url": "/v1/chat/completions"}])
+    with pytest.raises(HTTPException) as e:
+        list(scan_input(str(src), str(tmp_path / "q.jsonl"), "/v1/responses"))
+    assert e.value.status_code == 422
+    assert [err["line"] for err in e.value.detail] == [2, 3, 4]
+
+
+def _start(r, tmp_path, n: int) -> str:
+    """Пачка без БД: нормализованный файл + очередь и счётчики в Redis."""
+    batch_id = str(uuid.uuid4())
+    src = tmp_path / "in.jsonl"
+    _write(src, [_req(f"c{i}", f"text {i}") for i in range(n)])
+    lines = list(scan_input(str(src), str(tmp_path / f"{batch_id}.queue.jsonl"), "/v1/responses"))
+    r.hset(f"batch:{batch_id}:progress", mapping={"total": n, "completed": 0, "failed": 0})
+    r.rpush(f"batch:{batch_id}:pending", *[f"{uuid.uuid4()}:{line.offset}" for line in lines])
+    return batch_id
+
+
+def test_feed_limits_in_flight_and_results_are_checkpointed(env, tmp_path) -> None:
+    r, queued, finalized = env
+    batch_id = _start(r, tmp_path, 3)
+
+    assert feed_batch(r, batch_id, 2) == 2
+    assert [p["input"] for _, p in queued] == ["text 0", "text 1"]
+
+    first = BatchItem(batch_id, queued[0][0], "c0", True, "req-1", {"output": "ok"})
+    finish_batch_item(r, first)
+    finish_batch_item(r, first)  # повтор итога (ретрай задачи) не считается
+    assert len(queued) == 3  # освободилось место — поставлена следующая
+
+    finish_batch_item(r, BatchItem(batch_id, queued[1][0], "c1", False, error_code="x"))
+    assert not finalized
+    finish_batch_item(r, BatchItem(batch_id, queued[2][0], "c2", True, "req-3", {}))
+    assert finalized == [batch_id]
+    assert r.hgetall(f"batch:{batch_id}:progress") == {
+        "total": "3",
+        "completed": "2",
+        "failed": "1",
+    }
+
+    output_id, errors_id = result_file_ids(batch_id)
+    with open(file_path(output_id)) as f:
+        out = [json.loads(line) for line in f]
+    assert [o["custom_id"] for o in out] == ["c0", "c2"]
+    assert out[0]["response"]["body"] == {"output": "ok"}
+    with open(file_path(errors_id)) as f:
+        assert json.loads(f.readline())["error"]["code"] == "x"
+
+
+def test_finish_survives_failure_and_retry(env, tmp_path, monkeypatch) -> None:
+    r, queued, finalized = env
+    batch_id = _start(r, tmp_path, 2)
+    feed_batch(r, batch_id, 1)
+    item = BatchItem(batch_id, queued[0][0], "c0", True, "req-1", {"output": "ok"})
+
+    def no_space(path, lines):
+        raise OSError(28, "No space left on device")
+
+    append_lines = batches.append_lines
+    monkeypatch.setattr(batches, "append_lines", no_space)
+    with pytest.raises(OSError):
+        finish_batch_item(r, item)
+    monkeypatch.setattr(batches, "append_lines", append_lines)
+
+    # Ретрай задачи: строка дописывается один раз, следующая job ставится, итог учитывается.
+    finish_batch_item(r, item)
+    finish_batch_item(r, item)
+    assert len(queued) == 2
+    finish_batch_item(r, BatchItem(batch_id, queued[1][0], "c1", True, "req-2", {}))
+    assert finalized[:1] == [batch_id]
+    output_id, _ = result_file_ids(batch_id)
+    with open(file_path(output_id)) as f:
+        assert [json.loads(line)["custom_id"] for line in f] == ["c0", "c1"]
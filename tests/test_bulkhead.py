@@ -0,0 +1,36 @@
+import threading
+
+import pytest
+
+from ai_gateway.services.bulkhead import Bulkhead, BulkheadFullError
+from ai_gateway.services.errors import map_provider_exception
+
+
+def test_bulkhead_rejects_when_queue_full() -> None:
+    bh = Bulkhead("test-full", max_concurrent=1, max_queue=0, max_wait=1.0)
+    with bh.slot(), pytest.raises(BulkheadFullError) as ei, bh.slot():
+        pass
+    err = map_provider_exception(ei.value)
+    assert (err.status_code, err.code) == (503, "bulkhead_full")
+
+    with bh.slot():
+        pass  # слот освободился
+
+
+def test_bulkhead_queued_call_gets_released_slot() -> None:
+    bh = Bulkhead("test-queue", max_concurrent=1, max_queue=1, max_wait=2.0)
+    entered = threading.Event()
+    release = threading.Event()
+
+    def holder() -> None:
+        with bh.slot():
+            entered.set()
+            release.wait(2)
+
+    t = threading.Thread(target=holder)
+    t.start()
+    entered.wait(2)
+    threading.Timer(0.05, release.set).start()
+    with bh.slot():
+        pass
+    t.join()
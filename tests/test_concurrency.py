@@ -0,0 +1,57 @@
+import time
+
+import fakeredis
+import pytest
+from fastapi import HTTPException
+
+import ai_gateway.services.concurrency as concurrency
+import ai_gateway.settings as settings_mod
+from ai_gateway.services.concurrency import (
+    acquire_concurrency_slot,
+    concurrency_usage,
+    try_acquire_slot,
+)
+
+
+def test_slots_are_limited_and_released() -> None:
+    r = fakeredis.FakeRedis(decode_responses=True)
+    a = acquire_concurrency_slot(r, "k", 2)
+    b = acquire_concurrency_slot(r, "k", 2)
+    assert b.headers() == {"X-Concurrency-Limit": "2", "X-Concurrency-Remaining": "0"}
+    with pytest.raises(HTTPException) as ei:
+        acquire_concurrency_slot(r, "k", 2)
+    assert ei.value.status_code == 429
+
+    a.release()
+    assert concurrency_usage(r, "k") == 1
+    assert try_acquire_slot(r, "k", 2) is not None
+
+
+def test_expired_lease_frees_slot() -> None:
+    r = fakeredis.FakeRedis(decode_responses=True)
+    lease = try_acquire_slot(r, "k", 1)
+    assert lease is not None
+    # Воркер «упал»: lease не отпущен, но уже протух.
+    r.zadd("conc:k", {lease.lease_id: time.time() - 1})
+    assert try_acquire_slot(r, "k", 1) is not None
+
+
+def test_unlimited_key_has_no_headers() -> None:
+    r = fakeredis.FakeRedis(decode_responses=True)
+    lease = acquire_concurrency_slot(r, "k", None)
+    assert lease.headers() == {}
+    lease.release()
+
+
+def test_held_slot_is_renewed(monkeypatch) -> None:
+    monkeypatch.setenv("CONCURRENCY_LEASE_SECONDS", "0.3")
+    monkeypatch.setattr(settings_mod, "_settings", None)
+    monkeypatch.setattr(concurrency, "_renewer", concurrency._Renewer())
+    r = fakeredis.FakeRedis(decode_responses=True)
+    lease = try_acquire_slot(r, "k", 1)
+    # Вызов идёт дольше lease: слот продлевается и не достаётся другому.
+    time.sleep(0.5)
+    assert try_acquire_slot(r, "k", 1) is None
+    lease.release()
+    assert try_acquire_slot(r, "k", 1) is not None
+    monkeypatch.setattr(settings_mod, "_settings", None)
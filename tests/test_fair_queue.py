@@ -0,0 +1,77 @@
+import time
+
+import fakeredis
+import pytest
+
+import ai_gateway.queue.dispatch as dispatch
+import ai_gateway.settings as settings_mod
+from ai_gateway.queue import fair
+from ai_gateway.queue.dispatch import enqueue_jobs, release_fair_slot
+from ai_gateway.queue.fair import Tenant
+from ai_gateway.queue.streams import STREAM_KEY, StreamTask
+
+
+@pytest.fixture
+def r(monkeypatch):
+    monkeypatch.setenv("JOB_FAIR_QUEUING", "true")
+    monkeypatch.setenv("JOB_FAIR_WINDOW", "4")
+    monkeypatch.setenv("JOB_QUEUE", "streams")
+    monkeypatch.setenv("JOB_BLOB_STORE", "off")
+    monkeypatch.setattr(settings_mod, "_settings", None)
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(dispatch, "get_redis", lambda: client)
+    yield client
+    monkeypatch.setattr(settings_mod, "_settings", None)
+
+
+def _jobs(prefix: str, n: int) -> list[tuple[str, dict]]:
+    return [(f"{prefix}{i}", {"i": i}) for i in range(n)]
+
+
+def _published(r) -> list[str]:
+    return [StreamTask.decode(f["task"]).args[0] for _, f in r.xrange(STREAM_KEY)]
+
+
+def test_big_tenant_does_not_starve_small_one(r) -> None:
+    enqueue_jobs(_jobs("a", 100), tenant=Tenant("A"))
+    assert _published(r) == ["a0", "a1", "a2", "a3"]  # окно занято первым ключом
+
+    enqueue_jobs(_jobs("b", 2), tenant=Tenant("B"))
+    for job_id in ["a0", "a1", "a2", "a3"]:
+        release_fair_slot(job_id)
+    # Освободившиеся места делятся по кругу, а не достаются очереди A целиком.
+    assert sorted(_published(r)[4:]) == ["a4", "a5", "b0", "b1"]
+    assert r.zcard(fair.QUEUE_PREFIX + "B") == 0
+    assert r.lrange(fair.ACTIVE_KEY, 0, -1) == ["A"]
+
+
+def test_weights_and_priorities(r, monkeypatch) -> None:
+    monkeypatch.setenv("JOB_FAIR_WINDOW", "0")
+    monkeypatch.setattr(settings_mod, "_settings", None)
+    enqueue_jobs(_jobs("h", 10), tenant=Tenant("H", weight=3))
+    enqueue_jobs(_jobs("l", 10), tenant=Tenant("L"), priorities=[5] * 9 + [9])
+
+    monkeypatch.setenv("JOB_FAIR_WINDOW", "8")
+    monkeypatch.setattr(settings_mod, "_settings", None)
+    taken = [job_id for job_id, _ in fair.take(r)]
+    assert [j for j in taken if j.startswith("h")] == ["h0", "h1", "h2", "h3", "h4", "h5"]
+    assert [j for j in taken if j.startswith("l")] == ["l9", "l0"]  # priority 9 — первой
+
+
+def test_expired_lease_frees_window(r, monkeypatch) -> None:
+    enqueue_jobs(_jobs("a", 6), tenant=Tenant("A"))
+    assert len(_published(r)) == 4
+    monkeypatch.setenv("JOB_FAIR_LEASE_SECONDS", "0")
+    monkeypatch.setattr(settings_mod, "_settings", None)
+    assert dispatch.pump_fair_queue() == 2
+
+
+def test_heartbeat_keeps_window_slot(r) -> None:
+    enqueue_jobs(_jobs("a", 6), tenant=Tenant("A"))
+    for job_id in ["a0", "a1", "a2", "a3"]:
+        r.zadd(fair.INFLIGHT_KEY, {job_id: time.time() - 1000})  # старше JOB_FAIR_LEASE_SECONDS
+    for job_id in ["a0", "a1", "a2"]:
+        dispatch.renew_fair_slot(job_id)
+    dispatch.renew_fair_slot("a5")  # её нет в окне — место не появляется
+    assert dispatch.pump_fair_queue() == 1  # освободилось только место a3
+    assert r.zscore(fair.INFLIGHT_KEY, "a3") is None
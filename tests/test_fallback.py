@@ -0,0 +1,75 @@
+import json
+
+import httpx
+import pytest
+
+from ai_gateway import settings as settings_mod
+from ai_gateway.providers import factory
+from ai_gateway.providers.base import ProviderClient, ProviderResult
+from ai_gateway.providers.fallback import call_with_fallback, plan_hops
+
+
+class _Failing(ProviderClient):
+    def __init__(self, name: str, status_code: int) -> None:
+        self.name = name
+        self.status_code = status_code
+
+    def responses(self, payload: dict) -> ProviderResult:
+        req = httpx.Request("POST", "http://upstream/v1/responses")
+        resp = httpx.Response(self.status_code, request=req)
+        raise httpx.HTTPStatusError("boom", request=req, response=resp)
+
+
+class _Ok(ProviderClient):
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def responses(self, payload: dict) -> ProviderResult:
+        return ProviderResult(json={"model": payload.get("model")}, total_tokens=1)
+
+
+@pytest.fixture
+def chains(monkeypatch):
+    monkeypatch.setenv(
+        "FALLBACK_CHAINS",
+        json.dumps(
+            {
+                "model-a": [
+                    {"provider": "up2"},
+                    {"provider": "up2", "model": "model-b", "on": ["5xx"]},
+                ]
+            }
+        ),
+    )
+    monkeypatch.setattr(settings_mod, "_settings", None)
+    yield
+    monkeypatch.setattr(settings_mod, "_settings", None)
+
+
+def test_plan_hops_default_triggers(chains) -> None:
+    hops = plan_hops("up1", "model-a")
+    assert [(h.provider, h.model) for h in hops] == [
+        ("up1", "model-a"),
+        ("up2", "model-a"),
+        ("up2", "model-b"),
+    ]
+    assert "429" in hops[1].triggers
+    assert hops[2].triggers == frozenset({"5xx"})
+
+
+def test_call_with_fallback_reports_served_hop(chains, monkeypatch) -> None:
+    monkeypatch.setattr(factory, "_cache", {"up1": _Failing("up1", 429), "up2": _Ok("up2")})
+    served = call_with_fallback("responses", "up1", {"model": "model-a"})
+    assert (served.provider, served.model, served.hop) == ("up2", "model-a", 1)
+
+
+def test_call_with_fallback_respects_hop_triggers(chains, monkeypatch) -> None:
+    # up2/model-a вернул 429, а третий hop срабатывает только на 5xx.
+    monkeypatch.setattr(
+        factory,
+        "_cache",
+        {"up1": _Failing("up1", 503), "up2": _Failing("up2", 429)},
+    )
+    with pytest.raises(httpx.HTTPStatusError) as ei:
+        call_with_fallback("responses", "up1", {"model": "model-a"})
+    assert ei.value.response.status_code == 429
@@ -0,0 +1,27 @@
+import socket
+
+from ai_gateway.infrastructure.http import DnsCache
+
+
+def test_dns_cache_passes_ip_literals_through() -> None:
+    dns = DnsCache(60)
+    assert dns.resolve("127.0.0.1", 443) == ["127.0.0.1"]
+    assert dns.resolve("::1", 443) == ["::1"]
+
+
+def test_dns_cache_reuses_entry_within_ttl(monkeypatch) -> None:
+    calls = []
+
+    def fake_getaddrinfo(host, port, type=0):  # noqa: A002
+        calls.append(host)
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("10.0.0.7", port))]
+
+    monkeypatch.setattr(socket, "getaddrinfo", fake_getaddrinfo)
+    dns = DnsCache(60)
+    assert dns.resolve("api.example.com", 443) == ["10.0.0.7"]
+    assert dns.resolve("api.example.com", 443) == ["10.0.0.7"]
+    assert calls == ["api.example.com"]
+
+    dns.forget("api.example.com", 443)
+    dns.resolve("api.example.com", 443)
+    assert len(calls) == 2
@@ -0,0 +1,94 @@
+import threading
+import time
+
+import fakeredis
+import pytest
+from fastapi import HTTPException, Response
+from fastapi.responses import JSONResponse
+
+import ai_gateway.settings as settings_mod
+from ai_gateway.services.idempotency import REPLAY_HEADER, with_idempotency
+
+
+def test_replays_stored_response() -> None:
+    r = fakeredis.FakeRedis(decode_responses=True)
+    calls = []
+
+    def handler() -> dict:
+        calls.append(1)
+        return {"id": "resp_1"}
+
+    assert with_idempotency(r, "k", "responses", "abc", {"p": 1}, handler) == {"id": "resp_1"}
+    replay = with_idempotency(r, "k", "responses", "abc", {"p": 1}, handler)
+    assert isinstance(replay, JSONResponse)
+    assert replay.headers[REPLAY_HEADER] == "true"
+    assert len(calls) == 1
+
+    with pytest.raises(HTTPException) as ei:
+        with_idempotency(r, "k", "responses", "abc", {"p": 2}, handler)
+    assert ei.value.status_code == 422
+
+
+def test_retryable_errors_are_not_stored() -> None:
+    r = fakeredis.FakeRedis(decode_responses=True)
+    calls = []
+
+    def handler() -> JSONResponse:
+        calls.append(1)
+        return JSONResponse(status_code=502, content={"error": {"code": "upstream_error"}})
+
+    with_idempotency(r, "k", "responses", "abc", {}, handler)
+    with_idempotency(r, "k", "responses", "abc", {}, handler)
+    assert len(calls) == 2
+
+
+def test_concurrent_duplicate_waits_for_first() -> None:
+    r = fakeredis.FakeRedis(decode_responses=True)
+    calls = []
+
+    def handler() -> dict:
+        calls.append(1)
+        time.sleep(0.2)
+        return {"ok": True}
+
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(
+                with_idempotency(r, "k", "responses", "abc", {}, handler)
+            )
+        )
+        for _ in range(3)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert sum(isinstance(x, JSONResponse) for x in results) == 2
+
+
+def test_marker_renewed_while_running_and_headers_replayed(monkeypatch) -> None:
+    monkeypatch.setenv("IDEMPOTENCY_LOCK_SECONDS", "1")
+    monkeypatch.setattr(settings_mod, "_settings", None)
+    r = fakeredis.FakeRedis(decode_responses=True)
+    calls = []
+
+    def handler() -> dict:
+        calls.append(1)
+        response.headers["X-Concurrency-Limit"] = "2"
+        # Вызов дольше IDEMPOTENCY_LOCK_SECONDS: маркер не истекает, дубль в upstream не идёт.
+        time.sleep(1.5)
+        return {"ok": True}
+
+    response = Response()
+    first = threading.Thread(
+        target=lambda: with_idempotency(r, "k", "responses", "abc", {}, handler, response)
+    )
+    first.start()
+    time.sleep(1.2)
+    replay = with_idempotency(r, "k", "responses", "abc", {}, handler)
+    first.join()
+    assert len(calls) == 1
+    assert replay.headers["x-concurrency-limit"] == "2"
+    monkeypatch.setattr(settings_mod, "_settings", None)
@@ -0,0 +1,58 @@
+import time
+import uuid
+
+from sqlalchemy.dialects import postgresql
+
+import ai_gateway.settings as settings_mod
+from ai_gateway.queue import leases
+from ai_gateway.queue.execution import claim_statement, unclaim_statement
+from ai_gateway.queue.reaper import partition_expired
+
+
+def _sql(stmt) -> str:
+    return str(stmt.compile(dialect=postgresql.dialect())).replace("\n", " ")
+
+
+def test_claim_is_one_update_returning_row_and_key_limits() -> None:
+    sql = _sql(claim_statement(uuid.uuid4()))
+    assert sql.startswith("UPDATE jobs SET status=")
+    assert "attempt_count=(jobs.attempt_count +" in sql
+    assert "FOR UPDATE" not in sql  # lock живёт только внутри statement
+    # Чужую job в работе не берём, пока не истёк её lease.
+    assert "jobs.lease_expires_at < now()" in sql
+    assert "lease_expires_at=(now() +" in sql
+    assert sql.endswith("api_keys.max_concurrent, api_keys.tpm_limit")
+
+
+def test_unclaim_only_reverts_its_own_attempt() -> None:
+    sql = _sql(unclaim_statement(uuid.uuid4(), 3))
+    assert "attempt_count=(jobs.attempt_count -" in sql
+    assert "jobs.status = " in sql and "jobs.attempt_count = " in sql
+
+
+def test_expired_leases_requeue_until_attempts_run_out() -> None:
+    ids = [uuid.uuid4() for _ in range(3)]
+    requeue, fail = partition_expired(
+        [(ids[0], 1), (ids[1], 5), (ids[2], 2)],
+        [{"p": 0}, {"p": 1}, None],
+        max_attempts=5,
+    )
+    assert requeue == [(str(ids[0]), {"p": 0})]
+    assert "попытки исчерпаны" in fail[str(ids[1])]
+    assert "payload" in fail[str(ids[2])]
+
+
+def test_heartbeat_renews_lease_while_call_runs(monkeypatch) -> None:
+    monkeypatch.setenv("JOB_HEARTBEAT_SECONDS", "0.05")
+    monkeypatch.setattr(settings_mod, "_settings", None)
+    renewed: list[int] = []
+    monkeypatch.setattr(
+        leases, "renew_lease", lambda job_uuid, attempt: renewed.append(attempt) or True
+    )
+    with leases.Heartbeat(uuid.uuid4(), 2):
+        time.sleep(0.3)
+    count = len(renewed)
+    time.sleep(0.15)
+    assert count >= 3 and renewed[0] == 2
+    assert len(renewed) == count  # после выхода из блока не продлевает
+    monkeypatch.setattr(settings_mod, "_settings", None)
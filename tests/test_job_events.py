@@ -0,0 +1,128 @@
+import threading
+import uuid
+
+import fakeredis
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import ai_gateway.services.job_events as job_events
+from ai_gateway.api import v1_jobs
+from ai_gateway.auth.apikey import AuthedKey, require_api_key
+from ai_gateway.services.job_events import publish_job_status
+
+
+@pytest.fixture
+def app(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        job_events,
+        "get_async_redis",
+        lambda: fakeredis.FakeAsyncRedis(server=server, decode_responses=True),
+    )
+    monkeypatch.setattr(job_events, "_hub", None)
+    docs: dict[str, dict] = {}
+    loads: list[str] = []
+
+    def fake_load(job_uuid, authed):
+        loads.append(docs[str(job_uuid)]["status"])
+        return dict(docs[str(job_uuid)])
+
+    monkeypatch.setattr(v1_jobs, "_load_job", fake_load)
+    api = FastAPI()
+    api.include_router(v1_jobs.router, prefix="/v1")
+    api.dependency_overrides[require_api_key] = lambda: AuthedKey(
+        api_key_id=str(uuid.uuid4()),
+        rpm_limit=None,
+        daily_budget_rub=None,
+        monthly_budget_rub=None,
+    )
+    return TestClient(api), fakeredis.FakeRedis(server=server, decode_responses=True), docs, loads
+
+
+def _later(seconds: float, fn) -> None:
+    threading.Timer(seconds, fn).start()
+
+
+def test_long_poll_wakes_on_status_change(app) -> None:
+    c, r, docs, loads = app
+    job_id = str(uuid.uuid4())
+    docs[job_id] = {"job_id": job_id, "status": "queued"}
+
+    def finish() -> None:
+        docs[job_id] = {"job_id": job_id, "status": "succeeded", "result": {"ok": 1}}
+        publish_job_status(job_id, "succeeded", r)
+
+    _later(0.3, finish)
+    resp = c.get(f"/v1/jobs/{job_id}", params={"wait": 10})
+    assert resp.json()["status"] == "succeeded"
+    assert loads == ["queued", "succeeded"]  # два чтения вместо опроса в цикле
+
+    # Итоговый статус отдаётся сразу, без ожидания.
+    assert c.get(f"/v1/jobs/{job_id}", params={"wait": 10}).json()["result"] == {"ok": 1}
+
+
+def test_long_poll_times_out_with_current_status(app, monkeypatch) -> None:
+    c, _, docs, _ = app
+    job_id = str(uuid.uuid4())
+    docs[job_id] = {"job_id": job_id, "status": "running"}
+    assert c.get(f"/v1/jobs/{job_id}", params={"wait": 0.2}).json()["status"] == "running"
+
+
+def test_sse_streams_transitions_until_terminal(app) -> None:
+    c, r, docs, _ = app
+    job_id = str(uuid.uuid4())
+    docs[job_id] = {"job_id": job_id, "status": "queued"}
+
+    def run() -> None:
+        publish_job_status(job_id, "running", r)
+        docs[job_id] = {"job_id": job_id, "status": "failed", "error_code": "x"}
+        publish_job_status(job_id, "failed", r)
+
+    _later(0.3, run)
+    with c.stream("GET", f"/v1/jobs/{job_id}/events") as resp:
+        assert resp.headers["content-type"].startswith("text/event-stream")
+        body = "".join(resp.iter_text())
+    data = [line for line in body.splitlines() if line.startswith("data: ")]
+    assert [d.split('"status": ')[1].split('"')[1] for d in data] == ["queued", "running", "failed"]
+    assert '"error_code": "x"' in data[-1]
+
+
+def _entry(job_id: str, status: str, api_key_id: str) -> dict:
+    return {"api_key_id": api_key_id, "doc": {"job_id": job_id, "status": status}}
+
+
+def test_status_reads_come_from_cache(monkeypatch) -> None:
+    r = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(v1_jobs, "get_redis", lambda: r)
+
+    def no_db():
+        raise AssertionError("кэш должен ответить без БД")
+
+    monkeypatch.setattr(v1_jobs, "SessionLocal", no_db)
+    key_id = str(uuid.uuid4())
+    done, running = str(uuid.uuid4()), str(uuid.uuid4())
+    publish_job_status(done, "succeeded", r, entry=_entry(done, "succeeded", key_id))
+    publish_job_status(running, "running", r, entry=_entry(running, "running", key_id))
+
+    api = FastAPI()
+    api.include_router(v1_jobs.router, prefix="/v1")
+    api.dependency_overrides[require_api_key] = lambda: AuthedKey(
+        api_key_id=key_id,
+        rpm_limit=None,
+        daily_budget_rub=None,
+        monthly_budget_rub=None,
+    )
+    c = TestClient(api)
+    assert c.get(f"/v1/jobs/{done}").json()["status"] == "succeeded"
+
+    resp = c.get("/v1/jobs", params={"ids": f"{running},{done},nope"}).json()
+    assert [d["status"] for d in resp["data"][:2]] == ["running", "succeeded"]
+    assert resp["data"][2] == {
+        "job_id": "nope",
+        "error": {"status": 404, "message": "Задача не найдена"},
+    }
+
+    # Переход без строки под рукой (UPDATE) сбрасывает кэш — следующее чтение идёт в БД.
+    publish_job_status(running, "queued", r)
+    assert r.get(job_events.doc_key(running)) is None
@@ -0,0 +1,103 @@
+import json
+import uuid
+
+import fakeredis
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import ai_gateway.infrastructure.blobs as blobs
+import ai_gateway.queue.dispatch as dispatch
+import ai_gateway.settings as settings_mod
+from ai_gateway.api import v1_jobs
+from ai_gateway.auth.apikey import AuthedKey, require_api_key
+from ai_gateway.infrastructure.blobs import RedisBlobStore
+from ai_gateway.queue.dispatch import enqueue_jobs
+from ai_gateway.queue.streams import STREAM_KEY, StreamTask
+from ai_gateway.services.jobs import SubmittedJob
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("JOBS_BATCH_MAX_ITEMS", "3")
+    monkeypatch.setattr(settings_mod, "_settings", None)
+    submitted = []
+
+    def fake_submit_jobs(session, api_key_id, jobs, key_priority=None):
+        submitted.extend(jobs)
+        return [SubmittedJob(job_id=str(uuid.uuid4()), status="queued", created=True) for _ in jobs]
+
+    class _Session:
+        def close(self):
+            pass
+
+    monkeypatch.setattr(v1_jobs, "get_redis", lambda: fakeredis.FakeRedis())
+    monkeypatch.setattr(v1_jobs, "SessionLocal", _Session)
+    monkeypatch.setattr(v1_jobs, "enforce_budgets", lambda *a: None)
+    monkeypatch.setattr(v1_jobs, "submit_jobs", fake_submit_jobs)
+    app = FastAPI()
+    app.include_router(v1_jobs.router, prefix="/v1")
+    app.dependency_overrides[require_api_key] = lambda: AuthedKey(
+        api_key_id=str(uuid.uuid4()),
+        rpm_limit=None,
+        daily_budget_rub=None,
+        monthly_budget_rub=None,
+    )
+    yield TestClient(app), submitted
+    monkeypatch.setattr(settings_mod, "_settings", None)
+
+
+def test_batch_accepts_array_and_ndjson(client) -> None:
+    c, submitted = client
+    jobs = [
+        {"kind": "responses", "payload": {"model": "m", "input": "a"}, "idempotency_key": "k1"},
+        {"kind": "chat.completions", "model": "x", "payload": {"messages": []}},
+    ]
+    data = c.post("/v1/jobs/batch", json=jobs).json()
+    assert [d["index"] for d in data["data"]] == [0, 1]
+    assert data["created"] == 2
+    assert [(j.model, j.idempotency_key) for j in submitted] == [("m", "k1"), ("x", None)]
+
+    ndjson = "\n".join(json.dumps(j) for j in jobs) + "\n"
+    resp = c.post(
+        "/v1/jobs/batch",
+        content=ndjson,
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert resp.json()["created"] == 2
+
+
+def test_batch_item_errors_do_not_fail_batch(client) -> None:
+    c, submitted = client
+    jobs = [
+        {"kind": "responses", "payload": {"template_id": "bad@@"}},
+        {"kind": "responses", "payload": {"model": "m", "input": "a"}},
+    ]
+    data = c.post("/v1/jobs/batch", json={"jobs": jobs}).json()
+    assert data["failed"] == 1
+    assert data["data"][0]["error"]["status"] == 422
+    assert "job_id" in data["data"][1]
+    assert len(submitted) == 1
+
+
+def test_batch_limits(client) -> None:
+    c, _ = client
+    job = {"kind": "responses", "payload": {}}
+    assert c.post("/v1/jobs/batch", json=[job] * 4).status_code == 413
+    assert c.post("/v1/jobs/batch", json=[{"kind": "nope"}]).status_code == 422
+
+
+def test_enqueue_jobs_pipelines_stream_and_blobs(monkeypatch) -> None:
+    monkeypatch.setenv("JOB_QUEUE", "streams")
+    monkeypatch.setenv("JOB_BLOB_MIN_BYTES", "1024")
+    monkeypatch.setattr(settings_mod, "_settings", None)
+    r = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(dispatch, "get_redis", lambda: r)
+    monkeypatch.setattr(blobs, "_store", RedisBlobStore(fakeredis.FakeRedis()))
+
+    enqueue_jobs([("j1", {"input": "a"}), ("j2", {"input": "b" * 5000})])
+    tasks = [StreamTask.decode(f["task"]) for _, f in r.xrange(STREAM_KEY)]
+    assert [t.args[0] for t in tasks] == ["j1", "j2"]
+    assert tasks[0].args[1] == {"input": "a"}
+    assert "$blob" in tasks[1].args[1]
+    monkeypatch.setattr(settings_mod, "_settings", None)
@@ -0,0 +1,56 @@
+import fakeredis
+
+from ai_gateway.providers.keypool import KeyPool, headroom, parse_reset_seconds
+
+
+def test_parse_reset_seconds_formats() -> None:
+    assert parse_reset_seconds("20ms") == 0.02
+    assert parse_reset_seconds("6m0s") == 360.0
+    assert parse_reset_seconds("1h2m3.5s") == 3723.5
+    assert parse_reset_seconds("12") == 12.0
+    assert parse_reset_seconds("soon") is None
+    assert parse_reset_seconds(None) is None
+
+
+def test_key_pool_prefers_headroom_and_skips_cooldown() -> None:
+    r = fakeredis.FakeRedis(decode_responses=True)
+    pool = KeyPool("up", ["k1", "k2"], r)
+
+    pool.observe(
+        "k1",
+        200,
+        {"x-ratelimit-remaining-requests": "5", "x-ratelimit-limit-requests": "100"},
+    )
+    pool.observe(
+        "k2",
+        200,
+        {"x-ratelimit-remaining-requests": "90", "x-ratelimit-limit-requests": "100"},
+    )
+    assert pool.pick() == "k2"
+
+    pool.observe("k2", 429, {"retry-after": "30"})
+    assert pool.pick() == "k1"
+
+
+def test_unknown_headroom_is_pool_median() -> None:
+    assert headroom({}) is None
+    assert headroom({"rr": "7"}) is None  # без лимита доли нет
+    assert headroom({"rr": "0"}) == 0.0
+
+    r = fakeredis.FakeRedis(decode_responses=True)
+    pool = KeyPool("up", ["k1", "k2", "k3"], r)
+    limits = {"x-ratelimit-limit-requests": "100"}
+    pool.observe("k1", 200, {"x-ratelimit-remaining-requests": "80", **limits})
+    pool.observe("k2", 200, {"x-ratelimit-remaining-requests": "20", **limits})
+    # k3 ещё не наблюдался: его запас — медиана (0.5), он не обгоняет k1.
+    assert {pool.pick() for _ in range(20)} == {"k1"}
+
+
+def test_pick_never_takes_requests_below_zero() -> None:
+    r = fakeredis.FakeRedis(decode_responses=True)
+    pool = KeyPool("up", ["k1", "k2"], r)
+    for k in ("k1", "k2"):
+        pool.observe(k, 200, {"x-ratelimit-remaining-requests": "1"})
+    for _ in range(5):
+        pool.pick()
+    assert [r.hget(pool._state_key(k), "rr") for k in ("k1", "k2")] == ["0", "0"]
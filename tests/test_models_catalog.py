@@ -0,0 +1,139 @@
+import json
+import threading
+import time
+
+import fakeredis
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import ai_gateway.services.models_catalog as catalog
+import ai_gateway.settings as settings_mod
+from ai_gateway.api import v1_models
+from ai_gateway.auth.apikey import AuthedKey, require_api_key
+
+
+class _Provider:
+    def __init__(self, models: list[str], delay: float = 0.0) -> None:
+        self.models = models
+        self.delay = delay
+        self.calls = 0
+
+    def list_models(self) -> dict:
+        self.calls += 1
+        time.sleep(self.delay)
+        return {"object": "list", "data": [{"id": m, "object": "model"} for m in self.models]}
+
+
+def _lookup(providers: dict[str, _Provider]):
+    def get(name: str) -> _Provider:
+        if name not in providers:
+            raise ValueError(f"Unknown provider: {name}")
+        return providers[name]
+
+    return get
+
+
+@pytest.fixture
+def env(monkeypatch):
+    monkeypatch.setenv("MODELS_CACHE_TTL_SECONDS", "60")
+    monkeypatch.setattr(settings_mod, "_settings", None)
+    r = fakeredis.FakeRedis(decode_responses=True)
+    providers = {"a": _Provider(["m1", "m2"], delay=0.05), "b": _Provider(["m2", "m3"])}
+    monkeypatch.setattr(catalog, "get_redis", lambda: r)
+    monkeypatch.setattr(catalog, "get_provider", _lookup(providers))
+    monkeypatch.setattr(catalog, "_local", catalog._LocalCache())
+    yield r, providers
+    monkeypatch.setattr(settings_mod, "_settings", None)
+
+
+def test_cold_start_is_single_flight(env) -> None:
+    _, providers = env
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(catalog.get_models("a"))) for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert providers["a"].calls == 1
+    assert sorted(x.source for x in results).count("upstream") == 1
+    assert catalog.get_models("a").source == "memory"
+
+
+def test_stale_entry_served_while_refreshing(env) -> None:
+    r, providers = env
+    catalog.get_models("b")
+    # Запись устарела: отдаём её сразу, обновление — в фоне.
+    doc = json.loads(r.get(catalog._cache_key("b")))
+    doc["fetched_at"] -= 1000
+    r.set(catalog._cache_key("b"), json.dumps(doc))
+    catalog._local.clear()
+    providers["b"].models = ["m9"]
+
+    lookup = catalog.get_models("b")
+    assert lookup.stale and lookup.source == "redis"
+    assert [m["id"] for m in lookup.entry.data["data"]] == ["m2", "m3"]
+    for _ in range(100):
+        if providers["b"].calls == 2:
+            break
+        time.sleep(0.01)
+    time.sleep(0.05)
+    catalog._local.clear()
+    assert [m["id"] for m in catalog.get_models("b").entry.data["data"]] == ["m9"]
+
+
+def test_merge_and_etag(env) -> None:
+    data, etag = catalog.merge_catalogs(
+        [("a", catalog.get_models("a").entry), ("b", catalog.get_models("b").entry)]
+    )
+    assert [(m["id"], m["providers"]) for m in data["data"]] == [
+        ("m1", ["a"]),
+        ("m2", ["a", "b"]),
+        ("m3", ["b"]),
+    ]
+    assert catalog.etag_matches(f"W/{etag}, \"other\"", etag)
+    assert not catalog.etag_matches('"other"', etag)
+
+
+def test_failed_refresh_fails_fast(env, monkeypatch) -> None:
+    _, providers = env
+
+    def down() -> dict:
+        providers["a"].calls += 1
+        raise RuntimeError("upstream down")
+
+    monkeypatch.setattr(providers["a"], "list_models", down)
+    with pytest.raises(RuntimeError, match="upstream down"):
+        catalog.get_models("a")
+    # Ошибка запомнена: следующий холодный запрос не ждёт и в upstream не ходит.
+    t0 = time.monotonic()
+    with pytest.raises(catalog.ModelsUnavailableError):
+        catalog.get_models("a")
+    assert time.monotonic() - t0 < 1
+    assert providers["a"].calls == 1
+    with pytest.raises(ValueError, match="Unknown provider"):
+        catalog.get_models("bogus")
+
+
+def test_cached_failure_is_not_logged_as_upstream_call(monkeypatch) -> None:
+    def unavailable(name: str):
+        raise catalog.ModelsUnavailableError("Каталог a недоступен")
+
+    logged = []
+    monkeypatch.setattr(v1_models, "get_redis", lambda: fakeredis.FakeRedis())
+    monkeypatch.setattr(v1_models, "get_models", unavailable)
+    monkeypatch.setattr(v1_models, "_log_upstream_call", lambda *a, **kw: logged.append(a))
+    app = FastAPI()
+    app.include_router(v1_models.router, prefix="/v1")
+    app.dependency_overrides[require_api_key] = lambda: AuthedKey(
+        api_key_id="k",
+        rpm_limit=None,
+        daily_budget_rub=None,
+        monthly_budget_rub=None,
+    )
+    resp = TestClient(app).get("/v1/models", headers={"X-Provider": "a"})
+    assert resp.status_code == 503
+    assert resp.json()["error"]["code"] == "models_unavailable"
+    assert not logged
@@ -0,0 +1,31 @@
+import fakeredis
+import pytest
+
+from ai_gateway.providers.base import UpstreamBusyError
+from ai_gateway.providers.context import PRIORITY_JOBS, call_priority
+from ai_gateway.providers.pacing import UpstreamPacer
+
+
+def test_pacer_disabled_until_limit_observed() -> None:
+    pacer = UpstreamPacer("up", fakeredis.FakeRedis(decode_responses=True))
+    for _ in range(50):
+        assert pacer.acquire() == 0.0
+
+
+def test_pacer_holds_after_429_until_deadline() -> None:
+    pacer = UpstreamPacer("up", fakeredis.FakeRedis(decode_responses=True))
+    pacer.observe(429, {"retry-after": "30"})
+    with pytest.raises(UpstreamBusyError):
+        pacer.acquire()
+
+
+def test_pacer_keeps_reserve_for_sync_traffic() -> None:
+    pacer = UpstreamPacer("up", fakeredis.FakeRedis(decode_responses=True))
+    # 60 RPM = 1 req/s; burst по умолчанию 5, jobs не трогают резерв (40% burst).
+    pacer.observe(200, {"x-ratelimit-limit-requests": "60"})
+    with call_priority(PRIORITY_JOBS):
+        for _ in range(3):
+            pacer.acquire()
+        with pytest.raises(UpstreamBusyError):
+            pacer.acquire(deadline=0)
+    assert pacer.acquire(deadline=0) == 0.0
@@ -0,0 +1,73 @@
+import base64
+
+import fakeredis
+import pytest
+from cryptography.exceptions import InvalidTag
+
+import ai_gateway.infrastructure.blobs as blobs
+import ai_gateway.services.payloads as payloads
+from ai_gateway import settings as settings_mod
+from ai_gateway.infrastructure.blobs import DiskBlobStore, RedisBlobStore
+from ai_gateway.services.payloads import BlobMissingError, discard, is_blob_ref, resolve, stash
+
+_BIG = {"model": "m", "messages": [{"role": "user", "content": "секретный промпт " * 500}]}
+
+
+@pytest.fixture
+def store(monkeypatch):
+    monkeypatch.setenv("JOB_BLOB_MIN_BYTES", "1024")
+    monkeypatch.setattr(settings_mod, "_settings", None)
+    s = RedisBlobStore(fakeredis.FakeRedis())
+    monkeypatch.setattr(blobs, "_store", s)
+    monkeypatch.setattr(payloads, "_codecs", payloads._Codecs())
+    yield s
+    monkeypatch.setattr(settings_mod, "_settings", None)
+
+
+def test_small_payload_stays_inline_and_large_goes_to_blob(store) -> None:
+    small = {"model": "m", "input": "hi"}
+    assert stash(small) is small
+
+    ref = stash(_BIG)
+    assert is_blob_ref(ref)
+    assert stash(ref) is ref  # ретрай не кладёт blob второй раз
+    data = store.get(ref["$blob"])
+    assert len(data) < len(str(_BIG)) / 10
+    assert resolve(ref) == _BIG
+
+    discard(ref)
+    with pytest.raises(BlobMissingError):
+        resolve(ref)
+
+
+def test_encrypted_blob_is_bound_to_its_key(store, monkeypatch) -> None:
+    key = base64.urlsafe_b64encode(b"k" * 32).decode()
+    monkeypatch.setenv("JOB_BLOB_ENCRYPTION_KEY", key)
+    monkeypatch.setattr(settings_mod, "_settings", None)
+
+    ref = stash(_BIG)
+    data = store.get(ref["$blob"])
+    assert "секретный".encode() not in data
+    assert resolve(ref) == _BIG
+
+    # Содержимое одного blob'а под чужим ключом не расшифруется.
+    store.put("job-other", data, 60)
+    with pytest.raises(InvalidTag):
+        resolve({"$blob": "job-other"})
+
+
+def test_disk_store_expires_by_ttl(tmp_path) -> None:
+    s = DiskBlobStore(str(tmp_path))
+    s.put("a", b"1", 60)
+    s.put("b", b"2", -1)
+    assert s.get("a") == b"1"
+    assert s.get("b") is None
+    with pytest.raises(ValueError):
+        s.get("../etc")
+
+
+def test_bad_encryption_key_fails_startup_check(store, monkeypatch) -> None:
+    monkeypatch.setenv("JOB_BLOB_ENCRYPTION_KEY", "short")
+    monkeypatch.setattr(settings_mod, "_settings", None)
+    with pytest.raises(RuntimeError, match="JOB_BLOB_ENCRYPTION_KEY"):
+        payloads.check_codecs()
@@ -0,0 +1,64 @@
+import json
+import os
+import re
+from decimal import Decimal
+
+import pytest
+
+import ai_gateway.services.pricing as pricing_mod
+import ai_gateway.settings as settings_mod
+from ai_gateway.services.pricing import PricingIndex, calc_cost_rub, load_pricing
+
+PRICING = {
+    "defaults": {"prompt_per_1k_rub": 0.1, "completion_per_1k_rub": 0.2},
+    "models": [
+        {"match": "gpt-4o-mini", "prompt_per_1k_rub": 1},
+        {"match": "gpt-4o.*", "provider": "openrouter", "prompt_per_1k_rub": 2},
+        {"match": "gpt-4o.*", "prompt_per_1k_rub": 3},
+        {"match": "(claude|gemini)-.*", "prompt_per_1k_rub": 4},
+        {"match": "gpt-4o-mini-2024", "prompt_per_1k_rub": 5},
+        {"match": ".*", "prompt_per_1k_rub": 6},
+    ],
+}
+
+
+def test_index_keeps_first_match_order() -> None:
+    idx = PricingIndex(PRICING)
+    assert idx.price("gpt-4o-mini").prompt_per_1k_rub == Decimal(1)
+    assert idx.price("gpt-4o", "openrouter").prompt_per_1k_rub == Decimal(2)
+    assert idx.price("gpt-4o", "openai").prompt_per_1k_rub == Decimal(3)
+    # Точное правило ниже по списку проигрывает префиксу выше.
+    assert idx.price("gpt-4o-mini-2024").prompt_per_1k_rub == Decimal(3)
+    assert idx.price("claude-3").prompt_per_1k_rub == Decimal(4)
+    assert idx.price("other").prompt_per_1k_rub == Decimal(6)
+    assert idx.price("other").completion_per_1k_rub == Decimal("0.2")
+    assert PricingIndex({}).price("x").prompt_per_1k_rub == Decimal(0)
+
+
+def test_reload_on_file_change(tmp_path, monkeypatch) -> None:
+    path = tmp_path / "pricing.json"
+    path.write_text(json.dumps({"models": [{"match": ".*", "prompt_per_1k_rub": 1}]}))
+    monkeypatch.setenv("PRICING_PATH", str(path))
+    monkeypatch.setenv("PRICING_RELOAD_CHECK_SECONDS", "0.000001")
+    monkeypatch.setattr(settings_mod, "_settings", None)
+    monkeypatch.setattr(pricing_mod, "_store", pricing_mod._PricingStore())
+
+    assert calc_cost_rub("m", 1000, 0, load_pricing()) == Decimal(1)
+
+    path.write_text(json.dumps({"models": [{"match": ".*", "prompt_per_1k_rub": 2}]}))
+    os.utime(path, (0, 12345))
+    assert calc_cost_rub("m", 1000, 0, load_pricing()) == Decimal(2)
+
+    # Битый файл: остаёмся на прошлой версии.
+    path.write_text("{")
+    os.utime(path, (0, 23456))
+    assert calc_cost_rub("m", 1000, 0, load_pricing()) == Decimal(2)
+    monkeypatch.setattr(settings_mod, "_settings", None)
+
+
+@pytest.mark.parametrize("pattern", ["gpt\\-4", "a.b", "x\\d+"])
+def test_patterns_match_like_regex(pattern) -> None:
+    idx = PricingIndex({"models": [{"match": pattern, "prompt_per_1k_rub": 1}]})
+    for model in ["gpt-4", "a.b", "axb", "x12", "x"]:
+        expected = Decimal(1) if re.fullmatch(pattern, model) else Decimal(0)
+        assert idx.price(model).prompt_per_1k_rub == expected
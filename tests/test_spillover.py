@@ -0,0 +1,42 @@
+import pytest
+
+import ai_gateway.settings as settings_mod
+from ai_gateway.services.spillover import job_idempotency_key, prefers_async, spillover_reason
+
+
+@pytest.fixture
+def thresholds(monkeypatch):
+    monkeypatch.setenv("SPILLOVER_MAX_TOKENS", "1000")
+    monkeypatch.setenv("SPILLOVER_MAX_OUTPUT_TOKENS", "4000")
+    monkeypatch.setenv("SPILLOVER_MODELS", '["o1-pro"]')
+    monkeypatch.setattr(settings_mod, "_settings", None)
+    yield
+    monkeypatch.setattr(settings_mod, "_settings", None)
+
+
+def test_prefer_header() -> None:
+    assert prefers_async("respond-async")
+    assert prefers_async("return=minimal, Respond-Async; wait=10")
+    assert not prefers_async("return=minimal")
+    assert not prefers_async(None)
+
+
+def test_spillover_reasons(thresholds) -> None:
+    small = {"model": "gpt-4o", "input": "hi", "max_output_tokens": 100}
+    assert spillover_reason("responses", small, None) is None
+    assert spillover_reason("responses", small, "respond-async") == "prefer"
+    assert spillover_reason("responses", {**small, "model": "o1-pro"}, None) == "model"
+    assert spillover_reason("responses", {**small, "max_output_tokens": 8000}, None) == (
+        "output_tokens"
+    )
+    big = {"model": "gpt-4o", "messages": [{"role": "user", "content": "слово " * 2000}]}
+    assert spillover_reason("chat.completions", big, None) == "tokens"
+
+
+def test_sync_idempotency_key_is_namespaced() -> None:
+    key = job_idempotency_key("responses", "abc")
+    # Тот же ключ у `/v1/jobs` и у другого sync-эндпоинта — другие jobs.
+    assert key != "abc"
+    assert key != job_idempotency_key("chat.completions", "abc")
+    assert len(job_idempotency_key("responses", "x" * 255)) <= 200
+    assert job_idempotency_key("responses", None) is None
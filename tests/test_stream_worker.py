@@ -0,0 +1,107 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+import ai_gateway.queue.stream_worker as worker_mod
+from ai_gateway import settings as settings_mod
+from ai_gateway.queue.streams import (
+    DELAYED_KEY,
+    GROUP,
+    STREAM_KEY,
+    TASK_JOB,
+    StreamTask,
+    add_task,
+)
+
+
+@pytest.fixture
+def redis_pair(monkeypatch):
+    monkeypatch.setenv("JOB_STREAM_CLAIM_IDLE_SECONDS", "0.01")
+    monkeypatch.setenv("JOB_STREAM_MAX_DELIVERIES", "2")
+    monkeypatch.setattr(settings_mod, "_settings", None)
+    server = fakeredis.FakeServer()
+    yield (
+        fakeredis.FakeRedis(server=server, decode_responses=True),
+        fakeredis.FakeAsyncRedis(server=server, decode_responses=True),
+    )
+    monkeypatch.setattr(settings_mod, "_settings", None)
+
+
+@pytest.fixture
+def ran(monkeypatch):
+    calls = []
+
+    async def fake_run_job(job_id, payload, retries=0):
+        await asyncio.sleep(0.01)
+        calls.append((job_id, retries))
+
+    monkeypatch.setattr(worker_mod, "run_job", fake_run_job)
+    return calls
+
+
+async def _until(cond, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not cond():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+
+async def test_worker_runs_and_acks_tasks(redis_pair, ran) -> None:
+    r, ar = redis_pair
+    for i in range(5):
+        add_task(r, StreamTask(TASK_JOB, [f"job-{i}", {}]))
+
+    worker = worker_mod.StreamWorker(ar, concurrency=2, consumer="w1")
+    run = asyncio.create_task(worker.run(shutdown_seconds=1))
+    await _until(lambda: len(ran) == 5)
+    worker.stop()
+    await run
+
+    assert sorted(job_id for job_id, _ in ran) == [f"job-{i}" for i in range(5)]
+    assert r.xlen(STREAM_KEY) == 0
+    assert r.xpending(STREAM_KEY, GROUP)["pending"] == 0
+
+
+async def test_delayed_task_is_promoted_when_due(redis_pair) -> None:
+    r, ar = redis_pair
+    add_task(r, StreamTask(TASK_JOB, ["job-1", {}], retries=2), countdown=0.05)
+    worker = worker_mod.StreamWorker(ar, concurrency=1, consumer="w1")
+
+    assert await worker.promote_due() == 0
+    await asyncio.sleep(0.06)
+    assert await worker.promote_due() == 1
+    assert r.zcard(DELAYED_KEY) == 0
+    [(_, fields)] = r.xrange(STREAM_KEY)
+    assert StreamTask.decode(fields["task"]).retries == 2
+
+
+async def test_reclaims_entries_of_dead_consumer(redis_pair, ran, monkeypatch) -> None:
+    r, ar = redis_pair
+    failed = []
+
+    async def fake_fail_job(job_id, deliveries):
+        failed.append(job_id)
+
+    monkeypatch.setattr(worker_mod, "_fail_job", fake_fail_job)
+    r.xgroup_create(STREAM_KEY, GROUP, id="0", mkstream=True)
+    add_task(r, StreamTask(TASK_JOB, ["job-1", {}]))
+    # Consumer прочитал запись и умер, не подтвердив её.
+    r.xreadgroup(GROUP, "dead", {STREAM_KEY: ">"}, count=1)
+    await asyncio.sleep(0.02)
+
+    worker = worker_mod.StreamWorker(ar, concurrency=2, consumer="w1")
+    assert await worker.reclaim() == 1
+    await _until(lambda: not worker._inflight)
+    assert ran == [("job-1", 0)]
+    assert r.xpending(STREAM_KEY, GROUP)["pending"] == 0
+
+    # Запись, на которой воркеры падают, после JOB_STREAM_MAX_DELIVERIES снимается.
+    add_task(r, StreamTask(TASK_JOB, ["job-2", {}]))
+    r.xreadgroup(GROUP, "dead", {STREAM_KEY: ">"}, count=1)
+    entry_id = r.xpending_range(STREAM_KEY, GROUP, "-", "+", 1)[0]["message_id"]
+    r.xclaim(STREAM_KEY, GROUP, "dead", 0, [entry_id])
+    await asyncio.sleep(0.02)
+    assert await worker.reclaim() == 0
+    assert failed == ["job-2"]
+    assert r.xlen(STREAM_KEY) == 0
@@ -0,0 +1,113 @@
+import fakeredis
+import pytest
+from fastapi import HTTPException
+
+import ai_gateway.services.templates as templates
+import ai_gateway.settings as settings_mod
+from ai_gateway.services.templates import TemplateVersion, expand_request, redact_request
+
+_BODY = {
+    "model": "gpt-4o-mini",
+    "messages": [{"role": "system", "content": "Ты — ассистент {{product}}. " + "x" * 3000}],
+    "tools": [{"type": "function", "function": {"name": "lookup"}}],
+}
+
+
+@pytest.fixture
+def store(monkeypatch):
+    monkeypatch.setattr(settings_mod, "_settings", None)
+    r = fakeredis.FakeRedis(decode_responses=True)
+    rows = {("support", 1): {"kind": "chat.completions", "body": _BODY}}
+    loads = []
+
+    def db_load(name, version):
+        loads.append((name, version))
+        return rows.get((name, version))
+
+    def db_latest(name):
+        versions = [v for n, v in rows if n == name]
+        return max(versions) if versions else None
+
+    monkeypatch.setattr(templates, "get_redis", lambda: r)
+    monkeypatch.setattr(templates, "_db_load", db_load)
+    monkeypatch.setattr(templates, "_db_latest", db_latest)
+    monkeypatch.setattr(templates, "_local", templates._TemplateCache())
+    yield rows, loads
+    monkeypatch.setattr(settings_mod, "_settings", None)
+
+
+def test_expand_prepends_template_messages_and_keeps_static_parts_shared() -> None:
+    tpl = TemplateVersion("t", 1, None, {"instructions": "static", "input": ["{{a}}", "b"]})
+    out = tpl.expand({"input": "вопрос", "model": "m"}, {"a": "A"})
+    assert out["input"] == ["A", "b", {"role": "user", "content": "вопрос"}]
+    assert out["instructions"] is tpl.body["instructions"]
+    assert out["model"] == "m"
+    assert tpl.variables == {"a"}
+
+
+def test_missing_variable_is_422() -> None:
+    tpl = TemplateVersion("t", 1, None, {"instructions": "{{a}} и {{b}}"})
+    with pytest.raises(HTTPException) as e:
+        tpl.expand({}, {"a": "1"})
+    assert e.value.status_code == 422
+    assert "b" in str(e.value.detail)
+
+
+def test_expand_request_pins_version_and_caches(store) -> None:
+    _, loads = store
+    payload = {
+        "template_id": "support",
+        "template_variables": {"product": "Касса"},
+        "messages": [{"role": "user", "content": "привет"}],
+    }
+    req = expand_request("chat.completions", payload)
+    assert req.compact["template_id"] == "support@1"
+    assert [m["role"] for m in req.payload["messages"]] == ["system", "user"]
+    assert "Касса" in req.payload["messages"][0]["content"]
+    assert "template_id" not in req.payload
+
+    expand_request("chat.completions", payload)
+    assert loads == [("support", 1)]
+
+    # Новый процесс: память пустая, версия приходит из Redis, а не из БД.
+    templates._local.clear()
+    expand_request("chat.completions", payload)
+    assert loads == [("support", 1)]
+
+
+def test_wrong_kind_and_unknown_template(store) -> None:
+    with pytest.raises(HTTPException) as e:
+        expand_request("responses", {"template_id": "support"})
+    assert e.value.status_code == 422
+    with pytest.raises(HTTPException) as e:
+        expand_request("responses", {"template_id": "nope"})
+    assert e.value.status_code == 404
+
+
+def test_redaction_uses_template_ref_and_hides_variables(store) -> None:
+    payload = {"template_id": "support", "template_variables": {"product": "секрет"}}
+    req = expand_request("chat.completions", payload)
+    red = redact_request("chat.completions", req.compact, req.template)
+    assert red["template"] == req.template.ref
+    assert "секрет" not in str(red)
+    assert "x" * 100 not in str(red)
+
+
+def test_affinity_key_only_for_static_prefix(store) -> None:
+    static = TemplateVersion("s", 1, None, {"instructions": "y" * 3000})
+    assert static.affinity_key("m") == static.affinity_key("m")
+    assert static.affinity_key("m") != static.affinity_key("other")
+    dynamic = TemplateVersion("d", 1, None, {"instructions": "{{v}}" + "y" * 3000})
+    assert dynamic.affinity_key("m") is None
+
+
+def test_affinity_key_dropped_when_client_overrides_prefix(store) -> None:
+    tpl = TemplateVersion(
+        "s", 1, None, {"instructions": "y" * 3000, "messages": [{"role": "system", "content": "s"}]}
+    )
+    appended = {"messages": [{"role": "user", "content": "hi"}]}
+    assert tpl.affinity_key("m", appended) == tpl.affinity_key("m")
+    assert tpl.affinity_key("m", {"instructions": "другие"}) is None
+    assert tpl.affinity_key("m", {"tools": [{"type": "function"}]}) is None
+    # В шаблоне нет `input` — клиентский `input` целиком его, префикс по шаблону не годится.
+    assert tpl.affinity_key("m", {"input": "hi"}) is None
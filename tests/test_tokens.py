@@ -0,0 +1,110 @@
+import json
+
+import fakeredis
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+import ai_gateway.services.tokens as tokens_mod
+import ai_gateway.settings as settings_mod
+from ai_gateway.api import v1_estimate
+from ai_gateway.auth.apikey import AuthedKey, require_api_key
+from ai_gateway.services.limits import TokensOverLimitError, enforce_tpm_limit, try_reserve_tpm
+from ai_gateway.services.tokens import (
+    count_text_tokens,
+    count_texts_tokens,
+    estimate_prompt_tokens,
+    estimate_request_tokens,
+)
+
+
+@pytest.fixture
+def model_limits(monkeypatch):
+    monkeypatch.setenv("MODEL_TPM_LIMITS", json.dumps({"m": 1000}))
+    monkeypatch.setattr(settings_mod, "_settings", None)
+    yield
+    monkeypatch.setattr(settings_mod, "_settings", None)
+
+
+def test_estimate_counts_messages_and_output() -> None:
+    assert count_text_tokens("") == 0
+    assert count_text_tokens("hello world") == 2
+    # Кириллица «дороже» латиницы той же длины.
+    assert count_text_tokens("приветствие") > count_text_tokens("salutations")
+
+    chat = {"messages": [{"role": "user", "content": "hello world"}], "max_tokens": 100}
+    assert estimate_prompt_tokens("chat.completions", chat) == 3 + 4 + 2
+    assert estimate_request_tokens("chat.completions", chat) == 109
+
+    resp = {"input": [{"role": "user", "content": [{"type": "input_text", "text": "hello world"}]}]}
+    assert estimate_prompt_tokens("responses", resp) == 3 + 4 + 2
+
+
+def test_tpm_reserve_and_settle(model_limits) -> None:
+    r = fakeredis.FakeRedis(decode_responses=True)
+    a = try_reserve_tpm(r, "k1", "m", 600, None)
+    assert a is not None
+    # Лимит модели общий для всех ключей.
+    assert try_reserve_tpm(r, "k2", "m", 600, None) is None
+    # Фактически ушло меньше — разница возвращается в окно.
+    a.settle(100)
+    assert try_reserve_tpm(r, "k2", "m", 600, None) is not None
+
+
+def test_tpm_per_key_limit_raises_429() -> None:
+    r = fakeredis.FakeRedis(decode_responses=True)
+    enforce_tpm_limit(r, "k", "other", 80, 100)
+    with pytest.raises(HTTPException) as ei:
+        enforce_tpm_limit(r, "k", "other", 80, 100)
+    assert ei.value.status_code == 429
+    assert "Retry-After" in ei.value.headers
+    # Другой ключ свои токены не делит.
+    enforce_tpm_limit(r, "k2", "other", 80, 100)
+
+
+def test_tpm_request_over_limit_is_rejected_up_front(model_limits) -> None:
+    r = fakeredis.FakeRedis(decode_responses=True)
+    # Больше лимита модели: не 429 (окно не поможет), а 413.
+    with pytest.raises(HTTPException) as ei:
+        enforce_tpm_limit(r, "k", "m", 1500, None)
+    assert ei.value.status_code == 413
+    with pytest.raises(TokensOverLimitError):
+        try_reserve_tpm(r, "k", "m", 200, 100)
+    assert not r.keys("tpm:*")
+
+
+def test_tpm_settle_skips_expired_window(model_limits) -> None:
+    r = fakeredis.FakeRedis(decode_responses=True)
+    a = try_reserve_tpm(r, "k", "m", 600, None)
+    r.delete(*a.keys)  # окно закончилось, пока шёл вызов
+    a.settle(900)
+    assert not r.keys("tpm:*")
+
+
+def test_batch_counts_and_cache(monkeypatch) -> None:
+    system = "You are a helpful assistant. " * 20
+    assert count_texts_tokens(["", "hello", system]) == [0, 1, count_text_tokens(system)]
+
+    # Повторный длинный текст берётся из LRU, без повторной токенизации.
+    calls = []
+    monkeypatch.setattr(tokens_mod, "_heuristic_tokens", lambda t: calls.append(t) or 1)
+    count_texts_tokens([system, "hi"])
+    assert calls == ["hi"]
+
+
+def test_estimate_endpoint(monkeypatch) -> None:
+    monkeypatch.setattr(v1_estimate, "get_redis", lambda: fakeredis.FakeRedis())
+    app = FastAPI()
+    app.include_router(v1_estimate.router, prefix="/v1")
+    app.dependency_overrides[require_api_key] = lambda: AuthedKey(
+        api_key_id="k",
+        rpm_limit=None,
+        daily_budget_rub=None,
+        monthly_budget_rub=None,
+    )
+    body = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "hello world"}]}
+    data = TestClient(app).post("/v1/estimate", json={**body, "max_tokens": 50}).json()
+    assert data["kind"] == "chat.completions"
+    assert data["input_tokens"] == 9
+    assert data["total_tokens"] == 59
+    assert data["cost_rub"]["total"] is not None